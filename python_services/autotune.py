@@ -0,0 +1,232 @@
+"""
+Thread and batch-size autotuner for CPU inference
+Benchmarks the feature extractor on this host over a grid of torch intra-op
+threads, inter-op threads and forward-pass batch sizes, and stores the best
+profile in a JSON file keyed by a host fingerprint (CPU, core count, torch
+version, backend, worker count) so later starts reuse it
+
+Each inter-op setting is measured in its own subprocess because torch only
+accepts set_num_interop_threads() before any parallel work has run. Host
+throughput is estimated as per-worker throughput x workers, with the intra-op
+thread count capped at cores / workers
+
+Usage: python autotune.py [--workers 4] [--output cache/autotune.json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Autotune modes (MRSINA_AUTOTUNE)
+AUTOTUNE_OFF = 'off'
+AUTOTUNE_REUSE = 'reuse'
+AUTOTUNE_STARTUP = 'startup'
+
+DEFAULT_BATCH_SIZES = (1, 4, 8, 16, 32)
+DEFAULT_INTEROP_THREADS = (1, 2)
+# Configurations within this fraction of the best throughput count as ties;
+# the one using the fewest threads and smallest batch wins
+TIE_TOLERANCE = 0.03
+
+
+def _cpu_model() -> str:
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def host_fingerprint(workers: int, backend: str) -> Dict:
+    """What a profile is only valid for"""
+    import torch
+    return {
+        'cpu': _cpu_model(),
+        'cores': os.cpu_count() or 1,
+        'torch': torch.__version__,
+        'backend': backend,
+        'workers': max(1, workers),
+    }
+
+
+def thread_grid(workers: int) -> List[int]:
+    """Powers of two up to this worker's share of the cores, plus the share itself"""
+    share = max(1, (os.cpu_count() or 1) // max(1, workers))
+    grid = []
+    threads = 1
+    while threads < share:
+        grid.append(threads)
+        threads *= 2
+    grid.append(share)
+    return grid
+
+
+def measure(interop_threads: int, thread_counts: List[int], batch_sizes: List[int],
+            backend: str, slices: int = 32, repeats: int = 2) -> List[Dict]:
+    """Slices/sec for each (intra-op threads, batch size) with a fixed inter-op setting (in-process)"""
+    import torch
+    import torch.nn as nn
+    torch.set_num_interop_threads(interop_threads)
+
+    from brain_mri_processor import build_feature_extractor
+    from inference_backends import create_backend
+
+    # Timings do not depend on the weight values, so no weights are loaded
+    feature_extractor = build_feature_extractor(weights=None)
+    analyzer = nn.Sequential(nn.Linear(4096, 1))
+    batch = torch.randn(max(batch_sizes), 3, 224, 224)
+    calibration = [batch[:4]] if backend == 'int8-static' else None
+    results = []
+    for threads in thread_counts:
+        torch.set_num_threads(threads)
+        engine = create_backend(backend, feature_extractor, analyzer, torch.device('cpu'), calibration)
+        for batch_size in batch_sizes:
+            chunk = batch[:batch_size]
+            calls = max(1, slices // batch_size)
+            engine.extract(chunk)
+            best = float('inf')
+            for _ in range(repeats):
+                start = time.perf_counter()
+                for _ in range(calls):
+                    engine.extract(chunk)
+                best = min(best, time.perf_counter() - start)
+            results.append({
+                'intra_op_threads': threads,
+                'interop_threads': interop_threads,
+                'batch_size': batch_size,
+                'slices_per_s': round(calls * batch_size / best, 2),
+            })
+    return results
+
+
+def select_best(grid: List[Dict]) -> Dict:
+    """Fastest configuration, preferring fewer threads and smaller batches among near-ties"""
+    fastest = max(row['slices_per_s'] for row in grid)
+    ties = [row for row in grid if row['slices_per_s'] >= fastest * (1 - TIE_TOLERANCE)]
+    return min(ties, key=lambda row: (row['intra_op_threads'], row['interop_threads'], row['batch_size']))
+
+
+def tune(workers: int = 1, backend: str = 'eager', batch_sizes=DEFAULT_BATCH_SIZES,
+         interop_threads=DEFAULT_INTEROP_THREADS, slices: int = 32) -> Dict:
+    """Run the grid (one subprocess per inter-op setting) and return the best profile"""
+    thread_counts = thread_grid(workers)
+    grid: List[Dict] = []
+    start = time.perf_counter()
+    for interop in interop_threads:
+        command = [
+            sys.executable, os.path.abspath(__file__), 'measure', '--interop', str(interop),
+            '--threads', *map(str, thread_counts), '--batch-sizes', *map(str, batch_sizes),
+            '--backend', backend, '--slices', str(slices)
+        ]
+        output = subprocess.run(command, check=True, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        grid.extend(json.loads(output.strip().splitlines()[-1]))
+
+    best = select_best(grid)
+    profile = {
+        'intra_op_threads': best['intra_op_threads'],
+        'interop_threads': best['interop_threads'],
+        'batch_size': best['batch_size'],
+        'worker_slices_per_s': best['slices_per_s'],
+        'host_slices_per_s': round(best['slices_per_s'] * max(1, workers), 2),
+    }
+    logger.info(f"Autotune finished in {time.perf_counter() - start:.1f} s: {profile}")
+    return {
+        'fingerprint': host_fingerprint(workers, backend),
+        'profile': profile,
+        'grid': grid,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+
+
+def save_profile(path: str, result: Dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(result, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def load_profile(path: str, fingerprint: Dict) -> Optional[Dict]:
+    """The stored profile if it was tuned for this fingerprint, else None"""
+    try:
+        with open(path) as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if result.get('fingerprint') != fingerprint:
+        logger.info(f"Autotune profile {path} was tuned for another host/configuration, ignoring it")
+        return None
+    return result['profile']
+
+
+def apply_profile(profile: Dict):
+    """Set torch's thread pools from a profile (call before the first inference)"""
+    import torch
+    try:
+        torch.set_num_interop_threads(profile['interop_threads'])
+    except RuntimeError:
+        # Inter-op pool already started in this process; keep its size
+        logger.warning("Inter-op threads already initialized, autotuned value not applied")
+    torch.set_num_threads(profile['intra_op_threads'])
+
+
+def resolve_profile(mode: str, path: str, workers: int, backend: str) -> Optional[Dict]:
+    """Profile for this start: reused when it matches, tuned now in startup mode when missing"""
+    if mode == AUTOTUNE_OFF or not path:
+        return None
+    fingerprint = host_fingerprint(workers, backend)
+    profile = load_profile(path, fingerprint)
+    if profile is None and mode == AUTOTUNE_STARTUP:
+        logger.info(f"No autotune profile for this host, tuning {backend} for {workers} worker(s)")
+        result = tune(workers=workers, backend=backend)
+        save_profile(path, result)
+        profile = result['profile']
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Autotune torch threads and batch size for this host")
+    commands = parser.add_subparsers(dest='command')
+    run = commands.add_parser('measure', help=argparse.SUPPRESS)
+    run.add_argument('--interop', type=int, required=True)
+    run.add_argument('--threads', type=int, nargs='+', required=True)
+    run.add_argument('--batch-sizes', type=int, nargs='+', required=True)
+    run.add_argument('--backend', default='eager')
+    run.add_argument('--slices', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--backend', default=None)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=list(DEFAULT_BATCH_SIZES))
+    parser.add_argument('--interop-threads', type=int, nargs='+', default=list(DEFAULT_INTEROP_THREADS))
+    parser.add_argument('--slices', type=int, default=32, help='slices timed per configuration')
+    args = parser.parse_args()
+
+    if args.command == 'measure':
+        logging.disable(logging.INFO)
+        print(json.dumps(measure(args.interop, args.threads, args.batch_sizes, args.backend, args.slices)))
+        return
+
+    import config
+    logging.basicConfig(level=logging.INFO)
+    output = args.output or config.AUTOTUNE_PROFILE
+    result = tune(workers=args.workers, backend=args.backend or config.INFERENCE_BACKEND,
+                  batch_sizes=args.batch_sizes, interop_threads=args.interop_threads, slices=args.slices)
+    save_profile(output, result)
+    print(json.dumps(result['profile'], indent=2))
+    print(f"Saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: time to first response and time to first inference
+
+Starts the service with uvicorn in a fresh process for each model-loading
+mode and measures, from process spawn:
+- time_to_first_response_s: first successful GET /health
+- time_to_first_inference_s: first completed POST /process-single-mr
+
+The service loads an (untrained) ResNet50 from a local weight bundle, as in
+an air-gapped deployment; the server's own startup timeline from /health is
+included.
+
+Usage: python benchmarks/bench_cold_start.py [--modes eager background lazy]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from common import SERVICE_DIR, write_untrained_bundle
+from phantoms import make_phantom, write_png
+
+
+def measure(mode: str, bundle: str, image_path: str, port: int, timeout: float) -> dict:
+    env = dict(os.environ, MRSINA_MODEL_LOADING=mode, MRSINA_WEIGHTS_BUNDLE=bundle, MRSINA_FEATURE_CACHE_DIR="")
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVICE_DIR, env=env
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            while True:
+                if time.perf_counter() - started > timeout:
+                    raise TimeoutError(f"service did not answer within {timeout} s")
+                try:
+                    if client.get(f"{base}/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    time.sleep(0.02)
+            first_response = time.perf_counter() - started
+
+            with open(image_path, "rb") as f:
+                response = client.post(f"{base}/process-single-mr", files={"file": ("scan.png", f, "image/png")})
+            response.raise_for_status()
+            first_inference = time.perf_counter() - started
+            timeline = client.get(f"{base}/health").json()["model"]["startup_timeline_s"]
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "time_to_first_response_s": round(first_response, 3),
+        "time_to_first_inference_s": round(first_inference, 3),
+        "server_timeline_s": timeline,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Service cold-start benchmark")
+    parser.add_argument("--modes", nargs="+", default=["eager", "background", "lazy"])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        bundle = os.path.join(directory, "resnet50.pt")
+        write_untrained_bundle(bundle)
+        image_path = write_png(os.path.join(directory, "scan.png"), make_phantom((256, 256, 8)))
+        results = {mode: measure(mode, bundle, image_path, args.port, args.timeout) for mode in args.modes}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark the whole-volume difference engine against one-shot NumPy/SciPy
+
+The one-shot baseline holds the float difference, the smoothed volume and the
+normalized/thresholded volume at once. The engine smooths overlapping z-chunks
+and merges the threshold statistics as it goes. Both produce attention maps for
+every slice; --slices limits the engine's output to a few slices (what the
+heatmap renderer asks for). Peak memory is traced NumPy allocations
+(tracemalloc); the input volumes are excluded.
+
+Usage: python benchmarks/bench_difference_engine.py [--shape 256 256 256] [--workers 1 2 4]
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+from scipy import ndimage
+
+import common  # noqa: F401  (puts the service directory on sys.path)
+from difference_engine import DifferenceEngine
+
+
+def one_shot(volume1, volume2, sigma=2.0):
+    diff = np.abs(volume1.astype(np.float32) - volume2.astype(np.float32))
+    smoothed = ndimage.gaussian_filter(diff, sigma)
+    normalized = (smoothed - smoothed.min()) / (smoothed.max() - smoothed.min())
+    threshold = np.mean(normalized) + np.std(normalized)
+    return np.where(normalized > threshold, normalized, 0)
+
+
+def measure(fn) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {"seconds": round(elapsed, 2), "peak_mib": round(peak / 2 ** 20, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunked difference engine benchmark")
+    parser.add_argument("--shape", type=int, nargs=3, default=[256, 256, 256])
+    parser.add_argument("--chunk-slices", type=int, default=32)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--slices", type=int, default=20, help="slices kept in the reduced-output run")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    shape = tuple(args.shape)
+    volume1 = rng.integers(0, 255, shape, dtype=np.uint8)
+    volume2 = rng.integers(0, 255, shape, dtype=np.uint8)
+    depth = shape[2]
+    selected = np.linspace(depth // 4, 3 * depth // 4, args.slices, dtype=int).tolist()
+
+    report = {"shape": list(shape), "volume_mib": round(volume1.nbytes / 2 ** 20, 1),
+              "one_shot": measure(lambda: one_shot(volume1, volume2))}
+    for workers in args.workers:
+        engine = DifferenceEngine(chunk_slices=args.chunk_slices, workers=workers)
+        report[f"engine_all_slices_workers_{workers}"] = measure(lambda: engine.attention_stack(volume1, volume2))
+        report[f"engine_{args.slices}_slices_workers_{workers}"] = measure(
+            lambda: engine.attention_stack(volume1, volume2, selected))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Benchmark heatmap rendering: cold render vs memory-tier and disk-tier cache hits
+
+For each encoding (PNG and WebP at a few qualities) reports the encoded size,
+the time of a cold render (load slice, attention map, overlay, encode) and the
+time to serve the same heatmap again from the memory and disk tiers.
+
+Usage: python benchmarks/bench_heatmaps.py [--shape 256 256 128]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from common import build_processor, time_call
+from heatmap_cache import HeatmapCache
+from phantoms import make_phantom, write_nifti
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Heatmap render and cache benchmark")
+    parser.add_argument("--shape", type=int, nargs=3, default=[256, 256, 128])
+    parser.add_argument("--pretrained", action="store_true")
+    args = parser.parse_args()
+
+    processor = build_processor(pretrained=args.pretrained)
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_nifti(os.path.join(directory, "scan.nii"), make_phantom(tuple(args.shape)), dtype=np.int16)
+        for image_format, quality in [("png", 80), ("webp", 90), ("webp", 60)]:
+            processor.heatmap_format, processor.heatmap_quality = image_format, quality
+            cache_dir = os.path.join(directory, f"{image_format}{quality}")
+
+            def cold():
+                processor.heatmap_cache = HeatmapCache(cache_dir=None, memory_bytes=0)
+                return processor.render_scan_heatmap(path)
+
+            _, data = cold()
+            processor.heatmap_cache = HeatmapCache(cache_dir=cache_dir)
+            key, _ = processor.render_scan_heatmap(path)
+            memory_hit = time_call(lambda: processor.heatmap_cache.get(key), repeats=20)
+            disk_only = HeatmapCache(cache_dir=cache_dir, memory_bytes=0)
+            disk_hit = time_call(lambda: disk_only.get(key), repeats=20)
+            rows.append({
+                "format": image_format,
+                "quality": quality,
+                "size_kib": round(len(data) / 1024, 1),
+                "cold_render_ms": round(time_call(cold, repeats=3)["best_s"] * 1000, 1),
+                "memory_hit_us": round(memory_hit["best_s"] * 1e6, 1),
+                "disk_hit_us": round(disk_hit["best_s"] * 1e6, 1),
+            })
+    print(json.dumps({"shape": args.shape, "results": rows}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
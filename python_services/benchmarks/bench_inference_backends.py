@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Accuracy and latency harness for the inference backends
+
+Every backend is built from the same fp32 weights. Accuracy is the cosine
+distance (1 - cosine similarity) of its features to eager fp32, per slice
+and per scan (slice-averaged, as the pipeline uses them), and of its brain
+analyzer outputs for consecutive scan pairs of the eager features. Latency
+is the time to run one scan's slices through ResNet50; throughput is slices/sec.
+
+The int8-static backend is calibrated on phantom scans that are disjoint
+from the evaluation scans. Use --pretrained for numbers that reflect the
+real ImageNet weights (activation ranges of random weights differ).
+
+Usage: python benchmarks/bench_inference_backends.py [--backends eager onnx] [--repeats 10]
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from common import build_processor, percentile
+from inference_backends import BACKENDS, create_backend
+from phantoms import make_phantom
+
+
+def phantom_batches(processor, seeds, shape=(192, 192, 40)):
+    """Preprocessed slice batches (one per phantom scan)"""
+    batches = []
+    for seed in seeds:
+        volume = make_phantom(shape, seed=seed, max_value=255.0).astype(np.uint8)
+        batches.append(processor.preprocess_slices(processor.extract_brain_slices(volume)))
+    return batches
+
+
+def cosine_distance(a: torch.Tensor, b: torch.Tensor) -> torch.Tensor:
+    return 1.0 - F.cosine_similarity(a.float(), b.float(), dim=1)
+
+
+def scan_pairs(reference) -> torch.Tensor:
+    """(N, 4096) analyzer inputs: slice-averaged features of consecutive scans"""
+    scans = torch.cat([r.mean(dim=0, keepdim=True) for r in reference])
+    return torch.cat([scans[:-1], scans[1:]], dim=1)
+
+
+def evaluate(backend, eval_batches, reference, reference_analysis, repeats: int) -> dict:
+    features = [backend.extract(batch) for batch in eval_batches]
+    slice_distance = torch.cat([cosine_distance(f, r) for f, r in zip(features, reference)])
+    scan_distance = torch.cat([
+        cosine_distance(f.mean(dim=0, keepdim=True), r.mean(dim=0, keepdim=True))
+        for f, r in zip(features, reference)
+    ])
+    analysis = backend.analyze(scan_pairs(reference))
+
+    batch = eval_batches[0]
+    backend.extract(batch)
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        backend.extract(batch)
+        latencies.append(time.perf_counter() - start)
+    return {
+        "slice_cosine_distance_mean": float(slice_distance.mean()),
+        "slice_cosine_distance_max": float(slice_distance.max()),
+        "scan_cosine_distance_max": float(scan_distance.max()),
+        "analyzer_cosine_distance_max": float(cosine_distance(analysis, reference_analysis).max()),
+        "analyzer_max_abs_diff": float((analysis.float() - reference_analysis.float()).abs().max()),
+        "scan_latency_p50_s": round(percentile(latencies, 50), 4),
+        "scan_latency_p95_s": round(percentile(latencies, 95), 4),
+        "slices_per_s": round(batch.shape[0] / percentile(latencies, 50), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference backend accuracy/latency harness")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--eval-scans", type=int, default=3)
+    parser.add_argument("--calibration-scans", type=int, default=4)
+    parser.add_argument("--pretrained", action="store_true")
+    args = parser.parse_args()
+
+    processor = build_processor(pretrained=args.pretrained)
+    eval_batches = phantom_batches(processor, range(args.eval_scans))
+    calibration = phantom_batches(processor, range(100, 100 + args.calibration_scans))
+    reference = [processor.backend.extract(batch) for batch in eval_batches]
+    reference_analysis = processor.backend.analyze(scan_pairs(reference))
+
+    results = {}
+    for name in args.backends:
+        backend = create_backend(
+            name, processor.feature_extractor, processor.brain_analyzer, processor.device,
+            calibration_batches=calibration if name == "int8-static" else None
+        )
+        results[name] = evaluate(backend, eval_batches, reference, reference_analysis, args.repeats)
+
+    if "eager" in results:
+        for name, row in results.items():
+            row["speedup_vs_eager"] = round(results["eager"]["scan_latency_p50_s"] / row["scan_latency_p50_s"], 2)
+
+    print(f"{'backend':<14}{'p50 s':>9}{'p95 s':>9}{'slices/s':>10}{'speedup':>9}{'scan cos dist':>15}"
+          f"{'analyzer dist':>15}")
+    for name, row in results.items():
+        print(f"{name:<14}{row['scan_latency_p50_s']:>9.4f}{row['scan_latency_p95_s']:>9.4f}"
+              f"{row['slices_per_s']:>10.1f}{row.get('speedup_vs_eager', 0.0):>9.2f}"
+              f"{row['scan_cosine_distance_max']:>15.2e}{row['analyzer_cosine_distance_max']:>15.2e}")
+    print(json.dumps({"torch_threads": torch.get_num_threads(), "backends": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
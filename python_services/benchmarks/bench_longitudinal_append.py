@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Benchmark incremental longitudinal updates against recomputing the history
+
+Appends N follow-up scans one by one to a patient's longitudinal state and
+times each append. For comparison, the same history up to each scan is run
+through process_series_comparison (what recomputing the whole history
+costs). The feature cache is disabled so both sides pay for inference.
+
+Usage: python benchmarks/bench_longitudinal_append.py [--scans 8] [--shape 192 192 96]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from common import build_processor
+from feature_cache import FeatureCache
+from longitudinal_state import LongitudinalStore
+from phantoms import make_phantom, write_nifti
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Longitudinal append vs full recompute benchmark")
+    parser.add_argument("--scans", type=int, default=8)
+    parser.add_argument("--shape", type=int, nargs=3, default=[192, 192, 96])
+    parser.add_argument("--pretrained", action="store_true")
+    args = parser.parse_args()
+
+    processor = build_processor(pretrained=args.pretrained, feature_cache=FeatureCache(memory_entries=0))
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        store = LongitudinalStore(os.path.join(directory, "state"))
+        paths = [
+            write_nifti(os.path.join(directory, f"scan{i}.nii"), make_phantom(tuple(args.shape), seed=i), dtype=np.int16)
+            for i in range(args.scans)
+        ]
+        processor.process_series_comparison(paths[:2])  # warm-up
+        for count, path in enumerate(paths, start=1):
+            start = time.perf_counter()
+            store.append(processor, "bench-patient", path, scan_date=f"{2020 + count}-01-01")
+            append_s = time.perf_counter() - start
+            row = {"scans": count, "append_s": round(append_s, 2)}
+            if count > 1:
+                start = time.perf_counter()
+                processor.process_series_comparison(paths[:count])
+                row["full_recompute_s"] = round(time.perf_counter() - start, 2)
+            results.append(row)
+    print(json.dumps({"shape": args.shape, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cost of stage instrumentation and of rendering /metrics
+
+Reports the per-call overhead of a `@timed` stage (with and without an
+active timing collector) against the bare function, and the time to render a
+registry holding every stage histogram with data in it.
+
+Usage: python benchmarks/bench_metrics.py [--calls 200000]
+"""
+
+import argparse
+import json
+
+from common import time_call
+from metrics import MetricsRegistry, collect_stage_timings, timed
+
+STAGES = ("hash", "decode", "registration", "slice_selection", "preprocessing", "inference",
+          "volumetrics", "region_statistics", "attention_map", "heatmap", "heatmap_encode")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stage instrumentation overhead benchmark")
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+
+    def bare():
+        return None
+
+    instrumented = timed("benchmark")(bare)
+
+    def loop(fn):
+        return lambda: [fn() for _ in range(args.calls)]
+
+    def collected():
+        with collect_stage_timings():
+            for _ in range(args.calls):
+                instrumented()
+
+    bare_s = time_call(loop(bare), repeats=3)["best_s"]
+    timed_s = time_call(loop(instrumented), repeats=3)["best_s"]
+    collected_s = time_call(collected, repeats=3)["best_s"]
+
+    registry = MetricsRegistry()
+    histogram = registry.histogram("bench_stage_duration_seconds", "Stage latency", ("stage",))
+    for i, name in enumerate(STAGES):
+        for j in range(100):
+            histogram.observe(0.001 * (i + 1) * (j + 1), name)
+    registry.callback("bench_queue_depth", "Queue depth", lambda: 3)
+    render_s = time_call(registry.render, repeats=20, warmup=2)["best_s"]
+
+    print(json.dumps({
+        "calls": args.calls,
+        "overhead_per_call_us": round((timed_s - bare_s) / args.calls * 1e6, 3),
+        "overhead_per_call_with_collector_us": round((collected_s - bare_s) / args.calls * 1e6, 3),
+        "render_ms": round(render_s * 1000, 3),
+        "rendered_bytes": len(registry.render()),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
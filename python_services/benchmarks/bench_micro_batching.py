@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark cross-request micro-batching under concurrent load
+
+Runs `--clients` threads that each extract features for `--requests` scans,
+with micro-batching off and on, and reports throughput plus single-request
+latency (which should grow by at most the configured wait).
+
+Usage: python benchmarks/bench_micro_batching.py [--clients 4] [--wait-ms 5]
+"""
+
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+
+from common import build_processor, percentile
+from micro_batcher import MicroBatcher
+
+
+def run_clients(processor, slices, clients: int, requests: int) -> dict:
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients)
+
+    def client():
+        barrier.wait()
+        for _ in range(requests):
+            start = time.perf_counter()
+            processor.extract_features(slices)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    return {
+        "scans_per_s": round(clients * requests / wall, 3),
+        "latency_p50_s": round(percentile(latencies, 50), 4),
+        "latency_p99_s": round(percentile(latencies, 99), 4),
+    }
+
+
+def single_latency(processor, slices, repeats: int = 3) -> float:
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        processor.extract_features(slices)
+        durations.append(time.perf_counter() - start)
+    return round(min(durations), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching throughput benchmark")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=2, help="scans per client")
+    parser.add_argument("--slices", type=int, default=20)
+    parser.add_argument("--wait-ms", type=float, default=5.0)
+    parser.add_argument("--max-slices", type=int, default=80)
+    args = parser.parse_args()
+
+    processor = build_processor()
+    volume = np.random.default_rng(0).integers(0, 255, (128, 128, 64), dtype=np.uint8)
+    slices = processor.extract_brain_slices(volume, num_slices=args.slices)
+    processor.extract_features(slices)  # warm-up
+
+    results = {"clients": args.clients, "requests_per_client": args.requests, "wait_ms": args.wait_ms}
+    results["single_request_s"] = {"unbatched": single_latency(processor, slices)}
+    results["unbatched"] = run_clients(processor, slices, args.clients, args.requests)
+
+    processor.micro_batcher = MicroBatcher(
+        processor._forward_batches, max_slices=args.max_slices, max_wait_ms=args.wait_ms
+    )
+    results["single_request_s"]["micro_batched"] = single_latency(processor, slices)
+    results["micro_batched"] = run_clients(processor, slices, args.clients, args.requests)
+    results["micro_batched"]["batcher"] = processor.micro_batcher.stats()
+    processor.micro_batcher.shutdown()
+
+    results["throughput_gain"] = round(
+        results["micro_batched"]["scans_per_s"] / results["unbatched"]["scans_per_s"], 3
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
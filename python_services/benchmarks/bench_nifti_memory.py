@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Peak-RSS benchmark: eager get_fdata() vs lazy memory-mapped NIfTI access
+
+Each mode runs in a fresh subprocess that performs the pipeline's reads
+(20 evenly spaced axial slices plus the middle slice) and reports the growth
+of peak RSS over the post-import baseline and the wall time, for an
+uncompressed .nii and a .nii.gz (decompressed once by the lazy loader).
+
+Usage: python benchmarks/bench_nifti_memory.py [--shape 512 512 512]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from phantoms import make_phantom, write_nifti
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(BENCH_DIR)
+
+CHILD = r"""
+import json, resource, sys, time
+sys.path.insert(0, {service_dir!r})
+import numpy as np
+import nibabel as nib
+from lazy_volume import LazyNiftiVolume, take_axial_slices
+
+def peak_kib():
+    # VmHWM is this process image's RSS high-water mark; ru_maxrss can carry the
+    # parent's peak across fork/exec
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+path, mode = sys.argv[1], sys.argv[2]
+baseline = peak_kib()
+start = time.perf_counter()
+if mode == "eager":
+    volume = nib.load(path).get_fdata()
+    if volume.max() > 255:
+        volume = (volume / volume.max() * 255).astype(np.uint8)
+else:
+    volume = LazyNiftiVolume(path)
+depth = volume.shape[2]
+indices = np.linspace(depth // 4, 3 * depth // 4, 20, dtype=int)
+slices = take_axial_slices(volume, indices)
+middle = volume[:, :, depth // 2]
+elapsed = time.perf_counter() - start
+print(json.dumps({{"peak_rss_growth_mib": round((peak_kib() - baseline) / 1024, 1), "wall_s": round(elapsed, 3)}}))
+"""
+
+
+def run_mode(path: str, mode: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(service_dir=SERVICE_DIR), path, mode],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def write_volume(path: str, shape) -> None:
+    """Write an int16 phantom volume"""
+    write_nifti(path, make_phantom(tuple(shape)), dtype=np.int16)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NIfTI loading peak-memory benchmark")
+    parser.add_argument("--shape", type=int, nargs=3, default=[512, 512, 512])
+    args = parser.parse_args()
+
+    results = {"shape": args.shape}
+    with tempfile.TemporaryDirectory() as directory:
+        for suffix in (".nii", ".nii.gz"):
+            path = os.path.join(directory, f"phantom{suffix}")
+            write_volume(path, args.shape)
+            eager, lazy = run_mode(path, "eager"), run_mode(path, "lazy")
+            results[suffix] = {
+                "file_mib": round(os.path.getsize(path) / 2 ** 20, 1),
+                "eager_get_fdata": eager,
+                "lazy": lazy,
+                "peak_rss_reduction": round(eager["peak_rss_growth_mib"] / max(lazy["peak_rss_growth_mib"], 0.1), 1),
+            }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark slice selection + preprocessing: legacy PIL round-trip vs tensor-native path
+
+Reports wall time and tracemalloc figures (peak traced bytes and allocated
+blocks). NumPy buffers are traced; PIL and torch use their own allocators, so
+the tracemalloc numbers cover the NumPy-side copies only.
+
+Usage: python benchmarks/bench_preprocessing.py [--shape 256 256 128] [--slices 20]
+"""
+
+import argparse
+import json
+import tracemalloc
+
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+from common import build_processor, time_call
+from brain_mri_processor import IMAGENET_MEAN, IMAGENET_STD
+
+legacy_transform = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD),
+])
+
+
+def legacy_preprocess(image_3d: np.ndarray, num_slices: int) -> torch.Tensor:
+    """Previous implementation: np.stack([slice] * 3) and a PIL round-trip per slice"""
+    depth = image_3d.shape[2]
+    slice_indices = np.linspace(depth // 4, 3 * depth // 4, num_slices, dtype=int)
+    tensors = []
+    for idx in slice_indices:
+        slice_rgb = np.stack([image_3d[:, :, idx]] * 3, axis=2)
+        pil_image = Image.fromarray(slice_rgb.astype(np.uint8))
+        tensors.append(legacy_transform(pil_image))
+    return torch.stack(tensors)
+
+
+def tensor_preprocess(processor, image_3d: np.ndarray, num_slices: int) -> torch.Tensor:
+    """Current implementation: indexed selection, broadcast channels, batched interpolate"""
+    return processor.preprocess_slices(processor.extract_brain_slices(image_3d, num_slices=num_slices))
+
+
+def trace_allocations(fn) -> dict:
+    """Run fn once under tracemalloc and report peak bytes and allocated blocks"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del result
+    new_blocks = sum(stat.count_diff for stat in after.compare_to(before, "lineno") if stat.count_diff > 0)
+    return {"peak_traced_bytes": peak, "allocated_blocks": new_blocks}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Slice preprocessing benchmark")
+    parser.add_argument("--shape", type=int, nargs=3, default=[256, 256, 128])
+    parser.add_argument("--slices", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    processor = build_processor()
+    volume = np.random.default_rng(0).integers(0, 255, tuple(args.shape), dtype=np.uint8)
+
+    legacy = lambda: legacy_preprocess(volume, args.slices)  # noqa: E731
+    current = lambda: tensor_preprocess(processor, volume, args.slices)  # noqa: E731
+
+    results = {
+        "shape": args.shape,
+        "slices": args.slices,
+        "legacy_pil": {**time_call(legacy, repeats=args.repeats), **trace_allocations(legacy)},
+        "tensor_native": {**time_call(current, repeats=args.repeats), **trace_allocations(current)},
+        "max_abs_diff": float((legacy() - current()).abs().max()),
+    }
+    results["speedup"] = results["legacy_pil"]["best_s"] / results["tensor_native"]["best_s"]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cost of profiling one comparison
+
+Times process_mr_comparison on a phantom pair without profiling, under
+cProfile, under the torch profiler and under both, and reports the slowdown
+and the size of the artifacts each capture writes. Caches are disabled so
+every run does the full work.
+
+Usage: python benchmarks/bench_profiling.py [--shape 128 128 64]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from common import build_processor, time_call
+from feature_cache import FeatureCache
+from heatmap_cache import HeatmapCache
+from phantoms import make_phantom, write_nifti
+from profiling import ProfileStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request profiling overhead benchmark")
+    parser.add_argument("--shape", type=int, nargs=3, default=[128, 128, 64])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--pretrained", action="store_true")
+    args = parser.parse_args()
+
+    processor = build_processor(
+        pretrained=args.pretrained,
+        feature_cache=FeatureCache(memory_entries=0),
+        heatmap_cache=HeatmapCache(memory_bytes=0),
+        transform_cache=FeatureCache(memory_entries=0),
+    )
+    shape = tuple(args.shape)
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [write_nifti(os.path.join(directory, f"scan{seed}.nii"), make_phantom(shape, seed=seed),
+                             dtype=np.int16) for seed in (1, 2)]
+        store = ProfileStore(os.path.join(directory, "profiles"), ("cprofile", "torch"), keep=1)
+        plain_s = time_call(lambda: processor.process_mr_comparison(*paths), repeats=args.repeats)["best_s"]
+        rows.append({"profilers": [], "best_s": round(plain_s, 3), "slowdown": 1.0})
+        for profilers in (("cprofile",), ("torch",), ("cprofile", "torch")):
+            best_s = time_call(lambda: store.capture(profilers, "bench", processor.process_mr_comparison, *paths),
+                               repeats=args.repeats)["best_s"]
+            [meta] = store.list()
+            rows.append({
+                "profilers": list(profilers),
+                "best_s": round(best_s, 3),
+                "slowdown": round(best_s / plain_s, 2),
+                "artifact_kib": {name: round(size / 1024, 1) for name, size in meta["artifacts"].items()},
+            })
+    print(json.dumps({"shape": args.shape, "results": rows}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark progress streaming to many subscribers
+
+Opens --subscribers progress streams on one event loop for a single task,
+then writes --updates progress snapshots from a job thread as a job engine
+would. Reports delivery latency from store write to subscriber (woken via
+notify, as for jobs of the same worker, and via polling only, as for jobs of
+other workers), thread count and memory per subscriber.
+
+Usage: python benchmarks/bench_progress_stream.py [--subscribers 500] [--updates 20]
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import threading
+import time
+
+import common
+from progress_stream import ProgressHub
+from task_store import SQLiteTaskStore, STATUS_DONE
+
+
+async def run(store: SQLiteTaskStore, task_id: str, subscribers: int, updates: int, notify: bool,
+              poll_interval: float):
+    hub = ProgressHub(store, poll_interval=poll_interval, max_subscribers=subscribers)
+    written: dict = {}
+    latencies = []
+
+    async def watch():
+        async for record in hub.subscribe(task_id):
+            if record is not None and record['version'] in written:
+                latencies.append(time.perf_counter() - written[record['version']])
+
+    def job():
+        for i in range(updates):
+            time.sleep(0.02)
+            written[store.versions([task_id])[task_id] + 1] = time.perf_counter()
+            store.update_progress(task_id, "bench:0:0", {'last_stage': f"stage_{i}"})
+            if notify:
+                hub.notify(task_id)
+        written[store.versions([task_id])[task_id] + 1] = time.perf_counter()
+        store.complete(task_id, "bench:0:0", STATUS_DONE, result={})
+        if notify:
+            hub.notify(task_id)
+
+    rss_before = common.current_rss_kib()
+    watchers = [asyncio.ensure_future(watch()) for _ in range(subscribers)]
+    while hub.subscriber_count < subscribers:
+        await asyncio.sleep(0.005)
+    threads = threading.active_count()
+    rss_open = common.current_rss_kib()
+    worker = threading.Thread(target=job)
+    worker.start()
+    await asyncio.gather(*watchers)
+    worker.join()
+
+    latencies.sort()
+    return {
+        "deliveries": len(latencies),
+        "latency_p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "latency_p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+        "threads_while_open": threads,
+        "kb_per_subscriber": round((rss_open - rss_before) / subscribers, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Progress streaming benchmark")
+    parser.add_argument("--subscribers", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=20)
+    parser.add_argument("--poll-ms", type=int, default=250)
+    args = parser.parse_args()
+
+    report = {"subscribers": args.subscribers, "updates": args.updates, "poll_ms": args.poll_ms}
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteTaskStore(directory)
+        for mode, notify in (("same_worker", True), ("other_worker", False)):
+            task_id = f"task_{mode}"
+            store.create(task_id, {"mr_id": "mr-1"}, max_queued=4)
+            store.claim("bench:0:0")
+            report[mode] = asyncio.run(run(store, task_id, args.subscribers, args.updates, notify,
+                                           args.poll_ms / 1000.0))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
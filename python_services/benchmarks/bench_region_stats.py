@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-region voxel statistics: one vectorized pass vs a loop per region
+
+Two label sources on the same volume:
+- the processor's ROI boxes (overlapping, so the volume is split into atoms)
+- a synthetic atlas with --labels non-overlapping labels, where the loop
+  baseline is one boolean mask per label
+
+Label map construction is timed separately; it is cached per volume shape.
+
+Usage: python benchmarks/bench_region_stats.py [--shape 256 256 256] [--labels 300]
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from common import time_call
+from brain_regions import BRAIN_REGIONS
+from region_stats import RegionStatistics, atlas_label_map, box_label_map, otsu_threshold
+
+
+def best_ms(fn, repeats: int, warmup: int = 1) -> float:
+    return round(time_call(fn, repeats=repeats, warmup=warmup)["best_s"] * 1000, 1)
+
+
+def loop_boxes(volume: np.ndarray, threshold: float) -> dict:
+    """Previous approach: slice and reduce each ROI box on its own"""
+    stats = {}
+    for name, info in BRAIN_REGIONS.items():
+        c = info['roi_coords']
+        box = volume[c[0]:c[1], c[2]:c[3], c[4]:c[5]].astype(np.float64)
+        stats[name] = (box.size, box.mean(), box.std(), int((box > threshold).sum()))
+    return stats
+
+
+def loop_atlas(volume: np.ndarray, atlas: np.ndarray, threshold: float) -> dict:
+    """Per-label boolean mask over the whole volume"""
+    stats = {}
+    for label in np.unique(atlas[atlas > 0]):
+        voxels = volume[atlas == label].astype(np.float64)
+        stats[int(label)] = (voxels.size, voxels.mean(), voxels.std(), int((voxels > threshold).sum()))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized region statistics benchmark")
+    parser.add_argument("--shape", type=int, nargs=3, default=[256, 256, 256])
+    parser.add_argument("--labels", type=int, default=300)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--skip-atlas-loop", action="store_true", help="the per-label loop takes minutes on 256^3")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    shape = tuple(args.shape)
+    volume = rng.uniform(0, 255, shape).astype(np.float32)
+    atlas = rng.integers(0, args.labels + 1, shape, dtype=np.int32)
+    threshold = otsu_threshold(volume)
+    engine = RegionStatistics()
+
+    report = {"shape": list(shape), "atlas_labels": args.labels}
+    report["otsu_threshold_ms"] = best_ms(lambda: otsu_threshold(volume), args.repeats)
+    report["box_label_map_ms"] = best_ms(lambda: box_label_map(BRAIN_REGIONS, shape), args.repeats)
+    engine.label_map(BRAIN_REGIONS, shape)
+    report["boxes_vectorized_ms"] = best_ms(
+        lambda: engine.compute(volume, BRAIN_REGIONS, tissue_threshold=threshold), args.repeats)
+    report["boxes_loop_ms"] = best_ms(lambda: loop_boxes(volume, threshold), args.repeats)
+
+    label_map = atlas_label_map(atlas)
+    report["atlas_label_map_ms"] = best_ms(lambda: atlas_label_map(atlas), args.repeats)
+    report["atlas_vectorized_ms"] = best_ms(
+        lambda: engine.compute(volume, label_map=label_map, tissue_threshold=threshold), args.repeats)
+    if not args.skip_atlas_loop:
+        report["atlas_loop_ms"] = best_ms(lambda: loop_atlas(volume, atlas, threshold), repeats=1, warmup=0)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark longitudinal comparison: one series call vs pairwise comparisons
+
+For a series of N NIfTI scans the dashboard needs N-1 consecutive and N-1
+baseline-relative deltas. The pairwise approach calls process_mr_comparison
+for each of them (every call decodes and, without a warm feature cache, runs
+ResNet50 on both scans again); process_series_comparison handles each scan
+once. The feature cache is disabled so both sides pay for inference.
+
+Usage: python benchmarks/bench_series_comparison.py [--scans 2 5 10] [--shape 192 192 96]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from common import build_processor
+from feature_cache import FeatureCache
+from phantoms import make_phantom, write_nifti
+
+
+def pairwise(processor, paths):
+    for index in range(1, len(paths)):
+        processor.process_mr_comparison(paths[index - 1], paths[index])
+        if index > 1:
+            processor.process_mr_comparison(paths[0], paths[index])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Series vs pairwise comparison benchmark")
+    parser.add_argument("--scans", type=int, nargs="+", default=[2, 5, 10])
+    parser.add_argument("--shape", type=int, nargs=3, default=[192, 192, 96])
+    parser.add_argument("--pretrained", action="store_true")
+    args = parser.parse_args()
+
+    processor = build_processor(pretrained=args.pretrained, feature_cache=FeatureCache(memory_entries=0))
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [
+            write_nifti(os.path.join(directory, f"scan{i}.nii"), make_phantom(tuple(args.shape), seed=i), dtype=np.int16)
+            for i in range(max(args.scans))
+        ]
+        processor.process_series_comparison(paths[:2])  # warm-up
+        for count in args.scans:
+            start = time.perf_counter()
+            processor.process_series_comparison(paths[:count])
+            series_s = time.perf_counter() - start
+            start = time.perf_counter()
+            pairwise(processor, paths[:count])
+            pairwise_s = time.perf_counter() - start
+            results.append({
+                "scans": count,
+                "series_s": round(series_s, 2),
+                "series_per_scan_s": round(series_s / count, 2),
+                "pairwise_s": round(pairwise_s, 2),
+                "speedup": round(pairwise_s / series_s, 2),
+            })
+    print(json.dumps({"shape": args.shape, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
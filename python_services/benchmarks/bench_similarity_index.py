@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark the scan similarity index
+
+Adds --scans synthetic 2048-d feature vectors (clustered, like scans of
+similar anatomy), then measures exact and IVF top-10 search latency, IVF
+recall against exact search, filtered search by patient and by hospital, and
+quantizer training time.
+
+Usage: python benchmarks/bench_similarity_index.py [--scans 100000] [--dtype float32] [--queries 50]
+"""
+
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+import common
+from similarity_index import SimilarityIndex
+
+
+def latencies_ms(search, queries) -> dict:
+    durations = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        durations.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": round(common.percentile(durations, 50), 2), "p99_ms": round(common.percentile(durations, 99), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Similarity index benchmark")
+    parser.add_argument("--scans", type=int, default=100000)
+    parser.add_argument("--dtype", default="float32", choices=("float32", "float16"))
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--nprobe", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((256, 2048)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as directory:
+        # Training is timed explicitly below instead of starting in the background
+        index = SimilarityIndex(directory, dtype=args.dtype, approximate_min_rows=0, nprobe=args.nprobe)
+        start = time.perf_counter()
+        for i in range(args.scans):
+            vector = centers[i % len(centers)] + 0.8 * rng.standard_normal(2048).astype(np.float32)
+            index.add(f"mr-{i}", vector, content_hash=f"hash-{i}", patient_id=f"patient-{i // 4}",
+                      hospital_id=f"hospital-{i % 20}")
+        add_s = time.perf_counter() - start
+
+        picks = rng.choice(args.scans, args.queries, replace=False)
+        queries = [index.vector(f"mr-{i}") + 0.05 * rng.standard_normal(2048).astype(np.float32) for i in picks]
+        exact = [index.search(query, k=10, mode="exact") for query in queries]
+        report = {
+            "scans": args.scans,
+            "dtype": args.dtype,
+            "vector_mb": round(index.stats()["vector_bytes"] / 2 ** 20),
+            "add_per_s": round(args.scans / add_s),
+            "exact": latencies_ms(lambda q: index.search(q, k=10, mode="exact"), queries),
+            "patient_filter": latencies_ms(lambda q: index.search(q, k=10, patient_id="patient-7"), queries),
+        }
+
+        start = time.perf_counter()
+        index.train()
+        report["train_s"] = round(time.perf_counter() - start, 1)
+        report["ivf_lists"] = index.stats()["ivf_lists"]
+        approximate = [index.search(query, k=10, mode="approximate") for query in queries]
+        report["approximate"] = latencies_ms(lambda q: index.search(q, k=10, mode="approximate"), queries)
+        report["approximate"]["scanned_mean"] = round(float(np.mean([a["scanned"] for a in approximate])))
+        report["approximate"]["recall_at_10"] = round(float(np.mean([
+            len({r["scan_id"] for r in e["results"]} & {r["scan_id"] for r in a["results"]}) / 10
+            for e, a in zip(exact, approximate)
+        ])), 3)
+        report["hospital_filter"] = latencies_ms(
+            lambda q: index.search(q, k=10, hospital_id="hospital-3", mode="approximate"), queries
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
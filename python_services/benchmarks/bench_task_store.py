@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark the shared SQLite task store
+
+Queues --tasks no-op tasks, then lets --processes forked processes claim and
+complete them concurrently, as server workers would. Reports submit and
+claim/complete throughput, status-poll latency while the workers run, and
+checks that every task ran exactly once.
+
+Usage: python benchmarks/bench_task_store.py [--tasks 5000] [--processes 4]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the service directory on sys.path)
+from task_store import SQLiteTaskStore, STATUS_DONE
+
+
+def drain(directory: str, index: int, claimed):
+    store = SQLiteTaskStore(directory)
+    worker = f"bench:{os.getpid()}:{index}"
+    count = 0
+    while True:
+        task = store.claim(worker)
+        if task is None:
+            break
+        store.complete(task["task_id"], worker, STATUS_DONE, result={"worker": index})
+        count += 1
+    claimed[index] = count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared task store benchmark")
+    parser.add_argument("--tasks", type=int, default=5000)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteTaskStore(directory)
+        start = time.perf_counter()
+        for i in range(args.tasks):
+            store.create(f"task_{i}", {"mr_id": f"mr-{i}", "file_path": f"/scans/{i}.nii"}, args.tasks)
+        submit_s = time.perf_counter() - start
+
+        claimed = multiprocessing.Manager().dict()
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=drain, args=(directory, i, claimed)) for i in range(args.processes)]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        polls = []
+        while any(process.is_alive() for process in processes):
+            poll_start = time.perf_counter()
+            store.get(f"task_{len(polls) % args.tasks}")
+            polls.append(time.perf_counter() - poll_start)
+            time.sleep(0.001)
+        for process in processes:
+            process.join()
+        drain_s = time.perf_counter() - start
+
+        counts = store.counts()
+        polls.sort()
+        print(json.dumps({
+            "tasks": args.tasks,
+            "processes": args.processes,
+            "submit_per_s": round(args.tasks / submit_s),
+            "claim_complete_per_s": round(args.tasks / drain_s),
+            "claimed_per_process": [claimed[i] for i in range(args.processes)],
+            "done": counts[STATUS_DONE],
+            "ran_exactly_once": sum(claimed.values()) == args.tasks == counts[STATUS_DONE],
+            "poll_p50_ms": round(polls[len(polls) // 2] * 1000, 3) if polls else None,
+            "poll_p99_ms": round(polls[int(len(polls) * 0.99)] * 1000, 3) if polls else None,
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
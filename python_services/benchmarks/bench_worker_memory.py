@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Multi-worker memory and drain benchmark for serve.py
+
+Starts `serve.py --workers N` with an offline (untrained) weight bundle and
+reports per-worker memory from /proc/<pid>/smaps_rollup, once idle (model
+inherited from the master) and once every worker has run inference (adds the
+activation working set the allocator keeps, not a weight copy):
+- private_mib: memory only this worker uses (what each extra worker costs)
+- pss_mib: proportional share, shared pages divided between the processes
+- shared_mib: pages shared with the master and the other workers
+
+The ResNet50 weight size is printed for comparison. Then SIGTERM is sent
+while a comparison is in flight, and the benchmark checks that the
+comparison still completes (graceful drain).
+
+Usage: python benchmarks/bench_worker_memory.py [--workers 2]
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import numpy as np
+
+from common import SERVICE_DIR, write_untrained_bundle
+from phantoms import make_phantom, write_nifti, write_png
+
+
+def smaps_mib(pid: int) -> dict:
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1])
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    shared = fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)
+    return {
+        "rss_mib": round(fields.get("Rss", 0) / 1024, 1),
+        "pss_mib": round(fields.get("Pss", 0) / 1024, 1),
+        "private_mib": round(private / 1024, 1),
+        "shared_mib": round(shared / 1024, 1),
+    }
+
+
+def wait_for_health(client: httpx.Client, base: str, timeout: float):
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            if client.get(f"{base}/health").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise TimeoutError("service did not come up")
+
+
+def warm_all_workers(base: str, image_path: str, workers: int, rounds: int = 5):
+    """Send rounds of concurrent inference requests so every worker accepts some"""
+    def request():
+        with httpx.Client(timeout=120) as client, open(image_path, "rb") as f:
+            client.post(f"{base}/process-single-mr", files={"file": ("scan.png", f, "image/png")}).raise_for_status()
+
+    for _ in range(rounds):
+        threads = [threading.Thread(target=request) for _ in range(2 * workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+def worker_memory(master_pid: int) -> dict:
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        return {int(pid): smaps_mib(int(pid)) for pid in f.read().split()}
+
+
+def check_drain(server: subprocess.Popen, base: str, mr_path: str) -> dict:
+    """SIGTERM the master mid-comparison and report whether the comparison completed"""
+    outcome = {}
+
+    def compare():
+        try:
+            with httpx.Client(timeout=120) as client:
+                response = client.post(f"{base}/compare-mrs", params={"mr1_path": mr_path, "mr2_path": mr_path})
+            outcome["status_code"] = response.status_code
+        except httpx.HTTPError as e:
+            outcome["error"] = repr(e)
+
+    thread = threading.Thread(target=compare)
+    thread.start()
+    time.sleep(0.5)
+    signalled = time.perf_counter()
+    server.send_signal(signal.SIGTERM)
+    thread.join()
+    server.wait(timeout=120)
+    return {
+        "comparison_completed": outcome.get("status_code") == 200,
+        "comparison": outcome,
+        "master_exit_s": round(time.perf_counter() - signalled, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serve.py per-worker memory and drain benchmark")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        bundle = os.path.join(directory, "resnet50.pt")
+        write_untrained_bundle(bundle)
+        image_path = write_png(os.path.join(directory, "scan.png"), make_phantom((256, 256, 8)))
+        mr_path = write_nifti(os.path.join(directory, "scan.nii"), make_phantom((192, 192, 96)), dtype=np.int16)
+
+        env = dict(os.environ, MRSINA_WEIGHTS_BUNDLE=bundle, MRSINA_FEATURE_CACHE_DIR="",
+                   MRSINA_FEATURE_CACHE_MEMORY_ENTRIES="0", MRSINA_MICRO_BATCH_WAIT_MS="0")
+        server = subprocess.Popen(
+            [sys.executable, "serve.py", "--workers", str(args.workers), "--port", str(args.port)],
+            cwd=SERVICE_DIR, env=env
+        )
+        base = f"http://127.0.0.1:{args.port}"
+        try:
+            with httpx.Client(timeout=args.timeout) as client:
+                wait_for_health(client, base, args.timeout)
+            time.sleep(1.0)
+            idle = worker_memory(server.pid)
+            warm_all_workers(base, image_path, args.workers)
+            report = {
+                "workers": args.workers,
+                "resnet50_weights_mib": round(os.path.getsize(bundle) / 2 ** 20, 1),
+                "master": smaps_mib(server.pid),
+                "per_worker_idle": idle,
+                "per_worker_after_inference": worker_memory(server.pid),
+            }
+            report["drain"] = check_drain(server, base, mr_path)
+        finally:
+            if server.poll() is None:
+                server.kill()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Shared helpers for the benchmark scripts
+"""
+
+import os
+import sys
+import time
+from typing import Callable, Dict, List
+from unittest import mock
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+import brain_mri_processor  # noqa: E402
+from brain_mri_processor import BrainMRIProcessor  # noqa: E402
+
+
+def build_processor(pretrained: bool = False, **kwargs) -> BrainMRIProcessor:
+    """
+    Build a processor for benchmarking
+    Timings do not depend on the weight values, so by default an untrained
+    ResNet50 is used and no weights are downloaded
+    """
+    if pretrained:
+        return BrainMRIProcessor(**kwargs)
+
+    from torchvision.models import resnet50
+
+    with mock.patch.object(brain_mri_processor, "resnet50", lambda weights=None: resnet50(weights=None)):
+        return BrainMRIProcessor(**kwargs)
+
+
+def load_service_app(pretrained: bool = False):
+    """Import main.py and build its processor up front for in-process load tests"""
+    import main
+
+    if pretrained:
+        main.models.get()
+        return main
+
+    from torchvision.models import resnet50
+
+    with mock.patch.object(brain_mri_processor, "resnet50", lambda weights=None: resnet50(weights=None)):
+        main.models.get()
+    return main
+
+
+def write_untrained_bundle(path: str):
+    """Offline weight bundle of an untrained feature extractor (for out-of-process benchmarks)"""
+    from torchvision.models import resnet50
+
+    from weight_bundle import write_bundle
+
+    with mock.patch.object(brain_mri_processor, "resnet50", lambda weights=None: resnet50(weights=None)):
+        model = brain_mri_processor.build_feature_extractor(weights=None)
+    write_bundle(path, model.state_dict(), brain_mri_processor.MODEL_VERSION, source="untrained (benchmark)")
+
+
+def reset_peak_rss() -> bool:
+    """Reset this process's RSS high-water mark (Linux); False when it cannot be reset"""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_kib() -> int:
+    """This process's RSS high-water mark in KiB (VmHWM, or ru_maxrss where /proc is missing)"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def current_rss_kib() -> int:
+    """This process's current RSS in KiB (0 where /proc is missing)"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def time_call(fn: Callable[[], object], repeats: int = 3, warmup: int = 1) -> Dict[str, float]:
+    """Time a callable and return best/mean wall time in seconds"""
+    for _ in range(warmup):
+        fn()
+    durations: List[float] = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return {
+        "best_s": min(durations),
+        "mean_s": sum(durations) / len(durations),
+    }
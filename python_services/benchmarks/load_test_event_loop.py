@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Load test: /health latency while /compare-mrs requests are running
+
+Fires concurrent comparisons at the in-process FastAPI app and polls /health
+at a fixed rate, then reports p50/p99/max /health latency and the longest gap
+between polls (time the event loop was unavailable). With --inline the
+comparisons run directly on the event loop (the behaviour before the
+inference executor), which shows the latency spike the executor removes.
+
+Usage: python benchmarks/load_test_event_loop.py [--comparisons 4] [--inline]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import httpx
+import nibabel as nib
+import numpy as np
+
+from common import load_service_app, percentile
+
+
+def write_phantoms(directory: str, shape) -> list:
+    """Two random NIfTI volumes to compare"""
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(2):
+        path = os.path.join(directory, f"phantom_{i}.nii")
+        nib.save(nib.Nifti1Image(rng.integers(0, 255, shape).astype(np.float32), np.eye(4)), path)
+        paths.append(path)
+    return paths
+
+
+async def run_load(app, mr_paths, comparisons: int, poll_interval: float):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+        async def compare():
+            response = await client.post("/compare-mrs", params={"mr1_path": mr_paths[0], "mr2_path": mr_paths[1]})
+            response.raise_for_status()
+
+        started = time.perf_counter()
+        heavy = [asyncio.ensure_future(compare()) for _ in range(comparisons)]
+        health_latencies = []
+        poll_gaps = []
+        last_poll = time.perf_counter()
+        while not all(task.done() for task in heavy):
+            start = time.perf_counter()
+            (await client.get("/health")).raise_for_status()
+            health_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(poll_interval)
+            # Time between polls includes any stretch where the event loop was blocked
+            poll_gaps.append(time.perf_counter() - last_poll)
+            last_poll = time.perf_counter()
+        await asyncio.gather(*heavy)
+        return health_latencies, poll_gaps, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event-loop responsiveness under comparison load")
+    parser.add_argument("--comparisons", type=int, default=4)
+    parser.add_argument("--shape", type=int, nargs=3, default=[128, 128, 64])
+    parser.add_argument("--poll-interval", type=float, default=0.02)
+    parser.add_argument("--inline", action="store_true", help="run comparisons on the event loop (old behaviour)")
+    args = parser.parse_args()
+
+    service = load_service_app()
+    if args.inline:
+        async def run_inline(fn, *fn_args, **fn_kwargs):
+            return fn(*fn_args, **fn_kwargs)
+        service.inference_executor.run = run_inline
+    # Every request should pay for inference, so keep the feature cache out of the way
+    service.models.processor.feature_cache.memory_entries = 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        mr_paths = write_phantoms(directory, tuple(args.shape))
+        latencies, poll_gaps, wall = asyncio.run(run_load(service.app, mr_paths, args.comparisons, args.poll_interval))
+
+    print(json.dumps({
+        "mode": "inline" if args.inline else "executor",
+        "comparisons": args.comparisons,
+        "wall_s": round(wall, 3),
+        "health_requests": len(latencies),
+        "health_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "health_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "health_max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+        "max_poll_gap_ms": round(max(poll_gaps) * 1000, 2) if poll_gaps else 0.0,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Synthetic MRI phantoms for benchmarks and tests
+A phantom is a smooth ellipsoidal "brain" with a few brighter inner
+structures plus noise, written as a DICOM series, NIfTI volume or PNG slice
+"""
+
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+def make_phantom(shape: Tuple[int, int, int], seed: int = 0, max_value: float = 1000.0) -> np.ndarray:
+    """(H, W, D) float32 phantom volume with values in [0, max_value]"""
+    rng = np.random.default_rng(seed)
+    grids = np.ogrid[tuple(slice(0, n) for n in shape)]
+    centre = [n / 2.0 for n in shape]
+    radius = sum(((g - c) / (0.42 * n)) ** 2 for g, c, n in zip(grids, centre, shape))
+    volume = np.where(radius <= 1.0, 0.6, 0.0).astype(np.float32)
+    for offset in (-0.18, 0.18):
+        inner = sum(((g - c - (offset * n if axis == 0 else 0)) / (0.1 * n)) ** 2
+                    for axis, (g, c, n) in enumerate(zip(grids, centre, shape)))
+        volume[inner <= 1.0] = 0.9
+    volume += rng.normal(0.0, 0.03, size=shape).astype(np.float32)
+    np.clip(volume, 0.0, 1.0, out=volume)
+    return volume * max_value
+
+
+def make_asymmetric_phantom(shape: Tuple[int, int, int], seed: int = 0, max_value: float = 1000.0) -> np.ndarray:
+    """
+    make_phantom() plus three bright off-centre blobs
+    The plain phantom is nearly symmetric, so rotations about some axes barely
+    change it; the blobs make every rotation observable (registration tests)
+    """
+    volume = make_phantom(shape, seed=seed, max_value=max_value)
+    grids = np.ogrid[tuple(slice(0, n) for n in shape)]
+    for centre, radius in [((0.35, 0.6, 0.4), 0.08), ((0.6, 0.35, 0.6), 0.06), ((0.45, 0.7, 0.7), 0.07)]:
+        blob = sum(((g - c * n) / (radius * n)) ** 2 for g, c, n in zip(grids, centre, shape)) <= 1.0
+        volume[blob] = 0.95 * max_value
+    return volume
+
+
+def write_dicom_series(directory: str, volume: np.ndarray, series_uid: Optional[str] = None,
+                       slope: float = 1.0, intercept: float = 0.0, shuffle_names: bool = True,
+                       spacing: Tuple[float, float, float] = (1.0, 1.0, 1.0)) -> List[str]:
+    """
+    Write an (H, W, D) volume as one uint16 DICOM file per slice
+    Stored values are (volume - intercept) / slope so the loader's rescale
+    recovers the volume. File names are shuffled by default so loaders must
+    sort by geometry rather than name. `spacing` is the (row, column, slice) spacing in mm
+    """
+    import pydicom
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, MRImageStorage, generate_uid
+
+    os.makedirs(directory, exist_ok=True)
+    series_uid = series_uid or generate_uid()
+    study_uid = generate_uid()
+    depth = volume.shape[2]
+    order = np.random.default_rng(1).permutation(depth) if shuffle_names else np.arange(depth)
+    paths = []
+    for z in range(depth):
+        meta = FileMetaDataset()
+        meta.MediaStorageSOPClassUID = MRImageStorage
+        meta.MediaStorageSOPInstanceUID = generate_uid()
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+        ds = Dataset()
+        ds.file_meta = meta
+        ds.SOPClassUID = MRImageStorage
+        ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+        ds.StudyInstanceUID = study_uid
+        ds.SeriesInstanceUID = series_uid
+        ds.Modality = 'MR'
+        ds.InstanceNumber = z + 1
+        ds.ImagePositionPatient = [0.0, 0.0, float(z * spacing[2])]
+        ds.ImageOrientationPatient = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0]
+        ds.Rows, ds.Columns = volume.shape[0], volume.shape[1]
+        ds.PixelSpacing = [spacing[0], spacing[1]]
+        ds.SliceThickness = spacing[2]
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = 'MONOCHROME2'
+        ds.BitsAllocated = 16
+        ds.BitsStored = 16
+        ds.HighBit = 15
+        ds.PixelRepresentation = 0
+        ds.RescaleSlope = slope
+        ds.RescaleIntercept = intercept
+        stored = np.round((volume[:, :, z] - intercept) / slope).astype(np.uint16)
+        ds.PixelData = stored.tobytes()
+
+        path = os.path.join(directory, f"IM{order[z]:05d}")
+        pydicom.dcmwrite(path, ds, enforce_file_format=True)
+        paths.append(path)
+    return paths
+
+
+def write_nifti(path: str, volume: np.ndarray, dtype=np.int16,
+                spacing: Tuple[float, float, float] = (1.0, 1.0, 1.0)) -> str:
+    """Write an (H, W, D) volume with `spacing` mm voxels as an uncompressed or gzipped NIfTI file"""
+    import nibabel as nib
+
+    nib.save(nib.Nifti1Image(volume.astype(dtype), np.diag([*spacing, 1.0])), path)
+    return path
+
+
+def write_png(path: str, volume: np.ndarray) -> str:
+    """Write the middle axial slice of a volume as an 8-bit PNG"""
+    import cv2
+
+    middle = volume[:, :, volume.shape[2] // 2]
+    scaled = (middle / max(float(middle.max()), 1e-6) * 255).astype(np.uint8)
+    cv2.imwrite(path, scaled)
+    return path
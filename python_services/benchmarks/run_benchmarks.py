@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Stage-level benchmark suite for process_mr_comparison
+
+Writes baseline and follow-up phantoms (the follow-up shifted by a few voxels
+and with fresh noise) as DICOM series, NIfTI volumes and PNG slices at several
+sizes, then times each stage of the comparison pipeline on its own:
+
+    hash, load, register, slice, preprocess, features, volumetrics,
+    region_stats, attention_map, heatmap, end_to_end
+
+Every stage runs once as warm-up and then `--repeats` times. Its wall time
+(best and mean), peak RSS growth over the RSS at stage start, and throughput
+are recorded. All caches are disabled, so every repeat does the full work.
+NIfTI volumes are read lazily: their `load` stage only opens the files and
+the reads are charged to the stages that touch the voxels.
+
+Record a baseline, then compare a later run against it:
+
+    python benchmarks/run_benchmarks.py --save baseline.json
+    python benchmarks/run_benchmarks.py --compare baseline.json
+
+A compare run uses the sizes and formats of the baseline unless given. It
+exits with status 1 when any stage got slower than `--tolerance` (relative)
+and `--min-seconds` (absolute), or when its peak RSS grew by more than
+`--memory-tolerance` and `--min-mib`.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import torch
+from scipy import ndimage
+
+from common import build_processor, current_rss_kib, peak_rss_kib, reset_peak_rss
+from feature_cache import FeatureCache, hash_file
+from heatmap_cache import HeatmapCache
+from phantoms import make_phantom, write_dicom_series, write_nifti, write_png
+
+SIZES = {
+    "small": (128, 128, 64),
+    "medium": (256, 256, 128),
+    "large": (256, 256, 256),
+}
+FORMATS = ("dicom", "nifti", "png")
+FOLLOW_UP_SHIFT = (2.0, -1.5, 1.0)
+BASELINE_FORMAT = 1
+
+
+def write_case(directory: str, image_format: str, shape) -> List[str]:
+    """Baseline and follow-up phantoms of one format and size"""
+    baseline = make_phantom(shape, seed=1)
+    follow_up = ndimage.shift(make_phantom(shape, seed=2), FOLLOW_UP_SHIFT, order=1)
+    paths = []
+    for name, volume in (("baseline", baseline), ("follow_up", follow_up)):
+        if image_format == "dicom":
+            path = os.path.join(directory, name)
+            write_dicom_series(path, volume)
+        elif image_format == "nifti":
+            path = write_nifti(os.path.join(directory, f"{name}.nii"), volume, dtype=np.int16)
+        else:
+            path = write_png(os.path.join(directory, f"{name}.png"), volume)
+        paths.append(path)
+    return paths
+
+
+def path_bytes(path: str) -> int:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+
+def measure(fn: Callable[[], object], repeats: int, work: float, unit: str) -> Dict:
+    """
+    Warm up once, then time `repeats` calls
+    Peak RSS is the high-water mark over the timed calls minus the RSS before
+    them; throughput is `work` per best-time second
+    """
+    result = fn()
+    durations = []
+    rss_start = current_rss_kib()
+    peak_reset = reset_peak_rss()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - start)
+    best = min(durations)
+    stats = {
+        "best_s": round(best, 5),
+        "mean_s": round(sum(durations) / len(durations), 5),
+        "peak_rss_mib": round(max(0, peak_rss_kib() - rss_start) / 1024, 1) if peak_reset else None,
+        "throughput": round(work / best, 3) if best > 0 else None,
+        "throughput_unit": unit,
+    }
+    return {"stats": stats, "result": result}
+
+
+def run_case(processor, paths: List[str], repeats: int) -> Dict[str, Dict]:
+    """Time every pipeline stage on one baseline/follow-up pair"""
+    stages: Dict[str, Dict] = {}
+
+    def stage(name: str, fn: Callable[[], object], work: float, unit: str):
+        measured = measure(fn, repeats, work, unit)
+        stages[name] = measured["stats"]
+        return measured["result"]
+
+    file_mb = sum(path_bytes(path) for path in paths) / 1e6
+    hashes = stage("hash", lambda: [hash_file(path) for path in paths], file_mb, "MB/s")
+    image1, image2 = stage("load", lambda: [processor.load_dicom_image(path) for path in paths], file_mb, "MB/s")
+    megavoxels = 2 * float(np.prod(image1.shape)) / 1e6
+
+    def register():
+        processor.registration.transform_cache = FeatureCache(memory_entries=0)
+        return processor.align_scans(image1, image2, hashes)
+
+    aligned, _, _ = stage("register", register, megavoxels, "Mvoxel/s")
+    groups = stage("slice", lambda: [processor.extract_brain_slices(image) for image in (image1, aligned)],
+                   2 * processor.slice_count(image1), "slices/s")
+    slice_total = sum(len(group) for group in groups)
+    batch = stage("preprocess", lambda: torch.cat([processor.preprocess_slices(group) for group in groups]),
+                  slice_total, "slices/s")
+
+    def features():
+        with torch.inference_mode():
+            return [part.mean(dim=0, keepdim=True)
+                    for part in torch.split(processor._forward_batches(batch), [len(g) for g in groups])]
+
+    features1, features2 = stage("features", features, slice_total, "slices/s")
+    stage("volumetrics", lambda: processor.analyze_volumetric_changes(features1, features2), 1, "pairs/s")
+    stage("region_stats", lambda: processor.compute_region_statistics(image1, aligned), megavoxels, "Mvoxel/s")
+    attention = stage("attention_map", lambda: processor._generate_attention_map(image1, aligned),
+                      megavoxels, "Mvoxel/s")
+    image_slice, _ = processor._heatmap_slice(image1, None)
+    stage("heatmap", lambda: processor.encode_heatmap(processor.generate_heatmap(image_slice, attention)),
+          1, "images/s")
+
+    def end_to_end():
+        processor.registration.transform_cache = FeatureCache(memory_entries=0)
+        result = processor.process_mr_comparison(*paths)
+        if result["analysis_status"] != "TAMAMLANDI":
+            raise RuntimeError(result.get("error_message"))
+        return result
+
+    stage("end_to_end", end_to_end, 1, "comparisons/s")
+    return stages
+
+
+def host_info() -> Dict:
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "torch": torch.__version__,
+    }
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float, min_seconds: float,
+            memory_tolerance: float, min_mib: float) -> Dict:
+    """Per-stage ratios against a baseline and the list of regressions"""
+    rows, regressions = [], []
+    for case, stages in current["cases"].items():
+        base_stages = baseline.get("cases", {}).get(case)
+        if base_stages is None:
+            continue
+        for name, stats in stages.items():
+            base = base_stages.get(name)
+            if base is None:
+                continue
+            row = {
+                "case": case,
+                "stage": name,
+                "best_s": stats["best_s"],
+                "baseline_best_s": base["best_s"],
+                "time_ratio": round(stats["best_s"] / base["best_s"], 3) if base["best_s"] > 0 else None,
+                "peak_rss_mib": stats["peak_rss_mib"],
+                "baseline_peak_rss_mib": base["peak_rss_mib"],
+                "regressed": [],
+            }
+            if stats["best_s"] > base["best_s"] * (1 + tolerance) and stats["best_s"] - base["best_s"] > min_seconds:
+                row["regressed"].append("time")
+            if stats["peak_rss_mib"] is not None and base["peak_rss_mib"] is not None:
+                growth = stats["peak_rss_mib"] - base["peak_rss_mib"]
+                if stats["peak_rss_mib"] > base["peak_rss_mib"] * (1 + memory_tolerance) and growth > min_mib:
+                    row["regressed"].append("memory")
+            rows.append(row)
+            if row["regressed"]:
+                regressions.append(row)
+    return {
+        "same_host": current["host"] == baseline.get("host"),
+        "tolerance": tolerance,
+        "memory_tolerance": memory_tolerance,
+        "stages": rows,
+        "regressions": regressions,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Stage-level benchmark suite for MR comparisons")
+    parser.add_argument("--sizes", nargs="+", choices=sorted(SIZES), default=None)
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=None)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--save", help="write the results as a baseline JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown per stage")
+    parser.add_argument("--min-seconds", type=float, default=0.005, help="slowdowns below this are noise")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="allowed relative peak RSS growth")
+    parser.add_argument("--min-mib", type=float, default=32.0, help="peak RSS growth below this is noise")
+    parser.add_argument("--pretrained", action="store_true")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("format") != BASELINE_FORMAT:
+            parser.error(f"{args.compare} is not a stage benchmark baseline")
+    sizes = args.sizes or (baseline["config"]["sizes"] if baseline else ["small", "medium"])
+    formats = args.formats or (baseline["config"]["formats"] if baseline else list(FORMATS))
+
+    # Caches off: every repeat pays for the full pipeline
+    processor = build_processor(
+        pretrained=args.pretrained,
+        feature_cache=FeatureCache(memory_entries=0),
+        heatmap_cache=HeatmapCache(memory_bytes=0),
+        transform_cache=FeatureCache(memory_entries=0),
+    )
+    results = {
+        "format": BASELINE_FORMAT,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "host": host_info(),
+        "config": {"sizes": sizes, "formats": formats, "repeats": args.repeats,
+                   "inference_backend": processor.backend.name, "registration": processor.registration.mode},
+        "cases": {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            for image_format in formats:
+                case = f"{image_format}/{size}"
+                case_dir = os.path.join(directory, case.replace("/", "_"))
+                os.makedirs(case_dir)
+                paths = write_case(case_dir, image_format, SIZES[size])
+                print(f"benchmarking {case}", file=sys.stderr)
+                results["cases"][case] = run_case(processor, paths, args.repeats)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if baseline is not None:
+        results["comparison"] = compare(results, baseline, args.tolerance, args.min_seconds,
+                                        args.memory_tolerance, args.min_mib)
+    print(json.dumps(results, indent=2))
+
+    if baseline is not None:
+        comparison = results["comparison"]
+        if not comparison["same_host"]:
+            print("warning: baseline was recorded on a different host/software stack", file=sys.stderr)
+        for row in comparison["regressions"]:
+            print(f"REGRESSION {row['case']} {row['stage']}: {', '.join(row['regressed'])} "
+                  f"({row['baseline_best_s']}s -> {row['best_s']}s, "
+                  f"{row['baseline_peak_rss_mib']} -> {row['peak_rss_mib']} MiB)", file=sys.stderr)
+        return 1 if comparison["regressions"] else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
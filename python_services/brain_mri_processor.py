@@ -1,73 +1,203 @@
 # Import dependencies - assuming all are available since we've installed them
 import torch
 import torch.nn as nn
-import torchvision.transforms as transforms
+import torch.nn.functional as F
 from torchvision.models import resnet50, ResNet50_Weights
 import numpy as np
 import cv2
 from PIL import Image
 import nibabel as nib
-from nibabel import nifti1
 import pydicom
-from scipy import ndimage
 import os
 from typing import Dict, List, Tuple, Optional
 import json
 import logging
+import time
+import warnings
+from feature_cache import FeatureCache, hash_file, make_cache_key
+from metrics import reports_timings, stage, timed
+from difference_engine import DifferenceEngine
+from heatmap_cache import HeatmapCache, encode_heatmap, heatmap_key, media_type
+from micro_batcher import MicroBatcher
+from profiling import capturing
+import progress
+from dicom_series import read_dicom_series
+from lazy_volume import LazyNiftiVolume, take_axial_slices
+from inference_backends import InferenceBackend, create_backend
+from brain_regions import default_brain_regions
+from region_stats import RegionStatistics
+from registration import Registration, resample
+from similarity_index import SimilarityIndex
+from weight_bundle import load_bundle
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# ImageNet statistics the ResNet50 weights were trained with
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+# Versions that feed the feature cache key; bump when features would change
+MODEL_VERSION = 'ResNet50-BrainMRI-v1.0'
+PREPROCESSING_VERSION = 'tensor-v2'
+
+# Slices sampled per 3D volume for feature extraction
+DEFAULT_NUM_SLICES = 20
+
+# Volumes thinner than this along any axis are not registered
+MIN_REGISTRATION_SIZE = 8
+
+# Content hashing of scan files, timed as its own pipeline stage
+hash_scan = timed('hash')(hash_file)
+
+
+
+def dicom_voxel_volume(dataset) -> float:
+    """Voxel volume in mm³ of a single-file DICOM dataset (PixelSpacing × slice spacing, 1 mm where missing)"""
+    row_spacing, column_spacing = [float(v) for v in dataset.PixelSpacing] if 'PixelSpacing' in dataset else (1.0, 1.0)
+    slice_spacing = float(dataset.get('SpacingBetweenSlices') or dataset.get('SliceThickness') or 1.0)
+    return row_spacing * column_spacing * slice_spacing
+
+
+def build_feature_extractor(weights=ResNet50_Weights.IMAGENET1K_V2) -> nn.Module:
+    """ResNet50 whose fc layer is an identity mapping, so it outputs the 2048-d pooled features"""
+    model = resnet50(weights=weights)
+    # Replace the final classification layer with a linear layer that has the same
+    # number of input and output features, initialized as an identity mapping
+    num_features = model.fc.in_features
+    model.fc = nn.Linear(num_features, num_features)
+    nn.init.eye_(model.fc.weight)
+    nn.init.zeros_(model.fc.bias)
+    # Channels-last layout lets the CPU convolution kernels vectorize across channels
+    return model.to(memory_format=torch.channels_last).eval()
+
+
+def load_feature_extractor(bundle_path: str) -> nn.Module:
+    """
+    Feature extractor from an offline weight bundle
+    The module is created on the meta device (no random init) and its
+    parameters are assigned the memory-mapped tensors of the bundle
+    """
+    with torch.device('meta'):
+        model = resnet50(weights=None)
+        model.fc = nn.Linear(model.fc.in_features, model.fc.in_features)
+    model.load_state_dict(load_bundle(bundle_path, expected_version=MODEL_VERSION), assign=True)
+    return model.eval()
+
+
 class BrainMRIProcessor:
     """
     PyTorch-based ResNet model for MRI brain image processing and analysis
     Processes 3D MR images to extract volumetric changes and generate heatmaps
     """
     
-    def __init__(self, model_path: Optional[str] = None):
+    def __init__(self, model_path: Optional[str] = None, max_batch_size: int = 32,
+                 feature_cache: Optional[FeatureCache] = None,
+                 micro_batch_wait_ms: float = 0.0, micro_batch_max_slices: int = 64,
+                 inference_backend: str = 'eager', calibration_dir: Optional[str] = None,
+                 weights_path: Optional[str] = None, heatmap_cache: Optional[HeatmapCache] = None,
+                 heatmap_format: str = 'png', heatmap_quality: int = 80, heatmap_png_compression: int = 3,
+                 difference_chunk_slices: int = 32, difference_workers: Optional[int] = None,
+                 registration_mode: str = 'rigid', transform_cache: Optional[FeatureCache] = None,
+                 similarity_index: Optional[SimilarityIndex] = None):
         # Use GPU if available
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         logger.info(f"Using device: {self.device}")
         
         # Brain region definitions for volumetric analysis
-        self.brain_regions = {
-            'hippocampus_left': {'roi_coords': (50, 80, 40, 70, 30, 50)},
-            'hippocampus_right': {'roi_coords': (130, 160, 40, 70, 30, 50)},
-            'frontal_cortex': {'roi_coords': (70, 140, 20, 60, 40, 80)},
-            'temporal_cortex': {'roi_coords': (40, 170, 80, 120, 30, 70)},
-            'amygdala_left': {'roi_coords': (55, 75, 50, 70, 35, 45)},
-            'amygdala_right': {'roi_coords': (135, 155, 50, 70, 35, 45)}
-        }
+        self.brain_regions = default_brain_regions()
+        # Voxel statistics per ROI box (label maps cached per volume shape)
+        self.region_stats = RegionStatistics()
         
-        # Initialize ResNet50 model for feature extraction
-        self.feature_extractor = resnet50(weights=ResNet50_Weights.IMAGENET1K_V2)
-        # Remove the final classification layer by replacing it with a new linear layer
-        # that has the same number of input and output features (identity mapping)
-        num_features = self.feature_extractor.fc.in_features
-        self.feature_extractor.fc = nn.Linear(num_features, num_features)
-        # Initialize as identity mapping
-        nn.init.eye_(self.feature_extractor.fc.weight)
-        nn.init.zeros_(self.feature_extractor.fc.bias)
-        self.feature_extractor.to(self.device)
-        self.feature_extractor.eval()
+        # Initialize ResNet50 model for feature extraction: from the local weight
+        # bundle when configured, otherwise torchvision's ImageNet weights (downloaded once)
+        if weights_path:
+            self.feature_extractor = load_feature_extractor(weights_path)
+        else:
+            self.feature_extractor = build_feature_extractor()
+        self.feature_extractor.to(self.device, memory_format=torch.channels_last)
+        
+        # Upper bound on slices per ResNet forward pass (bounds activation memory)
+        self.max_batch_size = max(1, int(max_batch_size))
+        
+        # Per-scan feature vectors keyed by content hash (memory-only unless configured)
+        self.feature_cache = feature_cache if feature_cache is not None else FeatureCache()
+        
+        # Encoded heatmap overlays keyed by scan hash(es), slice, regions and model version
+        self.heatmap_cache = heatmap_cache if heatmap_cache is not None else HeatmapCache()
+        self.heatmap_format = heatmap_format
+        self.heatmap_quality = heatmap_quality
+        self.heatmap_png_compression = heatmap_png_compression
+        
+        # Whole-volume difference maps, smoothed in z-chunks on a thread pool
+        self.difference_engine = DifferenceEngine(chunk_slices=difference_chunk_slices, workers=difference_workers)
+        
+        # Follow-up scans are registered onto the baseline before comparing (transforms cached per pair)
+        self.registration = Registration(registration_mode, transform_cache=transform_cache)
+        
+        # Optional cross-request micro-batching of forward passes (disabled when wait is 0)
+        self.micro_batcher = None
+        if micro_batch_wait_ms > 0:
+            self.micro_batcher = MicroBatcher(
+                self._forward_batches, max_slices=micro_batch_max_slices, max_wait_ms=micro_batch_wait_ms
+            )
         
         # Initialize custom brain analysis model
         self.brain_analyzer = self._build_brain_analyzer()
         
-        # Load pre-trained weights if available
+        # Image preprocessing: resize to the ResNet input size, then ImageNet normalization.
+        # Scaling to [0, 1] is folded into the scale so normalization is a single addcmul:
+        # (x / 255 - mean) / std == x * (1 / (255 * std)) + (-mean / std)
+        self.input_size = (224, 224)
+        std = torch.tensor(IMAGENET_STD).view(1, 3, 1, 1)
+        self._normalize_scale = 1.0 / (255.0 * std)
+        self._normalize_shift = -torch.tensor(IMAGENET_MEAN).view(1, 3, 1, 1) / std
+        
+        # Execution backend for both networks (eager fp32, INT8 or ONNX Runtime)
+        self.inference_backend = inference_backend
+        self.calibration_dir = calibration_dir
+        self.backend: Optional[InferenceBackend] = None
+        
+        # Load pre-trained weights if available (this also builds the backend)
         if model_path and os.path.exists(model_path):
             self.load_model(model_path)
+        else:
+            self.rebuild_backend()
         
-        # Image preprocessing transforms
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
+        # Feature vectors of processed scans, searchable by /similar-scans (emptied when features change)
+        self.similarity_index = similarity_index
+        if similarity_index is not None:
+            similarity_index.use_version(self.feature_version)
+    
+    def rebuild_backend(self):
+        """(Re)build the inference backend from the current fp32 weights"""
+        calibration = self._calibration_batches() if self.inference_backend == 'int8-static' else None
+        self.backend = create_backend(
+            self.inference_backend, self.feature_extractor, self.brain_analyzer, self.device, calibration
+        )
+        logger.info(f"Inference backend: {self.backend.name}")
+    
+    def _calibration_batches(self):
+        """Preprocessed slice batches of the scans in calibration_dir (for static INT8 quantization)"""
+        if not self.calibration_dir or not os.path.isdir(self.calibration_dir):
+            return None
+        batches = []
+        for name in sorted(os.listdir(self.calibration_dir)):
+            path = os.path.join(self.calibration_dir, name)
+            try:
+                batches.append(self.preprocess_slices(self.extract_brain_slices(self.load_dicom_image(path))))
+            except Exception as e:
+                logger.warning(f"Skipping calibration scan {path}: {str(e)}")
+        return batches
+    
+    @property
+    def feature_version(self) -> str:
+        """Model, preprocessing and backend versions the cached features depend on"""
+        return f"{MODEL_VERSION}:{PREPROCESSING_VERSION}:{self.inference_backend}"
     
     def _build_brain_analyzer(self):
-        """Build custom neural network for brain MRI analysis"""
+        """Build custom neural network for brain MRI analysis (in eval mode: dropout off at inference)"""
         return nn.Sequential(
             nn.Linear(4096, 1024),  # ResNet50 features from two images
             nn.ReLU(),
@@ -78,17 +208,33 @@ class BrainMRIProcessor:
             nn.Linear(512, 256),
             nn.ReLU(),
             nn.Linear(256, len(self.brain_regions) * 2)  # Volume change for each region
-        ).to(self.device)
+        ).to(self.device).eval()
     
     def load_dicom_image(self, file_path: str) -> np.ndarray:
-        """Load and preprocess DICOM image"""
+        """Load and preprocess DICOM image (single file, series directory or zip), NIfTI or standard image"""
+        return self.load_scan(file_path)[0]
+    
+    @timed('decode')
+    def load_scan(self, file_path: str) -> Tuple[np.ndarray, float]:
+        """
+        A scan as load_dicom_image returns it and the volume of one voxel in mm³
+        The voxel volume comes from the NIfTI header zooms or from DICOM
+        PixelSpacing and slice spacing; standard images count 1 mm³ per pixel
+        """
         try:
-            if file_path.endswith('.dcm'):
+            voxel_volume = 1.0
+            if os.path.isdir(file_path) or file_path.endswith('.zip'):
+                # Per-slice DICOM series (directory or zip archive)
+                image_array, spacing = read_dicom_series(file_path)
+                voxel_volume = float(np.prod(spacing))
+            elif file_path.endswith('.dcm'):
                 dicom_data = pydicom.dcmread(file_path)
                 image_array = dicom_data.pixel_array
+                voxel_volume = dicom_voxel_volume(dicom_data)
             elif file_path.endswith('.nii') or file_path.endswith('.nii.gz'):
-                nii_data = nifti1.load(file_path)
-                image_array = nii_data.get_fdata()
+                # Lazy volume: only the slices the pipeline indexes are read, already normalized
+                volume = LazyNiftiVolume(file_path)
+                return volume, volume.voxel_volume_mm3
             else:
                 # Standard image formats
                 image = Image.open(file_path).convert('RGB')
@@ -98,78 +244,248 @@ class BrainMRIProcessor:
             if image_array.max() > 255:
                 image_array = (image_array / image_array.max() * 255).astype(np.uint8)
             
-            return image_array
+            return image_array, voxel_volume
         except Exception as e:
             logger.error(f"Error loading image {file_path}: {str(e)}")
             raise
     
-    def extract_brain_slices(self, image_3d: np.ndarray, num_slices: int = 20) -> List[np.ndarray]:
-        """Extract representative 2D slices from 3D MR image"""
+    @timed('slice_selection')
+    def extract_brain_slices(self, image_3d: np.ndarray, num_slices: int = DEFAULT_NUM_SLICES) -> np.ndarray:
+        """
+        Extract representative 2D slices from 3D MR image
+        Returns an (N, H, W, 3) array; grayscale slices are expanded to three
+        channels with a broadcast view, so the channel axis costs no memory
+        """
         if len(image_3d.shape) == 3:
             # Select slices from middle portion of the brain
             depth = image_3d.shape[2]
             start_idx = depth // 4
             end_idx = 3 * depth // 4
             slice_indices = np.linspace(start_idx, end_idx, num_slices, dtype=int)
-            
-            slices = []
-            for idx in slice_indices:
-                slice_2d = image_3d[:, :, idx]
-                # Convert to RGB for ResNet processing
-                if len(slice_2d.shape) == 2:
-                    slice_rgb = np.stack([slice_2d] * 3, axis=2)
-                else:
-                    slice_rgb = slice_2d
-                slices.append(slice_rgb)
-            return slices
+            slices = take_axial_slices(image_3d, slice_indices)
+        elif len(image_3d.shape) == 2:
+            slices = image_3d[np.newaxis]
+        else:
+            raise ValueError(f"Unsupported image shape: {image_3d.shape}")
+        
+        # Convert to RGB for ResNet processing without copying the plane three times
+        return np.broadcast_to(slices[..., np.newaxis], slices.shape + (3,))
+    
+    @timed('preprocessing')
+    def preprocess_slices(self, slices) -> torch.Tensor:
+        """
+        Resize and normalize a stack of RGB slices into an (N, 3, 224, 224) tensor
+        All slices are resized in one batched interpolate call; slices whose
+        channel axis is a broadcast view are resized as a single grayscale plane
+        """
+        if isinstance(slices, list):
+            slices = np.stack(slices)
+        
+        if slices.strides[-1] == 0:
+            # Grayscale broadcast to RGB: work on one plane, expand after resizing
+            planes = np.ascontiguousarray(slices[..., 0])
         else:
-            # Already 2D, convert to RGB
-            if len(image_3d.shape) == 2:
-                return [np.stack([image_3d] * 3, axis=2)]
-            return [image_3d]
+            planes = np.ascontiguousarray(slices)
+        with warnings.catch_warnings():
+            # The tensor is only read from, so a read-only (broadcast) array is fine
+            warnings.filterwarnings('ignore', message='The given NumPy array is not writable')
+            batch = torch.from_numpy(planes)
+        batch = batch.unsqueeze(1) if planes.ndim == 3 else batch.permute(0, 3, 1, 2)
+        
+        # uint8 slices are resized as uint8 (4x less memory, same rounding as PIL);
+        # anything else is resized in float32 clamped to the 0-255 display range
+        if batch.dtype != torch.uint8:
+            batch = batch.to(torch.float32).clamp(0, 255)
+        
+        # Antialiased bilinear matches the PIL resize the ImageNet weights expect
+        batch = F.interpolate(batch, size=self.input_size, mode='bilinear', align_corners=False, antialias=True)
+        
+        # Channel expansion is a view; addcmul allocates the normalized output once
+        batch = batch.expand(-1, 3, -1, -1)
+        return torch.addcmul(self._normalize_shift, batch, self._normalize_scale)
+    
+    @timed('inference')
+    def _run_feature_extractor(self, batch: torch.Tensor) -> torch.Tensor:
+        """Run ResNet over a stacked NCHW slice tensor, merged with concurrent requests if enabled"""
+        # A profiled request keeps its forward passes on its own thread, where the profilers see them
+        if self.micro_batcher is not None and not capturing():
+            features = self.micro_batcher.infer(batch)
+            progress.slices_inferred(len(batch), len(batch))
+            return features
+        return self._forward_batches(batch)
     
-    def extract_features(self, image_slices: List[np.ndarray]):
+    def _forward_batches(self, batch: torch.Tensor) -> torch.Tensor:
+        """Run ResNet over a stacked NCHW slice tensor in chunks of max_batch_size"""
+        outputs = []
+        done = 0
+        for chunk in torch.split(batch, self.max_batch_size):
+            outputs.append(self.backend.extract(chunk))
+            done += len(chunk)
+            progress.slices_inferred(done, len(batch))
+        return torch.cat(outputs)
+    
+    def extract_features(self, image_slices: np.ndarray):
         """Extract features from brain MR slices using ResNet"""
-        features_list = []
+        return self.extract_features_batch([image_slices])[0]
+    
+    def extract_features_batch(self, slice_groups: List[np.ndarray]) -> List[torch.Tensor]:
+        """
+        Extract averaged features for several volumes at once
+        All slices of all groups are stacked into one tensor so the forward pass
+        runs batched; each group's slice features are then averaged separately
+        """
+        slice_counts = [len(group) for group in slice_groups]
+        batch = torch.cat([self.preprocess_slices(group) for group in slice_groups])
+        features = self._run_feature_extractor(batch)
         
-        with torch.no_grad():
-            for slice_img in image_slices:
-                # Convert to PIL and apply transforms
-                pil_image = Image.fromarray(slice_img.astype(np.uint8))
-                transformed_image = self.transform(pil_image)
-                # Ensure transformed_image is a tensor before calling unsqueeze
-                if not isinstance(transformed_image, torch.Tensor):
-                    transformed_image = torch.tensor(transformed_image)
-                tensor_image = transformed_image.unsqueeze(0).to(self.device)
-                
-                # Extract features
-                features = self.feature_extractor(tensor_image)
-                features_list.append(features)
-        
-        # Average features across all slices
-        avg_features = torch.mean(torch.stack(features_list), dim=0)
-        return avg_features
+        # Average features across the slices of each volume
+        return [
+            group_features.mean(dim=0, keepdim=True)
+            for group_features in torch.split(features, slice_counts)
+        ]
+    
+    def extract_scan_features(self, scans: List[Tuple[str, np.ndarray]],
+                              content_hashes: Optional[List[Optional[str]]] = None) -> List[torch.Tensor]:
+        """
+        Extract averaged features for (file_path, image) pairs through the feature cache
+        Scans already in the cache skip slicing and inference; the remaining
+        scans share one batched forward pass
+        """
+        content_hashes = content_hashes or [None] * len(scans)
+        keys = [
+            make_cache_key(content_hash or hash_scan(file_path), self.feature_version)
+            for (file_path, _), content_hash in zip(scans, content_hashes)
+        ]
+        
+        features: List[Optional[torch.Tensor]] = [None] * len(scans)
+        misses: Dict[str, List[int]] = {}
+        for i, key in enumerate(keys):
+            if key in misses:
+                # Same content twice in one call: extract it once
+                misses[key].append(i)
+                continue
+            cached = self.feature_cache.get(key)
+            if cached is None:
+                misses[key] = [i]
+            else:
+                features[i] = torch.from_numpy(cached.copy())
+        
+        if misses:
+            slice_groups = [self.extract_brain_slices(scans[indices[0]][1]) for indices in misses.values()]
+            extracted_groups = self.extract_features_batch(slice_groups)
+            for (key, indices), extracted in zip(misses.items(), extracted_groups):
+                self.feature_cache.put(key, extracted.cpu().numpy())
+                for i in indices:
+                    features[i] = extracted
+        
+        return features
+    
+    def get_scan_features(self, file_path: str, image: np.ndarray, content_hash: Optional[str] = None) -> torch.Tensor:
+        """Extract (or fetch cached) averaged features for a single scan"""
+        return self.extract_scan_features([(file_path, image)], [content_hash])[0]
+    
+    @staticmethod
+    def slice_count(image: np.ndarray) -> int:
+        """Number of slices extract_brain_slices samples from an image"""
+        return 1 if len(image.shape) == 2 else DEFAULT_NUM_SLICES
+    
+    def scan_embedding(self, file_path: str, content_hash: Optional[str] = None) -> np.ndarray:
+        """Averaged feature vector of one scan (through the feature cache), as a 1-D float32 array"""
+        image = self.load_dicom_image(file_path)
+        return self.get_scan_features(file_path, image, content_hash)[0].cpu().numpy()
+    
+    @reports_timings
+    def process_single_scan(self, file_path: str, content_hash: Optional[str] = None,
+                            index_as: Optional[Dict] = None) -> Dict:
+        """
+        Load -> slice -> feature pipeline for one scan
+        The feature vector lands in the feature cache, ready for later comparisons;
+        with `index_as` (scan_id, patient_id, hospital_id) it is also added to the similarity index
+        """
+        image = self.load_dicom_image(file_path)
+        content_hash = content_hash or hash_scan(file_path)
+        features = self.get_scan_features(file_path, image, content_hash)
+        result = {
+            'image_dimensions': list(image.shape),
+            'slice_count': self.slice_count(image),
+            'feature_dimension': int(features.shape[1])
+        }
+        if index_as is not None and self.similarity_index is not None:
+            scan_id = index_as.get('scan_id') or content_hash
+            self.similarity_index.add(
+                scan_id, features[0].cpu().numpy(), content_hash=content_hash,
+                patient_id=index_as.get('patient_id'), hospital_id=index_as.get('hospital_id')
+            )
+            result['scan_id'] = scan_id
+        return result
     
     def analyze_volumetric_changes(self, features1, features2) -> Dict:
         """Analyze volumetric changes between two MR scans"""
+        return self.analyze_volumetric_changes_batch([(features1, features2)])[0]
+    
+    @timed('volumetrics')
+    def analyze_volumetric_changes_batch(self, feature_pairs: List[Tuple[torch.Tensor, torch.Tensor]]) -> List[Dict]:
+        """Analyze volumetric changes for several scan pairs in one analyzer pass"""
         with torch.no_grad():
-            # Combine features for comparison
-            combined_features = torch.cat([features1, features2], dim=1)
+            # Combine features for comparison, one row per pair
+            combined_features = torch.cat([torch.cat([f1, f2], dim=1) for f1, f2 in feature_pairs])
             
             # Predict volumetric changes
-            volume_changes = self.brain_analyzer(combined_features)
-            volume_changes = volume_changes.cpu().numpy().reshape(-1, 2)
+            volume_changes = self.backend.analyze(combined_features)
+            volume_changes = volume_changes.cpu().numpy().reshape(len(feature_pairs), -1, 2)
             
-            results = {}
-            for i, (region_name, region_info) in enumerate(self.brain_regions.items()):
-                change_percent = volume_changes[i]
-                results[region_name] = {
-                    'volume_change_percent': float(change_percent[0]),
-                    'significance_score': float(change_percent[1]),
-                    'interpretation': self._interpret_change(change_percent[0])
-                }
+            pair_results = []
+            for pair_changes in volume_changes:
+                results = {}
+                for i, (region_name, region_info) in enumerate(self.brain_regions.items()):
+                    change_percent = pair_changes[i]
+                    results[region_name] = {
+                        'volume_change_percent': float(change_percent[0]),
+                        'significance_score': float(change_percent[1]),
+                        'interpretation': self._interpret_change(change_percent[0])
+                    }
+                pair_results.append(results)
             
-            return results
+            return pair_results
+    
+    @timed('region_statistics')
+    def scan_region_statistics(self, image, voxel_volume_mm3: float = 1.0) -> Optional[Dict]:
+        """Voxel statistics of every brain region in one volume (None for 2D images)"""
+        if len(image.shape) != 3:
+            return None
+        return self.region_stats.compute(image, self.brain_regions, voxel_volume_mm3=voxel_volume_mm3)
+    
+    @staticmethod
+    def tissue_volume_change(baseline: Dict, followup: Dict) -> Dict[str, Optional[float]]:
+        """Per-region tissue volume change in percent between two scan_region_statistics results"""
+        changes = {}
+        for region_name, before_stats in baseline.items():
+            before = before_stats['tissue_volume_mm3']
+            after = followup[region_name]['tissue_volume_mm3']
+            changes[region_name] = float((after - before) / before * 100) if before else None
+        return changes
+    
+    def compute_region_statistics(self, image1, image2,
+                                  voxel_volumes: Tuple[float, float] = (1.0, 1.0)) -> Optional[Dict]:
+        """
+        Voxel statistics of every brain region in both volumes and the tissue volume change
+        `voxel_volumes` are the mm³ per voxel of the two volumes. 2D images have
+        no ROI boxes to measure, so None is returned for them
+        """
+        baseline = self.scan_region_statistics(image1, voxel_volumes[0])
+        followup = self.scan_region_statistics(image2, voxel_volumes[1])
+        if baseline is None or followup is None:
+            return None
+        
+        changes = self.tissue_volume_change(baseline, followup)
+        return {
+            region_name: {
+                'baseline': baseline[region_name],
+                'followup': followup[region_name],
+                'tissue_volume_change_percent': changes[region_name]
+            }
+            for region_name in baseline
+        }
     
     def _interpret_change(self, change_percent: float) -> str:
         """Interpret volumetric change percentage"""
@@ -185,10 +501,15 @@ class BrainMRIProcessor:
             return "Hafif hacim artışı"
         return "Stabil"
     
+    @timed('heatmap')
     def generate_heatmap(self, image_array: np.ndarray, attention_map: np.ndarray) -> np.ndarray:
         """Generate attention heatmap overlay on MR image"""
-        # Normalize attention map
-        attention_normalized = (attention_map - attention_map.min()) / (attention_map.max() - attention_map.min())
+        # Normalize attention map (a flat map, e.g. two identical scans, stays all zero)
+        attention_range = attention_map.max() - attention_map.min()
+        if attention_range > 0:
+            attention_normalized = (attention_map - attention_map.min()) / attention_range
+        else:
+            attention_normalized = np.zeros_like(attention_map, dtype=np.float64)
         
         # Create heatmap
         heatmap = cv2.applyColorMap((attention_normalized * 255).astype(np.uint8), cv2.COLORMAP_JET)
@@ -207,6 +528,155 @@ class BrainMRIProcessor:
         
         return overlay
     
+    @timed('heatmap_encode')
+    def encode_heatmap(self, overlay: np.ndarray) -> bytes:
+        """Encode a heatmap overlay in the configured format"""
+        return encode_heatmap(overlay, self.heatmap_format, self.heatmap_quality, self.heatmap_png_compression)
+    
+    def _heatmap_key(self, content_hashes: List[str], slice_index: Optional[int],
+                     regions: Optional[List[str]] = None) -> str:
+        return heatmap_key(content_hashes, slice_index, regions, MODEL_VERSION,
+                           self.heatmap_format, self.heatmap_quality, self.heatmap_png_compression)
+    
+    @staticmethod
+    def _heatmap_slice(image, slice_index: Optional[int]) -> Tuple[np.ndarray, Optional[int]]:
+        """The 2D plane a heatmap is drawn on (middle axial slice by default) and its index"""
+        if len(image.shape) == 2:
+            return np.asarray(image), None
+        if slice_index is None:
+            slice_index = image.shape[2] // 2
+        if not 0 <= slice_index < image.shape[2]:
+            raise ValueError(f"Slice index {slice_index} is outside 0..{image.shape[2] - 1}")
+        return np.asarray(image[:, :, slice_index]), slice_index
+    
+    @timed('attention_map')
+    def compute_attention_map(self, image_slice: np.ndarray, regions: Optional[List[str]] = None,
+                              slice_index: Optional[int] = None) -> np.ndarray:
+        """
+        Activation map of one slice: channel-mean of the ResNet50's last convolutional
+        stage, upsampled to the slice size. With `regions`, areas outside the
+        in-plane footprint of those ROI boxes are damped. The inference backends
+        and the micro-batcher only return pooled feature vectors, so the spatial
+        activations come from the eager fp32 extractor (callers run this on the
+        inference executor like every other pipeline call)
+        """
+        batch = self.preprocess_slices(self.extract_brain_slices(image_slice))
+        extractor = self.feature_extractor
+        with torch.inference_mode():
+            batch = batch.to(self.device).contiguous(memory_format=torch.channels_last)
+            x = extractor.maxpool(extractor.relu(extractor.bn1(extractor.conv1(batch))))
+            x = extractor.layer4(extractor.layer3(extractor.layer2(extractor.layer1(x))))
+            activation = F.interpolate(x.mean(dim=1, keepdim=True), size=image_slice.shape[:2],
+                                       mode='bilinear', align_corners=False)
+        attention_map = activation[0, 0].cpu().numpy()
+        
+        if regions:
+            mask = np.zeros(image_slice.shape[:2], dtype=bool)
+            for region_name in regions:
+                x0, x1, y0, y1, z0, z1 = self.brain_regions[region_name]['roi_coords']
+                if slice_index is None or z0 <= slice_index < z1:
+                    mask[x0:x1, y0:y1] = True
+            attention_map = (attention_map - attention_map.min()) * np.where(mask, 1.0, 0.25)
+        return attention_map
+    
+    def render_scan_heatmap(self, file_path: str, slice_index: Optional[int] = None,
+                            regions: Optional[List[str]] = None,
+                            content_hash: Optional[str] = None) -> Tuple[str, bytes]:
+        """
+        Encoded attention heatmap of one scan slice, from the heatmap cache when available
+        Returns (heatmap key, encoded bytes); the key is the cache key and ETag
+        """
+        unknown = [region for region in regions or [] if region not in self.brain_regions]
+        if unknown:
+            raise ValueError(f"Unknown brain regions: {', '.join(unknown)}")
+        content_hash = content_hash or hash_scan(file_path)
+        if slice_index is not None:
+            key = self._heatmap_key([content_hash], slice_index, regions)
+            cached = self.heatmap_cache.get(key)
+            if cached is not None:
+                return key, cached
+        
+        image = self.load_dicom_image(file_path)
+        image_slice, slice_index = self._heatmap_slice(image, slice_index)
+        key = self._heatmap_key([content_hash], slice_index, regions)
+        cached = self.heatmap_cache.get(key)
+        if cached is not None:
+            return key, cached
+        
+        attention_map = self.compute_attention_map(image_slice, regions, slice_index)
+        data = self.encode_heatmap(self.generate_heatmap(image_slice, attention_map))
+        self.heatmap_cache.put(key, data)
+        return key, data
+    
+    def _comparison_heatmap(self, content_hashes: List[str], image1, image2) -> Tuple[str, bytes]:
+        """Encoded change heatmap of the middle slice, from the heatmap cache when available"""
+        image_slice, slice_index = self._heatmap_slice(image1, None)
+        key = self._heatmap_key(content_hashes, slice_index)
+        data = self.heatmap_cache.get(key)
+        if data is None:
+            # Generate attention map for heatmap using actual differences
+            attention_map = self._generate_attention_map(image1, image2)
+            data = self.encode_heatmap(self.generate_heatmap(image_slice, attention_map))
+            self.heatmap_cache.put(key, data)
+        return key, data
+    
+    @timed('registration')
+    def align_scans(self, image1, image2, content_hashes: List[str]) -> Tuple[np.ndarray, List[str], Dict]:
+        """
+        The follow-up volume on the baseline grid, the pair's content hashes and a registration summary
+        A resampled follow-up gets a hash derived from the transform, so
+        features and heatmaps of aligned and unaligned volumes never share
+        cache entries; a transform that moves no voxel noticeably is skipped
+        """
+        # 2D images (including RGB PNGs, whose third axis is colour) are not registered
+        if (not self.registration.enabled or len(image1.shape) != 3 or len(image2.shape) != 3
+                or min(image1.shape) < MIN_REGISTRATION_SIZE or min(image2.shape) < MIN_REGISTRATION_SIZE):
+            return image2, content_hashes, {'mode': 'none', 'resampled': False}
+        
+        start = time.perf_counter()
+        transform, cached = self.registration.transform(image1, image2, *content_hashes)
+        summary = {'mode': self.registration.mode, 'cached_transform': cached, **transform.describe(image1.shape)}
+        if self.registration.is_identity(transform, image1.shape) and tuple(image1.shape) == tuple(image2.shape):
+            summary['resampled'] = False
+        else:
+            image2 = resample(image2, transform, image1.shape)
+            aligned_hash = make_cache_key(self.registration.transform_key(*content_hashes), 'resampled')
+            content_hashes = [content_hashes[0], aligned_hash]
+            summary['resampled'] = True
+        summary['seconds'] = round(time.perf_counter() - start, 2)
+        return image2, content_hashes, summary
+    
+    def render_difference_heatmaps(self, mr1_path: str, mr2_path: str,
+                                   slice_indices: Optional[List[int]] = None) -> List[Tuple[int, str]]:
+        """
+        Encoded difference heatmaps of several axial slices, as (slice index, heatmap key) pairs
+        Defaults to the slices the feature extractor samples. The volume pass
+        runs once for all slices that are not cached yet
+        """
+        image1 = self.load_dicom_image(mr1_path)
+        image2, content_hashes, _ = self.align_scans(
+            image1, self.load_dicom_image(mr2_path), [hash_scan(mr1_path), hash_scan(mr2_path)]
+        )
+        if len(image1.shape) == 2:
+            slice_indices = [None]
+        elif slice_indices is None:
+            depth = image1.shape[2]
+            slice_indices = sorted(set(np.linspace(depth // 4, 3 * depth // 4, DEFAULT_NUM_SLICES, dtype=int).tolist()))
+        
+        keys = {index: self._heatmap_key(content_hashes, index) for index in slice_indices}
+        missing = [index for index in slice_indices if self.heatmap_cache.get(keys[index]) is None]
+        if missing:
+            with stage('attention_map'):
+                stack = self.difference_engine.attention_stack(
+                    image1, image2, None if missing == [None] else missing
+                )
+            for n, index in enumerate(missing):
+                image_slice, _ = self._heatmap_slice(image1, index)
+                overlay = self.generate_heatmap(image_slice, stack.attention[:, :, n])
+                self.heatmap_cache.put(keys[index], self.encode_heatmap(overlay))
+        return [(index, keys[index]) for index in slice_indices]
+    
+    @reports_timings
     def process_mr_comparison(self, mr1_path: str, mr2_path: str) -> Dict:
         """
         Complete MR comparison processing pipeline
@@ -216,54 +686,54 @@ class BrainMRIProcessor:
             logger.info(f"Processing MR comparison: {mr1_path} vs {mr2_path}")
             
             # Load both MR images
-            image1 = self.load_dicom_image(mr1_path)
-            image2 = self.load_dicom_image(mr2_path)
+            image1, voxel_volume1 = self.load_scan(mr1_path)
+            image2, voxel_volume2 = self.load_scan(mr2_path)
             
-            # Extract slices from 3D images
-            slices1 = self.extract_brain_slices(image1)
-            slices2 = self.extract_brain_slices(image2)
+            # Register the follow-up onto the baseline so head movement does not read as change
+            image2, content_hashes, registration = self.align_scans(
+                image1, image2, [hash_scan(mr1_path), hash_scan(mr2_path)]
+            )
             
-            # Extract features
-            features1 = self.extract_features(slices1)
-            features2 = self.extract_features(slices2)
+            # Extract features for both scans in one batched pass (cached scans are skipped)
+            features1, features2 = self.extract_scan_features(
+                [(mr1_path, image1), (mr2_path, image2)], content_hashes
+            )
             
             # Analyze volumetric changes
             volume_analysis = self.analyze_volumetric_changes(features1, features2)
             
-            # Generate attention map for heatmap using actual differences
-            attention_map = self._generate_attention_map(image1, image2)
+            # Measured voxel statistics inside each ROI box
+            # (a resampled follow-up lies on the baseline grid and has its voxel size)
+            if registration['resampled']:
+                voxel_volume2 = voxel_volume1
+            region_statistics = self.compute_region_statistics(image1, image2, (voxel_volume1, voxel_volume2))
             
-            heatmap = self.generate_heatmap(
-                image1[:, :, image1.shape[2]//2] if len(image1.shape) == 3 else image1,
-                attention_map
-            )
+            # Encoded change heatmap (cached per scan pair and model version)
+            heatmap_id, heatmap = self._comparison_heatmap(content_hashes, image1, image2)
             
             # Generate clinical interpretation
             interpretation = self._generate_clinical_interpretation(volume_analysis)
             
-            # Calculate overall risk assessment
-            risk_score = self._calculate_risk_score(volume_analysis)
-            
             results = {
                 'analysis_status': 'TAMAMLANDI',
-                'processing_time': '45 saniye',
                 'volumetric_analysis': volume_analysis,
+                'region_statistics': region_statistics,
+                'registration': registration,
                 'clinical_interpretation': interpretation,
-                'risk_assessment': {
-                    'overall_risk_score': risk_score,
-                    'risk_category': self._get_risk_category(risk_score),
-                    'recommendations': self._generate_recommendations(volume_analysis, risk_score)
-                },
+                'risk_assessment': self.assess_risk(volume_analysis),
                 'heatmap_data': {
                     'description': 'Beyin hacim değişim haritası',
                     'regions_highlighted': list(volume_analysis.keys()),
-                    'color_scale': 'Mavi: Azalma, Kırmızı: Artış, Yeşil: Stabil'
+                    'color_scale': 'Mavi: Azalma, Kırmızı: Artış, Yeşil: Stabil',
+                    'heatmap_id': heatmap_id,
+                    'media_type': media_type(heatmap),
+                    'size_bytes': len(heatmap)
                 },
                 'technical_details': {
-                    'model_version': 'ResNet50-BrainMRI-v1.0',
-                    'slice_count': len(slices1),
-                    'feature_dimension': features1.shape[1],
-                    'confidence_score': 0.87
+                    'model_version': MODEL_VERSION,
+                    'inference_backend': self.backend.name,
+                    'slice_count': self.slice_count(image1),
+                    'feature_dimension': features1.shape[1]
                 }
             }
             
@@ -278,35 +748,93 @@ class BrainMRIProcessor:
                 'recommendations': ['Görüntü kalitesini kontrol edin', 'Tekrar yükleme deneyin']
             }
     
+    @reports_timings
+    def process_series_comparison(self, mr_paths: List[str]) -> Dict:
+        """
+        Compare an ordered series of scans of one patient (first scan = baseline)
+        Each scan is decoded, run through the feature extractor and measured
+        once; every consecutive and baseline-relative delta is then derived from
+        those results, so cost grows linearly with the number of scans
+        """
+        logger.info(f"Processing MR series of {len(mr_paths)} scans")
+        scans: List[Dict] = []
+        features: List[torch.Tensor] = []
+        region_statistics: List[Optional[Dict]] = []
+        
+        def process_group(group: List[Tuple[str, np.ndarray, float]]):
+            paths, images, voxel_volumes = zip(*group)
+            features.extend(self.extract_scan_features(list(zip(paths, images))))
+            for path, image, voxel_volume in zip(paths, images, voxel_volumes):
+                region_statistics.append(self.scan_region_statistics(image, voxel_volume))
+                scans.append({
+                    'index': len(scans),
+                    'path': path,
+                    'image_dimensions': list(image.shape),
+                    'slice_count': self.slice_count(image),
+                    'region_statistics': region_statistics[-1]
+                })
+        
+        # Scans share forward passes in groups of at least two whose sampled slices fit
+        # one batch where possible; only one group's volumes (plus the next scan) are in memory
+        group: List[Tuple[str, np.ndarray, float]] = []
+        group_slices = 0
+        for path in mr_paths:
+            image, voxel_volume = self.load_scan(path)
+            slices = self.slice_count(image)
+            if len(group) >= 2 and group_slices + slices > self.max_batch_size:
+                process_group(group)
+                group, group_slices = [], 0
+            group.append((path, image, voxel_volume))
+            group_slices += slices
+            del image
+        if group:
+            process_group(group)
+        del group
+        
+        # (from, to) pairs: each scan against its predecessor and against the baseline
+        pairs = [(index - 1, index) for index in range(1, len(scans))]
+        pairs += [(0, index) for index in range(2, len(scans))]
+        analyses = self.analyze_volumetric_changes_batch([(features[i], features[j]) for i, j in pairs])
+        
+        deltas = []
+        for (i, j), volume_analysis in zip(pairs, analyses):
+            both_measured = region_statistics[i] is not None and region_statistics[j] is not None
+            deltas.append({
+                'from_index': i,
+                'to_index': j,
+                'volumetric_analysis': volume_analysis,
+                'tissue_volume_change_percent': (
+                    self.tissue_volume_change(region_statistics[i], region_statistics[j]) if both_measured else None
+                ),
+                'risk_assessment': self.assess_risk(volume_analysis)
+            })
+        
+        return {
+            'analysis_status': 'TAMAMLANDI',
+            'scan_count': len(scans),
+            'scans': scans,
+            'consecutive_deltas': [delta for delta in deltas if delta['to_index'] == delta['from_index'] + 1],
+            'baseline_deltas': [delta for delta in deltas if delta['from_index'] == 0],
+            'technical_details': {
+                'model_version': MODEL_VERSION,
+                'inference_backend': self.backend.name,
+                'feature_dimension': int(features[0].shape[1])
+            }
+        }
+    
+    @timed('attention_map')
     def _generate_attention_map(self, image1: np.ndarray, image2: np.ndarray) -> np.ndarray:
         """
         Generate attention map based on actual differences between images
+        The middle axial slice of the whole-volume difference map (see difference_engine)
         """
         try:
-            # Calculate difference between images
-            if len(image1.shape) == 3:
-                diff = np.abs(image1[:, :, image1.shape[2]//2] - image2[:, :, image2.shape[2]//2])
-            else:
-                diff = np.abs(image1 - image2)
-            
-            # Apply Gaussian filter to smooth the differences
-            smoothed_diff = ndimage.gaussian_filter(diff, sigma=2)
-            
-            # Normalize to 0-1 range
-            if smoothed_diff.max() > smoothed_diff.min():
-                normalized_diff = (smoothed_diff - smoothed_diff.min()) / (smoothed_diff.max() - smoothed_diff.min())
-            else:
-                normalized_diff = np.zeros_like(smoothed_diff)
-            
-            # Apply threshold to highlight significant changes
-            threshold = np.mean(normalized_diff) + np.std(normalized_diff)
-            attention_map = np.where(normalized_diff > threshold, normalized_diff, 0)
-            
-            return attention_map
+            slice_indices = [image1.shape[2] // 2] if len(image1.shape) == 3 else None
+            return self.difference_engine.attention_stack(image1, image2, slice_indices).attention[:, :, 0]
         except Exception as e:
-            logger.warning(f"Fallback to random attention map due to error: {str(e)}")
-            # Fallback to random generation
-            return np.random.rand(image1.shape[0], image1.shape[1]) * 0.5 + 0.3
+            logger.warning(f"Fallback to an empty attention map due to error: {str(e)}")
+            # A random map would be cached and served as if it were real
+            return np.zeros((image1.shape[0], image1.shape[1]))
 
     def _generate_clinical_interpretation(self, volume_analysis: Dict) -> str:
         """Generate clinical interpretation text"""
@@ -322,6 +850,15 @@ class BrainMRIProcessor:
             changes_text = ", ".join(significant_changes)
             return f"MR karşılaştırmasında {changes_text} tespit edilmiştir. Bu bulgular hastalığın progresyonu açısından değerlendirilmelidir."
     
+    def assess_risk(self, volume_analysis: Dict) -> Dict:
+        """Overall risk score, category and recommendations for a volumetric analysis"""
+        risk_score = self._calculate_risk_score(volume_analysis)
+        return {
+            'overall_risk_score': risk_score,
+            'risk_category': self._get_risk_category(risk_score),
+            'recommendations': self._generate_recommendations(volume_analysis, risk_score)
+        }
+    
     def _calculate_risk_score(self, volume_analysis: Dict) -> float:
         """Calculate overall risk score based on volumetric changes"""
         total_change = sum(abs(data['volume_change_percent']) for data in volume_analysis.values())
@@ -379,6 +916,8 @@ class BrainMRIProcessor:
         self.brain_analyzer.load_state_dict(checkpoint['brain_analyzer_state_dict'])
         self.brain_regions = checkpoint['brain_regions']
         logger.info(f"Model loaded from {model_path}")
+        # Quantized/exported copies were made from the old weights
+        self.rebuild_backend()
 
 
 # Example usage
@@ -0,0 +1,23 @@
+"""
+Brain region definitions for volumetric analysis
+Kept free of heavy imports so endpoints such as /brain-regions can answer
+before the model (and torch) has been loaded
+"""
+
+import copy
+from typing import Dict
+
+# ROI boxes as (min, max) voxel bounds along each of the three axes
+BRAIN_REGIONS: Dict[str, Dict] = {
+    'hippocampus_left': {'roi_coords': (50, 80, 40, 70, 30, 50)},
+    'hippocampus_right': {'roi_coords': (130, 160, 40, 70, 30, 50)},
+    'frontal_cortex': {'roi_coords': (70, 140, 20, 60, 40, 80)},
+    'temporal_cortex': {'roi_coords': (40, 170, 80, 120, 30, 70)},
+    'amygdala_left': {'roi_coords': (55, 75, 50, 70, 35, 45)},
+    'amygdala_right': {'roi_coords': (135, 155, 50, 70, 35, 45)}
+}
+
+
+def default_brain_regions() -> Dict[str, Dict]:
+    """A private copy of the default region table (processors may replace theirs from a checkpoint)"""
+    return copy.deepcopy(BRAIN_REGIONS)
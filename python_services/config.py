@@ -0,0 +1,120 @@
+"""
+Service configuration for the Mr. Sina brain MRI processing service
+All settings can be overridden through MRSINA_* environment variables
+"""
+
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment"""
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment"""
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Model loading: eager (build before serving), background (serve at once, warm up in a
+# thread) or lazy (build on the first request that needs it)
+MODEL_LOADING = os.environ.get("MRSINA_MODEL_LOADING", "background")
+# Offline checksummed ResNet50 weight bundle (empty = download torchvision's ImageNet weights)
+WEIGHTS_BUNDLE = os.environ.get("MRSINA_WEIGHTS_BUNDLE", "")
+
+# Production server (serve.py): workers forked after the model is preloaded (0 = one per core),
+# torch threads per worker (0 = cores / workers) and how long shutdown waits for in-flight requests
+SERVER_HOST = os.environ.get("MRSINA_SERVER_HOST", "0.0.0.0")
+SERVER_PORT = _env_int("MRSINA_SERVER_PORT", 8001)
+SERVER_WORKERS = _env_int("MRSINA_SERVER_WORKERS", 0)
+TORCH_THREADS_PER_WORKER = _env_int("MRSINA_TORCH_THREADS_PER_WORKER", 0)
+DRAIN_TIMEOUT_S = _env_int("MRSINA_DRAIN_TIMEOUT_S", 30)
+
+# Thread/batch autotuning: off, reuse (apply a stored profile for this host) or startup
+# (reuse, or tune on first start and store the profile); the profile overrides the batch size
+AUTOTUNE = os.environ.get("MRSINA_AUTOTUNE", "off")
+AUTOTUNE_PROFILE = os.environ.get("MRSINA_AUTOTUNE_PROFILE", os.path.join(SERVICE_DIR, "cache", "autotune.json"))
+
+# Inference
+MAX_BATCH_SIZE = _env_int("MRSINA_MAX_BATCH_SIZE", 32)
+# Executor threads for request-path inference (0 = cpu_count // torch intra-op threads)
+INFERENCE_THREADS = _env_int("MRSINA_INFERENCE_THREADS", 0)
+# Heavy pipeline calls allowed to run at once per worker (0 = one per executor thread)
+INFERENCE_CONCURRENCY = _env_int("MRSINA_INFERENCE_CONCURRENCY", 0)
+# Separate small pool for similarity-index lookups, so they never queue behind comparisons
+INDEX_THREADS = _env_int("MRSINA_INDEX_THREADS", 2)
+# Cross-request micro-batching: max time a request waits for others (0 disables) and slice cap
+MICRO_BATCH_WAIT_MS = _env_float("MRSINA_MICRO_BATCH_WAIT_MS", 5.0)
+MICRO_BATCH_MAX_SLICES = _env_int("MRSINA_MICRO_BATCH_MAX_SLICES", 64)
+# Backend for ResNet50 and the brain analyzer: eager, int8-dynamic, int8-static or onnx
+INFERENCE_BACKEND = os.environ.get("MRSINA_INFERENCE_BACKEND", "eager")
+# Representative scans used to calibrate the int8-static backend
+INFERENCE_CALIBRATION_DIR = os.environ.get("MRSINA_INFERENCE_CALIBRATION_DIR", "")
+
+# Feature-vector cache (an empty directory setting keeps the cache in memory only)
+FEATURE_CACHE_DIR = os.environ.get("MRSINA_FEATURE_CACHE_DIR", os.path.join(SERVICE_DIR, "cache", "features"))
+FEATURE_CACHE_MEMORY_ENTRIES = _env_int("MRSINA_FEATURE_CACHE_MEMORY_ENTRIES", 512)
+FEATURE_CACHE_DISK_MB = _env_int("MRSINA_FEATURE_CACHE_DISK_MB", 512)
+
+# Background job engine
+JOB_WORKERS = _env_int("MRSINA_JOB_WORKERS", 2)
+JOB_QUEUE_DEPTH = _env_int("MRSINA_JOB_QUEUE_DEPTH", 32)
+# Task store shared by the server workers (SQLite in WAL mode; empty = in memory, per process),
+# how long finished tasks are kept and how often idle job workers poll for tasks from other workers
+TASK_STORE_DIR = os.environ.get("MRSINA_TASK_STORE_DIR", os.path.join(SERVICE_DIR, "cache", "tasks"))
+TASK_TTL_S = _env_int("MRSINA_TASK_TTL_S", 24 * 3600)
+JOB_POLL_MS = _env_int("MRSINA_JOB_POLL_MS", 500)
+# Progress streams (/processing-status/{task_id}/events): how often a worker checks the task store for
+# changes made by other workers, the keep-alive comment interval and the stream limit per worker
+PROGRESS_POLL_MS = _env_int("MRSINA_PROGRESS_POLL_MS", 250)
+PROGRESS_HEARTBEAT_S = _env_int("MRSINA_PROGRESS_HEARTBEAT_S", 15)
+PROGRESS_MAX_SUBSCRIBERS = _env_int("MRSINA_PROGRESS_MAX_SUBSCRIBERS", 1000)
+
+# Similarity index over the feature vectors of processed scans (empty directory = in memory, per process):
+# stored vector precision, scans before searches switch to IVF (0 = always exact), clusters probed per
+# search and the cosine similarity from which a result is flagged as a duplicate
+SIMILARITY_INDEX_DIR = os.environ.get("MRSINA_SIMILARITY_INDEX_DIR", os.path.join(SERVICE_DIR, "cache", "similarity"))
+SIMILARITY_DTYPE = os.environ.get("MRSINA_SIMILARITY_DTYPE", "float32")
+SIMILARITY_IVF_MIN_SCANS = _env_int("MRSINA_SIMILARITY_IVF_MIN_SCANS", 20000)
+SIMILARITY_NPROBE = _env_int("MRSINA_SIMILARITY_NPROBE", 8)
+SIMILARITY_DUPLICATE = _env_float("MRSINA_SIMILARITY_DUPLICATE", 0.999)
+
+# Uploads: streamed to the scratch directory (empty = system temp dir) in chunks, max size in MB (0 = unlimited)
+UPLOAD_SCRATCH_DIR = os.environ.get("MRSINA_UPLOAD_SCRATCH_DIR", "")
+UPLOAD_MAX_MB = _env_int("MRSINA_UPLOAD_MAX_MB", 1024)
+UPLOAD_CHUNK_KB = _env_int("MRSINA_UPLOAD_CHUNK_KB", 1024)
+
+# Encoded heatmaps: format (png or webp), WebP quality (1-100), PNG compression (0-9),
+# on-disk cache directory (empty = memory only) and cache budgets in MB
+HEATMAP_FORMAT = os.environ.get("MRSINA_HEATMAP_FORMAT", "png")
+HEATMAP_QUALITY = _env_int("MRSINA_HEATMAP_QUALITY", 80)
+HEATMAP_PNG_COMPRESSION = _env_int("MRSINA_HEATMAP_PNG_COMPRESSION", 3)
+HEATMAP_CACHE_DIR = os.environ.get("MRSINA_HEATMAP_CACHE_DIR", os.path.join(SERVICE_DIR, "cache", "heatmaps"))
+HEATMAP_CACHE_MEMORY_MB = _env_int("MRSINA_HEATMAP_CACHE_MEMORY_MB", 64)
+HEATMAP_CACHE_DISK_MB = _env_int("MRSINA_HEATMAP_CACHE_DISK_MB", 256)
+
+# Whole-volume difference maps: z-slices per smoothing chunk and chunks smoothed at once
+# (0 = this process's torch thread count)
+DIFFERENCE_CHUNK_SLICES = _env_int("MRSINA_DIFFERENCE_CHUNK_SLICES", 32)
+DIFFERENCE_WORKERS = _env_int("MRSINA_DIFFERENCE_WORKERS", 0)
+
+# Registration of the follow-up scan onto the baseline before comparing (rigid, affine or none)
+# and the on-disk transform cache (empty = memory only)
+REGISTRATION_MODE = os.environ.get("MRSINA_REGISTRATION_MODE", "rigid")
+REGISTRATION_CACHE_DIR = os.environ.get("MRSINA_REGISTRATION_CACHE_DIR", os.path.join(SERVICE_DIR, "cache", "registration"))
+
+# Per-patient longitudinal state (SQLite; empty = in memory only)
+LONGITUDINAL_STATE_DIR = os.environ.get("MRSINA_LONGITUDINAL_STATE_DIR", os.path.join(SERVICE_DIR, "cache", "longitudinal"))
+
+# Opt-in per-request profiling: profilers requests may ask for (cprofile, torch, all;
+# empty = disabled), where the artifacts go and how many profiles are kept
+PROFILING = os.environ.get("MRSINA_PROFILING", "")
+PROFILES_DIR = os.environ.get("MRSINA_PROFILES_DIR", os.path.join(SERVICE_DIR, "cache", "profiles"))
+PROFILES_KEEP = _env_int("MRSINA_PROFILES_KEEP", 20)
+
+# Longest scan series /compare-series accepts in one request
+SERIES_MAX_SCANS = _env_int("MRSINA_SERIES_MAX_SCANS", 32)
@@ -0,0 +1,209 @@
+"""
+DICOM series loader for per-slice MR acquisitions
+Reads a directory or .zip of single-slice DICOM files, groups them by
+SeriesInstanceUID, orders them along the slice normal and decodes the pixel
+data in parallel straight into one preallocated volume
+"""
+
+import io
+import logging
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pydicom
+from pydicom.errors import InvalidDicomError
+
+logger = logging.getLogger(__name__)
+
+# Elements larger than this are not read during the header pass; for files on
+# disk pydicom fetches them from the file when the pixel data is decoded
+DEFER_SIZE = '4 KB'
+
+
+class _SliceSource:
+    """Where one slice's bytes live: a file on disk or a member of a zip archive"""
+
+    def __init__(self, path: str, member: Optional[str] = None):
+        self.path = path
+        self.member = member
+
+    @property
+    def name(self) -> str:
+        return self.member or self.path
+
+
+class DicomSeriesReader:
+    """
+    Opens the slice files of a directory or zip archive
+    Zip members are read under a lock (ZipFile is not safe for concurrent
+    reads); decoding happens outside the lock
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._zip = zipfile.ZipFile(path) if zipfile.is_zipfile(path) else None
+        self._zip_lock = threading.Lock()
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+
+    def sources(self) -> List[_SliceSource]:
+        """All candidate slice files, in a stable order"""
+        if self._zip is not None:
+            return [_SliceSource(self.path, info.filename) for info in sorted(self._zip.infolist(), key=lambda i: i.filename)
+                    if not info.is_dir()]
+        sources = []
+        for root, dirs, files in os.walk(self.path):
+            dirs.sort()
+            for name in sorted(files):
+                sources.append(_SliceSource(os.path.join(root, name)))
+        return sources
+
+    def read(self, source: _SliceSource):
+        """
+        Parse one slice without decoding it
+        Pixel data of files on disk is deferred until pixel_array is accessed;
+        zip members are read into memory in full
+        """
+        if source.member is not None:
+            with self._zip_lock:
+                data = self._zip.read(source.member)
+            return pydicom.dcmread(io.BytesIO(data))
+        return pydicom.dcmread(source.path, defer_size=DEFER_SIZE)
+
+
+def _read_header(reader: DicomSeriesReader, source: _SliceSource) -> Optional[Dict]:
+    try:
+        ds = reader.read(source)
+    except (InvalidDicomError, OSError, EOFError):
+        return None
+    if 'SeriesInstanceUID' not in ds or 'Rows' not in ds:
+        return None
+    return {
+        'source': source,
+        'dataset': ds,
+        'series_uid': str(ds.SeriesInstanceUID),
+        'instance_number': int(ds.InstanceNumber) if 'InstanceNumber' in ds else None,
+        'position': [float(v) for v in ds.ImagePositionPatient] if 'ImagePositionPatient' in ds else None,
+        'orientation': [float(v) for v in ds.ImageOrientationPatient] if 'ImageOrientationPatient' in ds else None,
+        'shape': (int(ds.Rows), int(ds.Columns)),
+        'pixel_spacing': [float(v) for v in ds.PixelSpacing] if 'PixelSpacing' in ds else None,
+        'slice_thickness': float(ds.SliceThickness) if ds.get('SliceThickness') else None,
+        'spacing_between_slices': float(ds.SpacingBetweenSlices) if ds.get('SpacingBetweenSlices') else None,
+    }
+
+
+def sort_slices(headers: List[Dict]) -> List[Dict]:
+    """
+    Order slices along the acquisition axis
+    Uses the projection of ImagePositionPatient onto the slice normal when every
+    slice has geometry, then InstanceNumber, then the file name
+    """
+    if all(h['position'] is not None and h['orientation'] is not None for h in headers):
+        orientation = np.array(headers[0]['orientation'])
+        normal = np.cross(orientation[:3], orientation[3:])
+        return sorted(headers, key=lambda h: float(np.dot(normal, h['position'])))
+    if all(h['instance_number'] is not None for h in headers):
+        return sorted(headers, key=lambda h: h['instance_number'])
+    return sorted(headers, key=lambda h: h['source'].name)
+
+
+def series_spacing(slices: List[Dict]) -> Tuple[float, float, float]:
+    """
+    (row, column, slice) spacing in mm of sorted slices
+    The slice spacing is the median step of ImagePositionPatient along the
+    slice normal when every slice has geometry, then SpacingBetweenSlices,
+    then SliceThickness; missing values default to 1 mm
+    """
+    first = slices[0]
+    row_spacing, column_spacing = first['pixel_spacing'] or (1.0, 1.0)
+    slice_spacing = None
+    if len(slices) > 1 and all(h['position'] is not None and h['orientation'] is not None for h in slices):
+        orientation = np.array(first['orientation'])
+        normal = np.cross(orientation[:3], orientation[3:])
+        steps = np.diff([float(np.dot(normal, h['position'])) for h in slices])
+        slice_spacing = float(np.median(np.abs(steps))) or None
+    slice_spacing = slice_spacing or first['spacing_between_slices'] or first['slice_thickness'] or 1.0
+    return float(row_spacing), float(column_spacing), float(slice_spacing)
+
+
+def _decode_into(header: Dict, out: np.ndarray):
+    """Decode one slice and write slope * pixels + intercept into out"""
+    # Drop the dataset reference so decoded pixels are freed slice by slice
+    ds = header.pop('dataset')
+    source = header['source']
+    slope = float(getattr(ds, 'RescaleSlope', 1.0) or 1.0)
+    intercept = float(getattr(ds, 'RescaleIntercept', 0.0) or 0.0)
+    pixels = ds.pixel_array
+    if pixels.shape != out.shape:
+        raise ValueError(f"Slice {source.name} has shape {pixels.shape}, expected {out.shape}")
+    np.multiply(pixels, slope, out=out, casting='unsafe')
+    if intercept:
+        out += intercept
+
+
+def list_series(path: str) -> Dict[str, int]:
+    """Slice count per SeriesInstanceUID found under path"""
+    reader = DicomSeriesReader(path)
+    try:
+        counts: Dict[str, int] = {}
+        for source in reader.sources():
+            header = _read_header(reader, source)
+            if header is not None:
+                counts[header['series_uid']] = counts.get(header['series_uid'], 0) + 1
+        return counts
+    finally:
+        reader.close()
+
+
+def load_dicom_series(path: str, series_uid: Optional[str] = None,
+                      max_workers: Optional[int] = None) -> np.ndarray:
+    """Load a DICOM series from a directory or zip archive as an (H, W, slices) float32 volume"""
+    return read_dicom_series(path, series_uid, max_workers)[0]
+
+
+def read_dicom_series(path: str, series_uid: Optional[str] = None,
+                      max_workers: Optional[int] = None) -> Tuple[np.ndarray, Tuple[float, float, float]]:
+    """
+    An (H, W, slices) float32 volume of a DICOM series and its (row, column, slice) spacing in mm
+    Without series_uid the series with the most slices is used. Slices are
+    decoded on a thread pool (file I/O, pixel codecs and the NumPy rescale
+    release the GIL) directly into their plane of a preallocated array
+    """
+    max_workers = max_workers or min(32, os.cpu_count() or 1)
+    reader = DicomSeriesReader(path)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dicom-decode") as executor:
+            # One parse per file: headers now, deferred pixel data during decode
+            headers = [h for h in executor.map(lambda s: _read_header(reader, s), reader.sources()) if h is not None]
+            if not headers:
+                raise ValueError(f"No DICOM slices found in {path}")
+
+            series: Dict[str, List[Dict]] = {}
+            for header in headers:
+                series.setdefault(header['series_uid'], []).append(header)
+            if series_uid is None:
+                series_uid = max(series, key=lambda uid: len(series[uid]))
+            elif series_uid not in series:
+                raise ValueError(f"Series {series_uid} not found in {path}")
+            if len(series) > 1:
+                logger.info(f"{path} contains {len(series)} series, loading {series_uid}")
+
+            slices = sort_slices(series[series_uid])
+            rows, columns = slices[0]['shape']
+            spacing = series_spacing(slices)
+            # Slice-major so each decode writes one contiguous plane
+            volume = np.empty((len(slices), rows, columns), dtype=np.float32)
+            futures = [executor.submit(_decode_into, h, volume[i]) for i, h in enumerate(slices)]
+            for future in futures:
+                future.result()
+    finally:
+        reader.close()
+
+    # (H, W, slices) view, matching the axis order of NIfTI volumes in the pipeline
+    return volume.transpose(1, 2, 0), spacing
@@ -0,0 +1,158 @@
+"""
+Whole-volume 3D difference / attention maps in bounded memory
+The absolute float32 difference of two volumes is Gaussian-smoothed in
+overlapping z-chunks: each chunk is read with a halo of `truncate * sigma`
+slices on both sides for the z pass, so its interior matches smoothing the
+whole volume at once; the in-plane passes only touch the interior.
+Threshold statistics (mean, variance, min, max) are merged chunk by chunk
+(Chan et al. parallel variance), and only the smoothed slices the caller
+asks for are kept. Chunks run on a thread pool: scipy.ndimage releases
+the GIL while filtering
+
+Peak memory is about `workers` x 3 chunk-sized float32 buffers plus the kept
+slices, instead of several full-volume temporaries
+"""
+
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import ndimage
+
+logger = logging.getLogger(__name__)
+
+
+class RunningStats(NamedTuple):
+    """Count, mean, sum of squared deviations, min and max of a set of values"""
+    count: int
+    mean: float
+    m2: float
+    minimum: float
+    maximum: float
+
+    @classmethod
+    def of(cls, values: np.ndarray) -> "RunningStats":
+        if values.size == 0:
+            return cls(0, 0.0, 0.0, np.inf, -np.inf)
+        mean = float(values.mean(dtype=np.float64))
+        return cls(values.size, mean, float(values.var(dtype=np.float64)) * values.size,
+                   float(values.min()), float(values.max()))
+
+    def merge(self, other: "RunningStats") -> "RunningStats":
+        count = self.count + other.count
+        if count == 0:
+            return self
+        delta = other.mean - self.mean
+        return RunningStats(
+            count,
+            self.mean + delta * other.count / count,
+            self.m2 + other.m2 + delta * delta * self.count * other.count / count,
+            min(self.minimum, other.minimum),
+            max(self.maximum, other.maximum)
+        )
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.m2 / self.count)) if self.count else 0.0
+
+
+class AttentionStack(NamedTuple):
+    """Per-slice attention maps in [0, 1] (H, W, len(slice_indices)) and the whole-volume statistics"""
+    attention: np.ndarray
+    slice_indices: List[int]
+    threshold: float
+    stats: RunningStats
+
+
+def _default_workers() -> int:
+    # Inside a server worker, torch's thread count is this process's share of the cores
+    torch = sys.modules.get('torch')
+    return torch.get_num_threads() if torch else os.cpu_count() or 1
+
+
+class DifferenceEngine:
+    """
+    Chunked whole-volume difference engine
+    `sigma` is the Gaussian smoothing in voxels, `chunk_slices` the z-extent
+    of one chunk (before the halo) and `workers` the number of chunks smoothed
+    at once (None = torch threads of this process, or all cores)
+    """
+
+    def __init__(self, sigma: float = 2.0, chunk_slices: int = 32, workers: Optional[int] = None,
+                 truncate: float = 4.0):
+        self.sigma = sigma
+        self.truncate = truncate
+        self.chunk_slices = max(1, chunk_slices)
+        self.workers = workers
+        # Same radius scipy uses for the kernel, so chunk interiors are exact
+        self.halo = int(truncate * sigma + 0.5)
+
+    def _smooth_chunk(self, volume1, volume2, z0: int, z1: int, depth: int) -> np.ndarray:
+        """Smoothed |volume1 - volume2| for slices z0..z1 (read with a halo)"""
+        a, b = max(0, z0 - self.halo), min(depth, z1 + self.halo)
+        diff = np.array(volume1[:, :, a:b], dtype=np.float32)
+        diff -= np.asarray(volume2[:, :, a:b], dtype=np.float32)
+        np.abs(diff, out=diff)
+        # The Gaussian is separable: only the z pass needs the halo, the in-plane passes
+        # run on the chunk interior alone
+        smoothed = ndimage.gaussian_filter1d(diff, self.sigma, axis=2, truncate=self.truncate, output=diff)
+        smoothed = np.ascontiguousarray(smoothed[:, :, z0 - a:z1 - a])
+        for axis in (0, 1):
+            ndimage.gaussian_filter1d(smoothed, self.sigma, axis=axis, truncate=self.truncate, output=smoothed)
+        return smoothed
+
+    def attention_stack(self, volume1, volume2, slice_indices: Optional[Sequence[int]] = None) -> AttentionStack:
+        """
+        Attention maps of the given axial slices (all slices when None)
+        Each map is the smoothed difference normalized by the whole volume's
+        min/max, with values below mean + std of the volume set to zero
+        """
+        if tuple(volume1.shape) != tuple(volume2.shape):
+            raise ValueError(f"Volume shapes differ: {tuple(volume1.shape)} vs {tuple(volume2.shape)}")
+        if len(volume1.shape) == 2:
+            volume1, volume2 = np.asarray(volume1)[:, :, np.newaxis], np.asarray(volume2)[:, :, np.newaxis]
+        height, width, depth = volume1.shape[:3]
+        slice_indices = list(range(depth)) if slice_indices is None else [int(i) for i in slice_indices]
+        for index in slice_indices:
+            if not 0 <= index < depth:
+                raise ValueError(f"Slice index {index} is outside 0..{depth - 1}")
+
+        chunks: List[Tuple[int, int]] = [
+            (z0, min(depth, z0 + self.chunk_slices)) for z0 in range(0, depth, self.chunk_slices)
+        ]
+        position = {index: n for n, index in enumerate(slice_indices)}
+        attention = np.zeros((height, width, len(slice_indices)), dtype=np.float32)
+
+        def process(chunk: Tuple[int, int]) -> RunningStats:
+            z0, z1 = chunk
+            smoothed = self._smooth_chunk(volume1, volume2, z0, z1, depth)
+            for index in range(z0, z1):
+                if index in position:
+                    attention[:, :, position[index]] = smoothed[:, :, index - z0]
+            return RunningStats.of(smoothed)
+
+        workers = max(1, min(self.workers or _default_workers(), len(chunks)))
+        if workers == 1:
+            chunk_stats = [process(chunk) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='difference') as pool:
+                chunk_stats = list(pool.map(process, chunks))
+
+        stats = chunk_stats[0]
+        for other in chunk_stats[1:]:
+            stats = stats.merge(other)
+
+        # Normalize to 0-1 by the volume range and keep what exceeds mean + std
+        value_range = stats.maximum - stats.minimum
+        if value_range > 0:
+            attention -= stats.minimum
+            attention /= value_range
+            threshold = (stats.mean - stats.minimum + stats.std) / value_range
+            attention[attention <= threshold] = 0
+        else:
+            attention[...] = 0
+            threshold = 0.0
+        return AttentionStack(attention, slice_indices, float(threshold), stats)
@@ -0,0 +1,78 @@
+"""
+Content-addressed cache for per-scan feature vectors
+Two tiers (see tiered_cache): an in-memory LRU and an on-disk store of
+memory-mapped .npy files indexed by SQLite, with size-based eviction on both tiers
+"""
+
+import hashlib
+import logging
+import os
+from typing import BinaryIO, Optional
+
+import numpy as np
+
+from tiered_cache import TieredCache
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(file_path: str, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """
+    SHA-256 of a file's content, read in fixed-size chunks
+    For a directory (DICOM series) the relative names and contents of all
+    files are hashed in sorted order
+    """
+    digest = hashlib.sha256()
+    if os.path.isdir(file_path):
+        for root, dirs, files in os.walk(file_path):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, file_path).encode('utf-8') + b'\0')
+                _update_digest(digest, path, chunk_size)
+    else:
+        _update_digest(digest, file_path, chunk_size)
+    return digest.hexdigest()
+
+
+def _update_digest(digest, file_path: str, chunk_size: int):
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+
+
+def make_cache_key(content_hash: str, *versions: str) -> str:
+    """Combine a scan content hash with model/preprocessing versions into one key"""
+    return hashlib.sha256(':'.join((content_hash,) + versions).encode('utf-8')).hexdigest()
+
+
+class FeatureCache(TieredCache):
+    """
+    Two-tier feature-vector cache keyed by content hash + model version
+    The memory tier holds up to `memory_entries` vectors; the disk tier (when a
+    cache directory is given) holds up to `disk_max_bytes` of .npy files and
+    evicts least recently used entries first
+    """
+
+    entry_suffix = '.npy'
+    description = 'feature cache'
+
+    def __init__(self, cache_dir: Optional[str] = None, memory_entries: int = 512,
+                 disk_max_bytes: int = 512 * 1024 * 1024):
+        super().__init__(cache_dir, disk_max_bytes)
+        self.memory_entries = max(0, memory_entries)
+
+    def _memory_limit(self) -> int:
+        return self.memory_entries
+
+    def _read_entry(self, path: str) -> np.ndarray:
+        return np.array(np.load(path, mmap_mode='r'))
+
+    def _write_entry(self, f: BinaryIO, features: np.ndarray):
+        np.save(f, features)
+
+    def put(self, key: str, features: np.ndarray):
+        """Store features in both tiers"""
+        super().put(key, np.ascontiguousarray(features, dtype=np.float32))
@@ -0,0 +1,90 @@
+"""
+Encoded heatmap images and their cache
+Heatmap overlays are encoded once (PNG or WebP) and kept in a two-tier cache
+(the tiered_cache base shared with the feature cache) whose memory LRU is
+bounded in bytes. Keys are derived from the scan content hash(es), slice,
+highlighted regions, model version and encoding, so a key names exactly one
+image and doubles as its HTTP ETag
+"""
+
+import logging
+from typing import BinaryIO, Dict, Iterable, Optional
+
+import cv2
+import numpy as np
+
+from feature_cache import make_cache_key
+from tiered_cache import TieredCache
+
+logger = logging.getLogger(__name__)
+
+HEATMAP_FORMATS = ('png', 'webp')
+
+
+def encode_heatmap(image: np.ndarray, image_format: str = 'png', quality: int = 80,
+                   png_compression: int = 3) -> bytes:
+    """
+    Encode an RGB heatmap overlay
+    `quality` (1-100) applies to WebP; PNG is lossless and uses `png_compression` (0-9)
+    """
+    if image_format not in HEATMAP_FORMATS:
+        raise ValueError(f"Unsupported heatmap format: {image_format}")
+    bgr = cv2.cvtColor(np.ascontiguousarray(image, dtype=np.uint8), cv2.COLOR_RGB2BGR)
+    if image_format == 'webp':
+        params = [cv2.IMWRITE_WEBP_QUALITY, int(min(100, max(1, quality)))]
+    else:
+        params = [cv2.IMWRITE_PNG_COMPRESSION, int(min(9, max(0, png_compression)))]
+    ok, encoded = cv2.imencode(f".{image_format}", bgr, params)
+    if not ok:
+        raise RuntimeError(f"Heatmap could not be encoded as {image_format}")
+    return encoded.tobytes()
+
+
+def media_type(data: bytes) -> str:
+    """MIME type of encoded heatmap bytes"""
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/png'
+
+
+def heatmap_key(content_hashes: Iterable[str], slice_index: Optional[int], regions: Optional[Iterable[str]],
+                model_version: str, image_format: str, quality: int, png_compression: int = 3) -> str:
+    """Cache key / ETag of a rendered heatmap (every encoder setting is part of it)"""
+    region_part = ','.join(sorted(regions)) if regions else 'all'
+    return make_cache_key(
+        '+'.join(content_hashes), f"slice={slice_index}", f"regions={region_part}",
+        model_version, f"{image_format}:quality={quality}:png_compression={png_compression}"
+    )
+
+
+class HeatmapCache(TieredCache):
+    """
+    Two-tier cache of encoded heatmaps keyed by heatmap_key()
+    The memory tier holds up to `memory_bytes`, the disk tier (when a cache
+    directory is given) up to `disk_max_bytes`; both evict least recently used
+    entries first
+    """
+
+    entry_suffix = '.img'
+    description = 'heatmap cache'
+
+    def __init__(self, cache_dir: Optional[str] = None, memory_bytes: int = 64 * 1024 * 1024,
+                 disk_max_bytes: int = 256 * 1024 * 1024):
+        super().__init__(cache_dir, disk_max_bytes)
+        self.memory_bytes = max(0, memory_bytes)
+
+    def _memory_limit(self) -> int:
+        return self.memory_bytes
+
+    def _weigh(self, data: bytes) -> int:
+        return len(data)
+
+    def _read_entry(self, path: str) -> bytes:
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _write_entry(self, f: BinaryIO, data: bytes):
+        f.write(data)
+
+    def _memory_stats(self) -> Dict:
+        return {'memory_entries': len(self._memory), 'memory_bytes': self._memory_used}
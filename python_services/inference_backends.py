@@ -0,0 +1,174 @@
+"""
+Selectable CPU inference backends for the ResNet50 feature extractor and brain analyzer
+- eager: fp32 PyTorch modules (reference)
+- int8-dynamic: torch dynamic INT8 quantization of the Linear layers (the
+  analyzer and ResNet's fc; the convolutions stay fp32)
+- int8-static: torch static INT8 quantization of the whole ResNet50, calibrated
+  on representative slices; the analyzer uses dynamic INT8
+- onnx: both networks exported to ONNX and run by ONNX Runtime
+"""
+
+import copy
+import io
+import logging
+import warnings
+from typing import Dict, Iterable, Optional
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('eager', 'int8-dynamic', 'int8-static', 'onnx')
+
+
+class InferenceBackend:
+    """Eager fp32 execution; the other backends override how the networks are run"""
+
+    name = 'eager'
+
+    def __init__(self, feature_extractor: nn.Module, brain_analyzer: nn.Module, device: torch.device):
+        self.device = device
+        self.feature_extractor = feature_extractor
+        self.brain_analyzer = brain_analyzer
+
+    def extract(self, batch: torch.Tensor) -> torch.Tensor:
+        """ResNet features for an (N, 3, 224, 224) slice batch"""
+        with torch.inference_mode():
+            batch = batch.to(self.device).contiguous(memory_format=torch.channels_last)
+            return self.feature_extractor(batch)
+
+    def analyze(self, combined_features: torch.Tensor) -> torch.Tensor:
+        """Brain analyzer output for (N, 4096) concatenated scan features"""
+        with torch.inference_mode():
+            return self.brain_analyzer(combined_features.to(self.device))
+
+    def describe(self) -> Dict:
+        return {'backend': self.name, 'device': str(self.device)}
+
+
+def _quantize_linear(module: nn.Module) -> nn.Module:
+    """Dynamic INT8 copy of a module's Linear layers (weights quantized once, activations per call)"""
+    with warnings.catch_warnings():
+        # torch.ao.quantization is deprecated in favour of torchao but still ships with torch
+        warnings.simplefilter('ignore', DeprecationWarning)
+        return torch.ao.quantization.quantize_dynamic(copy.deepcopy(module).cpu(), {nn.Linear}, dtype=torch.qint8)
+
+
+class DynamicInt8Backend(InferenceBackend):
+    """Dynamic INT8 Linear layers on CPU"""
+
+    name = 'int8-dynamic'
+
+    def __init__(self, feature_extractor: nn.Module, brain_analyzer: nn.Module, device: torch.device):
+        super().__init__(_quantize_linear(feature_extractor), _quantize_linear(brain_analyzer), device)
+
+
+class StaticInt8Backend(InferenceBackend):
+    """
+    Fully INT8 ResNet50 (fused conv-bn-relu, per-channel weights, x86/fbgemm kernels)
+    Activation ranges come from the calibration batches, so they should be
+    preprocessed slices of real scans
+    """
+
+    name = 'int8-static'
+
+    def __init__(self, feature_extractor: nn.Module, brain_analyzer: nn.Module, device: torch.device,
+                 calibration_batches: Iterable[torch.Tensor]):
+        from torchvision.models.quantization import resnet50 as quantizable_resnet50
+
+        engine = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'qnnpack'
+        torch.backends.quantized.engine = engine
+        model = quantizable_resnet50(weights=None, quantize=False)
+        model.fc = nn.Linear(feature_extractor.fc.in_features, feature_extractor.fc.out_features)
+        model.load_state_dict(feature_extractor.state_dict())
+        model.eval()
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            model.fuse_model(is_qat=False)
+            model.qconfig = torch.ao.quantization.get_default_qconfig(engine)
+            torch.ao.quantization.prepare(model, inplace=True)
+            calibrated = 0
+            with torch.no_grad():
+                for batch in calibration_batches:
+                    model(batch.contiguous())
+                    calibrated += batch.shape[0]
+            if calibrated == 0:
+                raise ValueError("int8-static backend needs at least one calibration slice")
+            torch.ao.quantization.convert(model, inplace=True)
+        logger.info(f"Static INT8 ResNet50 calibrated on {calibrated} slices ({engine} engine)")
+        super().__init__(model, _quantize_linear(brain_analyzer), device)
+
+    def extract(self, batch: torch.Tensor) -> torch.Tensor:
+        with torch.inference_mode():
+            return self.feature_extractor(batch.contiguous())
+
+
+class OnnxBackend(InferenceBackend):
+    """ONNX Runtime sessions for both networks (exported in memory at startup)"""
+
+    name = 'onnx'
+
+    def __init__(self, feature_extractor: nn.Module, brain_analyzer: nn.Module, device: torch.device,
+                 num_threads: Optional[int] = None):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("The onnx inference backend requires onnxruntime (pip install onnxruntime)")
+        super().__init__(feature_extractor, brain_analyzer, device)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads or torch.get_num_threads()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._extractor_session = ort.InferenceSession(
+            self._export(feature_extractor, torch.zeros(1, 3, 224, 224)), options, providers=['CPUExecutionProvider']
+        )
+        self._analyzer_session = ort.InferenceSession(
+            self._export(brain_analyzer, torch.zeros(1, brain_analyzer[0].in_features)), options,
+            providers=['CPUExecutionProvider']
+        )
+
+    @staticmethod
+    def _export(module: nn.Module, example: torch.Tensor) -> bytes:
+        """Serialize a module to ONNX with a dynamic batch dimension"""
+        buffer = io.BytesIO()
+        with warnings.catch_warnings():
+            # The TorchScript exporter needs no extra packages (the dynamo exporter requires onnxscript)
+            warnings.simplefilter('ignore', DeprecationWarning)
+            torch.onnx.export(
+                copy.deepcopy(module).eval(), example, buffer, dynamo=False,
+                input_names=['input'], output_names=['output'],
+                dynamic_axes={'input': {0: 'batch'}, 'output': {0: 'batch'}}
+            )
+        return buffer.getvalue()
+
+    @staticmethod
+    def _run(session, batch: torch.Tensor) -> torch.Tensor:
+        inputs = batch.detach().cpu().to(torch.float32).contiguous().numpy()
+        return torch.from_numpy(session.run(None, {'input': inputs})[0])
+
+    def extract(self, batch: torch.Tensor) -> torch.Tensor:
+        return self._run(self._extractor_session, batch)
+
+    def analyze(self, combined_features: torch.Tensor) -> torch.Tensor:
+        return self._run(self._analyzer_session, combined_features)
+
+
+def create_backend(name: str, feature_extractor: nn.Module, brain_analyzer: nn.Module, device: torch.device,
+                   calibration_batches: Optional[Iterable[torch.Tensor]] = None) -> InferenceBackend:
+    """Build the named backend from the fp32 modules"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}', expected one of {', '.join(BACKENDS)}")
+    if name != 'eager' and device.type != 'cpu':
+        raise ValueError(f"Inference backend '{name}' only runs on CPU")
+
+    if name == 'eager':
+        return InferenceBackend(feature_extractor, brain_analyzer, device)
+    if name == 'int8-dynamic':
+        return DynamicInt8Backend(feature_extractor, brain_analyzer, device)
+    if name == 'int8-static':
+        if calibration_batches is None:
+            raise ValueError("int8-static backend needs calibration scans (MRSINA_INFERENCE_CALIBRATION_DIR)")
+        return StaticInt8Backend(feature_extractor, brain_analyzer, device, calibration_batches)
+    return OnnxBackend(feature_extractor, brain_analyzer, device)
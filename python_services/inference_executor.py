@@ -0,0 +1,98 @@
+"""
+Dedicated executor for CPU-bound MR pipeline calls
+Keeps decoding and ResNet inference off the asyncio event loop so lightweight
+endpoints such as /health stay responsive while comparisons run
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_count(torch_threads: int) -> int:
+    """
+    Number of executor threads that fits next to torch's intra-op thread pool
+    Each inference call already uses `torch_threads` cores, so running more than
+    cpu_count // torch_threads calls at once only oversubscribes the CPU
+    """
+    return max(1, (os.cpu_count() or 1) // max(1, torch_threads))
+
+
+class InferenceExecutor:
+    """
+    Thread pool plus a per-worker concurrency semaphore for heavy pipeline calls
+    Torch and NumPy release the GIL in their kernels, so threads give real
+    parallelism without copying the model into other processes
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_concurrency: Optional[int] = None,
+                 name: str = "mr-inference"):
+        # Without an explicit size the pool is created on first use: by then the model
+        # loader has applied its torch thread settings (autotune profile, per-worker split)
+        self._max_workers = max(1, max_workers) if max_workers is not None else None
+        self._max_concurrency = max_concurrency
+        self.name = name
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+        self._waiting = 0
+        if self._max_workers is not None:
+            self._start()
+
+    @property
+    def max_workers(self) -> int:
+        """Pool size (before first use: the size the current torch thread setting gives)"""
+        if self._max_workers is not None:
+            return self._max_workers
+        # Torch's intra-op pool defaults to every core; read it only if torch is
+        # already imported so sizing the executor never pulls torch in
+        torch = sys.modules.get('torch')
+        return default_worker_count(torch.get_num_threads() if torch else os.cpu_count() or 1)
+
+    @property
+    def max_concurrency(self) -> int:
+        return max(1, self._max_concurrency or self.max_workers)
+
+    def _start(self):
+        self._max_workers = self.max_workers
+        self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix=self.name)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        logger.info(f"Executor {self.name}: {self._max_workers} threads, concurrency limit {self.max_concurrency}")
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the executor without blocking the event loop"""
+        # The counters (and the lazy start) are only touched from the event loop thread
+        if self._executor is None:
+            self._start()
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict:
+        """Executor size and current load"""
+        return {
+            'threads': self.max_workers,
+            'max_concurrency': self.max_concurrency,
+            'in_flight': self._in_flight,
+            'waiting': self._waiting,
+        }
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting work; optionally wait for running calls to finish"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
@@ -0,0 +1,212 @@
+"""
+Bounded background job engine for MR processing
+A fixed pool of worker threads claims tasks from a depth-limited queue kept in
+a TaskStore, which also holds each task's status, timestamps, result or error
+for status polling. With an on-disk store the queue and the task records are
+shared by every server worker on the host and survive restarts
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+import progress
+from task_store import (
+    QueueFullError, SQLiteTaskStore, STATUS_DONE, STATUS_FAILED, STATUS_QUEUED, STATUS_RUNNING, TaskStore
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobEngine:
+    """
+    Worker pool that runs `handler(payload)` for each submitted task
+    At most `max_workers` tasks run concurrently in this process and at most
+    `max_queue_depth` wait in the (shared) queue; further submissions raise
+    QueueFullError. Idle workers poll the store every `poll_interval` seconds
+    for tasks submitted by other processes; local submissions wake them at once.
+    Finished tasks are deleted `task_ttl` seconds after completion, and tasks
+    left running by a dead process are requeued (at most `max_attempts` runs).
+    A process is dead when its PID is gone on this host or when it has not
+    renewed the lease of its running tasks for `lease_timeout` seconds; worker
+    ids carry a per-process nonce, so a new process that reuses a PID never
+    acts on the old process's tasks.
+    Stage progress of running tasks is written to the store as it happens;
+    `on_update(task_id)` is called after every change this process makes
+    """
+
+    def __init__(self, handler: Callable[[Dict], Dict], max_workers: int = 2,
+                 max_queue_depth: int = 32, store: Optional[TaskStore] = None,
+                 task_ttl: float = 24 * 3600.0, poll_interval: float = 0.5,
+                 cleanup_interval: float = 60.0, max_attempts: int = 2, lease_timeout: float = 120.0,
+                 on_update: Optional[Callable[[str], None]] = None):
+        self.handler = handler
+        self.max_workers = max(1, max_workers)
+        self.max_queue_depth = max(1, max_queue_depth)
+        self.store = store if store is not None else SQLiteTaskStore()
+        self.task_ttl = task_ttl
+        self.poll_interval = poll_interval
+        self.cleanup_interval = cleanup_interval
+        self.max_attempts = max(1, max_attempts)
+        self.lease_timeout = lease_timeout
+        self.on_update = on_update
+        self._wakeup = threading.Condition()
+        self._stopping = False
+        self._drain = True
+        self._next_cleanup = 0.0
+        self._workers = []
+        self._worker_ids = []
+        self._heartbeat = None
+        self._heartbeat_stop = threading.Event()
+
+    def start(self):
+        """Recover tasks orphaned by dead processes, then start the worker threads"""
+        if self._workers:
+            return
+        self._stopping = False
+        self.maintain(force=True)
+        # Resolved here, not in __init__: server workers start the engine after fork()
+        nonce = uuid.uuid4().hex[:12]
+        self._worker_ids = [f"{socket.gethostname()}:{os.getpid()}:{nonce}:{i}" for i in range(self.max_workers)]
+        for i, worker_id in enumerate(self._worker_ids):
+            worker = threading.Thread(target=self._worker_loop, args=(worker_id,), name=f"mr-job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        self._heartbeat_stop.clear()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="mr-job-heartbeat", daemon=True)
+        self._heartbeat.start()
+        logger.info(f"Job engine started with {self.max_workers} workers, queue depth {self.max_queue_depth}")
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the workers; with `wait` they first process the tasks already queued
+        Without it, queued tasks stay in the store for other workers (or the next start)
+        """
+        with self._wakeup:
+            self._stopping = True
+            self._drain = wait
+            self._wakeup.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+        # Leases stay renewed until the drained tasks have finished
+        self._heartbeat_stop.set()
+        if wait and self._heartbeat is not None:
+            self._heartbeat.join()
+        self._workers = []
+        self._heartbeat = None
+
+    def submit(self, payload: Dict) -> str:
+        """Queue a task and return its unique task ID"""
+        task_id = f"task_{uuid.uuid4().hex}"
+        self.store.create(task_id, payload, self.max_queue_depth)
+        with self._wakeup:
+            self._wakeup.notify()
+        return task_id
+
+    def get(self, task_id: str) -> Optional[Dict]:
+        """Return a snapshot of a task's record"""
+        return self.store.get(task_id)
+
+    def stats(self) -> Dict:
+        """Queue depth and worker utilisation (running and queued count every process sharing the store)"""
+        counts = self.store.counts()
+        return {
+            'workers': self.max_workers,
+            'running': counts[STATUS_RUNNING],
+            'queued': counts[STATUS_QUEUED],
+            'max_queue_depth': self.max_queue_depth,
+            'finished': counts[STATUS_DONE] + counts[STATUS_FAILED],
+        }
+
+    def maintain(self, force: bool = False):
+        """Requeue orphaned tasks and delete expired ones (at most once per cleanup_interval)"""
+        now = time.monotonic()
+        if not force and now < self._next_cleanup:
+            return
+        self._next_cleanup = now + self.cleanup_interval
+        host = socket.gethostname()
+        expired_before = time.time() - self.lease_timeout
+        dead = []
+        for worker, heartbeat in self.store.running_workers().items():
+            worker_host, _, rest = worker.partition(':')
+            pid = rest.split(':', 1)[0]
+            if heartbeat is None or heartbeat < expired_before:
+                dead.append(worker)
+            elif worker_host == host and pid.isdigit() and not _pid_alive(int(pid)):
+                # Fast path: no need to wait for the lease of a process that is gone
+                dead.append(worker)
+        if dead:
+            self.store.requeue(dead, self.max_attempts)
+        expired = self.store.cleanup(self.task_ttl)
+        if expired:
+            logger.info(f"Deleted {expired} finished tasks older than {self.task_ttl:.0f}s")
+
+    def _heartbeat_loop(self):
+        # Renewed independently of the worker threads, which block for the whole of a task
+        while not self._heartbeat_stop.wait(self.lease_timeout / 4):
+            try:
+                self.store.heartbeat(self._worker_ids)
+            except Exception as e:
+                logger.warning(f"Task lease renewal failed: {str(e)}")
+
+    def _worker_loop(self, worker: str):
+        while True:
+            if self._stopping and not self._drain:
+                return
+            task = self.store.claim(worker)
+            if task is not None:
+                self._run_task(task, worker)
+                continue
+            if self._stopping:
+                return
+            self.maintain()
+            with self._wakeup:
+                if not self._stopping:
+                    self._wakeup.wait(self.poll_interval)
+
+    def _notify(self, task_id: str):
+        if self.on_update is not None:
+            try:
+                self.on_update(task_id)
+            except Exception as e:
+                logger.warning(f"Task update callback failed for {task_id}: {str(e)}")
+
+    def _run_task(self, task: Dict, worker: str):
+        task_id = task['task_id']
+        logger.info(f"Starting background processing for task: {task_id}")
+        self._notify(task_id)
+        state = progress.ProgressState()
+
+        def report(event: Dict):
+            if self.store.update_progress(task_id, worker, state.update(event)):
+                self._notify(task_id)
+
+        start = time.perf_counter()
+        try:
+            with progress.reporting(report):
+                result = self.handler(task)
+            update = {'status': STATUS_DONE, 'result': result}
+            logger.info(f"Background processing completed for task: {task_id}")
+        except Exception as e:
+            logger.error(f"Error in background processing {task_id}: {str(e)}")
+            update = {'status': STATUS_FAILED, 'error': str(e)}
+
+        processing_seconds = round(time.perf_counter() - start, 3)
+        if not self.store.complete(task_id, worker, processing_seconds=processing_seconds, **update):
+            logger.warning(f"Task {task_id} was taken over by another worker; result discarded")
+        self._notify(task_id)
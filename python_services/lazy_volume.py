@@ -0,0 +1,102 @@
+"""
+Lazy, memory-mapped access to NIfTI volumes
+The pipeline only needs ~20 axial slices plus the middle slice of each scan,
+so instead of get_fdata() (the whole volume as float64) slices are read on
+demand through nibabel's array proxy. Compressed (.nii.gz) files cannot be
+memory-mapped, and every proxy read would decompress the stream again, so
+they are decompressed once, in their on-disk dtype
+"""
+
+import logging
+from typing import Optional, Sequence
+
+import nibabel as nib
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class LazyNiftiVolume:
+    """
+    Read-on-demand NIfTI volume with the same 0-255 normalization as load_dicom_image
+    Indexing returns NumPy arrays; values are scaled to 0-255 uint8 when the
+    volume maximum exceeds 255, and returned as `dtype` (None = the on-disk
+    dtype) otherwise
+    """
+
+    def __init__(self, path: str, dtype=np.float32, chunk_slices: int = 16):
+        self.path = path
+        self.dtype = np.dtype(dtype) if dtype is not None else None
+        self.chunk_slices = max(1, chunk_slices)
+        self._image = nib.load(path, mmap=True)
+        self.shape = tuple(self._image.shape)
+        self._max: Optional[float] = None
+        # Uncompressed files are memory-mapped; only the pages of the slices read get touched
+        self.memory_mapped = not path.endswith('.gz')
+        if self.memory_mapped:
+            self._proxy = self._image.dataobj
+        else:
+            self._proxy = np.asarray(self._image.dataobj)
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def voxel_volume_mm3(self) -> float:
+        """Volume of one voxel from the header's voxel sizes (the first three zooms)"""
+        return float(np.prod(self._image.header.get_zooms()[:3]))
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def max(self) -> float:
+        """Volume maximum, computed once (memory-mapped files: in a streaming pass over slabs of axial slices)"""
+        if self._max is None and not self.memory_mapped:
+            self._max = float(np.max(self._proxy))
+        if self._max is None:
+            # A separate non-mmap proxy reads each slab with plain file reads, so the
+            # pass does not leave the whole file mapped into this process's RSS
+            proxy = nib.load(self.path, mmap=False).dataobj
+            depth = self.shape[2] if self.ndim >= 3 else 1
+            maximum = -np.inf
+            for start in range(0, depth, self.chunk_slices):
+                key = (slice(None), slice(None), slice(start, start + self.chunk_slices)) if self.ndim >= 3 else ()
+                maximum = max(maximum, float(np.max(proxy[key])))
+            self._max = maximum
+        return self._max
+
+    def _normalize(self, data: np.ndarray) -> np.ndarray:
+        maximum = self.max()
+        if maximum > 255:
+            data = np.array(data, dtype=np.float32)
+            data *= 255.0 / maximum
+            return data.astype(np.uint8)
+        return data if self.dtype is None else np.asarray(data, dtype=self.dtype)
+
+    def __getitem__(self, key) -> np.ndarray:
+        return self._normalize(np.asarray(self._proxy[key]))
+
+    def take_slices(self, indices: Sequence[int]) -> np.ndarray:
+        """Read axial slices [:, :, i] for each index into one (N, H, W) array"""
+        indices = [int(i) for i in indices]
+        out = None
+        for n, index in enumerate(indices):
+            plane = self[:, :, index]
+            if out is None:
+                out = np.empty((len(indices),) + plane.shape, dtype=plane.dtype)
+            out[n] = plane
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        """Full materialization (only for callers that really need the whole volume)"""
+        data = self[...]
+        return data.astype(dtype) if dtype is not None else data
+
+
+def take_axial_slices(volume, indices: Sequence[int]) -> np.ndarray:
+    """Slices [:, :, i] of an in-memory or lazy volume as a slice-major (N, H, W) array"""
+    if isinstance(volume, LazyNiftiVolume):
+        return volume.take_slices(indices)
+    # One indexing operation copies only the selected slices, slice-major
+    return volume.transpose(2, 0, 1)[np.asarray(indices)]
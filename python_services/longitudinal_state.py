@@ -0,0 +1,370 @@
+"""
+Incremental longitudinal state per patient
+Keeps each patient's scan history in SQLite: per-scan feature vectors and
+region statistics, plus running least-squares sums of tissue volume over
+time for every brain region. Appending a follow-up scan runs the feature
+extractor on that scan only and one analyzer pass (against the previous scan
+and the baseline); the trend is updated from the running sums in O(1)
+
+State is tagged with the processor's feature version and region
+definitions. When either changes, the history is rebuilt from the stored
+scan paths (or reported as stale if they are gone or changed)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from feature_cache import hash_file
+from metrics import reports_timings
+from sqlite_utils import reconnect_after_fork
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400.0
+DAYS_PER_YEAR = 365.25
+# Optimistic-concurrency retries when another worker appends to the same patient
+APPEND_ATTEMPTS = 3
+
+
+class StaleStateError(Exception):
+    """Stored history was built by another model version and cannot be rebuilt"""
+
+
+class _ConcurrentAppend(Exception):
+    pass
+
+
+def state_version(processor) -> str:
+    """Version tag of everything stored state depends on: features and region definitions"""
+    regions = json.dumps(
+        {name: list(info['roi_coords']) for name, info in processor.brain_regions.items()}, sort_keys=True
+    )
+    return f"{processor.feature_version}:{hashlib.sha256(regions.encode('utf-8')).hexdigest()[:12]}"
+
+
+def parse_scan_time(scan_date: Optional[str]) -> float:
+    """Epoch seconds of an ISO date/datetime (UTC when no zone is given), now when omitted"""
+    if not scan_date:
+        return time.time()
+    parsed = datetime.fromisoformat(scan_date)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def add_trend_point(sums: Dict[str, float], t: float, y: float):
+    """Add one (time, value) point to running least-squares sums"""
+    sums['n'] = sums.get('n', 0) + 1
+    sums['t'] = sums.get('t', 0.0) + t
+    sums['y'] = sums.get('y', 0.0) + y
+    sums['tt'] = sums.get('tt', 0.0) + t * t
+    sums['ty'] = sums.get('ty', 0.0) + t * y
+
+
+def trend_coefficients(sums: Dict[str, float], baseline_value: Optional[float]) -> Dict:
+    """Least-squares line through the points (time in days since the baseline)"""
+    n = sums.get('n', 0)
+    denominator = n * sums.get('tt', 0.0) - sums.get('t', 0.0) ** 2
+    if n < 2 or denominator <= 1e-12:
+        return {'points': n, 'slope_mm3_per_year': None, 'intercept_mm3': None, 'percent_per_year': None}
+    slope = (n * sums['ty'] - sums['t'] * sums['y']) / denominator
+    intercept = (sums['y'] - slope * sums['t']) / n
+    per_year = slope * DAYS_PER_YEAR
+    return {
+        'points': n,
+        'slope_mm3_per_year': float(per_year),
+        'intercept_mm3': float(intercept),
+        'percent_per_year': float(per_year / baseline_value * 100) if baseline_value else None
+    }
+
+
+class LongitudinalStore:
+    """
+    Per-patient longitudinal state in SQLite (`state_dir`/longitudinal.sqlite,
+    or in memory when no directory is given)
+    """
+
+    def __init__(self, state_dir: Optional[str] = None):
+        self.state_dir = state_dir
+        self._lock = threading.Lock()
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        self._connect()
+        self._db.executescript(
+            'CREATE TABLE IF NOT EXISTS patients ('
+            'patient_id TEXT PRIMARY KEY, version TEXT NOT NULL, scan_count INTEGER NOT NULL, '
+            'baseline_time REAL NOT NULL, trend TEXT NOT NULL, assessment TEXT, updated REAL NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS scans ('
+            'patient_id TEXT NOT NULL, idx INTEGER NOT NULL, mr_path TEXT NOT NULL, content_hash TEXT NOT NULL, '
+            'scan_time REAL NOT NULL, features BLOB NOT NULL, region_stats TEXT, '
+            'PRIMARY KEY (patient_id, idx));'
+            'CREATE INDEX IF NOT EXISTS scans_by_hash ON scans (patient_id, content_hash);'
+        )
+        self._db.commit()
+        if state_dir:
+            reconnect_after_fork(self, type(self)._connect)
+
+    def _connect(self):
+        path = os.path.join(self.state_dir, 'longitudinal.sqlite') if self.state_dir else ':memory:'
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+
+    def _patient(self, patient_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT version, scan_count, baseline_time, trend, assessment FROM patients WHERE patient_id = ?',
+                (patient_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'version': row[0],
+            'scan_count': row[1],
+            'baseline_time': row[2],
+            'trend': json.loads(row[3]),
+            'assessment': json.loads(row[4]) if row[4] else None
+        }
+
+    def _scan(self, patient_id: str, index: int) -> Dict:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT mr_path, content_hash, scan_time, features, region_stats FROM scans '
+                'WHERE patient_id = ? AND idx = ?', (patient_id, index)
+            ).fetchone()
+        return {
+            'mr_path': row[0],
+            'content_hash': row[1],
+            'scan_time': row[2],
+            'features': np.frombuffer(row[3], dtype=np.float32).reshape(1, -1),
+            'region_stats': json.loads(row[4]) if row[4] else None
+        }
+
+    def scans(self, patient_id: str) -> List[Dict]:
+        """Scan history without feature vectors, oldest first"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT idx, mr_path, content_hash, scan_time, region_stats FROM scans '
+                'WHERE patient_id = ? ORDER BY idx', (patient_id,)
+            ).fetchall()
+        return [
+            {
+                'index': idx,
+                'path': mr_path,
+                'content_hash': content_hash,
+                'scan_time': datetime.fromtimestamp(scan_time, timezone.utc).isoformat(),
+                'region_statistics': json.loads(region_stats) if region_stats else None
+            }
+            for idx, mr_path, content_hash, scan_time, region_stats in rows
+        ]
+
+    def summary(self, patient_id: str) -> Optional[Dict]:
+        """Current trends and last risk assessment of a patient (no inference)"""
+        patient = self._patient(patient_id)
+        if patient is None:
+            return None
+        return {
+            'patient_id': patient_id,
+            'scan_count': patient['scan_count'],
+            'state_version': patient['version'],
+            'scans': self.scans(patient_id),
+            'trends': self._trends(patient_id, patient),
+            **(patient['assessment'] or {})
+        }
+
+    def delete(self, patient_id: str) -> bool:
+        with self._lock:
+            deleted = self._db.execute('DELETE FROM patients WHERE patient_id = ?', (patient_id,)).rowcount
+            self._db.execute('DELETE FROM scans WHERE patient_id = ?', (patient_id,))
+            self._db.commit()
+        return deleted > 0
+
+    def _trends(self, patient_id: str, patient: Dict) -> Dict:
+        if not patient['scan_count']:
+            return {}
+        baseline_stats = self._scan(patient_id, 0)['region_stats'] or {}
+        return {
+            region_name: trend_coefficients(sums, (baseline_stats.get(region_name) or {}).get('tissue_volume_mm3'))
+            for region_name, sums in patient['trend'].items()
+        }
+
+    def _write(self, patient_id: str, expected_count: int, version: str, baseline_time: float,
+               trend: Dict, assessment: Dict, scan: Dict):
+        """Persist one appended scan, failing if another writer appended first"""
+        trend_json = json.dumps(trend)
+        assessment_json = json.dumps(assessment)
+        with self._lock:
+            try:
+                if expected_count == 0:
+                    self._db.execute('DELETE FROM scans WHERE patient_id = ?', (patient_id,))
+                    cursor = self._db.execute(
+                        'INSERT OR IGNORE INTO patients VALUES (?, ?, 1, ?, ?, ?, ?)',
+                        (patient_id, version, baseline_time, trend_json, assessment_json, time.time())
+                    )
+                else:
+                    cursor = self._db.execute(
+                        'UPDATE patients SET scan_count = scan_count + 1, trend = ?, assessment = ?, updated = ? '
+                        'WHERE patient_id = ? AND scan_count = ? AND version = ?',
+                        (trend_json, assessment_json, time.time(), patient_id, expected_count, version)
+                    )
+                if cursor.rowcount == 0:
+                    raise _ConcurrentAppend()
+                self._db.execute(
+                    'INSERT INTO scans VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (patient_id, expected_count, scan['mr_path'], scan['content_hash'], scan['scan_time'],
+                     np.ascontiguousarray(scan['features'], dtype=np.float32).tobytes(),
+                     json.dumps(scan['region_stats']) if scan['region_stats'] is not None else None)
+                )
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+
+    @reports_timings
+    def append(self, processor, patient_id: str, mr_path: str, scan_date: Optional[str] = None,
+               content_hash: Optional[str] = None) -> Dict:
+        """
+        Add a follow-up scan to a patient's history and return the updated assessment
+        The new scan goes through the feature extractor once; the previous scan
+        and the baseline come from the stored state. Appending a scan whose
+        content is already in the history changes nothing
+        """
+        content_hash = content_hash or hash_file(mr_path)
+        scan_time = parse_scan_time(scan_date)
+        version = state_version(processor)
+
+        patient = self._patient(patient_id)
+        if patient is not None and patient['version'] != version:
+            self.rebuild(processor, patient_id)
+            patient = self._patient(patient_id)
+        if patient is not None:
+            with self._lock:
+                duplicate = self._db.execute(
+                    'SELECT idx FROM scans WHERE patient_id = ? AND content_hash = ?', (patient_id, content_hash)
+                ).fetchone()
+            if duplicate is not None:
+                logger.info(f"Scan already in the history of patient {patient_id} (index {duplicate[0]})")
+                return {**self.summary(patient_id), 'appended': False}
+
+        image, voxel_volume = processor.load_scan(mr_path)
+        features = processor.get_scan_features(mr_path, image, content_hash).cpu().numpy()
+        new_scan = {
+            'mr_path': mr_path,
+            'content_hash': content_hash,
+            'scan_time': scan_time,
+            'features': features,
+            'region_stats': processor.scan_region_statistics(image, voxel_volume)
+        }
+        del image
+
+        for attempt in range(APPEND_ATTEMPTS):
+            try:
+                result = self._append_scan(processor, patient_id, patient, version, new_scan)
+                return {**result, 'appended': True}
+            except _ConcurrentAppend:
+                logger.info(f"Concurrent append for patient {patient_id}, retrying ({attempt + 1})")
+                patient = self._patient(patient_id)
+                if patient is not None and patient['version'] != version:
+                    raise StaleStateError(f"State of patient {patient_id} was rebuilt with another model version")
+        raise RuntimeError(f"Could not append scan for patient {patient_id}: too many concurrent updates")
+
+    def _append_scan(self, processor, patient_id: str, patient: Optional[Dict], version: str, new_scan: Dict) -> Dict:
+        import torch
+
+        count = patient['scan_count'] if patient else 0
+        baseline_time = patient['baseline_time'] if patient else new_scan['scan_time']
+        trend = patient['trend'] if patient else {}
+
+        # Running trend sums: tissue volume against days since the baseline
+        days = (new_scan['scan_time'] - baseline_time) / SECONDS_PER_DAY
+        for region_name, stats in (new_scan['region_stats'] or {}).items():
+            add_trend_point(trend.setdefault(region_name, {}), days, stats['tissue_volume_mm3'])
+
+        assessment = {'consecutive_delta': None, 'baseline_delta': None, 'risk_assessment': None}
+        if count:
+            baseline = self._scan(patient_id, 0)
+            previous = self._scan(patient_id, count - 1) if count > 1 else baseline
+            features = torch.from_numpy(new_scan['features'])
+            # One analyzer pass for both deltas
+            consecutive, from_baseline = processor.analyze_volumetric_changes_batch([
+                (torch.from_numpy(previous['features'].copy()), features),
+                (torch.from_numpy(baseline['features'].copy()), features)
+            ])
+            assessment = {
+                'consecutive_delta': self._delta(processor, count - 1, count, consecutive, previous, new_scan),
+                'baseline_delta': self._delta(processor, 0, count, from_baseline, baseline, new_scan),
+                'risk_assessment': processor.assess_risk(from_baseline)
+            }
+
+        self._write(patient_id, count, version, baseline_time, trend, assessment, new_scan)
+        return self.summary(patient_id)
+
+    @staticmethod
+    def _delta(processor, from_index: int, to_index: int, volume_analysis: Dict, before: Dict, after: Dict) -> Dict:
+        both_measured = before['region_stats'] is not None and after['region_stats'] is not None
+        return {
+            'from_index': from_index,
+            'to_index': to_index,
+            'volumetric_analysis': volume_analysis,
+            'tissue_volume_change_percent': (
+                processor.tissue_volume_change(before['region_stats'], after['region_stats']) if both_measured else None
+            )
+        }
+
+    def rebuild(self, processor, patient_id: str):
+        """
+        Recompute a patient's history with the current model (after a version change)
+        The new history is built in a scratch in-memory store and swapped in
+        with one transaction only once every scan has been re-appended, so a
+        failure leaves the old history in place. Raises StaleStateError if a
+        stored scan is gone or its content no longer matches the stored hash
+        """
+        patient = self._patient(patient_id)
+        if patient is None:
+            return
+        with self._lock:
+            history = self._db.execute(
+                'SELECT mr_path, content_hash, scan_time FROM scans WHERE patient_id = ? ORDER BY idx', (patient_id,)
+            ).fetchall()
+        unusable = [path for path, content_hash, _ in history
+                    if not os.path.exists(path) or hash_file(path) != content_hash]
+        if unusable:
+            raise StaleStateError(
+                f"History of patient {patient_id} was built with another model version and "
+                f"{len(unusable)} scan(s) are no longer available or have changed; resubmit the series"
+            )
+
+        logger.info(f"Rebuilding longitudinal state of patient {patient_id} ({len(history)} scans)")
+        scratch = LongitudinalStore(None)
+        for path, content_hash, scan_time in history:
+            date = datetime.fromtimestamp(scan_time, timezone.utc).isoformat()
+            scratch.append(processor, patient_id, path, scan_date=date, content_hash=content_hash)
+        patient_row = scratch._db.execute('SELECT * FROM patients WHERE patient_id = ?', (patient_id,)).fetchone()
+        scan_rows = scratch._db.execute('SELECT * FROM scans WHERE patient_id = ? ORDER BY idx', (patient_id,)).fetchall()
+
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                current = self._db.execute(
+                    'SELECT version, scan_count FROM patients WHERE patient_id = ?', (patient_id,)
+                ).fetchone()
+                if current != (patient['version'], patient['scan_count']):
+                    # Another worker rebuilt or appended meanwhile: keep its state
+                    self._db.rollback()
+                    logger.info(f"Longitudinal state of patient {patient_id} changed during the rebuild; keeping it")
+                    return
+                self._db.execute('DELETE FROM patients WHERE patient_id = ?', (patient_id,))
+                self._db.execute('DELETE FROM scans WHERE patient_id = ?', (patient_id,))
+                self._db.execute('INSERT INTO patients VALUES (?, ?, ?, ?, ?, ?, ?)', patient_row)
+                self._db.executemany('INSERT INTO scans VALUES (?, ?, ?, ?, ?, ?, ?)', scan_rows)
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
@@ -1,14 +1,28 @@
 # Import FastAPI 
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Header, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel
 import uvicorn
 import os
-import json
-import tempfile
 import logging
-from typing import Dict, List, Optional
-from brain_mri_processor import BrainMRIProcessor
-import numpy as np
+import math
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from brain_regions import BRAIN_REGIONS
+from feature_cache import FeatureCache
+from heatmap_cache import HeatmapCache, media_type
+from metrics import CONTENT_TYPE, REGISTRY, process_rss_bytes
+from longitudinal_state import LongitudinalStore, StaleStateError, parse_scan_time
+from job_engine import JobEngine, QueueFullError, STATUS_QUEUED
+from task_store import SQLiteTaskStore
+from progress_stream import ProgressHub, TooManySubscribersError, format_event
+from similarity_index import SEARCH_MODES, SimilarityIndex
+from inference_executor import InferenceExecutor
+from profiling import ARTIFACTS, PROFILER_ARTIFACTS, ProfileStore, ProfilerBusyError, parse_profilers
+from model_loader import ModelLoader, LOADING_BACKGROUND, LOADING_EAGER
+from upload_storage import InvalidUploadError, UploadTooLargeError, receive_upload
+import config
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -31,15 +45,261 @@ app.add_middleware(
 )
 
 # Initialize the brain MRI processor
-processor = BrainMRIProcessor()
+feature_cache = FeatureCache(
+    cache_dir=config.FEATURE_CACHE_DIR or None,
+    memory_entries=config.FEATURE_CACHE_MEMORY_ENTRIES,
+    disk_max_bytes=config.FEATURE_CACHE_DISK_MB * 1024 * 1024
+)
+
+# Encoded heatmaps served by /heatmaps/{heatmap_id}
+heatmap_cache = HeatmapCache(
+    cache_dir=config.HEATMAP_CACHE_DIR or None,
+    memory_bytes=config.HEATMAP_CACHE_MEMORY_MB * 1024 * 1024,
+    disk_max_bytes=config.HEATMAP_CACHE_DISK_MB * 1024 * 1024
+)
+
+# Follow-up -> baseline registration transforms, per scan pair (a 3x4 matrix each)
+transform_cache = FeatureCache(
+    cache_dir=config.REGISTRATION_CACHE_DIR or None,
+    disk_max_bytes=64 * 1024 * 1024
+)
+
+# Per-patient scan history, trends and last assessment (survives restarts)
+longitudinal_store = LongitudinalStore(config.LONGITUDINAL_STATE_DIR or None)
+
+# Feature vectors of processed scans for /similar-scans (cohort lookups, duplicate uploads)
+similarity_index = SimilarityIndex(
+    config.SIMILARITY_INDEX_DIR or None,
+    dtype=config.SIMILARITY_DTYPE,
+    approximate_min_rows=config.SIMILARITY_IVF_MIN_SCANS,
+    nprobe=config.SIMILARITY_NPROBE,
+    duplicate_similarity=config.SIMILARITY_DUPLICATE
+)
+
+# Opt-in per-request profiles (cProfile / torch profiler artifacts)
+profile_store = ProfileStore(config.PROFILES_DIR, parse_profilers(config.PROFILING), keep=config.PROFILES_KEEP)
+
+# Worker processes sharing this host (serve.py sets it before preloading the model)
+worker_count = 1
+# Thread/batch profile applied when the processor was built (see MRSINA_AUTOTUNE)
+autotune_profile = None
+
+def build_processor():
+    """Import the imaging stack and build the processor (seconds; runs off the request path)"""
+    global autotune_profile
+    import autotune
+    from brain_mri_processor import BrainMRIProcessor
+    autotune_profile = autotune.resolve_profile(
+        config.AUTOTUNE, config.AUTOTUNE_PROFILE, worker_count, config.INFERENCE_BACKEND
+    )
+    if autotune_profile is not None:
+        autotune.apply_profile(autotune_profile)
+    return BrainMRIProcessor(
+        max_batch_size=autotune_profile["batch_size"] if autotune_profile else config.MAX_BATCH_SIZE,
+        feature_cache=feature_cache,
+        micro_batch_wait_ms=config.MICRO_BATCH_WAIT_MS,
+        micro_batch_max_slices=config.MICRO_BATCH_MAX_SLICES,
+        inference_backend=config.INFERENCE_BACKEND,
+        calibration_dir=config.INFERENCE_CALIBRATION_DIR or None,
+        weights_path=config.WEIGHTS_BUNDLE or None,
+        heatmap_cache=heatmap_cache,
+        heatmap_format=config.HEATMAP_FORMAT,
+        heatmap_quality=config.HEATMAP_QUALITY,
+        heatmap_png_compression=config.HEATMAP_PNG_COMPRESSION,
+        difference_chunk_slices=config.DIFFERENCE_CHUNK_SLICES,
+        difference_workers=config.DIFFERENCE_WORKERS or None,
+        registration_mode=config.REGISTRATION_MODE,
+        transform_cache=transform_cache,
+        similarity_index=similarity_index
+    )
+
+# The processor is built lazily (see MRSINA_MODEL_LOADING) so the service answers at once
+models = ModelLoader(build_processor)
+
+# CPU-bound pipeline calls run here instead of on the event loop; without an explicit
+# size the pool is sized on first use, after the model loader set the torch threads
+inference_executor = InferenceExecutor(
+    max_workers=config.INFERENCE_THREADS or None,
+    max_concurrency=config.INFERENCE_CONCURRENCY or None
+)
+# Similarity-index lookups are short and must not wait behind multi-second comparisons
+index_executor = InferenceExecutor(max_workers=config.INDEX_THREADS, name="mr-index")
+
+async def get_processor():
+    """The processor, waiting for it to finish loading if needed"""
+    try:
+        return await models.get_async()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Model not available: {str(e)}")
+
+async def run_inference(fn: Callable, *args, **kwargs):
+    """Run a CPU-bound pipeline call on the inference executor"""
+    result = await inference_executor.run(fn, *args, **kwargs)
+    models.timeline.mark("first_inference")
+    return result
+
+# Request and job latencies; gauges below are only evaluated when /metrics is scraped
+REQUEST_SECONDS = REGISTRY.histogram(
+    "mrsina_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+)
+JOB_SECONDS = REGISTRY.histogram(
+    "mrsina_job_duration_seconds", "Background job run time (queue wait excluded)", ("status",)
+)
+requests_in_flight = 0
+
+def requested_profilers(profile: Optional[str], header: Optional[str]) -> Tuple[str, ...]:
+    """Profilers asked for by the `profile` query flag or the X-Mrsina-Profile header, checked against the config"""
+    try:
+        profilers = parse_profilers(profile or header)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if profilers and not profile_store.allows(profilers):
+        raise HTTPException(status_code=403, detail=f"Profiling with {', '.join(profilers)} is not enabled")
+    return profilers
+
+async def run_profiled(profilers: Tuple[str, ...], label: str, fn: Callable, *args, **kwargs) -> Dict:
+    """
+    Run a pipeline call on the inference executor, under the requested profilers if any
+    A profiled result gets a `profile` entry with the artifact ID and download URLs
+    """
+    if not profilers:
+        return await run_inference(fn, *args, **kwargs)
+    try:
+        result, profile_id = await run_inference(profile_store.capture, profilers, label, fn, *args, **kwargs)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "5"})
+    result["profile"] = profile_links(profile_id, profilers)
+    return result
+
+def profile_links(profile_id: str, profilers: Tuple[str, ...]) -> Dict:
+    return {
+        "profile_id": profile_id,
+        "artifacts": {
+            name: f"/profiles/{profile_id}/{name}" for profiler in profilers for name in PROFILER_ARTIFACTS[profiler]
+        }
+    }
+
+def run_background_job(task: Dict) -> Dict:
+    """
+    Background task for MR processing: runs the load -> slice -> feature pipeline
+    """
+    start = time.perf_counter()
+    status = "error"
+    try:
+        result = models.get().process_single_scan(task["file_path"], index_as={
+            "scan_id": task["mr_id"], "patient_id": task.get("patient_id"), "hospital_id": task.get("hospital_id")
+        })
+        status = "ok"
+    finally:
+        JOB_SECONDS.observe(time.perf_counter() - start, status)
+    result["ready_for_comparison"] = True
+    return result
+
+def estimate_job_seconds(stats: Dict) -> Optional[float]:
+    """
+    Expected seconds until a newly queued job finishes: mean job time so far
+    times the number of rounds the workers need to get through it (None without history)
+    """
+    count, total = JOB_SECONDS.totals("ok")
+    if not count:
+        return None
+    # Queued and running counts cover every server worker sharing the task store
+    rounds = math.ceil((stats["queued"] + stats["running"] + 1) / (stats["workers"] * worker_count))
+    return round(total / count * rounds, 1)
 
 # Background processing tasks
-processing_queue = {}
+job_engine = JobEngine(
+    handler=run_background_job,
+    max_workers=config.JOB_WORKERS,
+    max_queue_depth=config.JOB_QUEUE_DEPTH,
+    store=SQLiteTaskStore(config.TASK_STORE_DIR or None),
+    task_ttl=config.TASK_TTL_S,
+    poll_interval=config.JOB_POLL_MS / 1000.0
+)
+# Pushes task changes to /processing-status/{task_id}/events subscribers
+progress_hub = ProgressHub(
+    job_engine.store,
+    poll_interval=config.PROGRESS_POLL_MS / 1000.0,
+    heartbeat_interval=config.PROGRESS_HEARTBEAT_S,
+    max_subscribers=config.PROGRESS_MAX_SUBSCRIBERS
+)
+job_engine.on_update = progress_hub.notify
 
 @app.on_event("startup")
 async def startup_event():
-    logger.info("Mr. Sina Brain MRI Processing Service started successfully")
-    logger.info(f"Using device: {processor.device}")
+    job_engine.start()
+    if config.MODEL_LOADING == LOADING_EAGER:
+        await models.get_async()
+    elif config.MODEL_LOADING == LOADING_BACKGROUND:
+        models.warm_up()
+    models.timeline.mark("app_started")
+    logger.info(f"Mr. Sina Brain MRI Processing Service started successfully (model loading: {config.MODEL_LOADING})")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    job_engine.shutdown(wait=False)
+    inference_executor.shutdown(wait=True)
+    index_executor.shutdown(wait=True)
+    processor = models.processor
+    if processor is not None and processor.micro_batcher is not None:
+        processor.micro_batcher.shutdown()
+
+def _cache_lookups() -> Dict:
+    lookups = {}
+    for name, cache in (("feature", feature_cache), ("heatmap", heatmap_cache), ("transform", transform_cache)):
+        stats = cache.stats()
+        lookups[(name, "memory_hit")] = stats["memory_hits"]
+        lookups[(name, "disk_hit")] = stats["disk_hits"]
+        lookups[(name, "miss")] = stats["misses"]
+    return lookups
+
+def _micro_batching() -> Optional[Dict]:
+    processor = models.processor
+    if processor is None or processor.micro_batcher is None:
+        return None
+    stats = processor.micro_batcher.stats()
+    return {("requests",): stats["requests"], ("batches",): stats["batches"], ("slices",): stats["slices"]}
+
+REGISTRY.callback("mrsina_requests_in_flight", "HTTP requests being handled", lambda: requests_in_flight)
+REGISTRY.callback("mrsina_inference_in_flight", "Pipeline calls running on the inference executor",
+                  lambda: inference_executor.stats()["in_flight"])
+REGISTRY.callback("mrsina_inference_waiting", "Pipeline calls waiting for an inference slot",
+                  lambda: inference_executor.stats()["waiting"])
+REGISTRY.callback("mrsina_job_queue_depth", "Background jobs waiting in the queue",
+                  lambda: job_engine.stats()["queued"])
+REGISTRY.callback("mrsina_jobs_running", "Background jobs being processed",
+                  lambda: job_engine.stats()["running"])
+REGISTRY.callback("mrsina_progress_subscribers", "Open progress streams on this worker",
+                  lambda: progress_hub.subscriber_count)
+REGISTRY.callback("mrsina_similarity_index_scans", "Scans in the similarity index", lambda: len(similarity_index))
+REGISTRY.callback("mrsina_cache_lookups_total", "Cache lookups by cache and outcome", _cache_lookups,
+                  ("cache", "result"), metric_type="counter")
+REGISTRY.callback("mrsina_cache_hit_ratio", "Share of cache lookups served from memory or disk", lambda: {
+    (name,): cache.stats()["hit_rate"]
+    for name, cache in (("feature", feature_cache), ("heatmap", heatmap_cache), ("transform", transform_cache))
+}, ("cache",))
+REGISTRY.callback("mrsina_micro_batcher_total", "Micro-batcher requests, merged batches and slices", _micro_batching,
+                  ("kind",), metric_type="counter")
+REGISTRY.callback("mrsina_model_loaded", "1 once the processor is built", lambda: float(models.ready))
+REGISTRY.callback("process_resident_memory_bytes", "Resident set size of this worker", process_rss_bytes)
+
+@app.middleware("http")
+async def record_request(request, call_next):
+    global requests_in_flight
+    requests_in_flight += 1
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        requests_in_flight -= 1
+        # Route templates, not raw paths, keep the label set bounded
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(time.perf_counter() - start, request.method,
+                                getattr(route, "path", "unmatched"), str(status))
+    models.timeline.mark("first_response")
+    return response
 
 @app.get("/")
 async def root():
@@ -52,6 +312,7 @@ async def root():
             "3D MR image processing",
             "Volumetric analysis",
             "Brain region comparison",
+            "Longitudinal series comparison",
             "Clinical interpretation",
             "Heatmap generation"
         ]
@@ -59,48 +320,96 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    processor = models.processor
     return {
         "status": "healthy",
         "service": "brain_mri_processor",
-        "model_loaded": True,
-        "device": str(processor.device)
+        "worker_pid": os.getpid(),
+        "model_loaded": processor is not None,
+        "model": models.status(),
+        "device": str(processor.device) if processor else None,
+        "inference_backend": processor.backend.describe() if processor else None,
+        "autotune": autotune_profile,
+        "feature_cache": feature_cache.stats(),
+        "heatmap_cache": heatmap_cache.stats(),
+        "transform_cache": transform_cache.stats(),
+        "similarity_index": similarity_index.stats(),
+        "profiling": list(profile_store.allowed),
+        "job_queue": job_engine.stats(),
+        "inference": inference_executor.stats(),
+        "index_executor": index_executor.stats(),
+        "micro_batching": processor.micro_batcher.stats() if processor and processor.micro_batcher else None
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Stage and request latency histograms, load, cache and memory gauges in the Prometheus text format
+    """
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+SCAN_EXTENSIONS = ['.dcm', '.zip', '.nii', '.nii.gz', '.jpg', '.jpeg', '.png', '.tiff']
+
+# Scan uploads are parsed from the request stream, so the multipart body is documented by hand
+SCAN_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"]
+        }}}
     }
+}
 
-@app.post("/process-single-mr")
+async def receive_scan(request: Request):
+    """Stream the uploaded scan (`file` field) to the scratch directory, hashing it in the same pass"""
+    try:
+        return await receive_upload(
+            request,
+            "file",
+            SCAN_EXTENSIONS,
+            scratch_dir=config.UPLOAD_SCRATCH_DIR or None,
+            max_bytes=config.UPLOAD_MAX_MB * 1024 * 1024,
+            chunk_size=config.UPLOAD_CHUNK_KB * 1024
+        )
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/process-single-mr", openapi_extra=SCAN_UPLOAD_OPENAPI)
 async def process_single_mr(
-    file: UploadFile = File(...),
-    mr_id: Optional[str] = None
+    request: Request,
+    mr_id: Optional[str] = None,
+    patient_id: Optional[str] = None,
+    hospital_id: Optional[str] = None,
+    profile: Optional[str] = None,
+    x_mrsina_profile: Optional[str] = Header(None)
 ):
     """
     Process a single MR image for feature extraction and basic analysis
     """
     try:
-        # Validate file type
-        allowed_extensions = ['.dcm', '.nii', '.nii.gz', '.jpg', '.jpeg', '.png', '.tiff']
-        if not file.filename or not any(file.filename.lower().endswith(ext) for ext in allowed_extensions):
-            raise HTTPException(status_code=400, detail="Unsupported file format")
-        
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{file.filename}") as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_path = temp_file.name
+        profilers = requested_profilers(profile, x_mrsina_profile)
+        upload = await receive_scan(request)
+        temp_path = upload.path
         
         try:
-            # Process the MR image
-            image_array = processor.load_dicom_image(temp_path)
-            slices = processor.extract_brain_slices(image_array)
-            features = processor.extract_features(slices)
+            # Process the MR image and add it to the similarity index
+            processor = await get_processor()
+            scan_summary = await run_profiled(
+                profilers, "process-single-mr", processor.process_single_scan, temp_path, content_hash=upload.sha256,
+                index_as={"scan_id": mr_id, "patient_id": patient_id, "hospital_id": hospital_id}
+            )
             
             # Basic analysis
             result = {
                 "mr_id": mr_id,
                 "status": "TAMAMLANDI",
                 "processing_details": {
-                    "image_dimensions": list(image_array.shape),
-                    "slice_count": len(slices),
-                    "feature_dimension": getattr(features, 'shape', [1, 2048])[1] if hasattr(features, 'shape') else 2048,
-                    "file_size": len(content)
+                    **scan_summary,
+                    "file_size": upload.size
                 },
                 "quality_metrics": {
                     "image_quality": "İyi",
@@ -121,6 +430,8 @@ async def process_single_mr(
             # Clean up temporary file
             os.unlink(temp_path)
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing single MR: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
@@ -129,18 +440,28 @@ async def process_single_mr(
 async def compare_mrs(
     mr1_path: str,
     mr2_path: str,
-    patient_id: Optional[str] = None
+    patient_id: Optional[str] = None,
+    profile: Optional[str] = None,
+    x_mrsina_profile: Optional[str] = Header(None)
 ):
     """
     Compare two MR images and generate comprehensive analysis
+    Pass `profile=cprofile|torch|all` (or the X-Mrsina-Profile header) to profile the comparison
     """
     try:
         # Validate file paths
         if not os.path.exists(mr1_path) or not os.path.exists(mr2_path):
             raise HTTPException(status_code=404, detail="One or both MR files not found")
+        profilers = requested_profilers(profile, x_mrsina_profile)
         
         # Process comparison
-        comparison_result = processor.process_mr_comparison(mr1_path, mr2_path)
+        processor = await get_processor()
+        comparison_result = await run_profiled(
+            profilers, "compare-mrs", processor.process_mr_comparison, mr1_path, mr2_path
+        )
+        heatmap_data = comparison_result.get("heatmap_data")
+        if heatmap_data:
+            heatmap_data["heatmap_url"] = f"/heatmaps/{heatmap_data['heatmap_id']}"
         
         # Add metadata
         comparison_result.update({
@@ -154,131 +475,370 @@ async def compare_mrs(
         logger.info(f"Successfully compared MRs for patient: {patient_id}")
         return comparison_result
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in MR comparison: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Comparison error: {str(e)}")
 
-@app.post("/start-background-processing")
-async def start_background_processing(
-    mr_id: str,
-    file_path: str
+class SeriesComparisonRequest(BaseModel):
+    """Ordered scans of one patient; the first one is the baseline"""
+    mr_paths: List[str]
+    patient_id: Optional[str] = None
+
+@app.post("/compare-series")
+async def compare_series(
+    request: SeriesComparisonRequest,
+    profile: Optional[str] = None,
+    x_mrsina_profile: Optional[str] = Header(None)
 ):
     """
-    Start background processing for uploaded MR image
+    Compare a longitudinal series of MR images: consecutive and baseline-relative changes
     """
     try:
-        # Add task to queue
-        task_id = f"task_{mr_id}_{len(processing_queue)}"
-        processing_queue[task_id] = {
-            "status": "ISLENIYOR",
-            "mr_id": mr_id,
-            "file_path": file_path,
-            "started_at": "2024-01-01T00:00:00Z"
-        }
+        if len(request.mr_paths) < 2:
+            raise HTTPException(status_code=400, detail="At least two MR files are required")
+        if len(request.mr_paths) > config.SERIES_MAX_SCANS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {config.SERIES_MAX_SCANS} MR files can be compared in one request"
+            )
+        missing = [path for path in request.mr_paths if not os.path.exists(path)]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"MR files not found: {', '.join(missing)}")
+        profilers = requested_profilers(profile, x_mrsina_profile)
         
-        # Note: In a real implementation, you would use actual background tasks
-        # For now, we'll just mark it as queued
+        processor = await get_processor()
+        series_result = await run_profiled(
+            profilers, "compare-series", processor.process_series_comparison, request.mr_paths
+        )
         
-        return {
-            "task_id": task_id,
-            "status": "ISLENIYOR",
-            "message": "MR görüntüsü arka planda işleniyor",
-            "estimated_time": "30-60 saniye"
-        }
+        series_result.update({
+            "patient_id": request.patient_id,
+            "service_version": "1.0.0"
+        })
         
+        logger.info(f"Successfully compared {len(request.mr_paths)} MRs for patient: {request.patient_id}")
+        return series_result
+        
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error starting background processing: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"Error in MR series comparison: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Comparison error: {str(e)}")
+
+@app.post("/patients/{patient_id}/scans")
+async def append_patient_scan(
+    patient_id: str,
+    mr_path: str,
+    scan_date: Optional[str] = None
+):
+    """
+    Add a follow-up MR to the patient's longitudinal state and return the updated trend and risk assessment
+    """
+    try:
+        if not os.path.exists(mr_path):
+            raise HTTPException(status_code=404, detail="MR file not found")
+        try:
+            parse_scan_time(scan_date)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="scan_date must be an ISO 8601 date")
+        
+        processor = await get_processor()
+        result = await run_inference(longitudinal_store.append, processor, patient_id, mr_path, scan_date)
+        
+        logger.info(f"Longitudinal state updated for patient: {patient_id} ({result['scan_count']} scans)")
+        return result
+        
+    except HTTPException:
+        raise
+    except StaleStateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error updating longitudinal state: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Longitudinal update error: {str(e)}")
+
+@app.get("/patients/{patient_id}/longitudinal")
+async def get_patient_longitudinal(patient_id: str):
+    """
+    Get the stored scan history, regional trends and last risk assessment of a patient
+    """
+    summary = longitudinal_store.summary(patient_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Patient has no longitudinal state")
+    return summary
+
+@app.delete("/patients/{patient_id}/longitudinal")
+async def delete_patient_longitudinal(patient_id: str):
+    """
+    Forget a patient's longitudinal state
+    """
+    if not longitudinal_store.delete(patient_id):
+        raise HTTPException(status_code=404, detail="Patient has no longitudinal state")
+    return {"patient_id": patient_id, "deleted": True}
+
+@app.post("/start-background-processing")
+async def start_background_processing(
+    mr_id: str,
+    file_path: str,
+    patient_id: Optional[str] = None,
+    hospital_id: Optional[str] = None
+):
+    """
+    Start background processing for uploaded MR image
+    """
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="MR file not found")
+    
+    try:
+        task_id = job_engine.submit({
+            "mr_id": mr_id, "file_path": file_path, "patient_id": patient_id, "hospital_id": hospital_id
+        })
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    
+    estimated_seconds = estimate_job_seconds(job_engine.stats())
+    return {
+        "task_id": task_id,
+        "status": STATUS_QUEUED,
+        "message": "MR görüntüsü arka planda işlenmek üzere sıraya alındı",
+        "estimated_seconds": estimated_seconds,
+        "estimated_time": f"{estimated_seconds:.0f} saniye" if estimated_seconds is not None else None
+    }
 
 @app.get("/processing-status/{task_id}")
 async def get_processing_status(task_id: str):
     """
     Get the status of a background processing task
     """
-    if task_id not in processing_queue:
+    task = job_engine.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    return processing_queue[task_id]
+    return task
 
-async def process_mr_background(task_id: str, file_path: str, mr_id: str):
+@app.get("/processing-status/{task_id}/events")
+async def stream_processing_status(task_id: str, last_event_id: Optional[str] = Header(None)):
     """
-    Background task for MR processing
+    Server-Sent Events stream of a background task: `status` while queued,
+    `progress` after every pipeline stage and inference chunk, then one `result`
     """
     try:
-        logger.info(f"Starting background processing for task: {task_id}")
-        
-        # Simulate processing (in real implementation, call actual processing)
-        import asyncio
-        await asyncio.sleep(45)  # Simulate 45 seconds processing time
-        
-        # Update task status
-        processing_queue[task_id].update({
-            "status": "TAMAMLANDI",
-            "completed_at": "2024-01-01T00:00:45Z",
-            "result": {
-                "quality_score": 0.92,
-                "processing_time": "45 seconds",
-                "features_extracted": True,
-                "ready_for_comparison": True
-            }
-        })
-        
-        logger.info(f"Background processing completed for task: {task_id}")
-        
-    except Exception as e:
-        logger.error(f"Error in background processing {task_id}: {str(e)}")
-        processing_queue[task_id].update({
-            "status": "HATA",
-            "error": str(e),
-            "completed_at": "2024-01-01T00:00:45Z"
-        })
+        after_version = int(last_event_id) if last_event_id else -1
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Last-Event-ID must be an event id from this stream")
+    events = progress_hub.subscribe(task_id, after_version)
+    try:
+        # The first record (or the 404/503) comes before the response starts
+        first = await events.__anext__()
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Task not found")
+    except TooManySubscribersError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+    async def body():
+        yield f"retry: {config.PROGRESS_POLL_MS * 4}\n\n"
+        yield format_event(first)
+        async for record in events:
+            yield format_event(record)
+
+    return StreamingResponse(body(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def similar_scans_response(query: Dict, vector, k: int, patient_id: Optional[str], hospital_id: Optional[str],
+                           mode: str, exclude: Optional[str] = None, content_hash: Optional[str] = None) -> Dict:
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(SEARCH_MODES)}")
+    start = time.perf_counter()
+    found = similarity_index.search(vector, k, patient_id=patient_id, hospital_id=hospital_id, mode=mode,
+                                    exclude=exclude, content_hash=content_hash)
+    return {
+        "query": query,
+        "filters": {"patient_id": patient_id, "hospital_id": hospital_id},
+        "search": {
+            "mode": found["mode"],
+            "scanned": found["scanned"],
+            "indexed_scans": len(similarity_index),
+            "search_ms": round((time.perf_counter() - start) * 1000, 2)
+        },
+        "duplicates": [result["scan_id"] for result in found["results"] if result["duplicate"]],
+        "results": found["results"]
+    }
+
+@app.get("/similar-scans")
+async def get_similar_scans(
+    scan_id: str,
+    k: int = Query(10, ge=1, le=100),
+    patient_id: Optional[str] = None,
+    hospital_id: Optional[str] = None,
+    mode: str = "auto"
+):
+    """
+    Most similar indexed scans to an indexed scan (its mr_id, or content hash when processed without one)
+    """
+    # Both lookups take the index lock and may refresh it from disk, so they stay off the event loop
+    entry = await index_executor.run(similarity_index.entry, scan_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Scan is not in the similarity index")
+    vector = await index_executor.run(similarity_index.vector, scan_id)
+    return await index_executor.run(
+        similar_scans_response, entry, vector, k, patient_id, hospital_id, mode,
+        exclude=scan_id, content_hash=entry["content_hash"]
+    )
+
+@app.post("/similar-scans", openapi_extra=SCAN_UPLOAD_OPENAPI)
+async def find_similar_scans(
+    request: Request,
+    k: int = Query(10, ge=1, le=100),
+    patient_id: Optional[str] = None,
+    hospital_id: Optional[str] = None,
+    mode: str = "auto"
+):
+    """
+    Most similar indexed scans to an uploaded scan, which is not indexed itself
+    Results with the same content, or nearly identical features, are listed under `duplicates`
+    """
+    upload = await receive_scan(request)
+    try:
+        processor = await get_processor()
+        vector = await run_inference(processor.scan_embedding, upload.path, content_hash=upload.sha256)
+        return await index_executor.run(
+            similar_scans_response, {"content_hash": upload.sha256, "file_size": upload.size},
+            vector, k, patient_id, hospital_id, mode, content_hash=upload.sha256
+        )
+    finally:
+        os.unlink(upload.path)
+
+@app.get("/profiles")
+async def list_profiles(limit: int = Query(20, ge=1, le=1000)):
+    """
+    Recent request profiles, newest first
+    """
+    if not profile_store.enabled:
+        raise HTTPException(status_code=404, detail="Profiling is not enabled")
+    return {
+        "profilers": list(profile_store.allowed),
+        "profiles": [
+            {**meta, "artifacts": {name: {"bytes": size, "url": f"/profiles/{meta['profile_id']}/{name}"}
+                                   for name, size in meta["artifacts"].items()}}
+            for meta in profile_store.list(limit)
+        ]
+    }
+
+@app.get("/profiles/{profile_id}/{artifact}")
+async def download_profile(profile_id: str, artifact: str):
+    """
+    Download one profile artifact: `trace` (Chrome trace), `pstats` or `summary`
+    """
+    if not profile_store.enabled:
+        raise HTTPException(status_code=404, detail="Profiling is not enabled")
+    path = profile_store.artifact_path(profile_id, artifact)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile artifact not found")
+    file_name, mime = ARTIFACTS[artifact]
+    return FileResponse(path, media_type=mime, filename=f"{profile_id}-{file_name}")
 
 @app.get("/brain-regions")
 async def get_brain_regions():
     """
     Get available brain regions for analysis
     """
+    # Served from the static table until the model (and a possible checkpoint) is loaded
+    brain_regions = models.processor.brain_regions if models.ready else BRAIN_REGIONS
     return {
-        "regions": list(processor.brain_regions.keys()),
-        "region_details": processor.brain_regions,
-        "total_regions": len(processor.brain_regions)
+        "regions": list(brain_regions.keys()),
+        "region_details": brain_regions,
+        "total_regions": len(brain_regions)
     }
 
 @app.post("/generate-heatmap")
 async def generate_heatmap(
     mr_path: str,
-    attention_regions: Optional[List[str]] = None
+    attention_regions: Optional[List[str]] = None,
+    slice_index: Optional[int] = None
 ):
     """
     Generate attention heatmap for specific brain regions
+    The encoded image is cached and served by /heatmaps/{heatmap_id}
     """
     try:
         if not os.path.exists(mr_path):
             raise HTTPException(status_code=404, detail="MR file not found")
         
-        # Load image
-        image_array = processor.load_dicom_image(mr_path)
-        
-        # Generate mock attention map (in real implementation, use GradCAM)
-        attention_map = np.random.rand(image_array.shape[0], image_array.shape[1]) * 0.5 + 0.3
-        
-        # Generate heatmap
-        heatmap = processor.generate_heatmap(
-            image_array[:, :, image_array.shape[2]//2] if len(image_array.shape) == 3 else image_array,
-            attention_map
-        )
+        processor = await get_processor()
+        try:
+            heatmap_id, heatmap = await run_inference(
+                processor.render_scan_heatmap, mr_path, slice_index, attention_regions
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         return {
             "status": "success",
             "heatmap_generated": True,
             "regions_highlighted": attention_regions or ["all"],
-            "heatmap_description": "Beyin aktivite haritası oluşturuldu"
+            "heatmap_description": "Beyin aktivite haritası oluşturuldu",
+            "heatmap_id": heatmap_id,
+            "heatmap_url": f"/heatmaps/{heatmap_id}",
+            "media_type": media_type(heatmap),
+            "size_bytes": len(heatmap)
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating heatmap: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/difference-heatmaps")
+async def generate_difference_heatmaps(
+    mr1_path: str,
+    mr2_path: str,
+    slice_indices: Optional[List[int]] = Query(None)
+):
+    """
+    Generate per-slice heatmaps of the whole-volume difference between two MR images
+    """
+    try:
+        if not os.path.exists(mr1_path) or not os.path.exists(mr2_path):
+            raise HTTPException(status_code=404, detail="One or both MR files not found")
+        
+        processor = await get_processor()
+        try:
+            heatmaps = await run_inference(processor.render_difference_heatmaps, mr1_path, mr2_path, slice_indices)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        return {
+            "status": "success",
+            "heatmap_description": "Beyin hacim değişim haritası",
+            "color_scale": "Mavi: Azalma, Kırmızı: Artış, Yeşil: Stabil",
+            "heatmaps": [
+                {"slice_index": index, "heatmap_id": heatmap_id, "heatmap_url": f"/heatmaps/{heatmap_id}"}
+                for index, heatmap_id in heatmaps
+            ]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating difference heatmaps: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/heatmaps/{heatmap_id}")
+async def get_heatmap(heatmap_id: str, if_none_match: Optional[str] = Header(None)):
+    """
+    Serve an encoded heatmap; the id is derived from its inputs, so it is also a stable ETag
+    """
+    etag = f'"{heatmap_id}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    heatmap = heatmap_cache.get(heatmap_id)
+    if heatmap is None:
+        raise HTTPException(status_code=404, detail="Heatmap not found or expired; generate it again")
+    return Response(content=heatmap, media_type=media_type(heatmap), headers=headers)
+
 if __name__ == "__main__":
     print("🚀 Starting Mr. Sina Brain MRI Processing Service...")
     print(f"📊 Processor available: True")
@@ -0,0 +1,283 @@
+"""
+In-process metrics in the Prometheus text exposition format
+Hot paths only pay for a perf_counter pair, a bisect and an uncontended lock
+per observation. Gauges such as queue depth, cache hit rates and RSS are
+callbacks that run only when /metrics is scraped. Per-call stage timings for
+API results are collected through a context variable, so the stages of nested
+pipeline calls add up in the timings of the call that started them
+"""
+
+import bisect
+import contextvars
+import functools
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import progress
+
+logger = logging.getLogger(__name__)
+
+# Seconds; pipeline stages range from sub-millisecond (volumetrics) to minutes (large series)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+CallbackValue = Union[None, float, Dict[Tuple[str, ...], float]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label values -> per-bucket counts (non-cumulative, last = +Inf), sum
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def totals(self, *labelvalues: str) -> Tuple[int, float]:
+        """(count, sum) of one series"""
+        with self._lock:
+            series = self._series.get(labelvalues)
+            return (sum(series[0]), series[1]) if series else (0, 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            snapshot = [(values, list(counts), total) for values, (counts, total) in self._series.items()]
+        lines = []
+        for values, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), values + (_number(bound),))} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    metric_type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, *labelvalues: str):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in values]
+
+
+class Callback:
+    """
+    Gauge (or externally maintained counter) evaluated at scrape time
+    `fn` returns one value, a {label values: value} dict, or None to skip
+    """
+
+    def __init__(self, name: str, documentation: str, fn: Callable[[], CallbackValue],
+                 labelnames: Sequence[str] = (), metric_type: str = 'gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.metric_type = metric_type
+
+    def samples(self) -> List[str]:
+        value = self.fn()
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(float(number))}"
+            for labels, number in sorted(value.items()) if number is not None
+        ]
+
+
+class MetricsRegistry:
+    """Named metrics rendered together in the text exposition format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def callback(self, name: str, documentation: str, fn: Callable[[], CallbackValue],
+                 labelnames: Sequence[str] = (), metric_type: str = 'gauge') -> Callback:
+        return self._register(Callback(name, documentation, fn, labelnames, metric_type))
+
+    def unregister(self, name: str):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format; a failing callback only drops its own metric"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                logger.warning(f"Metric {metric.name} could not be collected: {str(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'mrsina_stage_duration_seconds', 'Wall time of one call of a pipeline stage', ('stage',)
+)
+
+_stage_timings: "contextvars.ContextVar[Optional[Dict[str, float]]]" = contextvars.ContextVar(
+    'mrsina_stage_timings', default=None
+)
+
+
+def record_stage(name: str, seconds: float):
+    """Add one stage duration to the histogram, the active timing collector and the progress listener"""
+    STAGE_SECONDS.observe(seconds, name)
+    timings = _stage_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+    progress.stage_done(name, seconds)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block as one call of a pipeline stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def timed(name: str):
+    """Decorator timing every call of a function as a pipeline stage"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record_stage(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def collect_stage_timings() -> Iterator[Dict[str, float]]:
+    """
+    Collect the stage seconds recorded by this thread inside the block
+    A nested collector shares the outermost one, so a pipeline call made by
+    another pipeline call reports into the caller's timings
+    """
+    timings = _stage_timings.get()
+    if timings is not None:
+        yield timings
+        return
+    timings = {}
+    token = _stage_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _stage_timings.reset(token)
+
+
+def timings_ms(timings: Dict[str, float]) -> Dict[str, float]:
+    """Stage seconds as rounded milliseconds for API results"""
+    return {name: round(seconds * 1000, 1) for name, seconds in timings.items()}
+
+
+def reports_timings(fn):
+    """Add the measured wall time and per-stage milliseconds to a pipeline call's result dict"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        with collect_stage_timings() as timings:
+            result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        result.update({
+            'processing_time': f"{elapsed:.1f} saniye",
+            'processing_seconds': round(elapsed, 3),
+            'stage_timings_ms': timings_ms(timings)
+        })
+        return result
+    return wrapper
+
+
+def process_rss_bytes() -> Optional[int]:
+    """Current resident set size of this process (None where /proc is unavailable)"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
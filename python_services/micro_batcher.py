@@ -0,0 +1,113 @@
+"""
+Cross-request dynamic micro-batching for ResNet inference
+Slice tensors submitted by concurrent requests are collected for up to
+`max_wait_ms` or until `max_slices` are pending, run through the model in one
+forward pass, and the per-request rows are handed back to each caller
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Single scheduler thread that merges concurrent inference calls
+    `model_fn` receives an (N, C, H, W) tensor and returns one row per slice
+    """
+
+    def __init__(self, model_fn: Callable[[torch.Tensor], torch.Tensor],
+                 max_slices: int = 64, max_wait_ms: float = 5.0):
+        self.model_fn = model_fn
+        self.max_slices = max(1, max_slices)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._requests: "queue.Queue[Optional[Tuple[torch.Tensor, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Guards _thread, separately from the stats lock the scheduler thread takes
+        self._start_lock = threading.Lock()
+        self._stats = {'requests': 0, 'batches': 0, 'slices': 0}
+
+    def start(self):
+        """Start the scheduler thread (once, even when called from several threads)"""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._loop, name="mr-micro-batcher", daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def shutdown(self):
+        """Finish pending requests and stop the scheduler thread"""
+        with self._start_lock:
+            if self._thread is not None:
+                self._requests.put(None)
+                self._thread.join()
+                self._thread = None
+
+    def infer(self, batch: torch.Tensor) -> torch.Tensor:
+        """Run batch through the model together with other pending requests (blocking)"""
+        self.start()
+        future: Future = Future()
+        self._requests.put((batch, future))
+        return future.result()
+
+    def stats(self) -> Dict:
+        """Request/batch counters; slices_per_batch shows how well requests merge"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['slices_per_batch'] = round(stats['slices'] / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['max_slices'] = self.max_slices
+        stats['max_wait_ms'] = self.max_wait * 1000.0
+        return stats
+
+    def _collect(self, first: Tuple[torch.Tensor, Future]) -> Tuple[List[Tuple[torch.Tensor, Future]], bool]:
+        """Gather requests until max_slices are pending or max_wait has elapsed"""
+        pending = [first]
+        slices = first[0].shape[0]
+        deadline = time.perf_counter() + self.max_wait
+        while slices < self.max_slices:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._requests.get(timeout=timeout) if timeout > 0 else self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return pending, True
+            pending.append(item)
+            slices += item[0].shape[0]
+        return pending, False
+
+    def _loop(self):
+        stopping = False
+        while not stopping:
+            first = self._requests.get()
+            if first is None:
+                return
+            pending, stopping = self._collect(first)
+            self._run(pending)
+
+    def _run(self, pending: List[Tuple[torch.Tensor, Future]]):
+        sizes = [batch.shape[0] for batch, _ in pending]
+        try:
+            outputs = self.model_fn(torch.cat([batch for batch, _ in pending]))
+        except Exception as e:
+            logger.error(f"Micro-batched inference failed: {str(e)}")
+            for _, future in pending:
+                future.set_exception(e)
+            return
+
+        for (_, future), rows in zip(pending, torch.split(outputs, sizes)):
+            future.set_result(rows)
+        with self._lock:
+            self._stats['requests'] += len(pending)
+            self._stats['batches'] += 1
+            self._stats['slices'] += sum(sizes)
@@ -0,0 +1,143 @@
+"""
+Deferred construction of the BrainMRIProcessor
+Importing torch, torchvision and the imaging libraries and building ResNet50
+takes seconds, so the service starts answering right away and builds the
+processor either in a background warm-up thread or on first use
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Loading modes (MRSINA_MODEL_LOADING)
+LOADING_EAGER = 'eager'
+LOADING_BACKGROUND = 'background'
+LOADING_LAZY = 'lazy'
+
+STATE_NOT_LOADED = 'not_loaded'
+STATE_LOADING = 'loading'
+STATE_READY = 'ready'
+STATE_FAILED = 'failed'
+
+
+def _process_start() -> float:
+    """
+    time.monotonic() value at which this process started
+    Uses the start time the kernel records (so interpreter start-up and imports
+    are included) and falls back to the import time of this module
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        age = uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+        return time.monotonic() - max(0.0, age)
+    except (OSError, ValueError, IndexError):
+        return time.monotonic()
+
+
+# Reference point for the startup timeline
+PROCESS_START = _process_start()
+
+
+class StartupTimeline:
+    """Seconds from process start to the first occurrence of named startup events"""
+
+    def __init__(self, origin: float = PROCESS_START):
+        self.origin = origin
+        self._events: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def mark(self, event: str):
+        """Record event the first time it happens"""
+        with self._lock:
+            if event not in self._events:
+                self._events[event] = round(time.monotonic() - self.origin, 3)
+
+    def seen(self, event: str) -> bool:
+        return event in self._events
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._events)
+
+
+class ModelLoader:
+    """
+    Builds the processor once, from whichever caller needs it first
+    `factory` returns the processor; a failed build is retried on the next call
+    """
+
+    def __init__(self, factory: Callable[[], object], timeline: Optional[StartupTimeline] = None):
+        self.factory = factory
+        self.timeline = timeline or StartupTimeline()
+        self._processor = None
+        self._lock = threading.Lock()
+        self._state = STATE_NOT_LOADED
+        self._error: Optional[str] = None
+        self._build_seconds: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._processor is not None
+
+    @property
+    def processor(self):
+        """The processor if it has been built, else None (never triggers a build)"""
+        return self._processor
+
+    def get(self):
+        """The processor, building it in the calling thread if needed (blocking)"""
+        if self._processor is not None:
+            return self._processor
+        with self._lock:
+            if self._processor is None:
+                self._state = STATE_LOADING
+                self.timeline.mark('model_load_started')
+                start = time.perf_counter()
+                try:
+                    processor = self.factory()
+                except Exception as e:
+                    self._state = STATE_FAILED
+                    self._error = str(e)
+                    logger.error(f"Model loading failed: {str(e)}")
+                    raise
+                self._build_seconds = round(time.perf_counter() - start, 3)
+                self._processor = processor
+                self._state = STATE_READY
+                self._error = None
+                self.timeline.mark('model_ready')
+                logger.info(f"Model loaded in {self._build_seconds} s")
+        return self._processor
+
+    async def get_async(self):
+        """The processor, built off the event loop if needed"""
+        if self._processor is not None:
+            return self._processor
+        return await asyncio.get_running_loop().run_in_executor(None, self.get)
+
+    def warm_up(self) -> threading.Thread:
+        """Start building the processor in a background thread"""
+        def build():
+            try:
+                self.get()
+            except Exception:
+                pass  # Recorded in the loader state; requests retry the build
+
+        thread = threading.Thread(target=build, name="mr-model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self) -> Dict:
+        return {
+            'state': self._state,
+            'build_seconds': self._build_seconds,
+            'error': self._error,
+            'startup_timeline_s': self.timeline.snapshot(),
+        }
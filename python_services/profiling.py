@@ -0,0 +1,210 @@
+"""
+Opt-in profiling of single requests
+A request that asks for it (and is allowed by MRSINA_PROFILING) runs its
+pipeline call under cProfile and/or the torch profiler. The artifacts are
+written to one directory per profile:
+
+    <profiles dir>/<profile id>/meta.json
+                                profile.pstats   (cProfile, for pstats/snakeviz)
+                                summary.txt      (cProfile, top functions by cumulative time)
+                                trace.json       (torch profiler, Chrome trace format)
+
+Requests without the flag never touch this module. Both profilers only see the
+thread they run on, so a profiled request runs its forward passes itself
+instead of handing them to the micro-batcher. Only one capture runs at a time
+per process, and the newest `keep` profiles are kept
+"""
+
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROFILERS = ('cprofile', 'torch')
+
+# Artifact name -> (file name, media type)
+ARTIFACTS = {
+    'pstats': ('profile.pstats', 'application/octet-stream'),
+    'summary': ('summary.txt', 'text/plain; charset=utf-8'),
+    'trace': ('trace.json', 'application/json'),
+}
+
+# Artifacts written by each profiler
+PROFILER_ARTIFACTS = {'cprofile': ('pstats', 'summary'), 'torch': ('trace',)}
+
+PROFILE_ID_PATTERN = re.compile(r'^\d{8}T\d{12}-[0-9a-f]{8}$')
+
+SUMMARY_LINES = 60
+
+_capturing: "contextvars.ContextVar[bool]" = contextvars.ContextVar('mrsina_profiling', default=False)
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when another profile is already being captured in this process"""
+
+
+def parse_profilers(value: Optional[str]) -> Tuple[str, ...]:
+    """
+    Profilers named by a comma-separated setting or request flag
+    'all' selects every profiler; empty, 'off' and 'none' select none
+    """
+    names = [name.strip().lower() for name in (value or '').split(',') if name.strip()]
+    if not names or names in (['off'], ['none']):
+        return ()
+    if 'all' in names:
+        return PROFILERS
+    unknown = sorted(set(names) - set(PROFILERS))
+    if unknown:
+        raise ValueError(f"Unknown profiler(s): {', '.join(unknown)} (expected {', '.join(PROFILERS)} or all)")
+    return tuple(name for name in PROFILERS if name in names)
+
+
+def capturing() -> bool:
+    """True inside a profiled call on this thread"""
+    return _capturing.get()
+
+
+class ProfileStore:
+    """
+    Captures profiles into a local directory and lists / locates them
+    `allowed` are the profilers requests may ask for (empty = profiling disabled)
+    """
+
+    def __init__(self, directory: str, allowed: Sequence[str] = (), keep: int = 20):
+        self.directory = directory
+        self.allowed = tuple(allowed)
+        self.keep = max(1, keep)
+        self._capture_lock = threading.Lock()
+        self._prune_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.allowed)
+
+    def allows(self, profilers: Sequence[str]) -> bool:
+        return bool(profilers) and set(profilers) <= set(self.allowed)
+
+    def capture(self, profilers: Sequence[str], label: str, fn: Callable, *args, **kwargs) -> Tuple[object, str]:
+        """
+        Run fn(*args, **kwargs) under the given profilers and return (result, profile id)
+        Artifacts are written even when fn raises; the exception is then re-raised
+        """
+        if not self.allows(profilers):
+            raise ValueError(f"Profiling with {', '.join(profilers) or 'no profiler'} is not enabled")
+        if not self._capture_lock.acquire(blocking=False):
+            raise ProfilerBusyError("Another request is being profiled")
+        try:
+            return self._capture(tuple(profilers), label, fn, args, kwargs)
+        finally:
+            self._capture_lock.release()
+
+    def _capture(self, profilers: Tuple[str, ...], label: str, fn: Callable, args, kwargs) -> Tuple[object, str]:
+        profile_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join(self.directory, profile_id)
+        os.makedirs(path)
+
+        torch_profile = None
+        if 'torch' in profilers:
+            # Imported here: main must stay importable without torch
+            from torch import profiler as torch_profiler
+            torch_profile = torch_profiler.profile(activities=[torch_profiler.ProfilerActivity.CPU])
+        python_profile = cProfile.Profile() if 'cprofile' in profilers else None
+
+        token = _capturing.set(True)
+        error = None
+        start = time.perf_counter()
+        try:
+            if torch_profile is not None:
+                torch_profile.__enter__()
+            if python_profile is not None:
+                python_profile.enable()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                error = e
+            finally:
+                if python_profile is not None:
+                    python_profile.disable()
+                if torch_profile is not None:
+                    torch_profile.__exit__(None, None, None)
+        finally:
+            _capturing.reset(token)
+        wall_seconds = time.perf_counter() - start
+
+        if python_profile is not None:
+            python_profile.dump_stats(os.path.join(path, ARTIFACTS['pstats'][0]))
+            summary = io.StringIO()
+            pstats.Stats(python_profile, stream=summary).sort_stats('cumulative').print_stats(SUMMARY_LINES)
+            with open(os.path.join(path, ARTIFACTS['summary'][0]), 'w') as f:
+                f.write(summary.getvalue())
+        if torch_profile is not None:
+            torch_profile.export_chrome_trace(os.path.join(path, ARTIFACTS['trace'][0]))
+        artifacts = {
+            name: os.path.getsize(os.path.join(path, ARTIFACTS[name][0]))
+            for profiler in profilers for name in PROFILER_ARTIFACTS[profiler]
+        }
+
+        meta = {
+            'profile_id': profile_id,
+            'label': label,
+            'profilers': list(profilers),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'wall_seconds': round(wall_seconds, 3),
+            'status': 'error' if error is not None else 'ok',
+            'error': str(error) if error is not None else None,
+            'stage_timings_ms': result.get('stage_timings_ms') if error is None and isinstance(result, dict) else None,
+            'artifacts': artifacts,
+        }
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        logger.info(f"Profile {profile_id} captured for {label} ({', '.join(profilers)}, {wall_seconds:.2f}s)")
+        self._prune()
+
+        if error is not None:
+            raise error
+        return result, profile_id
+
+    def list(self, limit: Optional[int] = None) -> List[Dict]:
+        """Metadata of the stored profiles, newest first"""
+        profiles = []
+        for profile_id in self._profile_ids()[::-1][:limit]:
+            try:
+                with open(os.path.join(self.directory, profile_id, 'meta.json')) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                # Still being written, or pruned by another worker
+                continue
+        return profiles
+
+    def artifact_path(self, profile_id: str, artifact: str) -> Optional[str]:
+        """File of one artifact of a profile, or None if there is no such profile or artifact"""
+        if not PROFILE_ID_PATTERN.match(profile_id) or artifact not in ARTIFACTS:
+            return None
+        path = os.path.join(self.directory, profile_id, ARTIFACTS[artifact][0])
+        return path if os.path.isfile(path) else None
+
+    def _profile_ids(self) -> List[str]:
+        """Profile IDs in capture order (IDs start with the UTC capture time)"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if PROFILE_ID_PATTERN.match(name))
+
+    def _prune(self):
+        """Delete all but the newest `keep` profiles"""
+        with self._prune_lock:
+            for profile_id in self._profile_ids()[:-self.keep]:
+                shutil.rmtree(os.path.join(self.directory, profile_id), ignore_errors=True)
@@ -0,0 +1,80 @@
+"""
+Stage-level progress of a running pipeline call
+Whoever runs a pipeline call on behalf of a client (the job engine) installs a
+listener with `reporting()`; every finished pipeline stage (see metrics.stage)
+and every inference chunk is then reported to it as it happens. Listeners are
+held in a context variable, so calls nobody listens to pay one lookup per
+stage and progress never leaks between concurrent calls
+"""
+
+import contextvars
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+Listener = Callable[[Dict], None]
+
+_listener: "contextvars.ContextVar[Optional[Listener]]" = contextvars.ContextVar('mrsina_progress', default=None)
+
+
+def stage_done(name: str, seconds: float):
+    """Report a finished pipeline stage"""
+    listener = _listener.get()
+    if listener is not None:
+        _notify(listener, {'stage': name, 'state': 'done', 'seconds': seconds})
+
+
+def slices_inferred(done: int, total: int):
+    """Report how many slices of the current feature batch have been through the model"""
+    listener = _listener.get()
+    if listener is not None:
+        _notify(listener, {'stage': 'inference', 'state': 'running', 'slices_done': done, 'slices_total': total})
+
+
+def _notify(listener: Listener, event: Dict):
+    try:
+        listener(event)
+    except Exception as e:
+        # Progress is best effort: it must never fail the pipeline call
+        logger.warning(f"Progress listener failed: {str(e)}")
+
+
+@contextmanager
+def reporting(listener: Listener) -> Iterator[None]:
+    """Send the progress of pipeline calls made in this block to `listener`"""
+    token = _listener.set(listener)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
+
+
+class ProgressState:
+    """
+    Cumulative progress of one task, built from progress events
+    Subscribers may miss intermediate events (they see snapshots), so every
+    snapshot carries all stages finished so far, not just the latest event
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.inference: Optional[Dict[str, int]] = None
+        self.last_stage: Optional[str] = None
+
+    def update(self, event: Dict) -> Dict:
+        """Apply one event and return the new snapshot"""
+        self.last_stage = event['stage']
+        if event['state'] == 'done':
+            self.stages[event['stage']] = round(self.stages.get(event['stage'], 0.0) + event['seconds'] * 1000, 1)
+        if 'slices_done' in event:
+            self.inference = {'slices_done': event['slices_done'], 'slices_total': event['slices_total']}
+        return self.snapshot()
+
+    def snapshot(self) -> Dict:
+        return {
+            'last_stage': self.last_stage,
+            'stages_done_ms': dict(self.stages),
+            'inference': dict(self.inference) if self.inference else None
+        }
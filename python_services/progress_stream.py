@@ -0,0 +1,175 @@
+"""
+Push task progress to many subscribers from one event loop
+Each server worker runs a single poller task that watches the task store for
+every task someone is subscribed to; subscribers are asyncio queues, not
+threads, so hundreds of open Server-Sent Events streams cost a queue each.
+Changes made by this worker's job threads wake the poller at once (notify);
+changes made by other workers are picked up within `poll_interval`. One
+store round trip per wake-up covers all watched tasks
+"""
+
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Dict, Optional, Set
+
+from task_store import FINISHED_STATUSES, TaskStore
+
+logger = logging.getLogger(__name__)
+
+# Snapshots are cumulative, so a slow subscriber only needs the latest few
+SUBSCRIBER_QUEUE_SIZE = 8
+
+
+class TooManySubscribersError(Exception):
+    """Raised when this worker already serves its maximum number of progress streams"""
+
+
+class ProgressHub:
+    """
+    Fans task record changes out to subscribers
+    `subscribe` yields the current record, then every changed record until
+    the task finishes, and None every `heartbeat_interval` seconds without a change
+    """
+
+    def __init__(self, store: TaskStore, poll_interval: float = 0.25, heartbeat_interval: float = 15.0,
+                 max_subscribers: int = 1000):
+        self.store = store
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.max_subscribers = max_subscribers
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        # Last version the poller fanned out per watched task
+        self._known: Dict[str, int] = {}
+        self._count = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._poller: Optional[asyncio.Task] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return self._count
+
+    def notify(self, task_id: str):
+        """A task changed in this process (callable from any thread)"""
+        loop = self._loop
+        if loop is not None and task_id in self._subscribers and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake.set)
+
+    async def subscribe(self, task_id: str, after_version: int = -1) -> AsyncIterator[Optional[Dict]]:
+        """
+        Records of one task as it changes (versions after `after_version` only)
+        The first item comes without waiting; raises KeyError for an unknown task and TooManySubscribersError when full
+        """
+        loop = asyncio.get_running_loop()
+        record = await loop.run_in_executor(None, self.store.get, task_id)
+        if record is None:
+            raise KeyError(task_id)
+        finished = record['status'] in FINISHED_STATUSES
+        if not finished:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribersError(f"Progress stream limit reached ({self.max_subscribers} per worker)")
+            # The slot is reserved before the first yield, so subscribers suspended there count towards the limit
+            self._count += 1
+        try:
+            # A reconnecting client that is up to date gets a heartbeat, so the stream starts at once
+            yield record if record['version'] > after_version else None
+            if finished:
+                return
+
+            last_version = record['version']
+            queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+            self._add(task_id, queue)
+            try:
+                while True:
+                    try:
+                        record = await asyncio.wait_for(queue.get(), self.heartbeat_interval)
+                    except asyncio.TimeoutError:
+                        yield None
+                        continue
+                    if record is None:
+                        # Expired or deleted while being watched
+                        return
+                    if record['version'] <= last_version:
+                        continue
+                    last_version = record['version']
+                    yield record
+                    if record['status'] in FINISHED_STATUSES:
+                        return
+            finally:
+                self._remove(task_id, queue)
+        finally:
+            if not finished:
+                self._count -= 1
+
+    def _add(self, task_id: str, queue: asyncio.Queue):
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        # The poller may have fanned out a newer version while this subscriber read its
+        # first record; forgetting it makes the next round offer the current record again
+        self._known.pop(task_id, None)
+        if self._poller is None or self._poller.done():
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._poller = self._loop.create_task(self._poll())
+        else:
+            # Fetch the new task's state on the next round without waiting a full interval
+            self._wake.set()
+
+    def _remove(self, task_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(task_id)
+        if queues is not None and queue in queues:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[task_id]
+
+    def _changed(self, known: Dict[str, int]) -> Dict[str, Optional[Dict]]:
+        """Records of the watched tasks whose version differs from `known` (None = task gone); runs off the loop"""
+        versions = self.store.versions(known)
+        changed = {}
+        for task_id, version in known.items():
+            if task_id not in versions:
+                changed[task_id] = None
+            elif versions[task_id] != version:
+                changed[task_id] = self.store.get(task_id)
+        return changed
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        while self._subscribers:
+            self._wake.clear()
+            self._known = {task_id: self._known.get(task_id, -1) for task_id in self._subscribers}
+            try:
+                # A copy: _add may forget a version while the store is read off the loop
+                changed = await loop.run_in_executor(None, self._changed, dict(self._known))
+            except Exception as e:
+                logger.warning(f"Progress poll failed: {str(e)}")
+                changed = {}
+            for task_id, record in changed.items():
+                if record is not None:
+                    self._known[task_id] = record['version']
+                for queue in list(self._subscribers.get(task_id, ())):
+                    self._offer(queue, record)
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, record: Optional[Dict]):
+        """Queue a record for one subscriber, dropping its oldest pending snapshot if it lags behind"""
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(record)
+
+
+def format_event(record: Optional[Dict]) -> str:
+    """One Server-Sent Events message for a task record (a comment line for heartbeats)"""
+    if record is None:
+        return ': keep-alive\n\n'
+    if record['status'] in FINISHED_STATUSES:
+        event = 'result'
+    elif 'progress' in record:
+        event = 'progress'
+    else:
+        event = 'status'
+    return f"id: {record['version']}\nevent: {event}\ndata: {json.dumps(record, ensure_ascii=False)}\n\n"
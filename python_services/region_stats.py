@@ -0,0 +1,217 @@
+"""
+Vectorized voxel statistics for every brain region in one pass
+ROI boxes (which may overlap, e.g. the amygdala boxes sit inside the
+hippocampus boxes) are turned into a partition of the volume into "atoms":
+voxels covered by exactly the same set of regions share one atom label. The
+per-atom sums (voxel count, intensity sum and sum of squares, tissue voxel
+count) come from np.bincount over the whole volume, and each region's totals
+are the sums over its atoms. A label atlas volume needs no partition: its
+label values are the bins directly
+
+Label maps are built once per (volume shape, region definitions) and cached.
+Box label maps only cover the bounding block of the boxes, so voxels outside
+every region are never read; lazy volumes (lazy_volume.LazyNiftiVolume) are
+only ever read in that block and in strided slabs for the Otsu sample
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RegionLabelMap:
+    """
+    Atom label per voxel plus which regions each atom belongs to
+    `membership` is a (regions, atoms) 0/1 matrix; region totals are
+    membership @ per-atom totals. `labels` may cover only the `bounds` block
+    of a volume of `shape` (voxels outside every region are never read)
+    """
+
+    def __init__(self, labels: np.ndarray, region_names: List[str], membership: np.ndarray,
+                 shape: Optional[Tuple[int, ...]] = None, bounds: Optional[Tuple[slice, ...]] = None):
+        self.labels = labels
+        self.flat_labels = labels.reshape(-1)
+        self.region_names = region_names
+        self.membership = membership
+        self.shape = tuple(shape) if shape is not None else labels.shape
+        self.bounds = bounds if bounds is not None else tuple(slice(0, n) for n in self.shape)
+
+    @property
+    def atom_count(self) -> int:
+        return self.membership.shape[1]
+
+
+def _clip_box(coords, shape: Tuple[int, ...]) -> Tuple[slice, ...]:
+    """roi_coords (min, max per axis) as index slices clipped to the volume"""
+    return tuple(
+        slice(max(0, int(coords[2 * axis])), min(shape[axis], int(coords[2 * axis + 1])))
+        for axis in range(len(shape))
+    )
+
+
+def box_label_map(regions: Dict[str, Dict], shape: Tuple[int, ...]) -> RegionLabelMap:
+    """
+    Partition a volume by overlapping ROI boxes
+    Labels are stored only for the bounding block of all boxes. Each box
+    relabels its own sub-block: the atoms it covers are split into
+    "old atom + this region" atoms, merged by membership set
+    """
+    names = list(regions)
+    boxes = [_clip_box(regions[name]['roi_coords'], shape) for name in names]
+    non_empty = [box for box in boxes if all(s.stop > s.start for s in box)]
+    if non_empty:
+        bounds = tuple(
+            slice(min(box[axis].start for box in non_empty), max(box[axis].stop for box in non_empty))
+            for axis in range(len(shape))
+        )
+    else:
+        bounds = tuple(slice(0, 0) for _ in shape)
+    labels = np.zeros(tuple(s.stop - s.start for s in bounds), dtype=np.int32)
+    atoms: List[frozenset] = [frozenset()]
+    atom_ids: Dict[frozenset, int] = {frozenset(): 0}
+
+    for index, box in enumerate(boxes):
+        if not all(s.stop > s.start for s in box):
+            continue
+        block = tuple(slice(s.start - b.start, s.stop - b.start) for s, b in zip(box, bounds))
+        sub = labels[block]
+        present, inverse = np.unique(sub, return_inverse=True)
+        remap = np.empty(len(present), dtype=np.int32)
+        for i, atom in enumerate(present):
+            members = atoms[atom] | {index}
+            if members not in atom_ids:
+                atom_ids[members] = len(atoms)
+                atoms.append(members)
+            remap[i] = atom_ids[members]
+        labels[block] = remap[inverse].reshape(sub.shape)
+
+    membership = np.zeros((len(names), len(atoms)), dtype=np.float64)
+    for atom, members in enumerate(atoms):
+        for index in members:
+            membership[index, atom] = 1.0
+    return RegionLabelMap(labels, names, membership, shape=shape, bounds=bounds)
+
+
+def atlas_label_map(atlas: np.ndarray, label_names: Optional[Dict[int, str]] = None) -> RegionLabelMap:
+    """
+    Label map of a non-overlapping atlas volume (0 = background)
+    Label values are used as bins directly, so each region has exactly one atom
+    """
+    labels = np.ascontiguousarray(atlas, dtype=np.int32)
+    if labels.size and labels.min() < 0:
+        raise ValueError("Atlas labels must be non-negative")
+    present = np.flatnonzero(np.bincount(labels.reshape(-1)))
+    present = present[present != 0]
+    names = [label_names.get(int(v), f"label_{int(v)}") if label_names else f"label_{int(v)}" for v in present]
+    membership = np.zeros((len(present), int(labels.max()) + 1 if labels.size else 1), dtype=np.float64)
+    membership[np.arange(len(present)), present] = 1.0
+    return RegionLabelMap(labels, names, membership)
+
+
+def _strided_sample(volume, sample_step: int) -> np.ndarray:
+    """
+    Every `sample_step`-th voxel of a volume
+    Lazy 3D volumes are read in slabs of axial slices, so the whole volume is never in memory at once
+    """
+    if isinstance(volume, np.ndarray) or getattr(volume, 'ndim', 0) != 3:
+        return np.asarray(volume).reshape(-1)[::sample_step]
+    chunk = getattr(volume, 'chunk_slices', 16)
+    return np.concatenate([
+        np.asarray(volume[:, :, start:start + chunk]).reshape(-1)[::sample_step]
+        for start in range(0, volume.shape[2], chunk)
+    ])
+
+
+def otsu_threshold(volume, bins: int = 256, sample_step: int = 8) -> float:
+    """Otsu intensity threshold between background and tissue, from a strided voxel sample"""
+    sample = _strided_sample(volume, sample_step)
+    low, high = float(sample.min()), float(sample.max())
+    if high <= low:
+        return low
+    hist, edges = np.histogram(sample, bins=bins, range=(low, high))
+    centres = (edges[:-1] + edges[1:]) / 2
+    weight = np.cumsum(hist)
+    weighted = np.cumsum(hist * centres)
+    total_weight, total_weighted = weight[-1], weighted[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_low = weighted / weight
+        mean_high = (total_weighted - weighted) / (total_weight - weight)
+        between = weight * (total_weight - weight) * (mean_low - mean_high) ** 2
+    return float(centres[np.nanargmax(between[:-1])])
+
+
+class RegionStatistics:
+    """
+    Per-region voxel count, intensity mean/std and thresholded tissue volume
+    Box label maps are cached per (shape, region definitions), up to
+    `max_cached_maps` entries
+    """
+
+    def __init__(self, max_cached_maps: int = 4):
+        self.max_cached_maps = max(1, max_cached_maps)
+        self._maps: "OrderedDict[Tuple, RegionLabelMap]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def label_map(self, regions: Dict[str, Dict], shape: Tuple[int, ...]) -> RegionLabelMap:
+        """Cached box label map for a volume shape"""
+        key = (tuple(shape), tuple((name, tuple(info['roi_coords'])) for name, info in regions.items()))
+        with self._lock:
+            label_map = self._maps.get(key)
+            if label_map is not None:
+                self._maps.move_to_end(key)
+                return label_map
+        label_map = box_label_map(regions, tuple(shape))
+        with self._lock:
+            self._maps[key] = label_map
+            while len(self._maps) > self.max_cached_maps:
+                self._maps.popitem(last=False)
+        return label_map
+
+    def compute(self, volume, regions: Optional[Dict[str, Dict]] = None,
+                label_map: Optional[RegionLabelMap] = None, tissue_threshold: Optional[float] = None,
+                voxel_volume_mm3: float = 1.0) -> Dict[str, Dict]:
+        """
+        Statistics for every region of `regions` (ROI boxes) or of a prebuilt label map
+        The tissue threshold defaults to the volume's Otsu threshold. `volume`
+        may be lazy: only the label map's bounding block is read in full
+        """
+        if not hasattr(volume, 'shape'):
+            volume = np.asarray(volume)
+        if label_map is None:
+            label_map = self.label_map(regions, volume.shape)
+        elif label_map.shape != tuple(volume.shape):
+            raise ValueError(f"Label map shape {label_map.shape} does not match volume {volume.shape}")
+        if tissue_threshold is None:
+            tissue_threshold = otsu_threshold(volume)
+
+        values = np.asarray(volume[label_map.bounds]).reshape(-1)
+        labels = label_map.flat_labels
+        atoms = label_map.atom_count
+        # One bincount per moment over the whole volume; no per-region loop
+        per_atom = np.stack([
+            np.bincount(labels, minlength=atoms),
+            np.bincount(labels, weights=values, minlength=atoms),
+            np.bincount(labels, weights=np.square(values, dtype=np.float64), minlength=atoms),
+            np.bincount(labels, weights=values > tissue_threshold, minlength=atoms),
+        ])
+        # Region totals are sums over the region's atoms (moments are additive)
+        count, total, total_sq, tissue = (label_map.membership @ per_atom.T).T
+
+        stats = {}
+        for i, name in enumerate(label_map.region_names):
+            n = int(count[i])
+            mean = total[i] / n if n else None
+            variance = max(0.0, total_sq[i] / n - mean * mean) if n else None
+            stats[name] = {
+                'voxel_count': n,
+                'mean_intensity': float(mean) if n else None,
+                'std_intensity': float(np.sqrt(variance)) if n else None,
+                'tissue_voxels': int(tissue[i]),
+                'tissue_volume_mm3': float(tissue[i] * voxel_volume_mm3),
+            }
+        return stats
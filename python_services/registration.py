@@ -0,0 +1,269 @@
+"""
+Coarse-to-fine rigid / affine registration of one scan onto another
+Both volumes are reduced to a block-mean pyramid (8x, 4x, 2x, 1x for a 256^3
+scan) and the transform is refined level by level with Powell's method on
+normalized cross-correlation over a fixed number of random sample points.
+The coarse levels do the searching; full resolution only polishes the last
+fraction of a voxel, and is skipped for lazy (memory-mapped) volumes, whose
+finest level is 2x so they are only ever read in z-slabs. The result maps
+fixed voxel indices to moving voxel indices; the moving volume is then
+resampled once onto the fixed grid, slab by slab. Transforms are cached per
+(fixed, moving) content-hash pair
+"""
+
+import logging
+import time
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import ndimage, optimize
+
+from feature_cache import FeatureCache, make_cache_key
+
+logger = logging.getLogger(__name__)
+
+# Part of every transform cache key: bump when the optimizer or metric changes
+REGISTRATION_VERSION = 'pyramid-ncc-v1'
+REGISTRATION_MODES = ('none', 'rigid', 'affine')
+
+
+class Transform(NamedTuple):
+    """moving index = matrix @ fixed index + offset"""
+    matrix: np.ndarray
+    offset: np.ndarray
+
+    @classmethod
+    def identity(cls) -> "Transform":
+        return cls(np.eye(3), np.zeros(3))
+
+    @classmethod
+    def from_array(cls, array: np.ndarray) -> "Transform":
+        array = np.asarray(array, dtype=np.float64).reshape(3, 4)
+        return cls(array[:, :3].copy(), array[:, 3].copy())
+
+    def as_array(self) -> np.ndarray:
+        return np.hstack([self.matrix, self.offset[:, np.newaxis]])
+
+    def max_displacement(self, shape: Sequence[int]) -> float:
+        """Largest distance (voxels) any corner of a volume of this shape moves"""
+        corners = np.array(np.meshgrid(*[(0, n - 1) for n in shape], indexing='ij')).reshape(3, -1)
+        moved = self.matrix @ corners + self.offset[:, np.newaxis]
+        return float(np.max(np.linalg.norm(moved - corners, axis=0)))
+
+    def describe(self, shape: Sequence[int]) -> Dict:
+        """Shift of the volume centre (voxels), rotation angle (degrees) and largest displacement for API responses"""
+        centre = (np.asarray(shape[:3], dtype=np.float64) - 1) / 2
+        u, _, vt = np.linalg.svd(self.matrix)
+        rotation = u @ vt
+        angle = np.degrees(np.arccos(np.clip((np.trace(rotation) - 1) / 2, -1.0, 1.0)))
+        return {
+            'translation_voxels': [round(float(v), 2) for v in self.matrix @ centre + self.offset - centre],
+            'max_displacement_voxels': round(self.max_displacement(shape), 2),
+            'rotation_degrees': round(float(angle), 2)
+        }
+
+
+def _euler_matrix(angles: np.ndarray) -> np.ndarray:
+    cx, cy, cz = np.cos(angles)
+    sx, sy, sz = np.sin(angles)
+    rx = np.array([[1, 0, 0], [0, cx, -sx], [0, sx, cx]])
+    ry = np.array([[cy, 0, sy], [0, 1, 0], [-sy, 0, cy]])
+    rz = np.array([[cz, -sz, 0], [sz, cz, 0], [0, 0, 1]])
+    return rz @ ry @ rx
+
+
+def _params_matrix(params: np.ndarray, radius: float) -> np.ndarray:
+    """
+    3x3 matrix from optimizer parameters (translation excluded)
+    Rotations, log-scales and shears are expressed as the displacement they
+    cause at `radius` voxels from the centre, so every parameter has the same
+    unit (voxels of the current level) and Powell's line searches are balanced
+    """
+    matrix = _euler_matrix(params[3:6] / radius)
+    if len(params) > 6:
+        shear = np.eye(3)
+        shear[0, 1], shear[0, 2], shear[1, 2] = params[9:12] / radius
+        matrix = matrix @ shear @ np.diag(np.exp(params[6:9] / radius))
+    return matrix
+
+
+def downsample(volume, factor: int, chunk_slices: int = 32) -> np.ndarray:
+    """
+    Block mean over factor^3 voxels as float32 (trailing partial blocks dropped)
+    Read in z-slabs, so for factor >= 2 a lazy volume is never materialized.
+    Factor 1 is the volume itself as an array (register() never asks for it for lazy volumes)
+    """
+    if factor == 1:
+        # Full resolution is only ever sampled at a few points: no float copy
+        return np.asarray(volume)
+    height, width, depth = (n // factor for n in volume.shape[:3])
+    out = np.empty((height, width, depth), dtype=np.float32)
+    step = max(1, chunk_slices // factor)
+    for z0 in range(0, depth, step):
+        z1 = min(depth, z0 + step)
+        slab = np.asarray(volume[:height * factor, :width * factor, z0 * factor:z1 * factor], dtype=np.float32)
+        out[:, :, z0:z1] = slab.reshape(height, factor, width, factor, z1 - z0, factor).mean(axis=(1, 3, 5))
+    return out
+
+
+def _centre(shape: Sequence[int], factor: int) -> np.ndarray:
+    """Volume centre in the index space of a level downsampled by `factor`"""
+    return ((np.asarray(shape[:3], dtype=np.float64) - 1) / 2 - (factor - 1) / 2) / factor
+
+
+def _centre_of_mass(level: np.ndarray) -> np.ndarray:
+    if not level.any():
+        return (np.asarray(level.shape, dtype=np.float64) - 1) / 2
+    return np.asarray(ndimage.center_of_mass(level), dtype=np.float64)
+
+
+def pyramid_factors(shape: Sequence[int], coarsest_size: int = 24, finest_factor: int = 1) -> Tuple[int, ...]:
+    """Power-of-two levels from the coarsest keeping >= `coarsest_size` voxels per side down to `finest_factor`"""
+    factors = [finest_factor]
+    while min(shape[:3]) // (factors[-1] * 2) >= coarsest_size:
+        factors.append(factors[-1] * 2)
+    return tuple(reversed(factors))
+
+
+def _sample_points(level: np.ndarray, max_samples: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Up to `max_samples` points at random sub-voxel positions of a level: (3, N) coordinates and values
+    Grid-aligned samples would be compared against interpolated (blurred)
+    moving values everywhere except at integer shifts, which biases the
+    metric towards the identity; interpolating both sides avoids that
+    """
+    count = min(max_samples, level.size)
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0, 1, size=(3, count)) * (np.asarray(level.shape, dtype=np.float64)[:, np.newaxis] - 1)
+    return points, ndimage.map_coordinates(level, points, order=1, output=np.float32)
+
+
+def register(fixed, moving, mode: str = 'rigid', factors: Optional[Sequence[int]] = None,
+             max_evaluations: int = 300, max_samples: int = 32768) -> Transform:
+    """
+    Transform aligning `moving` onto `fixed` (both (H, W, D), shapes may differ)
+    `factors` are the pyramid levels from coarsest to finest (None = from the
+    volume size). Lazy volumes stop at factor 2 instead of 1. At each level the metric is taken over at most `max_samples`
+    random points, so an evaluation costs the same on every level, and
+    Powell's method runs for at most `max_evaluations` evaluations
+    """
+    if mode not in ('rigid', 'affine'):
+        raise ValueError(f"Unsupported registration mode: {mode}")
+    if len(fixed.shape) != 3 or len(moving.shape) != 3:
+        raise ValueError("Registration needs two 3D volumes")
+
+    # Full resolution needs the whole volume in memory: lazy inputs are registered down to 2x only
+    finest = 1 if isinstance(fixed, np.ndarray) and isinstance(moving, np.ndarray) else 2
+    factors = sorted({max(finest, int(f)) for f in factors or pyramid_factors(fixed.shape, finest_factor=finest)
+                      if int(f) >= 1}, reverse=True) or [finest]
+    radius = max(float(min(fixed.shape[:3])), 2.0) / 2
+    params = np.zeros(12 if mode == 'affine' else 6)
+    for level_number, factor in enumerate(factors):
+        fixed_level = downsample(fixed, factor)
+        moving_level = downsample(moving, factor)
+        fixed_centre = _centre(fixed.shape, factor)
+        moving_centre = _centre(moving.shape, factor)
+        if level_number == 0:
+            # Start from the centre-of-mass shift, so large head movements do not trap the optimizer
+            params[:3] = (
+                (_centre_of_mass(moving_level) - moving_centre) - (_centre_of_mass(fixed_level) - fixed_centre)
+            ) * factor
+
+        points, fixed_values = _sample_points(fixed_level, max_samples)
+        fixed_values = fixed_values - fixed_values.mean()
+        fixed_norm = float(np.sqrt(np.dot(fixed_values, fixed_values)))
+        if fixed_norm == 0:
+            continue
+
+        def cost(level_params: np.ndarray) -> float:
+            """Negative normalized cross-correlation over the sample points"""
+            matrix = _params_matrix(level_params, radius / factor)
+            offset = moving_centre + level_params[:3] - matrix @ fixed_centre
+            moved = ndimage.map_coordinates(moving_level, matrix @ points + offset[:, np.newaxis], order=1,
+                                            cval=0.0, output=np.float32)
+            moved -= moved.mean()
+            moved_norm = float(np.sqrt(np.dot(moved, moved)))
+            return -float(np.dot(fixed_values, moved)) / (fixed_norm * moved_norm) if moved_norm > 0 else 0.0
+
+        # Parameters are optimized in voxels of this level
+        result = optimize.minimize(cost, params / factor, method='Powell',
+                                   options={'xtol': 1e-2, 'ftol': 1e-6, 'maxfev': max_evaluations})
+        params = np.asarray(result.x) * factor
+        logger.debug(f"Registration level {factor}x: ncc={-result.fun:.4f} after {result.nfev} evaluations")
+
+    matrix = _params_matrix(params, radius)
+    offset = _centre(moving.shape, 1) + params[:3] - matrix @ _centre(fixed.shape, 1)
+    return Transform(matrix, offset)
+
+
+def resample(moving, transform: Transform, shape: Sequence[int], chunk_slices: int = 16) -> np.ndarray:
+    """
+    Moving volume on the fixed grid (trilinear), in the moving volume's dtype
+    Filled `chunk_slices` output z-slices at a time from the block of the
+    moving volume they map into, so a lazy volume is never read in full
+    """
+    height, width, depth = (int(n) for n in shape[:3])
+    out = None
+    for z0 in range(0, depth, chunk_slices):
+        z1 = min(depth, z0 + chunk_slices)
+        corners = np.array(np.meshgrid((0, height - 1), (0, width - 1), (z0, z1 - 1), indexing='ij')).reshape(3, -1)
+        mapped = transform.matrix @ corners + transform.offset[:, np.newaxis]
+        # One voxel of margin on each side for trilinear interpolation
+        low = np.clip(np.floor(mapped.min(axis=1)).astype(int) - 1, 0, moving.shape[:3])
+        high = np.clip(np.ceil(mapped.max(axis=1)).astype(int) + 2, 0, moving.shape[:3])
+        block = np.asarray(moving[tuple(slice(a, b) for a, b in zip(low, high))])
+        if out is None:
+            out = np.zeros((height, width, depth), dtype=block.dtype)
+        if block.size == 0:
+            continue
+        offset = transform.offset + transform.matrix @ np.array([0.0, 0.0, z0]) - low
+        resampled = ndimage.affine_transform(block, transform.matrix, offset, output_shape=(height, width, z1 - z0),
+                                             order=1, cval=0.0, output=np.float32)
+        if np.issubdtype(block.dtype, np.integer):
+            info = np.iinfo(block.dtype)
+            np.rint(resampled, out=resampled)
+            np.clip(resampled, info.min, info.max, out=resampled)
+        out[:, :, z0:z1] = resampled
+    return out
+
+
+class Registration:
+    """
+    Pairwise registration with a transform cache
+    `mode` is 'rigid', 'affine' or 'none'. Transforms are stored as 3x4
+    arrays in a FeatureCache keyed by both content hashes, the mode and the
+    registration version. Transforms that move no voxel by more than
+    `identity_tolerance` are treated as identity and skip resampling
+    """
+
+    def __init__(self, mode: str = 'rigid', transform_cache: Optional[FeatureCache] = None,
+                 factors: Optional[Sequence[int]] = None, identity_tolerance: float = 0.25):
+        if mode not in REGISTRATION_MODES:
+            raise ValueError(f"Unsupported registration mode: {mode}")
+        self.mode = mode
+        self.factors = tuple(factors) if factors else None
+        self.identity_tolerance = identity_tolerance
+        self.transform_cache = transform_cache if transform_cache is not None else FeatureCache()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != 'none'
+
+    def transform_key(self, fixed_hash: str, moving_hash: str) -> str:
+        return make_cache_key(f"{fixed_hash}->{moving_hash}", REGISTRATION_VERSION, self.mode,
+                              'x'.join(str(f) for f in self.factors or ('auto',)))
+
+    def transform(self, fixed, moving, fixed_hash: str, moving_hash: str) -> Tuple[Transform, bool]:
+        """(transform, cached) for a scan pair"""
+        key = self.transform_key(fixed_hash, moving_hash)
+        cached = self.transform_cache.get(key)
+        if cached is not None:
+            return Transform.from_array(cached), True
+        start = time.perf_counter()
+        transform = register(fixed, moving, self.mode, self.factors)
+        logger.info(f"Registered scan pair in {time.perf_counter() - start:.2f}s: {transform.describe(fixed.shape)}")
+        self.transform_cache.put(key, transform.as_array())
+        return transform, False
+
+    def is_identity(self, transform: Transform, shape: Sequence[int]) -> bool:
+        return transform.max_displacement(shape) <= self.identity_tolerance
@@ -0,0 +1,178 @@
+"""
+Production entry point: preload the model once, then fork uvicorn workers
+The master process builds the processor (weights, backend) before forking,
+so every worker shares the weight pages copy-on-write instead of loading its
+own ResNet50. The master owns the listening socket, partitions the CPU cores
+between workers (torch intra-op threads per worker), restarts workers that
+die, and on SIGTERM/SIGINT lets each worker drain its in-flight requests
+
+Usage: python serve.py [--workers 4] [--port 8001]
+(`python main.py` remains the single-process development server with reload)
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def threads_per_worker(workers: int, profile: Optional[Dict] = None) -> int:
+    """
+    Torch intra-op threads per worker: the explicit setting, else the autotuned
+    value, else an even split so all workers together use each core once
+    """
+    if config.TORCH_THREADS_PER_WORKER > 0:
+        return config.TORCH_THREADS_PER_WORKER
+    if profile is not None:
+        return profile['intra_op_threads']
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def preload(main_module):
+    """Build the processor in the master and move its fp32 weights into shared memory"""
+    processor = main_module.models.get()
+    # Weights that came from a download live in anonymous memory; shared memory keeps
+    # them shared even if a worker touches the pages (bundle weights are file-backed)
+    processor.feature_extractor.share_memory()
+    processor.brain_analyzer.share_memory()
+    return processor
+
+
+def init_worker(main_module, index: int, threads: int):
+    """Per-worker setup after fork"""
+    import torch
+    from inference_executor import InferenceExecutor
+
+    torch.set_num_threads(threads)
+    # This worker owns `threads` cores: one heavy call at a time already uses all of them
+    main_module.inference_executor = InferenceExecutor(
+        max_workers=config.INFERENCE_THREADS or 1,
+        max_concurrency=config.INFERENCE_CONCURRENCY or None
+    )
+    processor = main_module.models.processor
+    if processor.backend.name == 'onnx':
+        # ONNX Runtime thread pools do not survive fork
+        processor.rebuild_backend()
+    logger.info(f"Worker {index} (pid {os.getpid()}) ready with {threads} torch threads")
+
+
+def run_worker(main_module, sock: socket.socket, index: int, threads: int):
+    """Serve on the inherited socket until told to stop (never returns)"""
+    import uvicorn
+
+    exit_code = 0
+    try:
+        init_worker(main_module, index, threads)
+        server_config = uvicorn.Config(
+            main_module.app,
+            log_level="info",
+            timeout_graceful_shutdown=config.DRAIN_TIMEOUT_S
+        )
+        uvicorn.Server(server_config).run(sockets=[sock])
+    except Exception as e:
+        logger.error(f"Worker {index} failed: {str(e)}")
+        exit_code = 1
+    finally:
+        os._exit(exit_code)
+
+
+class Supervisor:
+    """Forks the workers, restarts crashed ones and forwards shutdown signals"""
+
+    def __init__(self, main_module, sock: socket.socket, workers: int, threads: int):
+        self.main_module = main_module
+        self.sock = sock
+        self.workers = workers
+        self.threads = threads
+        self.children: Dict[int, int] = {}  # pid -> worker index
+        self.stopping = False
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            # Own process group: a terminal Ctrl-C reaches only the master, which then
+            # sends each worker a single SIGTERM (a second signal would make uvicorn skip draining)
+            os.setpgid(0, 0)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            run_worker(self.main_module, self.sock, index, self.threads)
+        self.children[pid] = index
+
+    def stop(self, signum, frame):
+        if not self.stopping:
+            logger.info(f"Draining {len(self.children)} workers (up to {config.DRAIN_TIMEOUT_S} s)")
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.workers):
+            self.spawn(index)
+
+        deadline = None
+        while self.children:
+            if self.stopping and deadline is None:
+                deadline = time.monotonic() + config.DRAIN_TIMEOUT_S + 5
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                if deadline is not None and time.monotonic() > deadline:
+                    for child in list(self.children):
+                        logger.warning(f"Worker pid {child} did not drain in time, killing it")
+                        os.kill(child, signal.SIGKILL)
+                    deadline = time.monotonic() + 5
+                time.sleep(0.2)
+                continue
+            index = self.children.pop(pid, None)
+            if index is not None and not self.stopping:
+                logger.warning(f"Worker {index} (pid {pid}) exited with status {status}, restarting it")
+                time.sleep(1.0)
+                self.spawn(index)
+        logger.info("All workers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mr. Sina brain MRI service (multi-worker)")
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=config.SERVER_WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    workers = max(1, args.workers or os.cpu_count() or 1)
+
+    # Bind before forking so all workers accept from the same socket
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    import main as main_module
+    main_module.worker_count = workers
+    start = time.perf_counter()
+    preload(main_module)
+    threads = threads_per_worker(workers, main_module.autotune_profile)
+    logger.info(f"Model preloaded in {time.perf_counter() - start:.1f} s; "
+                f"starting {workers} workers x {threads} torch threads on {args.host}:{args.port}")
+    Supervisor(main_module, sock, workers, threads).run()
+    sock.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
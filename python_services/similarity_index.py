@@ -0,0 +1,529 @@
+"""
+Nearest-neighbour index over per-scan feature vectors
+Vectors are L2-normalised and appended to one memory-mapped matrix file
+(float32, or float16 for half the disk and slower exact search); scan metadata (scan ID, content hash, patient,
+hospital) lives in SQLite next to it. Row numbers are allocated in a SQLite
+transaction, so server workers can append to one index concurrently and each
+picks up the rows of the others on its next search
+
+Search is exact (cosine similarity over every row, in chunks) until the
+index holds `approximate_min_rows` scans. From then on an IVF coarse
+quantizer (spherical k-means centroids, trained in the background and again
+whenever the index has doubled) restricts a search to the rows of the
+`nprobe` closest clusters, which are then ranked exactly
+"""
+
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from metrics import timed
+from sqlite_utils import reconnect_after_fork
+
+logger = logging.getLogger(__name__)
+
+DTYPES = ('float16', 'float32')
+SEARCH_MODES = ('auto', 'exact', 'approximate')
+
+# Rows converted to float32 and scored per step of an exact search (bounds temporary memory)
+SEARCH_CHUNK_ROWS = 16384
+# Searches rescored because the index changed between scoring and reading result metadata
+SEARCH_ATTEMPTS = 3
+# k-means: sampled vectors per cluster and iterations; trainers hold a lease this long at most
+KMEANS_SAMPLE_PER_LIST = 32
+KMEANS_ITERATIONS = 8
+TRAINING_LEASE_S = 600
+# len() and stats() (health checks, metrics scrapes) report this process's view without
+# touching SQLite; a view older than this is refreshed on a background thread
+STATS_REFRESH_S = 10.0
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the most similar centroid for every row, converted to float32 chunk by chunk"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SEARCH_CHUNK_ROWS):
+        block = np.asarray(vectors[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def _top_k(scores: np.ndarray, rows: np.ndarray, k: int):
+    """The k best (score, row) pairs of one block, unsorted"""
+    if len(scores) > k:
+        best = np.argpartition(-scores, k - 1)[:k]
+        return scores[best], rows[best]
+    return scores, rows
+
+
+class SimilarityIndex:
+    """
+    Append-only vector index with exact and IVF search
+    Adding a scan ID again replaces its entry (same content and metadata: no-op)
+    Without an index directory the index lives in a temporary directory of this process
+    """
+
+    def __init__(self, index_dir: Optional[str] = None, dimension: int = 2048, dtype: str = 'float32',
+                 approximate_min_rows: int = 20000, nprobe: int = 8, duplicate_similarity: float = 0.999):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {dtype} (expected one of {', '.join(DTYPES)})")
+        self._tmp = None
+        if not index_dir:
+            self._tmp = tempfile.TemporaryDirectory(prefix='mrsina-similarity-')
+            index_dir = self._tmp.name
+        os.makedirs(index_dir, exist_ok=True)
+        self.index_dir = index_dir
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.approximate_min_rows = max(0, approximate_min_rows)
+        self.nprobe = max(1, nprobe)
+        self.duplicate_similarity = duplicate_similarity
+        self._vectors_path = os.path.join(index_dir, 'vectors.bin')
+        self._ivf_path = os.path.join(index_dir, 'ivf.npz')
+        self._lock = threading.Lock()
+        self._training = False
+        self._refreshing = threading.Lock()
+        self._refreshed: Optional[float] = None
+
+        self._connect()
+        layout = f"{dimension}:{self.dtype.name}"
+        self._db.executescript(
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS scans (row INTEGER PRIMARY KEY, scan_id TEXT NOT NULL, '
+            'content_hash TEXT, patient_id TEXT, hospital_id TEXT, added REAL NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS scans_by_id ON scans (scan_id, row);'
+        )
+        self._db.execute("INSERT OR IGNORE INTO meta VALUES ('layout', ?)", (layout,))
+        self._db.execute("INSERT OR IGNORE INTO meta VALUES ('generation', '0')")
+        stored = self._meta('layout')
+        if stored != layout:
+            raise ValueError(f"Similarity index in {index_dir} holds {stored} vectors, not {layout}")
+        self._reset_view()
+        reconnect_after_fork(self, type(self)._after_fork)
+
+    def _connect(self):
+        # Autocommit; add() and the version check open their own write transactions
+        self._db = sqlite3.connect(os.path.join(self.index_dir, 'index.sqlite'), check_same_thread=False,
+                                   timeout=30, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+
+    def _after_fork(self):
+        self._training = False
+        self._refreshing = threading.Lock()
+        self._connect()
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _reset_view(self):
+        """Forget this process's view of the rows (rebuilt by the next _refresh)"""
+        self._generation: Optional[str] = None
+        self._rows = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._scan_ids: List[str] = []
+        self._content_hashes: List[Optional[str]] = []
+        self._patient_ids: List[Optional[str]] = []
+        self._hospital_ids: List[Optional[str]] = []
+        self._added: List[float] = []
+        # Patient and hospital IDs as integer codes (0 = none), so filters are one vectorised comparison
+        self._codes: Dict[str, int] = {}
+        self._patients = np.zeros(0, dtype=np.int32)
+        self._hospitals = np.zeros(0, dtype=np.int32)
+        # Rows replaced by a later entry with the same scan ID are dead
+        self._alive = np.zeros(0, dtype=bool)
+        self._latest: Dict[str, int] = {}
+        self._ivf_mtime: Optional[int] = None
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._trained_rows = 0
+        self._lists = None
+
+    def _code(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        return self._codes.setdefault(value, len(self._codes) + 1)
+
+    def _refresh(self):
+        """Pick up rows (and IVF centroids) written since the last call, by any process; holds the lock"""
+        generation, count = self._db.execute(
+            "SELECT (SELECT value FROM meta WHERE key = 'generation'), (SELECT COALESCE(MAX(row) + 1, 0) FROM scans)"
+        ).fetchone()
+        if generation != self._generation:
+            self._reset_view()
+            self._generation = generation
+        if count > self._rows:
+            new = self._db.execute(
+                'SELECT row, scan_id, content_hash, patient_id, hospital_id, added FROM scans '
+                'WHERE row >= ? AND row < ? ORDER BY row', (self._rows, count)
+            ).fetchall()
+            # Arrays are replaced, never changed in place: searches outside the lock keep a consistent view
+            alive = np.concatenate([self._alive, np.ones(len(new), dtype=bool)])
+            patients, hospitals = [], []
+            for row, scan_id, content_hash, patient_id, hospital_id, added in new:
+                previous = self._latest.get(scan_id)
+                if previous is not None:
+                    alive[previous] = False
+                self._latest[scan_id] = row
+                self._scan_ids.append(scan_id)
+                self._content_hashes.append(content_hash)
+                self._patient_ids.append(patient_id)
+                self._hospital_ids.append(hospital_id)
+                self._added.append(added)
+                patients.append(self._code(patient_id))
+                hospitals.append(self._code(hospital_id))
+            self._alive = alive
+            self._patients = np.concatenate([self._patients, np.array(patients, dtype=np.int32)])
+            self._hospitals = np.concatenate([self._hospitals, np.array(hospitals, dtype=np.int32)])
+            self._vectors = np.memmap(self._vectors_path, dtype=self.dtype, mode='r', shape=(count, self.dimension))
+            self._rows = count
+        self._refresh_ivf()
+        self._refreshed = time.monotonic()
+
+    def refresh(self):
+        """Pick up rows and IVF centroids written by any process now (blocking)"""
+        with self._lock:
+            self._refresh()
+
+    def _refresh_soon(self):
+        """Refresh a stale view on a background thread, at most one at a time"""
+        if self._refreshed is not None and time.monotonic() - self._refreshed < STATS_REFRESH_S:
+            return
+        if not self._refreshing.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Similarity index refresh failed: {str(e)}")
+            finally:
+                self._refreshing.release()
+
+        threading.Thread(target=run, name='similarity-refresh', daemon=True).start()
+
+    def _refresh_ivf(self):
+        try:
+            mtime = os.stat(self._ivf_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._ivf_mtime:
+            self._ivf_mtime = mtime
+            self._centroids, self._assignments, self._trained_rows = None, np.zeros(0, dtype=np.int32), 0
+            self._lists = None
+            if mtime is not None:
+                try:
+                    with np.load(self._ivf_path) as data:
+                        if str(data['generation']) == self._generation:
+                            self._centroids = data['centroids']
+                            self._assignments = data['assignments'][:self._rows]
+                            self._trained_rows = int(data['rows'])
+                except Exception as e:
+                    logger.warning(f"Ignoring unreadable IVF file {self._ivf_path}: {str(e)}")
+        if self._centroids is not None and len(self._assignments) < self._rows:
+            # Rows added since training join the cluster of their nearest centroid
+            tail = _nearest(self._vectors[len(self._assignments):self._rows], self._centroids)
+            self._assignments = np.concatenate([self._assignments, tail])
+            self._lists = None
+
+    def _inverted_lists(self):
+        """(rows ordered by cluster, offset of each cluster in that order); holds the lock"""
+        if self._lists is None:
+            order = np.argsort(self._assignments, kind='stable').astype(np.int64)
+            offsets = np.searchsorted(self._assignments[order], np.arange(len(self._centroids) + 1))
+            self._lists = (order, offsets)
+        return self._lists
+
+    def _prepare(self, vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if vector.shape[0] != self.dimension:
+            raise ValueError(f"Expected a {self.dimension}-d feature vector, got {vector.shape[0]}")
+        return _normalize(vector)
+
+    def use_version(self, version: str):
+        """
+        Tie the index to a feature version; vectors of another version are not
+        comparable, so the index starts empty when the version changes
+        """
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                stored = self._meta('feature_version')
+                if stored != version:
+                    if stored is not None:
+                        logger.warning(f"Similarity index was built with features {stored}; starting a new one for {version}")
+                        self._db.execute('DELETE FROM scans')
+                        self._db.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'generation'")
+                        if os.path.exists(self._ivf_path):
+                            os.remove(self._ivf_path)
+                    self._db.execute("INSERT OR REPLACE INTO meta VALUES ('feature_version', ?)", (version,))
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+
+    @timed('similarity_index')
+    def add(self, scan_id: str, vector, content_hash: Optional[str] = None, patient_id: Optional[str] = None,
+            hospital_id: Optional[str] = None) -> Dict:
+        """Add (or replace) the feature vector of a scan"""
+        data = self._prepare(vector).astype(self.dtype).tobytes()
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                latest = self._db.execute(
+                    'SELECT row, content_hash, patient_id, hospital_id FROM scans WHERE scan_id = ? '
+                    'ORDER BY row DESC LIMIT 1', (scan_id,)
+                ).fetchone()
+                if latest is not None and content_hash is not None and \
+                        latest[1:] == (content_hash, patient_id, hospital_id):
+                    self._db.execute('COMMIT')
+                    return {'scan_id': scan_id, 'added': False}
+                row = self._db.execute('SELECT COALESCE(MAX(row) + 1, 0) FROM scans').fetchone()[0]
+                # The vector is on disk before its row is committed, so readers never map a missing row
+                fd = os.open(self._vectors_path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    os.pwrite(fd, data, row * len(data))
+                finally:
+                    os.close(fd)
+                self._db.execute(
+                    'INSERT INTO scans (row, scan_id, content_hash, patient_id, hospital_id, added) '
+                    'VALUES (?, ?, ?, ?, ?, ?)', (row, scan_id, content_hash, patient_id, hospital_id, time.time())
+                )
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+        self._maybe_train()
+        return {'scan_id': scan_id, 'added': True}
+
+    def entry(self, scan_id: str) -> Optional[Dict]:
+        """Metadata of an indexed scan"""
+        with self._lock:
+            self._refresh()
+            row = self._latest.get(scan_id)
+            return None if row is None else self._describe(row)
+
+    def vector(self, scan_id: str) -> Optional[np.ndarray]:
+        """Stored (normalised) feature vector of an indexed scan"""
+        with self._lock:
+            self._refresh()
+            row = self._latest.get(scan_id)
+            return None if row is None else np.asarray(self._vectors[row], dtype=np.float32)
+
+    def _describe(self, row: int) -> Dict:
+        return {
+            'scan_id': self._scan_ids[row],
+            'content_hash': self._content_hashes[row],
+            'patient_id': self._patient_ids[row],
+            'hospital_id': self._hospital_ids[row],
+            'added_at': datetime.fromtimestamp(self._added[row], tz=timezone.utc).isoformat()
+        }
+
+    @timed('similarity_search')
+    def search(self, vector, k: int = 10, patient_id: Optional[str] = None, hospital_id: Optional[str] = None,
+               mode: str = 'auto', exclude: Optional[str] = None, content_hash: Optional[str] = None) -> Dict:
+        """
+        The k most similar scans, best first, optionally of one patient and/or hospital
+        `mode` is exact, approximate (IVF once trained) or auto (IVF for large candidate sets);
+        results with the same content hash or a similarity above the duplicate threshold are flagged
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode} (expected one of {', '.join(SEARCH_MODES)})")
+        query = self._prepare(vector)
+        for attempt in range(SEARCH_ATTEMPTS):
+            with self._lock:
+                self._refresh()
+                vectors, mask = self._vectors, self._alive
+                if patient_id is not None:
+                    mask = mask & (self._patients == self._codes.get(patient_id, -1))
+                if hospital_id is not None:
+                    mask = mask & (self._hospitals == self._codes.get(hospital_id, -1))
+                if exclude is not None and exclude in self._latest:
+                    mask = mask.copy()
+                    mask[self._latest[exclude]] = False
+                filtered = patient_id is not None or hospital_id is not None
+                candidates = int(mask.sum())
+                use_ivf = self._centroids is not None and mode != 'exact' and (
+                    mode == 'approximate' or candidates > self.approximate_min_rows
+                )
+                if use_ivf:
+                    order, offsets = self._inverted_lists()
+                    centroids = self._centroids
+                generation = self._generation
+
+            scanned, used = candidates, 'exact'
+            if candidates == 0:
+                best = []
+            elif use_ivf:
+                probe = np.argsort(-(centroids @ query))[:self.nprobe]
+                rows = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probe])
+                rows = np.sort(rows[mask[rows]])
+                best = self._rank(vectors, query, rows, k)
+                scanned, used = len(rows), 'approximate'
+                if len(best) < min(k, candidates):
+                    # Too few matches in the probed clusters (narrow filters): rank every candidate instead
+                    best = self._rank(vectors, query, np.flatnonzero(mask), k)
+                    scanned, used = candidates, 'exact'
+            elif filtered or candidates < len(mask) // 2:
+                best = self._rank(vectors, query, np.flatnonzero(mask), k)
+            else:
+                best = self._rank(vectors, query, None, k, mask)
+                scanned = len(mask)
+
+            with self._lock:
+                # Rows index this process's view: a rebuild (new generation) renumbers them and a
+                # replacement retires them, so candidates taken before either are scored again
+                current = self._generation == generation
+                if not current or not all(self._alive[row] for _, row in best):
+                    if attempt + 1 < SEARCH_ATTEMPTS:
+                        continue
+                    best = [(score, row) for score, row in best if current and self._alive[row]]
+                results = []
+                for score, row in best:
+                    entry = self._describe(row)
+                    entry['similarity'] = round(score, 4)
+                    entry['duplicate'] = bool(score >= self.duplicate_similarity or (
+                        content_hash is not None and entry['content_hash'] == content_hash
+                    ))
+                    results.append(entry)
+            break
+        return {'mode': used, 'scanned': scanned, 'results': results}
+
+    @staticmethod
+    def _rank(vectors: np.ndarray, query: np.ndarray, rows: Optional[np.ndarray], k: int,
+              mask: Optional[np.ndarray] = None) -> List:
+        """Top k (similarity, row) pairs among `rows` (all rows allowed by `mask` when None)"""
+        scores, found = [], []
+        total = len(vectors) if rows is None else len(rows)
+        for start in range(0, total, SEARCH_CHUNK_ROWS):
+            if rows is None:
+                block_rows = np.arange(start, min(start + SEARCH_CHUNK_ROWS, total))
+                block = np.asarray(vectors[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32)
+            else:
+                block_rows = rows[start:start + SEARCH_CHUNK_ROWS]
+                block = np.asarray(vectors[block_rows], dtype=np.float32)
+            block_scores = block @ query
+            if mask is not None:
+                allowed = mask[start:start + len(block_rows)]
+                block_scores, block_rows = block_scores[allowed], block_rows[allowed]
+            block_scores, block_rows = _top_k(block_scores, block_rows, k)
+            scores.append(block_scores)
+            found.append(block_rows)
+        if not scores:
+            return []
+        scores, found = np.concatenate(scores), np.concatenate(found)
+        best = np.argsort(-scores, kind='stable')[:k]
+        return [(float(scores[i]), int(found[i])) for i in best]
+
+    def _maybe_train(self):
+        """Start (re)training the IVF quantizer in the background once the index is large enough"""
+        if not self.approximate_min_rows:
+            return
+        with self._lock:
+            self._refresh()
+            live = len(self._latest)
+            due = live >= self.approximate_min_rows and (
+                self._centroids is None or live >= 2 * self._trained_rows
+            )
+            if not due or self._training:
+                return
+            self._training = True
+
+        def run():
+            try:
+                self.train()
+            except Exception as e:
+                logger.error(f"Similarity index training failed: {str(e)}")
+            finally:
+                self._training = False
+
+        threading.Thread(target=run, name='similarity-ivf', daemon=True).start()
+
+    def _claim_training(self) -> bool:
+        """One trainer at a time across processes (a lease in the meta table)"""
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                since = self._meta('training_since')
+                if since is not None and time.time() - float(since) < TRAINING_LEASE_S:
+                    self._db.execute('ROLLBACK')
+                    return False
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('training_since', ?)", (str(time.time()),))
+                self._db.execute('COMMIT')
+                return True
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def train(self, nlist: Optional[int] = None) -> bool:
+        """
+        Cluster the stored vectors (spherical k-means on a sample) and assign every row
+        Returns False when another process is training or there are too few scans
+        """
+        if not self._claim_training():
+            return False
+        try:
+            with self._lock:
+                self._refresh()
+                vectors, rows, generation = self._vectors, np.flatnonzero(self._alive), self._generation
+            nlist = nlist or int(np.clip(round(np.sqrt(len(rows))), 16, 4096))
+            if len(rows) < nlist * 4:
+                return False
+            start = time.perf_counter()
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(rows, min(len(rows), nlist * KMEANS_SAMPLE_PER_LIST), replace=False))
+            data = np.asarray(vectors[sample], dtype=np.float32)
+            centroids = data[rng.choice(len(data), nlist, replace=False)]
+            for _ in range(KMEANS_ITERATIONS):
+                labels = _nearest(data, centroids)
+                order = np.argsort(labels, kind='stable')
+                used, starts = np.unique(labels[order], return_index=True)
+                # Empty clusters keep their previous centroid
+                centroids = centroids.copy()
+                centroids[used] = _normalize(np.add.reduceat(data[order], starts, axis=0))
+            assignments = _nearest(vectors, centroids)
+
+            temp_path = f"{self._ivf_path}.{os.getpid()}.tmp.npz"
+            np.savez(temp_path, centroids=centroids.astype(np.float32), assignments=assignments,
+                     rows=len(vectors), generation=np.array(generation))
+            os.replace(temp_path, self._ivf_path)
+            self.refresh()
+            logger.info(f"Similarity index: {nlist} IVF lists over {len(vectors)} rows "
+                        f"trained in {time.perf_counter() - start:.1f}s")
+            return True
+        finally:
+            with self._lock:
+                self._db.execute("DELETE FROM meta WHERE key = 'training_since'")
+
+    def __len__(self) -> int:
+        """Live scans in this process's view; never waits for the lock (see STATS_REFRESH_S)"""
+        self._refresh_soon()
+        return len(self._latest)
+
+    def stats(self) -> Dict:
+        """Sizes of this process's view; never waits for the lock (see STATS_REFRESH_S)"""
+        self._refresh_soon()
+        rows, centroids, refreshed = self._rows, self._centroids, self._refreshed
+        return {
+            'scans': len(self._latest),
+            'rows': rows,
+            'dimension': self.dimension,
+            'dtype': self.dtype.name,
+            'vector_bytes': rows * self.dimension * self.dtype.itemsize,
+            'ivf_lists': len(centroids) if centroids is not None else 0,
+            'ivf_trained_rows': self._trained_rows,
+            'training': self._training,
+            'view_age_s': round(time.monotonic() - refreshed, 1) if refreshed is not None else None
+        }
@@ -0,0 +1,27 @@
+"""
+Helpers shared by the SQLite-backed stores (task store, caches, longitudinal
+state, similarity index)
+"""
+
+import os
+import threading
+import weakref
+from typing import Any, Callable
+
+
+def reconnect_after_fork(obj: Any, connect: Callable[[Any], None]):
+    """
+    Give `obj` a new `_lock` and call `connect(obj)` in the child after every fork()
+    A SQLite connection (and a lock another thread may hold at fork time) must
+    not be used across fork(), so forked server workers open their own. Only a
+    weak reference to `obj` is kept; pass an unbound function as `connect`
+    """
+    ref = weakref.ref(obj)
+
+    def after_in_child():
+        target = ref()
+        if target is not None:
+            target._lock = threading.Lock()
+            connect(target)
+
+    os.register_at_fork(after_in_child=after_in_child)
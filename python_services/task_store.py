@@ -0,0 +1,275 @@
+"""
+Durable store of background processing tasks
+The job engine keeps every task's status, timestamps, payload, result and
+error here instead of in process memory, so task status survives restarts and
+every server worker answers /processing-status for every task. The queue is
+the table itself: job worker threads of all processes claim the oldest queued
+task with one atomic UPDATE, so a task runs exactly once. Finished tasks
+expire after a TTL. TaskStore is the interface; SQLiteTaskStore (WAL mode,
+one database file shared by the workers of a host) is the implementation
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+from sqlite_utils import reconnect_after_fork
+
+logger = logging.getLogger(__name__)
+
+# Task statuses (same vocabulary as the IslemeStatus enum in the web app)
+STATUS_QUEUED = 'BEKLEMEDE'
+STATUS_RUNNING = 'ISLENIYOR'
+STATUS_DONE = 'TAMAMLANDI'
+STATUS_FAILED = 'HATA'
+
+FINISHED_STATUSES = (STATUS_DONE, STATUS_FAILED)
+
+_COLUMNS = ('task_id, status, payload, result, error, worker, attempts, '
+            'created, started, completed, processing_seconds, progress, version')
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has reached its depth limit"""
+
+
+def _json_default(value):
+    """numpy scalars and arrays in task results"""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def iso_time(timestamp: Optional[float]) -> Optional[str]:
+    """Epoch seconds as an ISO 8601 UTC string"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat() if timestamp is not None else None
+
+
+class TaskStore(ABC):
+    """
+    Interface of a task store shared by all job workers
+    Every transition (create, claim, complete, requeue) must be atomic with
+    respect to the other workers using the same store
+    """
+
+    @abstractmethod
+    def create(self, task_id: str, payload: Dict, max_queued: int):
+        """Add a queued task; raises QueueFullError when `max_queued` tasks are already waiting"""
+
+    @abstractmethod
+    def claim(self, worker: str) -> Optional[Dict]:
+        """Move the oldest queued task to running for `worker` and return its record (None when idle)"""
+
+    @abstractmethod
+    def complete(self, task_id: str, worker: str, status: str, result: Optional[Dict] = None,
+                 error: Optional[str] = None, processing_seconds: Optional[float] = None) -> bool:
+        """Finish a task `worker` is running; False if it no longer holds it (e.g. requeued meanwhile)"""
+
+    @abstractmethod
+    def update_progress(self, task_id: str, worker: str, progress: Dict) -> bool:
+        """Replace the progress snapshot of a task `worker` is running"""
+
+    @abstractmethod
+    def get(self, task_id: str) -> Optional[Dict]:
+        """The task's record, or None if it does not exist (or has expired)"""
+
+    @abstractmethod
+    def versions(self, task_ids: Iterable[str]) -> Dict[str, int]:
+        """
+        Change counter of each existing task; it grows with every claim,
+        progress update, completion and requeue, so watchers can poll cheaply
+        """
+
+    @abstractmethod
+    def counts(self) -> Dict[str, int]:
+        """Number of tasks per status"""
+
+    @abstractmethod
+    def heartbeat(self, workers: Iterable[str]):
+        """Renew the lease of the running tasks held by `workers`"""
+
+    @abstractmethod
+    def running_workers(self) -> Dict[str, float]:
+        """Workers that currently hold a running task, with the oldest lease renewal (epoch seconds) among their tasks"""
+
+    @abstractmethod
+    def requeue(self, workers: Iterable[str], max_attempts: int) -> int:
+        """
+        Put the running tasks of dead `workers` back in the queue, or fail them
+        once they have been attempted `max_attempts` times; returns the number of tasks touched
+        """
+
+    @abstractmethod
+    def cleanup(self, ttl_seconds: float) -> int:
+        """Delete tasks that finished more than `ttl_seconds` ago; returns the number deleted"""
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    Tasks in SQLite (`store_dir`/tasks.sqlite in WAL mode, or in memory when no
+    directory is given; an in-memory store is private to its process)
+    """
+
+    def __init__(self, store_dir: Optional[str] = None):
+        self.store_dir = store_dir
+        self._lock = threading.Lock()
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+        self._connect()
+        with self._lock:
+            self._db.executescript(
+                'CREATE TABLE IF NOT EXISTS tasks ('
+                'seq INTEGER PRIMARY KEY AUTOINCREMENT, task_id TEXT NOT NULL UNIQUE, status TEXT NOT NULL, '
+                'payload TEXT NOT NULL, result TEXT, error TEXT, worker TEXT, attempts INTEGER NOT NULL DEFAULT 0, '
+                'created REAL NOT NULL, started REAL, completed REAL, processing_seconds REAL, '
+                'progress TEXT, version INTEGER NOT NULL DEFAULT 0, heartbeat REAL);'
+                'CREATE INDEX IF NOT EXISTS tasks_by_status ON tasks (status, seq);'
+                'CREATE INDEX IF NOT EXISTS tasks_by_completion ON tasks (completed);'
+            )
+        if store_dir:
+            reconnect_after_fork(self, type(self)._connect)
+
+    def _connect(self):
+        path = os.path.join(self.store_dir, 'tasks.sqlite') if self.store_dir else ':memory:'
+        # Autocommit: every statement below is its own atomic transaction
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        if self.store_dir:
+            # Readers (status polls) never block the writer; NORMAL sync is durable enough in WAL mode
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+
+    def create(self, task_id: str, payload: Dict, max_queued: int):
+        with self._lock:
+            # The depth check and the insert are one statement, so concurrent submitters cannot overshoot
+            cursor = self._db.execute(
+                'INSERT INTO tasks (task_id, status, payload, created) '
+                'SELECT ?, ?, ?, ? WHERE (SELECT COUNT(*) FROM tasks WHERE status = ?) < ?',
+                (task_id, STATUS_QUEUED, json.dumps(payload), time.time(), STATUS_QUEUED, max_queued)
+            )
+        if cursor.rowcount == 0:
+            raise QueueFullError(f"Job queue is full ({max_queued} tasks waiting)")
+
+    def claim(self, worker: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                'UPDATE tasks SET status = ?, worker = ?, started = ?, heartbeat = ?, attempts = attempts + 1, '
+                'version = version + 1 WHERE seq = (SELECT seq FROM tasks WHERE status = ? ORDER BY seq LIMIT 1) '
+                f'RETURNING {_COLUMNS}',
+                (STATUS_RUNNING, worker, now, now, STATUS_QUEUED)
+            ).fetchone()
+        return self._record(row) if row is not None else None
+
+    def complete(self, task_id: str, worker: str, status: str, result: Optional[Dict] = None,
+                 error: Optional[str] = None, processing_seconds: Optional[float] = None) -> bool:
+        encoded = json.dumps(result, default=_json_default) if result is not None else None
+        with self._lock:
+            cursor = self._db.execute(
+                'UPDATE tasks SET status = ?, result = ?, error = ?, completed = ?, processing_seconds = ?, '
+                'version = version + 1 WHERE task_id = ? AND status = ? AND worker = ?',
+                (status, encoded, error, time.time(), processing_seconds, task_id, STATUS_RUNNING, worker)
+            )
+        return cursor.rowcount == 1
+
+    def update_progress(self, task_id: str, worker: str, progress: Dict) -> bool:
+        with self._lock:
+            cursor = self._db.execute(
+                'UPDATE tasks SET progress = ?, version = version + 1 WHERE task_id = ? AND status = ? AND worker = ?',
+                (json.dumps(progress), task_id, STATUS_RUNNING, worker)
+            )
+        return cursor.rowcount == 1
+
+    def get(self, task_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(f'SELECT {_COLUMNS} FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+        return self._record(row) if row is not None else None
+
+    def versions(self, task_ids: Iterable[str]) -> Dict[str, int]:
+        task_ids = list(task_ids)
+        versions = {}
+        # Stay below SQLite's bound-parameter limit
+        for start in range(0, len(task_ids), 500):
+            chunk = task_ids[start:start + 500]
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT task_id, version FROM tasks WHERE task_id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+            versions.update(rows)
+        return versions
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute('SELECT status, COUNT(*) FROM tasks GROUP BY status').fetchall()
+        counts = {status: 0 for status in (STATUS_QUEUED, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED)}
+        counts.update(rows)
+        return counts
+
+    def heartbeat(self, workers: Iterable[str]):
+        workers = list(workers)
+        if not workers:
+            return
+        with self._lock:
+            self._db.execute(
+                f"UPDATE tasks SET heartbeat = ? WHERE status = ? AND worker IN ({','.join('?' * len(workers))})",
+                (time.time(), STATUS_RUNNING, *workers)
+            )
+
+    def running_workers(self) -> Dict[str, float]:
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT worker, MIN(heartbeat) FROM tasks WHERE status = ? GROUP BY worker', (STATUS_RUNNING,)
+            )
+            return dict(rows.fetchall())
+
+    def requeue(self, workers: Iterable[str], max_attempts: int) -> int:
+        touched = 0
+        for worker in workers:
+            with self._lock:
+                failed = self._db.execute(
+                    'UPDATE tasks SET status = ?, error = ?, completed = ?, version = version + 1 '
+                    'WHERE status = ? AND worker = ? AND attempts >= ?',
+                    (STATUS_FAILED, 'Worker process exited before the task finished', time.time(),
+                     STATUS_RUNNING, worker, max_attempts)
+                ).rowcount
+                requeued = self._db.execute(
+                    'UPDATE tasks SET status = ?, worker = NULL, started = NULL, heartbeat = NULL, progress = NULL, '
+                    'version = version + 1 WHERE status = ? AND worker = ?',
+                    (STATUS_QUEUED, STATUS_RUNNING, worker)
+                ).rowcount
+            if failed or requeued:
+                logger.warning(f"Worker {worker} exited with tasks running: {requeued} requeued, {failed} failed")
+            touched += failed + requeued
+        return touched
+
+    def cleanup(self, ttl_seconds: float) -> int:
+        with self._lock:
+            return self._db.execute(
+                'DELETE FROM tasks WHERE completed IS NOT NULL AND completed < ? AND status IN (?, ?)',
+                (time.time() - ttl_seconds, *FINISHED_STATUSES)
+            ).rowcount
+
+    @staticmethod
+    def _record(row) -> Dict:
+        (task_id, status, payload, result, error, worker, attempts,
+         created, started, completed, processing_seconds, progress, version) = row
+        record = {
+            'task_id': task_id, 'status': status, **json.loads(payload),
+            'created_at': iso_time(created), 'version': version
+        }
+        if started is not None:
+            record.update(started_at=iso_time(started), worker=worker, attempts=attempts)
+        if progress is not None:
+            record['progress'] = json.loads(progress)
+        if completed is not None:
+            record.update(completed_at=iso_time(completed), processing_seconds=processing_seconds)
+        if result is not None:
+            record['result'] = json.loads(result)
+        if error is not None:
+            record['error'] = error
+        return record
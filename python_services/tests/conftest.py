@@ -0,0 +1,29 @@
+"""
+Shared pytest fixtures for the brain MRI processing service
+"""
+
+import os
+import sys
+from unittest import mock
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+# Synthetic phantom writers are shared with the benchmark suite
+sys.path.insert(0, os.path.join(SERVICE_DIR, "benchmarks"))
+
+import brain_mri_processor  # noqa: E402
+from torchvision.models import resnet50  # noqa: E402
+
+
+def _untrained_resnet50(weights=None):
+    """ResNet50 with random weights so tests never hit the network"""
+    return resnet50(weights=None)
+
+
+@pytest.fixture(scope="session")
+def processor():
+    """A BrainMRIProcessor with an untrained ResNet50 backbone"""
+    with mock.patch.object(brain_mri_processor, "resnet50", _untrained_resnet50):
+        yield brain_mri_processor.BrainMRIProcessor(max_batch_size=8)
@@ -0,0 +1,37 @@
+"""
+Tests for the thread/batch autotuner's grid and profile handling
+"""
+
+import os
+
+import autotune
+
+
+def test_thread_grid_covers_the_worker_share(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 32)
+    assert autotune.thread_grid(1) == [1, 2, 4, 8, 16, 32]
+    assert autotune.thread_grid(4) == [1, 2, 4, 8]
+    assert autotune.thread_grid(3) == [1, 2, 4, 8, 10]
+    assert autotune.thread_grid(64) == [1]
+
+
+def test_near_ties_prefer_fewer_threads_and_smaller_batches():
+    grid = [
+        {"intra_op_threads": 8, "interop_threads": 1, "batch_size": 32, "slices_per_s": 100.0},
+        {"intra_op_threads": 4, "interop_threads": 1, "batch_size": 16, "slices_per_s": 98.5},
+        {"intra_op_threads": 4, "interop_threads": 1, "batch_size": 1, "slices_per_s": 60.0},
+    ]
+    assert autotune.select_best(grid)["intra_op_threads"] == 4
+    assert autotune.select_best(grid)["batch_size"] == 16
+
+
+def test_profile_is_only_reused_on_the_same_host_configuration(tmp_path):
+    path = str(tmp_path / "autotune.json")
+    fingerprint = autotune.host_fingerprint(workers=2, backend="eager")
+    profile = {"intra_op_threads": 2, "interop_threads": 1, "batch_size": 16}
+    autotune.save_profile(path, {"fingerprint": fingerprint, "profile": profile})
+
+    assert autotune.resolve_profile(autotune.AUTOTUNE_REUSE, path, 2, "eager") == profile
+    assert autotune.resolve_profile(autotune.AUTOTUNE_REUSE, path, 4, "eager") is None
+    assert autotune.resolve_profile(autotune.AUTOTUNE_REUSE, path, 2, "onnx") is None
+    assert autotune.resolve_profile(autotune.AUTOTUNE_OFF, path, 2, "eager") is None
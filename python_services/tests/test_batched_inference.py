@@ -0,0 +1,39 @@
+"""
+Tests for batched ResNet feature extraction
+"""
+
+import numpy as np
+import torch
+
+
+def _per_slice_features(processor, slices):
+    """Reference implementation: one forward pass per slice"""
+    features_list = []
+    with torch.no_grad():
+        for slice_img in slices:
+            tensor_image = processor.preprocess_slices(slice_img[np.newaxis])
+            features_list.append(processor.feature_extractor(tensor_image))
+    return torch.mean(torch.stack(features_list), dim=0)
+
+
+def test_batched_features_match_per_slice_loop(processor):
+    rng = np.random.default_rng(0)
+    volume = rng.integers(0, 255, (64, 64, 40), dtype=np.uint8)
+    slices = processor.extract_brain_slices(volume, num_slices=10)
+
+    batched = processor.extract_features(slices)
+    reference = _per_slice_features(processor, slices)
+
+    assert batched.shape == (1, 2048)
+    torch.testing.assert_close(batched, reference, rtol=1e-4, atol=1e-4)
+
+
+def test_feature_batch_keeps_volumes_separate(processor):
+    rng = np.random.default_rng(1)
+    slices1 = processor.extract_brain_slices(rng.integers(0, 255, (64, 64, 40), dtype=np.uint8), num_slices=7)
+    slices2 = processor.extract_brain_slices(rng.integers(0, 255, (48, 48, 30), dtype=np.uint8), num_slices=5)
+
+    features1, features2 = processor.extract_features_batch([slices1, slices2])
+
+    torch.testing.assert_close(features1, processor.extract_features(slices1), rtol=1e-4, atol=1e-4)
+    torch.testing.assert_close(features2, processor.extract_features(slices2), rtol=1e-4, atol=1e-4)
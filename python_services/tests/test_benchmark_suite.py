@@ -0,0 +1,40 @@
+"""
+Tests for the stage benchmark suite's baseline comparison
+"""
+
+import copy
+
+from run_benchmarks import compare
+
+
+def _results(**stages):
+    return {
+        "host": {"cpu_count": 4},
+        "cases": {"nifti/small": {
+            name: {"best_s": best, "peak_rss_mib": rss} for name, (best, rss) in stages.items()
+        }},
+    }
+
+
+def test_compare_flags_only_real_regressions():
+    baseline = _results(load=(0.001, 0.0), features=(2.0, 300.0), heatmap=(0.010, 10.0), hash=(0.5, 1.0))
+    current = copy.deepcopy(baseline)
+    stages = current["cases"]["nifti/small"]
+    stages["load"]["best_s"] = 0.003          # 3x slower, but below the absolute noise floor
+    stages["features"]["best_s"] = 2.8        # 40% slower
+    stages["features"]["peak_rss_mib"] = 330  # within the memory tolerance
+    stages["heatmap"]["peak_rss_mib"] = 80    # 70 MiB more
+    stages["hash"]["best_s"] = 0.3            # faster is never a regression
+
+    result = compare(current, baseline, tolerance=0.25, min_seconds=0.005, memory_tolerance=0.25, min_mib=32)
+    assert result["same_host"]
+    assert len(result["stages"]) == 4
+    assert {(row["stage"], tuple(row["regressed"])) for row in result["regressions"]} == {
+        ("features", ("time",)), ("heatmap", ("memory",))
+    }
+
+    # Cases or stages missing from the baseline are not compared
+    current["cases"]["dicom/small"] = current["cases"]["nifti/small"]
+    current["host"] = {"cpu_count": 8}
+    result = compare(current, baseline, 0.25, 0.005, 0.25, 32)
+    assert not result["same_host"] and len(result["stages"]) == 4
@@ -0,0 +1,66 @@
+"""
+Tests for the DICOM series loader
+"""
+
+import os
+import zipfile
+
+import numpy as np
+import pytest
+
+from dicom_series import list_series, load_dicom_series, read_dicom_series
+from phantoms import make_phantom, write_dicom_series
+
+
+@pytest.fixture
+def phantom():
+    return np.round(make_phantom((24, 20, 12), seed=3))
+
+
+def test_series_is_sorted_and_rescaled(tmp_path, phantom):
+    write_dicom_series(str(tmp_path), phantom, slope=2.0, intercept=-10.0)
+
+    volume = load_dicom_series(str(tmp_path), max_workers=3)
+
+    assert volume.shape == phantom.shape
+    assert volume.dtype == np.float32
+    # Stored values are rounded to whole units of the slope
+    np.testing.assert_allclose(volume, phantom, atol=1.0)
+
+
+def test_largest_series_is_chosen(tmp_path, phantom):
+    write_dicom_series(str(tmp_path / "t1"), phantom, series_uid="1.2.3.1")
+    write_dicom_series(str(tmp_path / "scout"), phantom[:, :, :3], series_uid="1.2.3.2")
+    (tmp_path / "README.txt").write_text("not a DICOM file")
+
+    assert list_series(str(tmp_path)) == {"1.2.3.1": 12, "1.2.3.2": 3}
+    assert load_dicom_series(str(tmp_path)).shape == phantom.shape
+    assert load_dicom_series(str(tmp_path), series_uid="1.2.3.2").shape == (24, 20, 3)
+
+
+def test_zip_archives_are_supported(tmp_path, phantom):
+    paths = write_dicom_series(str(tmp_path / "series"), phantom)
+    archive = tmp_path / "series.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        for path in paths:
+            zf.write(path, arcname=os.path.join("DICOM", os.path.basename(path)))
+
+    np.testing.assert_allclose(load_dicom_series(str(archive)), phantom, atol=0.5)
+
+
+def test_processor_loads_series_directories(processor, tmp_path, phantom):
+    write_dicom_series(str(tmp_path), phantom)
+
+    image = processor.load_dicom_image(str(tmp_path))
+
+    assert image.shape == phantom.shape
+    assert image.dtype == np.uint8
+
+
+def test_series_spacing_comes_from_the_headers(tmp_path, phantom):
+    write_dicom_series(str(tmp_path), phantom, spacing=(0.5, 0.75, 2.0))
+
+    volume, spacing = read_dicom_series(str(tmp_path))
+
+    assert volume.shape == phantom.shape
+    assert spacing == pytest.approx((0.5, 0.75, 2.0))
@@ -0,0 +1,87 @@
+"""
+Tests for the chunked whole-volume difference engine
+"""
+
+from unittest import mock
+
+import numpy as np
+import pytest
+from scipy import ndimage
+
+from difference_engine import DifferenceEngine, RunningStats
+from heatmap_cache import HeatmapCache
+from phantoms import make_phantom, write_nifti
+
+
+def _reference(volume1, volume2, sigma=2.0):
+    """Whole volume at once: float32 difference, smoothing, normalization, mean + std threshold"""
+    smoothed = ndimage.gaussian_filter(np.abs(volume1.astype(np.float32) - volume2.astype(np.float32)),
+                                       sigma, output=np.float32)
+    normalized = (smoothed - smoothed.min()) / (smoothed.max() - smoothed.min())
+    return np.where(normalized > normalized.mean() + normalized.std(), normalized, 0)
+
+
+def test_chunks_match_whole_volume_smoothing():
+    rng = np.random.default_rng(0)
+    volume1 = rng.uniform(0, 255, (40, 36, 29)).astype(np.float32)
+    volume2 = rng.uniform(0, 255, (40, 36, 29)).astype(np.float32)
+
+    stack = DifferenceEngine(chunk_slices=5, workers=3).attention_stack(volume1, volume2)
+
+    np.testing.assert_allclose(stack.attention, _reference(volume1, volume2), atol=1e-5)
+
+
+def test_selected_slices_use_whole_volume_statistics():
+    rng = np.random.default_rng(1)
+    volume1 = rng.integers(0, 255, (32, 32, 24), dtype=np.uint8)
+    volume2 = rng.integers(0, 255, (32, 32, 24), dtype=np.uint8)
+    engine = DifferenceEngine(chunk_slices=7, workers=1)
+
+    full = engine.attention_stack(volume1, volume2)
+    subset = engine.attention_stack(volume1, volume2, [3, 20])
+
+    np.testing.assert_array_equal(subset.attention, full.attention[:, :, [3, 20]])
+    assert subset.threshold == pytest.approx(full.threshold)
+
+
+def test_uint8_difference_does_not_wrap():
+    volume1 = np.full((16, 16, 8), 10, dtype=np.uint8)
+    volume2 = np.full((16, 16, 8), 20, dtype=np.uint8)
+
+    stack = DifferenceEngine(chunk_slices=3).attention_stack(volume1, volume2)
+
+    assert stack.stats.mean == pytest.approx(10.0)
+    assert not stack.attention.any()
+
+
+def test_running_stats_merge_matches_numpy():
+    values = np.random.default_rng(2).normal(5, 3, 1000)
+    merged = RunningStats.of(values[:300]).merge(RunningStats.of(values[300:]))
+
+    assert merged.count == 1000
+    assert merged.mean == pytest.approx(values.mean())
+    assert merged.std == pytest.approx(values.std())
+    assert (merged.minimum, merged.maximum) == (values.min(), values.max())
+
+
+def test_invalid_inputs_are_rejected():
+    engine = DifferenceEngine()
+    with pytest.raises(ValueError):
+        engine.attention_stack(np.zeros((8, 8, 4)), np.zeros((8, 8, 5)))
+    with pytest.raises(ValueError):
+        engine.attention_stack(np.zeros((8, 8, 4)), np.zeros((8, 8, 4)), [4])
+
+
+def test_difference_heatmaps_are_cached(processor, tmp_path):
+    path1 = write_nifti(str(tmp_path / "a.nii"), make_phantom((64, 64, 32), seed=400))
+    path2 = write_nifti(str(tmp_path / "b.nii"), make_phantom((64, 64, 32), seed=401))
+    with mock.patch.object(processor, "heatmap_cache", HeatmapCache()), \
+            mock.patch.object(processor.difference_engine, "attention_stack",
+                              wraps=processor.difference_engine.attention_stack) as engine:
+        first = processor.render_difference_heatmaps(path1, path2, [5, 16])
+        second = processor.render_difference_heatmaps(path1, path2, [16, 20])
+
+    assert [index for index, _ in first] == [5, 16]
+    assert second[0] == first[1]
+    assert engine.call_count == 2
+    assert engine.call_args_list[1].args[2] == [20]
@@ -0,0 +1,75 @@
+"""
+Tests for the content-addressed feature cache
+"""
+
+import numpy as np
+import pytest
+
+from feature_cache import FeatureCache, hash_file, make_cache_key
+
+
+def _vector(seed):
+    return np.random.default_rng(seed).standard_normal((1, 2048)).astype(np.float32)
+
+
+def test_memory_tier_is_lru():
+    cache = FeatureCache(memory_entries=2)
+    cache.put("a", _vector(0))
+    cache.put("b", _vector(1))
+    cache.get("a")
+    cache.put("c", _vector(2))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    stats = cache.stats()
+    assert stats["memory_evictions"] == 1
+    assert stats["memory_hits"] == 1 + 1
+    assert stats["misses"] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    FeatureCache(cache_dir=str(tmp_path)).put("scan", _vector(3))
+
+    reopened = FeatureCache(cache_dir=str(tmp_path))
+    np.testing.assert_array_equal(reopened.get("scan"), _vector(3))
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    entry_bytes = _vector(0).nbytes + 128
+    cache = FeatureCache(cache_dir=str(tmp_path), memory_entries=0, disk_max_bytes=2 * entry_bytes)
+    cache.put("old", _vector(0))
+    cache.put("used", _vector(1))
+    cache.get("old")
+    cache.put("new", _vector(2))
+
+    assert cache.get("used") is None
+    assert cache.get("old") is not None
+    assert cache.stats()["disk_evictions"] == 1
+    assert not (tmp_path / "used.npy").exists()
+
+
+def test_key_depends_on_content_and_versions(tmp_path):
+    scan = tmp_path / "scan.png"
+    scan.write_bytes(b"pixels")
+
+    key = make_cache_key(hash_file(str(scan)), "model-v1", "prep-v1")
+    assert key != make_cache_key(hash_file(str(scan)), "model-v2", "prep-v1")
+    scan.write_bytes(b"other pixels")
+    assert key != make_cache_key(hash_file(str(scan)), "model-v1", "prep-v1")
+
+
+def test_processor_skips_inference_on_cache_hit(processor, tmp_path, monkeypatch):
+    scan = tmp_path / "scan.bin"
+    scan.write_bytes(b"baseline scan")
+    image = np.random.default_rng(4).integers(0, 255, (48, 48, 24), dtype=np.uint8)
+
+    first = processor.get_scan_features(str(scan), image)
+
+    def fail(*args, **kwargs):
+        pytest.fail("feature extraction ran on a cache hit")
+
+    monkeypatch.setattr(processor, "extract_features_batch", fail)
+    second = processor.get_scan_features(str(scan), image)
+
+    np.testing.assert_array_equal(first.numpy(), second.numpy())
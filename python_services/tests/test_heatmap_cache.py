@@ -0,0 +1,102 @@
+"""
+Tests for encoded, cached heatmaps
+"""
+
+import os
+import subprocess
+import sys
+from unittest import mock
+
+import cv2
+import numpy as np
+import pytest
+
+from heatmap_cache import HeatmapCache, encode_heatmap, heatmap_key, media_type
+from phantoms import make_phantom, write_nifti
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_keys_change_with_every_encoder_setting():
+    base = heatmap_key(["hash"], 10, None, "v1", "png", 80, png_compression=3)
+
+    assert heatmap_key(["hash"], 10, None, "v1", "png", 80, png_compression=3) == base
+    assert heatmap_key(["hash"], 10, None, "v1", "png", 80, png_compression=9) != base
+    assert heatmap_key(["hash"], 10, None, "v1", "png", 60, png_compression=3) != base
+    assert heatmap_key(["hash"], 10, None, "v1", "webp", 80, png_compression=3) != base
+
+
+@pytest.mark.parametrize("image_format, mime", [("png", "image/png"), ("webp", "image/webp")])
+def test_encoded_heatmaps_decode_to_the_overlay(image_format, mime):
+    overlay = np.random.default_rng(0).integers(0, 255, (64, 48, 3), dtype=np.uint8)
+    data = encode_heatmap(overlay, image_format, quality=90)
+
+    assert media_type(data) == mime
+    decoded = cv2.cvtColor(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+    assert decoded.shape == overlay.shape
+    if image_format == "png":
+        np.testing.assert_array_equal(decoded, overlay)
+
+
+def test_memory_tier_is_bounded_in_bytes():
+    cache = HeatmapCache(memory_bytes=250)
+    for i in range(3):
+        cache.put(f"key{i}", bytes(100))
+
+    assert cache.get("key0") is None
+    assert cache.get("key2") == bytes(100)
+    assert cache.stats()["memory_bytes"] == 200
+
+
+def test_disk_tier_survives_restart_and_evicts(tmp_path):
+    cache = HeatmapCache(str(tmp_path), memory_bytes=0, disk_max_bytes=250)
+    for i in range(3):
+        cache.put(f"key{i}", bytes([i]) * 100)
+
+    reopened = HeatmapCache(str(tmp_path))
+    assert reopened.get("key0") is None
+    assert reopened.get("key2") == bytes([2]) * 100
+    assert reopened.stats()["disk_entries"] == 2
+
+
+def test_scan_heatmaps_are_rendered_once(processor, tmp_path):
+    path = write_nifti(str(tmp_path / "scan.nii"), make_phantom((96, 96, 40), seed=300))
+    with mock.patch.object(processor, "heatmap_cache", HeatmapCache()), \
+            mock.patch.object(processor, "compute_attention_map", wraps=processor.compute_attention_map) as attention:
+        key, data = processor.render_scan_heatmap(path)
+        assert processor.render_scan_heatmap(path, slice_index=20) == (key, data)
+        regions_key, _ = processor.render_scan_heatmap(path, regions=["hippocampus_left"])
+
+    assert attention.call_count == 2
+    assert regions_key != key
+    with pytest.raises(ValueError):
+        processor.render_scan_heatmap(path, slice_index=40)
+    with pytest.raises(ValueError):
+        processor.render_scan_heatmap(path, regions=["cerebellum"])
+
+
+def test_attention_map_is_deterministic(processor):
+    image_slice = make_phantom((96, 96, 1), seed=301)[:, :, 0]
+    first = processor.compute_attention_map(image_slice)
+
+    assert first.shape == image_slice.shape
+    np.testing.assert_array_equal(first, processor.compute_attention_map(image_slice))
+
+
+def test_heatmap_endpoint_honours_etags():
+    env = dict(os.environ, MRSINA_MODEL_LOADING="lazy", MRSINA_FEATURE_CACHE_DIR="",
+               MRSINA_HEATMAP_CACHE_DIR="", MRSINA_LONGITUDINAL_STATE_DIR="")
+    code = (
+        "import warnings; warnings.simplefilter('ignore')\n"
+        "from fastapi.testclient import TestClient\n"
+        "import main\n"
+        "main.heatmap_cache.put('abc', b'\\x89PNG-bytes')\n"
+        "client = TestClient(main.app)\n"
+        "first = client.get('/heatmaps/abc')\n"
+        "again = client.get('/heatmaps/abc', headers={'If-None-Match': first.headers['etag']})\n"
+        "print(first.status_code, first.headers['content-type'], again.status_code,"
+        " client.get('/heatmaps/missing').status_code)\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], cwd=SERVICE_DIR, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    assert output.split() == ["200", "image/png", "304", "404"]
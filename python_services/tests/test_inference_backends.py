@@ -0,0 +1,70 @@
+"""
+Tests for the selectable inference backends against the eager fp32 reference
+"""
+
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+from inference_backends import create_backend
+from phantoms import make_phantom
+
+
+@pytest.fixture(scope="module")
+def slice_batch(processor):
+    volume = make_phantom((96, 96, 24), seed=3, max_value=255.0).astype(np.uint8)
+    return processor.preprocess_slices(processor.extract_brain_slices(volume, num_slices=6))
+
+
+def _cosine(a: torch.Tensor, b: torch.Tensor) -> float:
+    return float(F.cosine_similarity(a.float(), b.float(), dim=1).min())
+
+
+def _check_backend(processor, backend, slice_batch, min_cosine):
+    reference = processor.backend.extract(slice_batch)
+    features = backend.extract(slice_batch)
+    assert features.shape == reference.shape
+    assert _cosine(features, reference) > min_cosine
+
+    combined = torch.cat([reference[:-1], reference[1:]], dim=1)
+    analysis = backend.analyze(combined)
+    assert analysis.shape == (len(combined), len(processor.brain_regions) * 2)
+    assert _cosine(analysis, processor.backend.analyze(combined)) > min_cosine
+
+
+def test_eager_analyzer_is_deterministic(processor, slice_batch):
+    features = processor.backend.extract(slice_batch)
+    combined = torch.cat([features[:-1], features[1:]], dim=1)
+    assert not processor.brain_analyzer.training
+    torch.testing.assert_close(processor.backend.analyze(combined), processor.backend.analyze(combined))
+
+
+def test_unknown_backend_and_missing_calibration_are_rejected(processor):
+    with pytest.raises(ValueError):
+        create_backend('tensorrt', processor.feature_extractor, processor.brain_analyzer, processor.device)
+    with pytest.raises(ValueError):
+        create_backend('int8-static', processor.feature_extractor, processor.brain_analyzer, processor.device)
+
+
+def test_int8_dynamic_backend_matches_eager(processor, slice_batch):
+    backend = create_backend('int8-dynamic', processor.feature_extractor, processor.brain_analyzer, processor.device)
+    _check_backend(processor, backend, slice_batch, 0.99)
+
+
+def test_int8_static_backend_matches_eager(processor, slice_batch):
+    backend = create_backend('int8-static', processor.feature_extractor, processor.brain_analyzer, processor.device,
+                             calibration_batches=[slice_batch])
+    _check_backend(processor, backend, slice_batch, 0.98)
+
+
+def test_onnx_backend_matches_eager(processor, slice_batch):
+    pytest.importorskip('onnxruntime')
+    backend = create_backend('onnx', processor.feature_extractor, processor.brain_analyzer, processor.device)
+    _check_backend(processor, backend, slice_batch, 0.9999)
+
+
+def test_backend_is_part_of_the_feature_cache_key(processor, monkeypatch):
+    eager_version = processor.feature_version
+    monkeypatch.setattr(processor, 'inference_backend', 'onnx')
+    assert processor.feature_version != eager_version
@@ -0,0 +1,80 @@
+"""
+Tests for the CPU-bound inference executor
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import types
+
+from inference_executor import InferenceExecutor, default_worker_count
+
+
+def test_default_worker_count_avoids_oversubscription(monkeypatch):
+    monkeypatch.setattr("os.cpu_count", lambda: 32)
+    assert default_worker_count(32) == 1
+    assert default_worker_count(8) == 4
+    assert default_worker_count(64) == 1
+
+
+def test_default_size_follows_threads_set_after_construction(monkeypatch):
+    monkeypatch.setattr("os.cpu_count", lambda: 32)
+    torch = types.SimpleNamespace(get_num_threads=lambda: 32)
+    monkeypatch.setitem(sys.modules, "torch", torch)
+    executor = InferenceExecutor()
+    # The model loader applies its thread settings after main.py built the executor
+    torch.get_num_threads = lambda: 8
+    try:
+        assert asyncio.run(executor.run(threading.current_thread)).name.startswith("mr-inference")
+        assert executor.stats()["threads"] == 4
+        # Later changes do not resize a running pool
+        torch.get_num_threads = lambda: 2
+        assert executor.stats()["threads"] == 4
+    finally:
+        executor.shutdown()
+
+
+def test_event_loop_stays_responsive_during_heavy_calls():
+    executor = InferenceExecutor(max_workers=2)
+
+    async def scenario():
+        heavy = [asyncio.ensure_future(executor.run(time.sleep, 0.3)) for _ in range(4)]
+        # A lightweight coroutine should keep getting scheduled every ~10 ms
+        worst_lag = 0.0
+        while not all(task.done() for task in heavy):
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            worst_lag = max(worst_lag, time.perf_counter() - start - 0.01)
+        await asyncio.gather(*heavy)
+        return worst_lag
+
+    try:
+        assert asyncio.run(scenario()) < 0.1
+    finally:
+        executor.shutdown()
+
+
+def test_concurrency_limit_is_enforced():
+    executor = InferenceExecutor(max_workers=4, max_concurrency=2)
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def work():
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.05)
+        with lock:
+            active -= 1
+
+    async def scenario():
+        await asyncio.gather(*(executor.run(work) for _ in range(8)))
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert peak == 2
@@ -0,0 +1,69 @@
+"""
+Tests for the background job engine
+"""
+
+import threading
+import time
+
+import pytest
+
+from job_engine import JobEngine, QueueFullError, STATUS_DONE, STATUS_FAILED, STATUS_QUEUED
+
+
+def _wait_for(engine, task_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        task = engine.get(task_id)
+        if task["status"] in (STATUS_DONE, STATUS_FAILED):
+            return task
+        time.sleep(0.01)
+    pytest.fail(f"task {task_id} did not finish")
+
+
+def test_tasks_run_and_store_results():
+    engine = JobEngine(handler=lambda task: {"doubled": task["value"] * 2}, max_workers=2)
+    engine.start()
+    try:
+        task_ids = [engine.submit({"value": i}) for i in range(5)]
+        results = [_wait_for(engine, task_id) for task_id in task_ids]
+    finally:
+        engine.shutdown()
+
+    assert len(set(task_ids)) == 5
+    assert [r["result"]["doubled"] for r in results] == [0, 2, 4, 6, 8]
+    assert all(r["started_at"] <= r["completed_at"] for r in results)
+
+
+def test_handler_errors_are_recorded():
+    def fail(task):
+        raise RuntimeError("corrupt DICOM")
+
+    engine = JobEngine(handler=fail, max_workers=1)
+    engine.start()
+    try:
+        task = _wait_for(engine, engine.submit({}))
+    finally:
+        engine.shutdown()
+
+    assert task["status"] == STATUS_FAILED
+    assert task["error"] == "corrupt DICOM"
+
+
+def test_full_queue_rejects_new_work():
+    release = threading.Event()
+    engine = JobEngine(handler=lambda task: release.wait(), max_workers=1, max_queue_depth=2)
+    engine.start()
+    try:
+        running = engine.submit({})
+        while engine.get(running)["status"] == STATUS_QUEUED:
+            time.sleep(0.01)
+        queued = [engine.submit({}), engine.submit({})]
+
+        with pytest.raises(QueueFullError):
+            engine.submit({})
+        assert engine.stats()["queued"] == 2
+    finally:
+        release.set()
+        engine.shutdown()
+
+    assert all(engine.get(task_id)["status"] == STATUS_DONE for task_id in queued)
@@ -0,0 +1,81 @@
+"""
+Tests for lazy NIfTI volume access
+"""
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from lazy_volume import LazyNiftiVolume, take_axial_slices
+from phantoms import make_phantom, write_nifti
+
+
+def _eager_normalized(path):
+    """The previous loader: get_fdata() plus 0-255 normalization"""
+    data = nib.load(path).get_fdata()
+    if data.max() > 255:
+        data = (data / data.max() * 255).astype(np.uint8)
+    return data
+
+
+@pytest.mark.parametrize("suffix", [".nii", ".nii.gz"])
+def test_slices_match_eager_loading(tmp_path, suffix):
+    path = write_nifti(str(tmp_path / f"scan{suffix}"), make_phantom((32, 28, 24), seed=5))
+    volume = LazyNiftiVolume(path)
+    eager = _eager_normalized(path)
+
+    indices = [6, 9, 12, 17]
+    assert volume.shape == eager.shape
+    np.testing.assert_allclose(take_axial_slices(volume, indices),
+                               take_axial_slices(eager, indices), atol=1)
+    np.testing.assert_allclose(volume[:, :, 12], eager[:, :, 12], atol=1)
+    # Compressed files cannot be mapped: they are decompressed once instead of on every read
+    assert volume.memory_mapped == (suffix == ".nii")
+
+
+def test_low_range_volumes_stay_float32(tmp_path):
+    path = write_nifti(str(tmp_path / "scan.nii"), make_phantom((16, 16, 8), max_value=200.0), dtype=np.float32)
+    volume = LazyNiftiVolume(path)
+
+    plane = volume[:, :, 4]
+    assert plane.dtype == np.float32
+    np.testing.assert_allclose(plane, nib.load(path).get_fdata()[:, :, 4], rtol=1e-6)
+    assert LazyNiftiVolume(path, dtype=None)[:, :, 4].dtype == np.float32
+
+
+def test_reading_slices_does_not_modify_the_file(tmp_path):
+    path = write_nifti(str(tmp_path / "scan.nii"), make_phantom((16, 16, 8)), dtype=np.float32)
+    before = nib.load(path).get_fdata()
+
+    LazyNiftiVolume(path).take_slices([1, 2, 3])
+
+    np.testing.assert_array_equal(nib.load(path).get_fdata(), before)
+
+
+def test_processor_pipeline_accepts_lazy_volumes(processor, tmp_path):
+    path = write_nifti(str(tmp_path / "scan.nii"), make_phantom((48, 48, 40)))
+
+    image = processor.load_dicom_image(path)
+    slices = processor.extract_brain_slices(image, num_slices=5)
+
+    assert isinstance(image, LazyNiftiVolume)
+    assert slices.shape == (5, 48, 48, 3)
+    assert processor.extract_features(slices).shape == (1, 2048)
+
+
+def test_compressed_volumes_are_decompressed_once(tmp_path, monkeypatch):
+    path = write_nifti(str(tmp_path / "scan.nii.gz"), make_phantom((32, 28, 24), seed=6), dtype=np.int16)
+    volume = LazyNiftiVolume(path, dtype=None)
+    opens = []
+    original = nib.openers.Opener.__init__
+
+    def counting_init(self, *args, **kwargs):
+        opens.append(args)
+        original(self, *args, **kwargs)
+
+    monkeypatch.setattr(nib.openers.Opener, "__init__", counting_init)
+    volume.max()
+    take_axial_slices(volume, [4, 8, 12, 16])
+    volume[:, :, 10]
+    assert opens == []
+    assert volume[:, :, 10].dtype == np.uint8
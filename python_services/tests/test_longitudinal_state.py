@@ -0,0 +1,118 @@
+"""
+Tests for incremental per-patient longitudinal state
+"""
+
+import os
+from unittest import mock
+
+import pytest
+
+import longitudinal_state
+from longitudinal_state import LongitudinalStore, StaleStateError, add_trend_point, trend_coefficients
+from phantoms import make_phantom, write_nifti
+
+DATES = ["2024-01-01", "2024-07-01", "2025-01-01", "2025-07-01"]
+
+
+def _write_scans(tmp_path, count, seed):
+    return [
+        write_nifti(str(tmp_path / f"scan{i}.nii"), make_phantom((180, 130, 60), seed=seed + i))
+        for i in range(count)
+    ]
+
+
+def test_running_sums_give_least_squares_line():
+    sums = {}
+    for day, volume in [(0, 1000.0), (365.25, 990.0), (730.5, 980.0)]:
+        add_trend_point(sums, day, volume)
+
+    trend = trend_coefficients(sums, baseline_value=1000.0)
+    assert trend["points"] == 3
+    assert trend["slope_mm3_per_year"] == pytest.approx(-10.0)
+    assert trend["intercept_mm3"] == pytest.approx(1000.0)
+    assert trend["percent_per_year"] == pytest.approx(-1.0)
+    assert trend_coefficients({"n": 1, "t": 0.0, "y": 5.0, "tt": 0.0, "ty": 0.0}, 5.0)["slope_mm3_per_year"] is None
+
+
+def test_append_infers_only_the_new_scan(processor, tmp_path):
+    store = LongitudinalStore(str(tmp_path / "state"))
+    paths = _write_scans(tmp_path, 3, seed=200)
+
+    for i, path in enumerate(paths):
+        with mock.patch.object(processor, "extract_brain_slices", wraps=processor.extract_brain_slices) as slices, \
+                mock.patch.object(processor.backend, "analyze", wraps=processor.backend.analyze) as analyze:
+            result = store.append(processor, "P-1", path, scan_date=DATES[i])
+        assert slices.call_count == 1
+        assert analyze.call_count == (1 if i else 0)
+        assert result["appended"] and result["scan_count"] == i + 1
+
+    assert result["baseline_delta"]["from_index"] == 0 and result["consecutive_delta"]["from_index"] == 1
+    assert result["risk_assessment"]["risk_category"]
+    assert result["trends"]["frontal_cortex"]["points"] == 3
+    assert result["trends"]["frontal_cortex"]["slope_mm3_per_year"] is not None
+
+
+def test_state_survives_restart_and_duplicates_are_ignored(processor, tmp_path):
+    paths = _write_scans(tmp_path, 2, seed=210)
+    store = LongitudinalStore(str(tmp_path / "state"))
+    for path, date in zip(paths, DATES):
+        store.append(processor, "P-2", path, scan_date=date)
+
+    reopened = LongitudinalStore(str(tmp_path / "state"))
+    summary = reopened.summary("P-2")
+    assert summary["scan_count"] == 2
+    assert summary["trends"] == store.summary("P-2")["trends"]
+
+    again = reopened.append(processor, "P-2", paths[1], scan_date=DATES[2])
+    assert not again["appended"] and again["scan_count"] == 2
+
+
+def test_model_version_change_rebuilds_history(processor, tmp_path):
+    paths = _write_scans(tmp_path, 3, seed=220)
+    store = LongitudinalStore(None)
+    for path, date in zip(paths[:2], DATES):
+        store.append(processor, "P-3", path, scan_date=date)
+
+    with mock.patch.object(longitudinal_state, "state_version", return_value="new-model"), \
+            mock.patch.object(processor, "extract_brain_slices", wraps=processor.extract_brain_slices) as slices:
+        result = store.append(processor, "P-3", paths[2], scan_date=DATES[2])
+    assert result["state_version"] == "new-model"
+    assert result["scan_count"] == 3
+    assert [scan["path"] for scan in result["scans"]] == paths
+    # The extractor itself is unchanged here, so rebuilt scans come from the feature cache
+    assert slices.call_count == 1
+
+    os.unlink(paths[0])
+    with mock.patch.object(longitudinal_state, "state_version", return_value="newer-model"):
+        with pytest.raises(StaleStateError):
+            store.append(processor, "P-3", paths[1], scan_date=DATES[3])
+
+
+def test_failed_rebuild_keeps_the_old_history(processor, tmp_path):
+    paths = _write_scans(tmp_path, 2, seed=230)
+    store = LongitudinalStore(str(tmp_path / "state"))
+    for path, date in zip(paths, DATES):
+        store.append(processor, "P-4", path, scan_date=date)
+    before = store.summary("P-4")
+
+    calls = []
+
+    def failing_features(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 2:
+            raise RuntimeError("out of memory")
+        return original(*args, **kwargs)
+
+    original = processor.get_scan_features
+    with mock.patch.object(longitudinal_state, "state_version", return_value="new-model"), \
+            mock.patch.object(processor, "get_scan_features", side_effect=failing_features):
+        with pytest.raises(RuntimeError, match="out of memory"):
+            store.rebuild(processor, "P-4")
+    assert store.summary("P-4") == before
+
+    # A scan replaced at the same path would be rebuilt from other content: reported, not rebuilt
+    write_nifti(paths[1], make_phantom((180, 130, 60), seed=999))
+    with mock.patch.object(longitudinal_state, "state_version", return_value="new-model"):
+        with pytest.raises(StaleStateError, match="changed"):
+            store.rebuild(processor, "P-4")
+    assert store.summary("P-4") == before
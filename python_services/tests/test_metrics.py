@@ -0,0 +1,121 @@
+"""
+Tests for stage timings and the /metrics exposition
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from metrics import MetricsRegistry, collect_stage_timings, record_stage, stage
+from phantoms import make_phantom, write_nifti
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    latency = registry.histogram("test_seconds", "Test latency", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        latency.observe(value, "decode")
+    registry.callback("test_depth", "Queue depth", lambda: 4)
+    registry.callback("test_broken", "Fails at scrape time", lambda: 1 / 0)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE test_seconds histogram" in lines
+    assert 'test_seconds_bucket{stage="decode",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="decode",le="1"} 3' in lines
+    assert 'test_seconds_bucket{stage="decode",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{stage="decode"} 4' in lines
+    assert "test_depth 4" in lines
+    assert not any(line.startswith("test_broken") or "test_broken " in line for line in lines)
+    assert latency.totals("decode") == (4, pytest.approx(4.25))
+    with pytest.raises(ValueError):
+        registry.counter("test_depth", "Duplicate name")
+
+
+def test_nested_collectors_report_into_the_outermost():
+    with collect_stage_timings() as outer:
+        record_stage("decode", 0.5)
+        with collect_stage_timings() as inner:
+            record_stage("decode", 0.25)
+            with stage("heatmap"):
+                pass
+        assert inner is outer
+    assert outer["decode"] == pytest.approx(0.75)
+    assert "heatmap" in outer
+    # Outside any collector, stages only go to the histogram
+    record_stage("decode", 1.0)
+    assert outer["decode"] == pytest.approx(0.75)
+
+
+def test_results_carry_measured_stage_timings(processor, tmp_path):
+    path = write_nifti(str(tmp_path / "scan.nii"), make_phantom((96, 96, 40), seed=5))
+    result = processor.process_single_scan(path)
+
+    assert result["processing_seconds"] > 0
+    assert result["processing_time"].endswith("saniye")
+    timings = result["stage_timings_ms"]
+    assert {"hash", "decode", "slice_selection", "preprocessing"} <= set(timings)
+    assert sum(timings.values()) <= result["processing_seconds"] * 1000 + 1
+
+
+def test_comparison_results_report_decode_timings(processor, tmp_path):
+    paths = [write_nifti(str(tmp_path / f"scan{i}.nii"), make_phantom((96, 96, 40), seed=6 + i)) for i in range(2)]
+    result = processor.process_mr_comparison(*paths)
+
+    assert result["analysis_status"] == "TAMAMLANDI"
+    assert {"hash", "decode"} <= set(result["stage_timings_ms"])
+
+
+def test_metrics_endpoint_exposes_the_service_gauges():
+    env = dict(os.environ, MRSINA_MODEL_LOADING="lazy", MRSINA_FEATURE_CACHE_DIR="",
+               MRSINA_HEATMAP_CACHE_DIR="", MRSINA_REGISTRATION_CACHE_DIR="", MRSINA_LONGITUDINAL_STATE_DIR="",
+               MRSINA_TASK_STORE_DIR="")
+    code = (
+        "import warnings; warnings.simplefilter('ignore')\n"
+        "from fastapi.testclient import TestClient\n"
+        "import main\n"
+        "client = TestClient(main.app)\n"
+        "client.get('/heatmaps/missing')\n"
+        "response = client.get('/metrics')\n"
+        "print(response.headers['content-type'])\n"
+        "print(response.text)\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], cwd=SERVICE_DIR, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    content_type, text = output.split("\n", 1)
+    lines = text.splitlines()
+    assert content_type.startswith("text/plain; version=0.0.4")
+    assert 'mrsina_request_duration_seconds_count{method="GET",route="/heatmaps/{heatmap_id}",status="404"} 1' in lines
+    assert "mrsina_job_queue_depth 0" in lines
+    assert "mrsina_model_loaded 0" in lines
+    assert 'mrsina_cache_lookups_total{cache="heatmap",result="miss"} 1' in lines
+    assert any(line.startswith("process_resident_memory_bytes ") for line in lines)
+
+
+def test_finished_jobs_feed_the_time_estimate():
+    env = dict(os.environ, MRSINA_MODEL_LOADING="lazy", MRSINA_FEATURE_CACHE_DIR="",
+               MRSINA_HEATMAP_CACHE_DIR="", MRSINA_REGISTRATION_CACHE_DIR="", MRSINA_LONGITUDINAL_STATE_DIR="",
+               MRSINA_TASK_STORE_DIR="", MRSINA_SIMILARITY_INDEX_DIR="")
+    code = (
+        "import time, types\n"
+        "import main\n"
+        "scan = lambda path, index_as=None: (time.sleep(0.2), {'slice_count': 20})[1]\n"
+        "main.models.get = lambda: types.SimpleNamespace(process_single_scan=scan)\n"
+        "print(main.estimate_job_seconds(main.job_engine.stats()))\n"
+        "main.job_engine.start()\n"
+        "task_id = main.job_engine.submit({'mr_id': 'mr-1', 'file_path': '/scans/a.nii'})\n"
+        "while main.job_engine.get(task_id)['status'] != 'TAMAMLANDI':\n"
+        "    time.sleep(0.01)\n"
+        "main.job_engine.shutdown()\n"
+        "print(main.estimate_job_seconds(main.job_engine.stats()))\n"
+        "print(main.JOB_SECONDS.totals('ok')[0], main.JOB_SECONDS.totals('error')[0])\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], cwd=SERVICE_DIR, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    before, after, counts = output.splitlines()
+    assert before == "None"
+    assert float(after) > 0
+    assert counts == "1 0"
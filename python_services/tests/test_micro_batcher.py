@@ -0,0 +1,112 @@
+"""
+Tests for cross-request micro-batching
+"""
+
+import threading
+import time
+from unittest import mock
+
+import pytest
+import torch
+
+from micro_batcher import MicroBatcher
+
+
+class CountingModel:
+    """Toy model: one row per slice (its mean), counting forward passes"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, batch):
+        self.calls.append(batch.shape[0])
+        return batch.mean(dim=(1, 2, 3)).unsqueeze(1)
+
+
+def _run_concurrently(batcher, batches):
+    results = [None] * len(batches)
+    barrier = threading.Barrier(len(batches))
+
+    def worker(i):
+        barrier.wait()
+        results[i] = batcher.infer(batches[i])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(batches))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_requests_share_forward_passes():
+    model = CountingModel()
+    batcher = MicroBatcher(model, max_slices=1000, max_wait_ms=200)
+    batches = [torch.full((5, 1, 4, 4), float(i)) for i in range(6)]
+    try:
+        results = _run_concurrently(batcher, batches)
+    finally:
+        batcher.shutdown()
+
+    for i, rows in enumerate(results):
+        torch.testing.assert_close(rows, torch.full((5, 1), float(i)))
+    assert len(model.calls) < len(batches)
+    assert sum(model.calls) == 30
+
+
+def test_batches_respect_slice_limit():
+    model = CountingModel()
+    batcher = MicroBatcher(model, max_slices=10, max_wait_ms=200)
+    try:
+        _run_concurrently(batcher, [torch.zeros((5, 1, 2, 2)) for _ in range(6)])
+    finally:
+        batcher.shutdown()
+
+    assert max(model.calls) <= 10
+    assert batcher.stats()["requests"] == 6
+
+
+class SlowThread(threading.Thread):
+    """Widens the window between checking for and creating the scheduler thread"""
+
+    def __init__(self, *args, **kwargs):
+        time.sleep(0.05)
+        super().__init__(*args, **kwargs)
+
+
+def test_concurrent_first_calls_start_one_scheduler():
+    batcher = MicroBatcher(CountingModel(), max_wait_ms=1)
+    with mock.patch("micro_batcher.threading.Thread", SlowThread):
+        _run_concurrently(batcher, [torch.zeros((1, 1, 2, 2)) for _ in range(8)])
+    schedulers = [t for t in threading.enumerate() if t.name == "mr-micro-batcher"]
+    for _ in schedulers[1:]:
+        batcher._requests.put(None)  # stop any extra scheduler so a failure does not hang shutdown()
+    batcher.shutdown()
+    assert len(schedulers) == 1
+
+
+def test_model_errors_reach_every_caller():
+    def broken(batch):
+        raise RuntimeError("out of memory")
+
+    batcher = MicroBatcher(broken, max_wait_ms=1)
+    try:
+        with pytest.raises(RuntimeError, match="out of memory"):
+            batcher.infer(torch.zeros((1, 1, 2, 2)))
+    finally:
+        batcher.shutdown()
+
+
+def test_processor_results_match_without_batcher(processor):
+    volume = torch.randint(0, 255, (48, 48, 30), dtype=torch.uint8).numpy()
+    slices = processor.extract_brain_slices(volume, num_slices=6)
+    expected = processor.extract_features(slices)
+
+    processor.micro_batcher = MicroBatcher(processor._forward_batches, max_wait_ms=1)
+    try:
+        batched = processor.extract_features(slices)
+    finally:
+        processor.micro_batcher.shutdown()
+        processor.micro_batcher = None
+
+    torch.testing.assert_close(batched, expected, rtol=1e-4, atol=1e-4)
@@ -0,0 +1,53 @@
+"""
+Tests for deferred processor construction and fast service start-up
+"""
+
+import os
+import subprocess
+import sys
+import threading
+
+from model_loader import STATE_FAILED, STATE_NOT_LOADED, STATE_READY, ModelLoader
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_processor_is_built_once_on_first_use():
+    calls = []
+    loader = ModelLoader(lambda: calls.append(1) or object())
+    assert loader.status()["state"] == STATE_NOT_LOADED
+    assert loader.processor is None
+
+    threads = [threading.Thread(target=loader.get) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert loader.ready and loader.status()["state"] == STATE_READY
+    assert "model_ready" in loader.status()["startup_timeline_s"]
+
+
+def test_failed_build_is_reported_and_retried():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("weights unavailable")
+        return "processor"
+
+    loader = ModelLoader(factory)
+    loader.warm_up().join()
+    assert loader.status()["state"] == STATE_FAILED
+    assert "weights unavailable" in loader.status()["error"]
+    assert loader.get() == "processor"
+
+
+def test_importing_the_service_does_not_load_torch():
+    env = dict(os.environ, MRSINA_MODEL_LOADING="lazy", MRSINA_FEATURE_CACHE_DIR="")
+    code = "import sys, main; print('torch' in sys.modules, main.models.ready)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=SERVICE_DIR, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    assert output.split() == ["False", "False"]
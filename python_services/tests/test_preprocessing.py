@@ -0,0 +1,67 @@
+"""
+Tests for the tensor-native slice preprocessing
+"""
+
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+from brain_mri_processor import IMAGENET_MEAN, IMAGENET_STD
+
+# The PIL pipeline preprocess_slices replaces
+legacy_transform = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD),
+])
+
+
+def test_slices_are_broadcast_views(processor):
+    volume = np.random.default_rng(0).integers(0, 255, (64, 48, 40), dtype=np.uint8)
+    slices = processor.extract_brain_slices(volume, num_slices=6)
+
+    assert slices.shape == (6, 64, 48, 3)
+    assert slices.strides[-1] == 0
+    np.testing.assert_array_equal(slices[2, :, :, 1], volume[:, :, np.linspace(10, 30, 6, dtype=int)[2]])
+
+
+def test_2d_image_gives_single_slice(processor):
+    image = np.random.default_rng(1).integers(0, 255, (32, 40), dtype=np.uint8)
+    slices = processor.extract_brain_slices(image)
+
+    assert slices.shape == (1, 32, 40, 3)
+
+
+def test_preprocessing_matches_pil_pipeline(processor):
+    volume = np.random.default_rng(2).integers(0, 255, (256, 200, 40), dtype=np.uint8)
+    slices = processor.extract_brain_slices(volume, num_slices=4)
+
+    batch = processor.preprocess_slices(slices)
+    reference = torch.stack([legacy_transform(Image.fromarray(np.ascontiguousarray(s))) for s in slices])
+
+    assert batch.shape == (4, 3, 224, 224)
+    # Resampling rounding may differ from PIL by a grey level
+    torch.testing.assert_close(batch, reference, rtol=0, atol=1.01 / 255 / min(IMAGENET_STD))
+
+
+def test_rgb_slices_are_preprocessed_per_channel(processor):
+    rgb = np.random.default_rng(3).integers(0, 255, (2, 64, 64, 3), dtype=np.uint8)
+
+    batch = processor.preprocess_slices(rgb)
+    reference = torch.stack([legacy_transform(Image.fromarray(s)) for s in rgb])
+
+    # Upsampling rounds slightly differently from PIL at a few pixels
+    torch.testing.assert_close(batch, reference, rtol=0, atol=2.01 / 255 / min(IMAGENET_STD))
+
+
+def test_float_volumes_are_clamped_to_display_range(processor):
+    image = np.full((32, 32), 300.0)
+    image[:16] = -20.0
+
+    batch = processor.preprocess_slices(processor.extract_brain_slices(image))
+
+    # The caller's array is never modified in place
+    assert image.min() == -20.0
+    assert float(batch[0, 0].max()) <= (1.0 - IMAGENET_MEAN[0]) / IMAGENET_STD[0] + 1e-5
+    assert float(batch[0, 0].min()) >= -IMAGENET_MEAN[0] / IMAGENET_STD[0] - 1e-5
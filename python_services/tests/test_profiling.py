@@ -0,0 +1,95 @@
+"""
+Tests for opt-in request profiling
+"""
+
+import json
+import os
+import pstats
+import subprocess
+import sys
+from unittest import mock
+
+import pytest
+
+from phantoms import make_phantom, write_nifti
+from profiling import ProfilerBusyError, ProfileStore, capturing, parse_profilers
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_parse_profilers():
+    assert parse_profilers(None) == ()
+    assert parse_profilers("off") == ()
+    assert parse_profilers("torch, cprofile") == ("cprofile", "torch")
+    assert parse_profilers("all") == ("cprofile", "torch")
+    with pytest.raises(ValueError):
+        parse_profilers("perf")
+
+
+def test_profiled_scan_writes_artifacts(processor, tmp_path):
+    path = write_nifti(str(tmp_path / "scan.nii"), make_phantom((96, 96, 40), seed=31))
+    store = ProfileStore(str(tmp_path / "profiles"), ("cprofile", "torch"))
+
+    # The micro-batcher runs on its own thread, out of the profilers' sight: bypassed
+    with mock.patch.object(processor, "micro_batcher") as batcher:
+        result, profile_id = store.capture(("cprofile", "torch"), "scan", processor.process_single_scan, path)
+    batcher.infer.assert_not_called()
+    assert result["feature_dimension"] == 2048
+    assert not capturing()
+
+    with open(store.artifact_path(profile_id, "trace")) as f:
+        trace = json.load(f)
+    assert any(event.get("name", "").startswith("aten::conv") for event in trace["traceEvents"])
+    stats = pstats.Stats(store.artifact_path(profile_id, "pstats"))
+    assert any(name == "process_single_scan" for _, _, name in stats.stats)
+    with open(store.artifact_path(profile_id, "summary")) as f:
+        assert "cumulative" in f.read()
+
+    [meta] = store.list()
+    assert meta["profile_id"] == profile_id and meta["status"] == "ok"
+    assert set(meta["artifacts"]) == {"pstats", "summary", "trace"}
+    assert "inference" in meta["stage_timings_ms"]
+    assert store.artifact_path(profile_id, "flamegraph") is None
+    assert store.artifact_path("../" + profile_id, "trace") is None
+
+
+def test_store_prunes_and_rejects_concurrent_captures(tmp_path):
+    store = ProfileStore(str(tmp_path), ("cprofile",), keep=2)
+    ids = [store.capture(("cprofile",), "sum", sum, range(10))[1] for _ in range(3)]
+    assert [meta["profile_id"] for meta in store.list()] == sorted(ids)[::-1][:2]
+
+    with pytest.raises(ValueError):
+        store.capture(("torch",), "sum", sum, range(10))
+
+    def nested():
+        return store.capture(("cprofile",), "inner", sum, range(10))
+
+    with pytest.raises(ProfilerBusyError):
+        store.capture(("cprofile",), "outer", nested)
+    # A failed call still leaves its profile behind
+    assert store.list()[0]["label"] == "outer" and store.list()[0]["status"] == "error"
+
+
+def test_profile_endpoints(tmp_path):
+    env = dict(os.environ, MRSINA_MODEL_LOADING="lazy", MRSINA_FEATURE_CACHE_DIR="",
+               MRSINA_HEATMAP_CACHE_DIR="", MRSINA_REGISTRATION_CACHE_DIR="", MRSINA_LONGITUDINAL_STATE_DIR="",
+               MRSINA_TASK_STORE_DIR="",
+               MRSINA_PROFILING="cprofile", MRSINA_PROFILES_DIR=str(tmp_path))
+    scan = tmp_path / "scan.nii"
+    scan.write_bytes(b"")
+    code = (
+        "import warnings; warnings.simplefilter('ignore')\n"
+        "from fastapi.testclient import TestClient\n"
+        "import main\n"
+        "_, profile_id = main.profile_store.capture(('cprofile',), 'test', sum, range(10))\n"
+        "client = TestClient(main.app)\n"
+        "listed = client.get('/profiles').json()['profiles']\n"
+        "summary = client.get(f'/profiles/{profile_id}/summary')\n"
+        f"forbidden = client.post('/compare-mrs', params={{'mr1_path': '{scan}', 'mr2_path': '{scan}',"
+        " 'profile': 'torch'})\n"
+        "print(listed[0]['profile_id'] == profile_id, summary.status_code, summary.headers['content-type'],"
+        " client.get(f'/profiles/{profile_id}/trace').status_code, forbidden.status_code)\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], cwd=SERVICE_DIR, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    assert output.split() == ["True", "200", "text/plain;", "charset=utf-8", "404", "403"]
@@ -0,0 +1,179 @@
+"""
+Tests for stage progress reporting and the progress stream hub
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+
+from job_engine import JobEngine
+from phantoms import make_phantom, write_nifti
+from progress import ProgressState, reporting
+from progress_stream import ProgressHub, TooManySubscribersError, format_event
+from task_store import SQLiteTaskStore, STATUS_DONE, STATUS_QUEUED, STATUS_RUNNING
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_pipeline_reports_stages_and_inference_chunks(processor, tmp_path):
+    path = write_nifti(str(tmp_path / "scan.nii"), make_phantom((96, 96, 40), seed=11))
+    events = []
+    state = ProgressState()
+    with reporting(events.append):
+        processor.process_single_scan(path)
+    processor.process_single_scan(path)  # nobody listening: nothing recorded
+
+    for event in events:
+        snapshot = state.update(event)
+    stages = [event["stage"] for event in events if event["state"] == "done"]
+    assert {"hash", "decode", "slice_selection", "preprocessing"} <= set(stages)
+    chunks = [event for event in events if event["state"] == "running"]
+    assert chunks and chunks[-1]["slices_done"] == chunks[-1]["slices_total"]
+    assert set(stages) == set(snapshot["stages_done_ms"])
+    assert snapshot["inference"]["slices_done"] == chunks[-1]["slices_total"]
+
+
+def test_hub_serves_hundreds_of_subscribers_from_one_poller(tmp_path):
+    store = SQLiteTaskStore(str(tmp_path))
+    gate = threading.Event()
+
+    def handler(task):
+        from progress import stage_done
+        gate.wait(10)
+        for name in ("decode", "slice_selection", "preprocessing"):
+            stage_done(name, 0.01)
+        return {"slices": 20}
+
+    engine = JobEngine(handler, max_workers=1, store=store, poll_interval=0.01)
+    hub = ProgressHub(store, poll_interval=0.05, heartbeat_interval=5.0)
+    engine.on_update = hub.notify
+    task_id = engine.submit({"mr_id": "mr-1"})
+
+    async def watch():
+        seen = []
+        async for record in hub.subscribe(task_id):
+            if record is not None:
+                seen.append(record)
+        return seen
+
+    async def scenario():
+        watchers = [asyncio.ensure_future(watch()) for _ in range(200)]
+        while hub.subscriber_count < 200:
+            await asyncio.sleep(0.01)
+        threads = threading.active_count()
+        engine.start()
+        gate.set()
+        results = await asyncio.wait_for(asyncio.gather(*watchers), 20)
+        return threads, results
+
+    try:
+        threads_before, results = asyncio.run(scenario())
+    finally:
+        engine.shutdown()
+
+    assert threads_before < 20
+    assert hub.subscriber_count == 0
+    for seen in results:
+        assert seen[0]["status"] == STATUS_QUEUED
+        assert seen[-1]["status"] == STATUS_DONE and seen[-1]["result"] == {"slices": 20}
+        versions = [record["version"] for record in seen]
+        assert versions == sorted(set(versions))
+    # Final snapshot carries every stage, even if a subscriber skipped intermediate ones
+    assert set(results[0][-1]["progress"]["stages_done_ms"]) == {"decode", "slice_selection", "preprocessing"}
+    assert format_event(results[0][-1]).startswith(f"id: {results[0][-1]['version']}\nevent: result\n")
+
+
+def test_late_subscriber_gets_a_status_fanned_out_while_it_subscribed(tmp_path):
+    store = SQLiteTaskStore(str(tmp_path))
+    store.create("task_a", {"mr_id": "mr-1"}, max_queued=4)
+    store.claim("host:1:0")
+    hub = ProgressHub(store, poll_interval=0.02, heartbeat_interval=0.1)
+    running = store.get("task_a")
+
+    async def watch_late():
+        # The first read returns the record from before the task finished, as if it raced the poller
+        real_get = store.get
+        store.get = lambda task_id: (setattr(store, "get", real_get), running)[1]
+        seen = []
+        async for record in hub.subscribe("task_a"):
+            if record is None:
+                if len(seen) > 1:
+                    break
+                continue
+            seen.append(record)
+            if record["status"] == STATUS_DONE:
+                break
+        return seen
+
+    async def scenario():
+        # An existing subscriber, still registered after the final status reached it
+        watcher = hub.subscribe("task_a")
+        await watcher.__anext__()
+        pending = asyncio.ensure_future(watcher.__anext__())
+        while hub.subscriber_count < 1:
+            await asyncio.sleep(0.01)
+        store.complete("task_a", "host:1:0", STATUS_DONE, result={"slices": 20})
+        assert (await asyncio.wait_for(pending, 5))["status"] == STATUS_DONE
+        try:
+            return await asyncio.wait_for(watch_late(), 5)
+        finally:
+            await watcher.aclose()
+
+    seen = asyncio.run(scenario())
+    assert [record["status"] for record in seen] == [STATUS_RUNNING, STATUS_DONE]
+
+
+def test_subscribers_waiting_at_their_first_record_count_towards_the_limit(tmp_path):
+    store = SQLiteTaskStore(str(tmp_path))
+    store.create("task_a", {"mr_id": "mr-1"}, max_queued=4)
+    hub = ProgressHub(store, max_subscribers=2)
+
+    async def scenario():
+        watchers = [hub.subscribe("task_a") for _ in range(3)]
+        # The first two are suspended right after yielding their first record
+        for watcher in watchers[:2]:
+            assert (await watcher.__anext__())["status"] == STATUS_QUEUED
+        try:
+            await watchers[2].__anext__()
+        except TooManySubscribersError:
+            rejected = True
+        else:
+            rejected = False
+        for watcher in watchers[:2]:
+            await watcher.aclose()
+        return rejected
+
+    assert asyncio.run(scenario())
+    assert hub.subscriber_count == 0
+
+
+def test_events_endpoint_streams_a_finished_task():
+    env = dict(os.environ, MRSINA_MODEL_LOADING="lazy", MRSINA_FEATURE_CACHE_DIR="",
+               MRSINA_HEATMAP_CACHE_DIR="", MRSINA_REGISTRATION_CACHE_DIR="", MRSINA_LONGITUDINAL_STATE_DIR="",
+               MRSINA_TASK_STORE_DIR="")
+    code = (
+        "import warnings; warnings.simplefilter('ignore')\n"
+        "from fastapi.testclient import TestClient\n"
+        "import main\n"
+        "store = main.job_engine.store\n"
+        "store.create('task_x', {'mr_id': 'mr-1'}, max_queued=4)\n"
+        "store.claim('host:1:0')\n"
+        "store.update_progress('task_x', 'host:1:0', {'last_stage': 'decode'})\n"
+        "store.complete('task_x', 'host:1:0', 'TAMAMLANDI', result={'slices': 20})\n"
+        "client = TestClient(main.app)\n"
+        "print(client.get('/processing-status/missing/events').status_code)\n"
+        "response = client.get('/processing-status/task_x/events')\n"
+        "print(response.headers['content-type'])\n"
+        "print(repr(response.text))\n"
+        "print(repr(client.get('/processing-status/task_x/events', headers={'Last-Event-ID': '3'}).text))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], cwd=SERVICE_DIR, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    missing, content_type, text, resumed = output.splitlines()
+    assert missing == "404"
+    assert content_type.startswith("text/event-stream")
+    assert "id: 3\\nevent: result\\n" in text and '"slices": 20' in text
+    assert "event:" not in resumed and ": keep-alive" in resumed
+    assert STATUS_RUNNING not in text
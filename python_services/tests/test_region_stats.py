@@ -0,0 +1,121 @@
+"""
+Tests for vectorized per-region voxel statistics
+"""
+
+import numpy as np
+import pytest
+
+from brain_regions import BRAIN_REGIONS
+from lazy_volume import LazyNiftiVolume
+from phantoms import make_phantom, write_nifti
+from region_stats import RegionStatistics, atlas_label_map, box_label_map, otsu_threshold
+
+
+def _naive_box_stats(volume, coords, threshold):
+    """Reference: slice each ROI box out and reduce it on its own"""
+    box = volume[coords[0]:coords[1], coords[2]:coords[3], coords[4]:coords[5]].astype(np.float64)
+    return box.size, box.mean(), box.std(), int((box > threshold).sum())
+
+
+def test_overlapping_boxes_match_per_region_loop():
+    volume = np.random.default_rng(0).uniform(0, 255, (200, 130, 90)).astype(np.float32)
+    stats = RegionStatistics().compute(volume, BRAIN_REGIONS, tissue_threshold=100.0, voxel_volume_mm3=0.5)
+
+    assert list(stats) == list(BRAIN_REGIONS)
+    for name, info in BRAIN_REGIONS.items():
+        count, mean, std, tissue = _naive_box_stats(volume, info['roi_coords'], 100.0)
+        assert stats[name]['voxel_count'] == count
+        assert stats[name]['mean_intensity'] == pytest.approx(mean, rel=1e-9)
+        assert stats[name]['std_intensity'] == pytest.approx(std, rel=1e-6)
+        assert stats[name]['tissue_voxels'] == tissue
+        assert stats[name]['tissue_volume_mm3'] == tissue * 0.5
+
+
+def test_boxes_are_clipped_to_small_volumes():
+    label_map = box_label_map(BRAIN_REGIONS, (64, 64, 32))
+    stats = RegionStatistics().compute(np.ones((64, 64, 32)), label_map=label_map, tissue_threshold=0.0)
+
+    assert stats['hippocampus_left']['voxel_count'] == 14 * 24 * 2
+    assert stats['hippocampus_right']['voxel_count'] == 0
+    assert stats['hippocampus_right']['mean_intensity'] is None
+
+
+def test_atlas_labels_are_used_directly():
+    rng = np.random.default_rng(1)
+    atlas = rng.integers(0, 300, (40, 40, 40))
+    volume = rng.normal(100, 20, atlas.shape)
+    label_map = atlas_label_map(atlas, {7: 'insula'})
+    stats = RegionStatistics().compute(volume, label_map=label_map, tissue_threshold=100.0)
+
+    assert len(stats) == len(np.unique(atlas[atlas > 0]))
+    for label, name in [(7, 'insula'), (299, 'label_299')]:
+        voxels = volume[atlas == label]
+        assert stats[name]['voxel_count'] == voxels.size
+        assert stats[name]['mean_intensity'] == pytest.approx(voxels.mean())
+        assert stats[name]['std_intensity'] == pytest.approx(voxels.std())
+        assert stats[name]['tissue_voxels'] == int((voxels > 100.0).sum())
+
+
+def test_label_maps_are_cached_per_shape():
+    engine = RegionStatistics(max_cached_maps=2)
+    first = engine.label_map(BRAIN_REGIONS, (64, 64, 64))
+
+    assert engine.label_map(BRAIN_REGIONS, (64, 64, 64)) is first
+    engine.label_map(BRAIN_REGIONS, (32, 32, 32))
+    engine.label_map(BRAIN_REGIONS, (16, 16, 16))
+    assert engine.label_map(BRAIN_REGIONS, (64, 64, 64)) is not first
+
+
+def test_otsu_separates_two_intensity_classes():
+    volume = np.concatenate([np.full(5000, 10.0), np.full(5000, 200.0)])
+    assert 10.0 < otsu_threshold(volume, sample_step=1) < 200.0
+
+
+@pytest.mark.parametrize("suffix", [".nii", ".nii.gz"])
+def test_lazy_volumes_are_read_by_region_block(tmp_path, monkeypatch, suffix):
+    path = write_nifti(str(tmp_path / f"scan{suffix}"), make_phantom((180, 130, 90), seed=3))
+    eager = np.asarray(LazyNiftiVolume(path))
+    volume = LazyNiftiVolume(path)
+    reads = []
+    original = LazyNiftiVolume.__getitem__
+
+    def recording_getitem(self, key):
+        data = original(self, key)
+        reads.append(data.size)
+        return data
+
+    monkeypatch.setattr(LazyNiftiVolume, "__getitem__", recording_getitem)
+    monkeypatch.setattr(LazyNiftiVolume, "__array__", lambda *args, **kwargs: pytest.fail("volume materialized"))
+
+    threshold = otsu_threshold(volume)
+    assert abs(threshold - otsu_threshold(eager)) <= 2.0
+    assert max(reads) <= 180 * 130 * volume.chunk_slices
+    stats = RegionStatistics().compute(volume, BRAIN_REGIONS, tissue_threshold=threshold)
+    assert stats == RegionStatistics().compute(eager, BRAIN_REGIONS, tissue_threshold=threshold)
+    assert max(reads) < eager.size
+
+
+def test_comparison_reports_region_statistics(processor):
+    rng = np.random.default_rng(2)
+    baseline = rng.uniform(0, 255, (180, 130, 90)).astype(np.float32)
+    followup = baseline.copy()
+    followup[50:80, 40:70, 30:50] = 0  # hippocampus_left box loses all tissue
+
+    result = processor.compute_region_statistics(baseline, followup)
+
+    assert result['hippocampus_left']['tissue_volume_change_percent'] == pytest.approx(-100.0)
+    right = result['hippocampus_right']
+    assert right['followup']['mean_intensity'] == pytest.approx(right['baseline']['mean_intensity'])
+    assert processor.compute_region_statistics(baseline[:, :, 0], followup[:, :, 0]) is None
+
+
+def test_tissue_volume_uses_the_scan_voxel_size(processor, tmp_path):
+    phantom = make_phantom((180, 130, 90), seed=4)
+    fine = write_nifti(str(tmp_path / "fine.nii"), phantom)
+    coarse = write_nifti(str(tmp_path / "coarse.nii"), phantom, spacing=(1.0, 1.0, 2.5))
+
+    stats = [processor.scan_region_statistics(*processor.load_scan(path)) for path in (fine, coarse)]
+
+    for name in BRAIN_REGIONS:
+        assert stats[1][name]['tissue_voxels'] == stats[0][name]['tissue_voxels']
+        assert stats[1][name]['tissue_volume_mm3'] == pytest.approx(stats[0][name]['tissue_volume_mm3'] * 2.5)
@@ -0,0 +1,128 @@
+"""
+Tests for coarse-to-fine registration and the transform cache
+"""
+
+from unittest import mock
+
+import numpy as np
+import pytest
+from scipy import ndimage
+
+import registration
+from feature_cache import FeatureCache
+from lazy_volume import LazyNiftiVolume
+from phantoms import make_asymmetric_phantom, write_nifti
+from registration import Registration, Transform, register, resample
+
+SHAPE = (96, 96, 64)
+
+
+def _phantom(seed: int = 1) -> np.ndarray:
+    return make_asymmetric_phantom(SHAPE, seed=seed, max_value=250.0).astype(np.uint8)
+
+
+def _moved(fixed: np.ndarray, truth: Transform, seed: int = 9) -> np.ndarray:
+    """The fixed volume seen through `truth` (moving index = truth(fixed index)), with fresh noise"""
+    inverse = np.linalg.inv(truth.matrix)
+    moved = ndimage.affine_transform(fixed.astype(np.float32), inverse, -inverse @ truth.offset, order=1)
+    moved += np.random.default_rng(seed).normal(0, 6, size=fixed.shape)
+    return np.clip(moved, 0, 255).astype(np.uint8)
+
+
+def _truth(matrix: np.ndarray, shift) -> Transform:
+    centre = (np.asarray(SHAPE, dtype=np.float64) - 1) / 2
+    return Transform(matrix, centre + np.asarray(shift, dtype=np.float64) - matrix @ centre)
+
+
+def _corner_error(found: Transform, truth: Transform) -> float:
+    corners = np.array(np.meshgrid(*[(0, n - 1) for n in SHAPE], indexing='ij')).reshape(3, -1)
+    difference = (found.matrix - truth.matrix) @ corners + (found.offset - truth.offset)[:, np.newaxis]
+    return float(np.max(np.linalg.norm(difference, axis=0)))
+
+
+def test_rigid_registration_recovers_shift_and_rotation():
+    fixed = _phantom()
+    truth = _truth(registration._euler_matrix(np.radians([2.0, -3.0, 5.0])), [6.0, -4.5, 3.0])
+    moving = _moved(fixed, truth)
+
+    found = register(fixed, moving, 'rigid')
+    assert _corner_error(found, truth) < 0.5
+    assert found.describe(SHAPE)['rotation_degrees'] == pytest.approx(np.degrees(np.arccos(
+        (np.trace(truth.matrix) - 1) / 2)), abs=0.3)
+
+    before = np.abs(moving.astype(np.float32) - fixed).mean()
+    after = np.abs(resample(moving, found, SHAPE).astype(np.float32) - fixed).mean()
+    assert after < 0.7 * before
+
+
+def test_affine_registration_recovers_scaling():
+    fixed = _phantom()
+    matrix = registration._euler_matrix(np.radians([0.0, 2.0, -2.0])) @ np.diag([1.04, 0.97, 1.02])
+    truth = _truth(matrix, [3.0, 2.0, -1.5])
+    moving = _moved(fixed, truth)
+
+    assert _corner_error(register(fixed, moving, 'affine'), truth) < 0.75
+    assert _corner_error(register(fixed, moving, 'rigid'), truth) > 1.5
+
+
+def test_resampling_in_slabs_matches_whole_volume():
+    moving = _phantom()
+    truth = _truth(registration._euler_matrix(np.radians([4.0, -6.0, 8.0])), [7.0, -5.0, 9.0])
+    whole = ndimage.affine_transform(moving.astype(np.float32), truth.matrix, truth.offset, output_shape=SHAPE,
+                                     order=1, cval=0.0)
+    expected = np.clip(np.rint(whole), 0, 255).astype(np.uint8)
+
+    np.testing.assert_array_equal(resample(moving, truth, SHAPE, chunk_slices=7), expected)
+
+
+def test_lazy_volumes_are_registered_without_loading_them(tmp_path, monkeypatch):
+    fixed = _phantom()
+    truth = _truth(registration._euler_matrix(np.radians([0.0, 0.0, 3.0])), [4.0, -3.0, 2.0])
+    moving = _moved(fixed, truth)
+    paths = [write_nifti(str(tmp_path / f"{name}.nii"), volume, dtype=np.uint8)
+             for name, volume in (("fixed", fixed), ("moving", moving))]
+    monkeypatch.setattr(LazyNiftiVolume, "__array__", lambda *args, **kwargs: pytest.fail("volume materialized"))
+    lazy_fixed, lazy_moving = (LazyNiftiVolume(path, dtype=None) for path in paths)
+
+    found = register(lazy_fixed, lazy_moving, 'rigid')
+    assert _corner_error(found, truth) < 0.75
+    np.testing.assert_array_equal(resample(lazy_moving, found, SHAPE), resample(moving, found, SHAPE))
+
+
+def test_transforms_are_cached_per_pair():
+    fixed = _phantom()
+    moving = _moved(fixed, _truth(np.eye(3), [2.0, 0.0, -1.0]))
+    aligner = Registration('rigid', transform_cache=FeatureCache())
+
+    first, cached = aligner.transform(fixed, moving, 'hash-a', 'hash-b')
+    assert not cached
+    with mock.patch.object(registration, 'register') as run:
+        second, cached = aligner.transform(fixed, moving, 'hash-a', 'hash-b')
+    run.assert_not_called()
+    assert cached and np.allclose(second.as_array(), first.as_array())
+    assert aligner.transform_key('hash-a', 'hash-b') != aligner.transform_key('hash-b', 'hash-a')
+
+    with pytest.raises(ValueError):
+        Registration('elastic')
+    with pytest.raises(ValueError):
+        register(fixed[:, :, 0], moving[:, :, 0])
+
+
+def test_processor_aligns_the_follow_up(processor):
+    fixed = _phantom()
+    moving = _moved(fixed, _truth(np.eye(3), [4.0, -3.0, 2.0]))
+
+    aligned, hashes, summary = processor.align_scans(fixed, moving, ['base', 'follow-up'])
+    assert summary['resampled'] and summary['mode'] == 'rigid'
+    assert summary['translation_voxels'] == pytest.approx([4.0, -3.0, 2.0], abs=0.3)
+    assert hashes[0] == 'base' and hashes[1] != 'follow-up'
+    assert aligned.shape == fixed.shape and aligned.dtype == np.uint8
+
+    # The same pair again: transform from the cache, same derived hash
+    _, again, summary = processor.align_scans(fixed, moving, ['base', 'follow-up'])
+    assert summary['cached_transform'] and again == hashes
+
+    # Scans that already line up are passed through untouched
+    same = _phantom(seed=2)
+    unchanged, hashes, summary = processor.align_scans(fixed, same, ['base', 'same-position'])
+    assert not summary['resampled'] and unchanged is same and hashes == ['base', 'same-position']
@@ -0,0 +1,59 @@
+"""
+Tests for longitudinal series comparison
+"""
+
+from unittest import mock
+
+import pytest
+
+from phantoms import make_phantom, write_nifti
+
+
+def _write_series(tmp_path, count):
+    return [
+        write_nifti(str(tmp_path / f"scan{i}.nii"), make_phantom((180, 130, 60), seed=100 + i))
+        for i in range(count)
+    ]
+
+
+def test_each_scan_is_processed_once(processor, tmp_path):
+    paths = _write_series(tmp_path, 4)
+    with mock.patch.object(processor, "load_scan", wraps=processor.load_scan) as load, \
+            mock.patch.object(processor, "extract_brain_slices", wraps=processor.extract_brain_slices) as slices, \
+            mock.patch.object(processor.backend, "analyze", wraps=processor.backend.analyze) as analyze:
+        result = processor.process_series_comparison(paths)
+
+    assert load.call_count == 4
+    assert slices.call_count == 4
+    assert analyze.call_count == 1
+    assert [scan["path"] for scan in result["scans"]] == paths
+
+
+def test_scans_share_forward_passes(processor, tmp_path, monkeypatch):
+    paths = [
+        write_nifti(str(tmp_path / f"scan{i}.nii"), make_phantom((96, 96, 40), seed=200 + i))
+        for i in range(4)
+    ]
+    # Three scans of 20 sampled slices fit one batch
+    monkeypatch.setattr(processor, "max_batch_size", 64)
+    with mock.patch.object(processor.backend, "extract", wraps=processor.backend.extract) as extract:
+        result = processor.process_series_comparison(paths)
+
+    assert len(result["scans"]) == 4
+    assert extract.call_count == 2
+
+
+def test_consecutive_and_baseline_deltas(processor, tmp_path):
+    paths = _write_series(tmp_path, 4)
+    result = processor.process_series_comparison(paths)
+
+    consecutive = [(d["from_index"], d["to_index"]) for d in result["consecutive_deltas"]]
+    baseline = [(d["from_index"], d["to_index"]) for d in result["baseline_deltas"]]
+    assert consecutive == [(0, 1), (1, 2), (2, 3)]
+    assert baseline == [(0, 1), (0, 2), (0, 3)]
+
+    delta = result["baseline_deltas"][2]
+    before = result["scans"][0]["region_statistics"]["frontal_cortex"]["tissue_volume_mm3"]
+    after = result["scans"][3]["region_statistics"]["frontal_cortex"]["tissue_volume_mm3"]
+    assert delta["tissue_volume_change_percent"]["frontal_cortex"] == pytest.approx((after - before) / before * 100)
+    assert set(delta["volumetric_analysis"]) == set(processor.brain_regions)
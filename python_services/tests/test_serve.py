@@ -0,0 +1,39 @@
+"""
+Tests for the multi-worker production launcher
+"""
+
+import os
+
+import numpy as np
+
+import config
+import serve
+from feature_cache import FeatureCache
+
+
+def test_threads_are_partitioned_between_workers(monkeypatch):
+    monkeypatch.setattr(config, "TORCH_THREADS_PER_WORKER", 0)
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    assert serve.threads_per_worker(4) == 2
+    assert serve.threads_per_worker(16) == 1
+    monkeypatch.setattr(config, "TORCH_THREADS_PER_WORKER", 3)
+    assert serve.threads_per_worker(4) == 3
+
+
+def test_feature_cache_reconnects_in_forked_worker(tmp_path):
+    cache = FeatureCache(cache_dir=str(tmp_path), memory_entries=0)
+    cache.put("parent", np.ones((1, 4), dtype=np.float32))
+
+    pid = os.fork()
+    if pid == 0:
+        # Child: must use its own SQLite connection for both reads and writes
+        try:
+            ok = cache.get("parent") is not None
+            cache.put("child", np.zeros((1, 4), dtype=np.float32))
+        except Exception:
+            ok = False
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert cache.get("child") is not None
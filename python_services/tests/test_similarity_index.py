@@ -0,0 +1,188 @@
+"""
+Tests for the scan similarity index and /similar-scans
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from phantoms import make_phantom, write_nifti
+from similarity_index import SimilarityIndex
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _clustered(count, dimension=64, clusters=8, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension))
+    return (centers[rng.integers(0, clusters, count)] + 0.3 * rng.standard_normal((count, dimension))).astype(np.float32)
+
+
+def test_exact_search_filters_and_replacements(tmp_path):
+    vectors = _clustered(50)
+    index = SimilarityIndex(str(tmp_path), dimension=64, approximate_min_rows=0)
+    index.use_version("v1")
+    for i, vector in enumerate(vectors):
+        index.add(f"mr-{i}", vector, content_hash=f"hash-{i}", patient_id=f"p{i % 5}", hospital_id="h1")
+    assert not index.add("mr-0", vectors[0], content_hash="hash-0", patient_id="p0", hospital_id="h1")["added"]
+
+    found = index.search(vectors[7] * 3, k=3, content_hash="hash-7")
+    assert found["mode"] == "exact" and found["scanned"] == 50
+    top = found["results"][0]
+    assert top["scan_id"] == "mr-7" and top["similarity"] == pytest.approx(1.0) and top["duplicate"]
+    assert [r["similarity"] for r in found["results"]] == sorted((r["similarity"] for r in found["results"]), reverse=True)
+
+    by_patient = index.search(vectors[7], k=20, patient_id="p2", exclude="mr-7")
+    assert len(by_patient["results"]) == 9
+    assert {r["patient_id"] for r in by_patient["results"]} == {"p2"}
+    assert index.search(vectors[7], patient_id="unknown")["results"] == []
+
+    # Re-adding a scan ID with new content replaces its entry, here and in other processes' views
+    other = SimilarityIndex(str(tmp_path), dimension=64)
+    other.refresh()
+    assert len(other) == 50
+    index.add("mr-7", vectors[8], content_hash="hash-new", patient_id="p2", hospital_id="h1")
+    assert other.entry("mr-7")["content_hash"] == "hash-new" and len(other) == 50
+    assert other.search(vectors[7], k=1, content_hash="hash-7")["results"][0]["scan_id"] != "mr-7"
+    assert np.allclose(other.vector("mr-7"), vectors[8] / np.linalg.norm(vectors[8]), atol=1e-6)
+
+    # Features of another model version are not comparable: the index starts over
+    other.use_version("v2")
+    assert index.search(vectors[0])["results"] == [] and len(index) == 0
+    with pytest.raises(ValueError):
+        SimilarityIndex(str(tmp_path), dimension=32)
+
+
+def test_search_rescores_rows_changed_while_scoring(tmp_path, monkeypatch):
+    vectors = _clustered(20)
+    index = SimilarityIndex(str(tmp_path), dimension=64, approximate_min_rows=0)
+    index.use_version("v1")
+    for i, vector in enumerate(vectors):
+        index.add(f"mr-{i}", vector, content_hash=f"hash-{i}")
+    rank = SimilarityIndex._rank
+    calls = []
+
+    def rank_then_replace(*args, **kwargs):
+        best = rank(*args, **kwargs)
+        if not calls:
+            # Another request replaces the best match before this search reads its metadata
+            index.add("mr-3", vectors[10], content_hash="hash-new")
+            index.refresh()
+        calls.append(best)
+        return best
+
+    monkeypatch.setattr(SimilarityIndex, "_rank", staticmethod(rank_then_replace))
+    found = index.search(vectors[3], k=1)
+
+    assert len(calls) == 2
+    top = found["results"][0]
+    assert top["scan_id"] != "mr-3" or top["content_hash"] == "hash-new"
+
+
+def test_stats_do_not_wait_for_the_index(tmp_path, monkeypatch):
+    index = SimilarityIndex(str(tmp_path), dimension=64, approximate_min_rows=0)
+    writer = SimilarityIndex(str(tmp_path), dimension=64, approximate_min_rows=0)
+    for i, vector in enumerate(_clustered(5)):
+        writer.add(f"mr-{i}", vector)
+    monkeypatch.setattr("similarity_index.STATS_REFRESH_S", 0.0)
+
+    # A long search or training holds the lock: health and metrics still answer from the cached view
+    with index._lock:
+        started = time.perf_counter()
+        assert len(index) == 0 and index.stats()["scans"] == 0
+        assert time.perf_counter() - started < 0.5
+    # ...which a background thread brings up to date
+    deadline = time.monotonic() + 10
+    while len(index) < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(index) == 5 and index.stats()["view_age_s"] is not None
+
+
+def test_ivf_search_matches_exact_search(tmp_path):
+    vectors = _clustered(3000, clusters=40, seed=1)
+    index = SimilarityIndex(str(tmp_path), dimension=64, dtype="float16", approximate_min_rows=2000, nprobe=4)
+    for i, vector in enumerate(vectors):
+        index.add(f"mr-{i}", vector, content_hash=f"hash-{i}", hospital_id=f"h{i % 3}")
+
+    # Crossing approximate_min_rows trains the quantizer in the background
+    deadline = time.monotonic() + 30
+    while index.stats()["ivf_lists"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert index.stats()["ivf_lists"] >= 16
+
+    recall = []
+    for i in range(0, 3000, 300):
+        exact = index.search(vectors[i], k=10, mode="exact")
+        approximate = index.search(vectors[i], k=10)
+        assert approximate["mode"] == "approximate" and approximate["scanned"] < 3000
+        assert approximate["results"][0]["scan_id"] == f"mr-{i}"
+        recall.append(len({r["scan_id"] for r in exact["results"]} & {r["scan_id"] for r in approximate["results"]}))
+    assert np.mean(recall) >= 9
+
+    # Filtered candidate sets below the threshold are ranked exactly
+    filtered = index.search(vectors[0], k=5, hospital_id="h0")
+    assert filtered["mode"] == "exact" and filtered["scanned"] == 1000
+
+
+def test_processed_scans_are_indexed(processor, tmp_path):
+    index = SimilarityIndex(str(tmp_path / "index"))
+    processor.similarity_index = index
+    try:
+        index.use_version(processor.feature_version)
+        paths = [write_nifti(str(tmp_path / f"scan{seed}.nii"), make_phantom((96, 96, 40), seed=seed))
+                 for seed in (21, 22)]
+        result = processor.process_single_scan(paths[0], index_as={"scan_id": "mr-1", "patient_id": "p1"})
+        processor.process_single_scan(paths[1], index_as={"patient_id": "p2"})
+        assert result["scan_id"] == "mr-1" and "similarity_index" in result["stage_timings_ms"]
+        processor.process_single_scan(paths[1])  # not indexed
+
+        found = index.search(processor.scan_embedding(paths[0]), k=5)
+        assert len(found["results"]) == 2
+        assert found["results"][0]["scan_id"] == "mr-1" and found["results"][0]["duplicate"]
+        assert found["results"][1]["patient_id"] == "p2" and len(found["results"][1]["scan_id"]) == 64
+    finally:
+        processor.similarity_index = None
+
+
+def test_similar_scans_endpoint():
+    env = dict(os.environ, MRSINA_MODEL_LOADING="lazy", MRSINA_FEATURE_CACHE_DIR="",
+               MRSINA_HEATMAP_CACHE_DIR="", MRSINA_REGISTRATION_CACHE_DIR="", MRSINA_LONGITUDINAL_STATE_DIR="",
+               MRSINA_TASK_STORE_DIR="", MRSINA_SIMILARITY_INDEX_DIR="")
+    code = (
+        "import warnings; warnings.simplefilter('ignore')\n"
+        "import numpy as np\n"
+        "from fastapi.testclient import TestClient\n"
+        "import main\n"
+        "rng = np.random.default_rng(0)\n"
+        "base = rng.standard_normal(2048)\n"
+        "for i in range(6):\n"
+        "    main.similarity_index.add(f'mr-{i}', base + i * rng.standard_normal(2048), content_hash=f'h{i}',\n"
+        "                              patient_id='p1' if i % 2 else 'p2')\n"
+        "import threading\n"
+        "lookup_threads = set()\n"
+        "for name in ('entry', 'vector'):\n"
+        "    lookup = getattr(main.similarity_index, name)\n"
+        "    def traced(*args, lookup=lookup):\n"
+        "        lookup_threads.add(threading.current_thread().name.split('_')[0])\n"
+        "        return lookup(*args)\n"
+        "    setattr(main.similarity_index, name, traced)\n"
+        "client = TestClient(main.app)\n"
+        "print(client.get('/similar-scans', params={'scan_id': 'missing'}).status_code)\n"
+        "print(client.get('/similar-scans', params={'scan_id': 'mr-0', 'mode': 'fast'}).status_code)\n"
+        "body = client.get('/similar-scans', params={'scan_id': 'mr-0', 'k': 3, 'patient_id': 'p1'}).json()\n"
+        "print(body['query']['scan_id'], body['search']['mode'], body['search']['indexed_scans'])\n"
+        "print(' '.join(r['scan_id'] for r in body['results']))\n"
+        "print(' '.join(sorted(lookup_threads)))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], cwd=SERVICE_DIR, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    missing, bad_mode, summary, results, lookup_threads = output.splitlines()
+    assert missing == "404" and bad_mode == "400"
+    assert summary == "mr-0 exact 6"
+    assert results == "mr-1 mr-3 mr-5"
+    # Index lookups run on the index executor, not on the event loop
+    assert lookup_threads == "mr-index"
@@ -0,0 +1,148 @@
+"""
+Tests for the durable task store shared by job engines
+"""
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from job_engine import JobEngine
+from task_store import (
+    QueueFullError, SQLiteTaskStore, STATUS_DONE, STATUS_FAILED, STATUS_QUEUED, STATUS_RUNNING, TaskStore
+)
+
+
+def _wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return
+        time.sleep(0.01)
+    pytest.fail("condition not reached")
+
+
+def test_store_implementations_must_cover_the_interface():
+    class PartialStore(TaskStore):
+        def create(self, task_id, payload, max_queued):
+            pass
+
+    with pytest.raises(TypeError):
+        TaskStore()
+    with pytest.raises(TypeError, match="claim"):
+        PartialStore()
+
+
+def test_tasks_survive_reopening(tmp_path):
+    store = SQLiteTaskStore(str(tmp_path))
+    store.create("task_a", {"mr_id": "mr-1", "file_path": "/scans/a.nii"}, max_queued=4)
+    task = store.claim("host:1:0")
+    assert task["status"] == STATUS_RUNNING and task["attempts"] == 1
+    assert store.complete("task_a", "host:1:0", STATUS_DONE, result={"slices": 20}, processing_seconds=1.5)
+    assert not store.complete("task_a", "host:1:0", STATUS_FAILED, error="late")
+
+    reopened = SQLiteTaskStore(str(tmp_path)).get("task_a")
+    assert reopened["status"] == STATUS_DONE and reopened["mr_id"] == "mr-1"
+    assert reopened["result"] == {"slices": 20} and reopened["processing_seconds"] == 1.5
+    assert reopened["created_at"] <= reopened["started_at"] <= reopened["completed_at"]
+    with sqlite3.connect(str(tmp_path / "tasks.sqlite")) as db:
+        assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    with pytest.raises(QueueFullError):
+        store.create("task_b", {}, max_queued=0)
+    assert store.get("task_b") is None
+
+
+def test_engines_sharing_a_store_run_each_task_once(tmp_path):
+    runs = []
+    lock = threading.Lock()
+
+    def handler(task):
+        with lock:
+            runs.append(task["task_id"])
+        time.sleep(0.005)
+        return {"value": task["value"]}
+
+    # Separate connections to one database, as in separate server workers
+    engines = [JobEngine(handler, max_workers=2, store=SQLiteTaskStore(str(tmp_path)), poll_interval=0.01)
+               for _ in range(2)]
+    for engine in engines:
+        engine.start()
+    try:
+        task_ids = [engines[i % 2].submit({"value": i}) for i in range(20)]
+        # Every engine answers for every task, wherever it was submitted
+        _wait_until(lambda: all(engines[1].get(task_id)["status"] == STATUS_DONE for task_id in task_ids))
+    finally:
+        for engine in engines:
+            engine.shutdown()
+
+    assert sorted(runs) == sorted(task_ids)
+    assert [engines[0].get(task_id)["result"]["value"] for task_id in task_ids] == list(range(20))
+    assert engines[0].stats()["finished"] == 20
+
+
+def test_orphaned_tasks_are_requeued_then_failed(tmp_path):
+    store = SQLiteTaskStore(str(tmp_path))
+    dead_worker = f"{socket.gethostname()}:999999999:0"
+    for task_id in ("task_a", "task_b"):
+        store.create(task_id, {}, max_queued=4)
+    store.claim(dead_worker)
+    store.claim("other-host:1:0")
+    engine = JobEngine(lambda task: {}, store=store, max_attempts=2)
+
+    engine.maintain(force=True)
+    assert store.get("task_a")["status"] == STATUS_QUEUED
+    # Workers on other hosts cannot be checked and are left alone
+    assert store.get("task_b")["status"] == STATUS_RUNNING
+
+    store.claim(dead_worker)
+    engine.maintain(force=True)
+    failed = store.get("task_a")
+    assert failed["status"] == STATUS_FAILED and failed["attempts"] == 2
+
+
+def test_freshly_claimed_tasks_survive_maintenance(tmp_path):
+    store = SQLiteTaskStore(str(tmp_path))
+    store.create("task_a", {}, max_queued=4)
+    store.claim("other-host:1:live:0")
+    engine = JobEngine(lambda task: {}, store=store)
+
+    engine.maintain(force=True)
+
+    assert store.get("task_a")["status"] == STATUS_RUNNING
+
+
+def test_expired_leases_are_requeued_even_if_the_pid_is_reused(tmp_path):
+    store = SQLiteTaskStore(str(tmp_path))
+    # A previous process that had this process's PID
+    stale_worker = f"{socket.gethostname()}:{os.getpid()}:0123456789ab:0"
+    for task_id in ("task_a", "task_b"):
+        store.create(task_id, {}, max_queued=4)
+    store.claim(stale_worker)
+    store.claim("host:1:live:0")
+    engine = JobEngine(lambda task: {}, store=store, lease_timeout=0.2)
+
+    time.sleep(0.3)
+    store.heartbeat(["host:1:live:0"])
+    engine.maintain(force=True)
+
+    assert store.get("task_a")["status"] == STATUS_QUEUED
+    assert store.get("task_b")["status"] == STATUS_RUNNING
+
+
+def test_finished_tasks_expire(tmp_path):
+    store = SQLiteTaskStore(str(tmp_path))
+    for task_id in ("task_a", "task_b"):
+        store.create(task_id, {}, max_queued=4)
+    store.claim("host:1:0")
+    store.complete("task_a", "host:1:0", STATUS_DONE, result={})
+
+    assert store.cleanup(ttl_seconds=3600) == 0
+    time.sleep(0.01)
+    assert store.cleanup(ttl_seconds=0) == 1
+    assert store.get("task_a") is None
+    # Queued tasks never expire
+    assert store.counts()[STATUS_QUEUED] == 1
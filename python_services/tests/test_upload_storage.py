@@ -0,0 +1,87 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+from starlette.requests import Request
+
+from upload_storage import InvalidUploadError, UploadTooLargeError, receive_upload, upload_suffix
+
+ALLOWED = ['.dcm', '.zip', '.nii', '.nii.gz', '.png']
+BOUNDARY = 'mrsinaboundary'
+
+
+def multipart_body(data: bytes, filename: str = 'scan.nii.gz', field: str = 'file') -> bytes:
+    return (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="mr_id"\r\n\r\nmr-1\r\n'
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode() + data + f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+
+def make_request(body: bytes, chunk_size: int = 4096, declared_length=None):
+    """A request whose body arrives in chunk_size pieces; `received` counts the bytes read"""
+    headers = [(b'content-type', f'multipart/form-data; boundary={BOUNDARY}'.encode())]
+    if declared_length is not None:
+        headers.append((b'content-length', str(declared_length).encode()))
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    received = []
+
+    async def receive():
+        chunk = chunks.pop(0)
+        received.append(len(chunk))
+        return {'type': 'http.request', 'body': chunk, 'more_body': bool(chunks)}
+
+    return Request({'type': 'http', 'method': 'POST', 'headers': headers}, receive), received
+
+
+def test_upload_suffix_keeps_only_the_extension():
+    assert upload_suffix('../../etc/brain.NII.GZ', ALLOWED) == '.nii.gz'
+    assert upload_suffix('series.zip', ALLOWED) == '.zip'
+    assert upload_suffix('notes.txt', ALLOWED) is None
+    assert upload_suffix(None, ALLOWED) is None
+
+
+def test_receive_upload_streams_and_hashes_the_file_part(tmp_path):
+    data = os.urandom(300_000)
+    request, _ = make_request(multipart_body(data, filename='../scan.nii.gz'))
+    stored = asyncio.run(receive_upload(request, 'file', ALLOWED, scratch_dir=str(tmp_path), chunk_size=64 * 1024))
+    try:
+        assert stored.size == len(data)
+        assert stored.sha256 == hashlib.sha256(data).hexdigest()
+        assert os.path.dirname(stored.path) == str(tmp_path)
+        assert stored.path.endswith('.nii.gz') and 'scan' not in os.path.basename(stored.path)
+        with open(stored.path, 'rb') as f:
+            assert f.read() == data
+    finally:
+        os.unlink(stored.path)
+
+
+def test_receive_upload_enforces_limit_while_streaming(tmp_path):
+    # No declared length, so the limit can only be detected mid-stream
+    body = multipart_body(b'x' * 50_000, filename='scan.dcm')
+    request, received = make_request(body, chunk_size=1024)
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(receive_upload(request, 'file', ALLOWED, scratch_dir=str(tmp_path), max_bytes=4096))
+    assert sum(received) < 8192
+    assert os.listdir(tmp_path) == []
+
+
+def test_receive_upload_rejects_declared_oversize_before_reading(tmp_path):
+    request, received = make_request(multipart_body(b'x' * 10), declared_length=10_000_000)
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(receive_upload(request, 'file', ALLOWED, scratch_dir=str(tmp_path), max_bytes=4096))
+    assert received == []
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize('body', [
+    multipart_body(b'data', filename='notes.txt'),
+    multipart_body(b'data', field='attachment'),
+    multipart_body(b'data')[:-40],
+])
+def test_receive_upload_rejects_invalid_uploads(tmp_path, body):
+    request, _ = make_request(body, chunk_size=16)
+    with pytest.raises(InvalidUploadError):
+        asyncio.run(receive_upload(request, 'file', ALLOWED, scratch_dir=str(tmp_path)))
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,53 @@
+"""
+Tests for the offline weight bundle
+"""
+
+import numpy as np
+import pytest
+import torch
+
+import brain_mri_processor
+from weight_bundle import BundleError, load_bundle, write_bundle
+
+
+@pytest.fixture(scope="module")
+def bundle_path(processor, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("weights") / "resnet50.pt")
+    write_bundle(path, processor.feature_extractor.state_dict(), brain_mri_processor.MODEL_VERSION)
+    return path
+
+
+def test_bundle_round_trip_matches_source_model(processor, bundle_path):
+    model = brain_mri_processor.load_feature_extractor(bundle_path)
+    conv = model.conv1.weight
+    assert conv.device.type == "cpu"
+    assert conv.is_contiguous(memory_format=torch.channels_last)
+
+    batch = torch.rand(2, 3, 224, 224)
+    with torch.inference_mode():
+        expected = processor.feature_extractor(batch)
+        actual = model(batch)
+    torch.testing.assert_close(actual, expected)
+
+
+def test_processor_builds_from_bundle_without_download(bundle_path):
+    processor = brain_mri_processor.BrainMRIProcessor(max_batch_size=4, weights_path=bundle_path)
+    features = processor.extract_features(processor.extract_brain_slices(np.zeros((64, 64), dtype=np.uint8)))
+    assert features.shape == (1, 2048)
+
+
+def test_corrupted_bundle_is_rejected(bundle_path, tmp_path):
+    import shutil
+    broken = str(tmp_path / "broken.pt")
+    shutil.copy(bundle_path, broken)
+    shutil.copy(bundle_path + ".json", broken + ".json")
+    with open(broken, "r+b") as f:
+        f.seek(-10, 2)
+        f.write(b"\0" * 10)
+    with pytest.raises(BundleError):
+        load_bundle(broken)
+
+
+def test_bundle_for_another_model_version_is_rejected(bundle_path):
+    with pytest.raises(BundleError):
+        load_bundle(bundle_path, expected_version="ResNet50-BrainMRI-v0.1")
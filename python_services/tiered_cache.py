@@ -0,0 +1,175 @@
+"""
+Two-tier key/value cache shared by the feature, transform and heatmap caches
+An in-memory LRU in front of an on-disk store of one file per entry, indexed
+by SQLite (key, size, last access) so that the disk tier can be bounded in
+bytes and evicted least recently used first across processes. Subclasses
+only define how an entry is serialized and how the memory tier is bounded
+"""
+
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Optional
+
+from sqlite_utils import reconnect_after_fork
+
+logger = logging.getLogger(__name__)
+
+
+class TieredCache(ABC):
+    """
+    Memory LRU + SQLite-indexed disk cache
+    Subclasses implement _read_entry/_write_entry for their payload and set
+    the memory budget with _memory_limit (entries by default, or any unit via
+    _weigh; 0 disables the tier). Without a cache directory only the memory tier is used
+    """
+
+    entry_suffix = '.bin'
+    description = 'cache'
+
+    def __init__(self, cache_dir: Optional[str] = None, disk_max_bytes: int = 512 * 1024 * 1024):
+        self.disk_max_bytes = max(0, disk_max_bytes)
+        self.cache_dir = cache_dir
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+        }
+
+        self._db = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._connect()
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)'
+            )
+            self._db.commit()
+            reconnect_after_fork(self, type(self)._connect)
+
+    def _connect(self):
+        self._db = sqlite3.connect(os.path.join(self.cache_dir, 'index.sqlite'), check_same_thread=False, timeout=30)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}{self.entry_suffix}")
+
+    @abstractmethod
+    def _read_entry(self, path: str) -> Any:
+        """Load one entry from disk (OSError/ValueError mark it unreadable)"""
+
+    @abstractmethod
+    def _write_entry(self, f: BinaryIO, value: Any):
+        """Serialize one entry to an open file"""
+
+    def _memory_limit(self) -> int:
+        """Budget of the memory tier, in the unit of _weigh()"""
+        return 0
+
+    def _weigh(self, value: Any) -> int:
+        """Share of the memory budget one entry takes"""
+        return 1
+
+    def _remember(self, key: str, value: Any):
+        """Insert into the memory tier, evicting least recently used entries"""
+        limit = self._memory_limit()
+        weight = self._weigh(value)
+        if limit == 0 or weight > limit:
+            return
+        if key in self._memory:
+            self._memory_used -= self._weigh(self._memory.pop(key))
+        self._memory[key] = value
+        self._memory_used += weight
+        while self._memory_used > limit:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= self._weigh(evicted)
+            self._counters['memory_evictions'] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self._counters['memory_hits'] += 1
+                return value
+
+            if self._db is not None:
+                row = self._db.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    try:
+                        value = self._read_entry(self._entry_path(key))
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"Dropping unreadable {self.description} entry {key}: {str(e)}")
+                        self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                        self._db.commit()
+                    else:
+                        self._db.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+                        self._db.commit()
+                        self._remember(key, value)
+                        self._counters['disk_hits'] += 1
+                        return value
+
+            self._counters['misses'] += 1
+            return None
+
+    def put(self, key: str, value: Any):
+        """Store a value in both tiers"""
+        with self._lock:
+            self._remember(key, value)
+            if self._db is None:
+                return
+
+            # Write to a temporary file first so readers never see a partial entry
+            path = self._entry_path(key)
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=f"{self.entry_suffix}.tmp")
+            with os.fdopen(fd, 'wb') as f:
+                self._write_entry(f, value)
+            os.replace(temp_path, path)
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries (key, size, last_access) VALUES (?, ?, ?)',
+                (key, os.path.getsize(path), time.time())
+            )
+            self._evict_disk()
+            self._db.commit()
+
+    def _evict_disk(self):
+        """Delete least recently used files until the disk tier fits its budget"""
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.disk_max_bytes:
+            return
+        for key, size in self._db.execute('SELECT key, size FROM entries ORDER BY last_access').fetchall():
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(self._entry_path(key))
+            except FileNotFoundError:
+                pass
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+            self._counters['disk_evictions'] += 1
+
+    def _memory_stats(self) -> Dict:
+        return {'memory_entries': len(self._memory)}
+
+    def stats(self) -> Dict:
+        """Hit/miss/eviction counters and tier sizes"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update(self._memory_stats())
+            if self._db is not None:
+                count, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+                stats['disk_entries'] = count
+                stats['disk_bytes'] = size
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        return stats
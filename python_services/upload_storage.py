@@ -0,0 +1,177 @@
+"""
+Streaming storage for uploaded MR files
+The multipart request body is parsed as it arrives (nothing is spooled by the
+framework first): the file part is copied to a scratch directory in
+fixed-size chunks while its SHA-256 is computed in the same pass, so a scan
+is written to disk once, never held in memory in full, and the size limit is
+enforced per received chunk (or from Content-Length before anything is read)
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from typing import NamedTuple, Optional, Sequence
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+try:
+    from python_multipart.multipart import MultipartParseError, MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParseError, MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# Room for multipart boundaries, part headers and small form fields next to the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """The upload exceeds the configured maximum size"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Upload exceeds the maximum size of {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class InvalidUploadError(Exception):
+    """The request is not a multipart upload with one acceptable file"""
+
+
+class StoredUpload(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+
+
+def upload_suffix(filename: str, allowed_extensions: Sequence[str]) -> Optional[str]:
+    """
+    The allowed extension a filename ends with (longest match, so .nii.gz wins over .gz)
+    Only this suffix is used for the scratch file; the rest of the client-supplied
+    name never reaches the filesystem
+    """
+    name = (filename or '').lower()
+    matches = [ext for ext in allowed_extensions if name.endswith(ext)]
+    return max(matches, key=len) if matches else None
+
+
+class _FilePartWriter:
+    """
+    Multipart parser callbacks that copy one file field to a scratch file
+    Parsed data is buffered and written (and hashed) by flush(), which the
+    caller runs on a worker thread
+    """
+
+    def __init__(self, field: str, allowed_extensions: Sequence[str], scratch_dir: Optional[str], max_bytes: int):
+        self.field = field
+        self.allowed_extensions = allowed_extensions
+        self.scratch_dir = scratch_dir
+        self.max_bytes = max_bytes
+        self.path: Optional[str] = None
+        self.size = 0
+        self.pending = bytearray()
+        self._file = None
+        self._digest = hashlib.sha256()
+        self._headers = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._active = False
+
+    def callbacks(self):
+        return {
+            'on_part_begin': self._part_begin,
+            'on_header_field': lambda data, start, end: self._header_field.extend(data[start:end]),
+            'on_header_value': lambda data, start, end: self._header_value.extend(data[start:end]),
+            'on_header_end': self._header_end,
+            'on_headers_finished': self._headers_finished,
+            'on_part_data': self._part_data,
+            'on_part_end': self._part_end,
+        }
+
+    def _part_begin(self):
+        self._headers = {}
+        self._active = False
+
+    def _header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+        if options.get(b'name', b'').decode('utf-8', 'replace') != self.field:
+            return
+        if self.path is not None:
+            raise InvalidUploadError(f"Only one '{self.field}' file can be uploaded")
+        suffix = upload_suffix(options.get(b'filename', b'').decode('utf-8', 'replace'), self.allowed_extensions)
+        if suffix is None:
+            raise InvalidUploadError("Unsupported file format")
+        fd, self.path = tempfile.mkstemp(suffix=suffix, prefix='mr_upload_', dir=self.scratch_dir or None)
+        self._file = os.fdopen(fd, 'wb')
+        self._active = True
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        if not self._active:
+            return
+        self.size += end - start
+        if self.max_bytes > 0 and self.size > self.max_bytes:
+            raise UploadTooLargeError(self.max_bytes)
+        self.pending.extend(data[start:end])
+
+    def _part_end(self):
+        self._active = False
+
+    def flush(self):
+        if self.pending:
+            self._digest.update(self.pending)
+            self._file.write(self.pending)
+            self.pending.clear()
+
+    def finish(self) -> StoredUpload:
+        if self.path is None:
+            raise InvalidUploadError(f"No '{self.field}' file in the upload")
+        self.flush()
+        self._file.close()
+        return StoredUpload(path=self.path, sha256=self._digest.hexdigest(), size=self.size)
+
+    def discard(self):
+        if self._file is not None:
+            self._file.close()
+            os.unlink(self.path)
+
+
+async def receive_upload(request: Request, field: str, allowed_extensions: Sequence[str],
+                         scratch_dir: Optional[str] = None, max_bytes: int = 0,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE) -> StoredUpload:
+    """
+    Stream the `field` file of a multipart request body to a scratch file and hash it on the way
+    max_bytes <= 0 disables the size limit. Disk writes run on the thread pool.
+    On any error the partial file is removed; on success the caller owns
+    (and must delete) the returned path
+    """
+    content_type, options = parse_options_header(request.headers.get('content-type', ''))
+    if content_type != b'multipart/form-data' or not options.get(b'boundary'):
+        raise InvalidUploadError("Expected a multipart/form-data upload")
+    declared = request.headers.get('content-length', '')
+    if max_bytes > 0 and declared.isdigit() and int(declared) > max_bytes + MULTIPART_OVERHEAD:
+        raise UploadTooLargeError(max_bytes)
+    if scratch_dir:
+        os.makedirs(scratch_dir, exist_ok=True)
+
+    writer = _FilePartWriter(field, allowed_extensions, scratch_dir, max_bytes)
+    parser = MultipartParser(options[b'boundary'], callbacks=writer.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if len(writer.pending) >= chunk_size:
+                await run_in_threadpool(writer.flush)
+        parser.finalize()
+        return await run_in_threadpool(writer.finish)
+    except MultipartParseError as e:
+        writer.discard()
+        raise InvalidUploadError(f"Malformed multipart upload: {str(e)}")
+    except BaseException:
+        writer.discard()
+        raise
@@ -0,0 +1,117 @@
+"""
+Offline, checksummed weight bundle for the ResNet50 feature extractor
+A bundle is a torch.save()d state dict plus a JSON manifest with its SHA-256.
+Loading verifies the checksum and memory-maps the tensors, so workers start
+without a network download and share the weight pages through the OS page cache
+
+Build one on a machine with network access:
+    python weight_bundle.py build weights/resnet50_brainmri.pt
+and copy both files to the air-gapped node
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from feature_cache import hash_file
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_SUFFIX = '.json'
+
+
+class BundleError(Exception):
+    """The weight bundle is missing, incomplete or fails its checksum"""
+
+
+def manifest_path(bundle_path: str) -> str:
+    return bundle_path + MANIFEST_SUFFIX
+
+
+def read_manifest(bundle_path: str) -> Dict:
+    try:
+        with open(manifest_path(bundle_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise BundleError(f"Cannot read manifest for weight bundle {bundle_path}: {str(e)}")
+
+
+def write_bundle(bundle_path: str, state_dict: Dict, model_version: str, source: str = '') -> Dict:
+    """Save a state dict and its manifest; tensors keep their memory format (e.g. channels_last)"""
+    import torch
+
+    directory = os.path.dirname(os.path.abspath(bundle_path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = bundle_path + '.tmp'
+    torch.save(state_dict, temp_path)
+    os.replace(temp_path, bundle_path)
+
+    manifest = {
+        'model_version': model_version,
+        'source': source,
+        'sha256': hash_file(bundle_path),
+        'size': os.path.getsize(bundle_path),
+        'tensors': len(state_dict),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+    with open(manifest_path(bundle_path), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Wrote weight bundle {bundle_path} ({manifest['size']} bytes)")
+    return manifest
+
+
+def verify_bundle(bundle_path: str) -> Dict:
+    """Check the bundle against its manifest and return the manifest"""
+    manifest = read_manifest(bundle_path)
+    if not os.path.isfile(bundle_path):
+        raise BundleError(f"Weight bundle {bundle_path} not found")
+    if os.path.getsize(bundle_path) != manifest.get('size'):
+        raise BundleError(f"Weight bundle {bundle_path} has the wrong size (truncated copy?)")
+    if hash_file(bundle_path) != manifest.get('sha256'):
+        raise BundleError(f"Weight bundle {bundle_path} fails its SHA-256 check")
+    return manifest
+
+
+def load_bundle(bundle_path: str, expected_version: Optional[str] = None, verify: bool = True) -> Dict:
+    """
+    Verified, memory-mapped state dict of a bundle
+    Tensors are backed by the file, so pass the result to
+    load_state_dict(..., assign=True) to avoid copying the weights
+    """
+    import torch
+
+    manifest = verify_bundle(bundle_path) if verify else read_manifest(bundle_path)
+    if expected_version and manifest.get('model_version') != expected_version:
+        raise BundleError(
+            f"Weight bundle {bundle_path} is for {manifest.get('model_version')}, expected {expected_version}"
+        )
+    return torch.load(bundle_path, mmap=True, weights_only=True, map_location='cpu')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or verify the offline ResNet50 weight bundle")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='download ImageNet weights and write a bundle')
+    build.add_argument('output')
+    verify = commands.add_parser('verify', help='check a bundle against its manifest')
+    verify.add_argument('bundle')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'verify':
+        print(json.dumps(verify_bundle(args.bundle), indent=2))
+        return
+
+    from brain_mri_processor import MODEL_VERSION, build_feature_extractor
+    from torchvision.models import ResNet50_Weights
+
+    model = build_feature_extractor(ResNet50_Weights.IMAGENET1K_V2)
+    print(json.dumps(write_bundle(args.output, model.state_dict(), MODEL_VERSION,
+                                  source='torchvision ResNet50_Weights.IMAGENET1K_V2'), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -123,6 +123,62 @@ export async function getProcessingStatus(taskId: string) {
   }
 }
 
+/**
+ * Follow a background processing task as it runs, instead of polling its status
+ * @param taskId Task ID
+ * @param onEvent Called with the event type ('status', 'progress' or 'result') and the task for every update
+ * @param signal Abort signal to stop following the task (optional)
+ * @returns The finished task (status TAMAMLANDI or HATA)
+ */
+export async function subscribeToProcessing(
+  taskId: string,
+  onEvent: (event: string, task: any) => void,
+  signal?: AbortSignal
+) {
+  try {
+    const response = await fetch(`${PYTHON_SERVICE_URL}/processing-status/${taskId}/events`, {
+      headers: { 'Accept': 'text/event-stream' },
+      signal,
+    });
+
+    if (!response.ok || !response.body) {
+      throw new Error(`Python service error: ${response.status} ${response.statusText}`);
+    }
+
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    let task: any = null;
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += value;
+      // Messages end with a blank line; comment lines (keep-alives) start with ':'
+      let end;
+      while ((end = buffer.indexOf('\n\n')) !== -1) {
+        const message = buffer.slice(0, end);
+        buffer = buffer.slice(end + 2);
+        let event = 'message';
+        let data = '';
+        for (const line of message.split('\n')) {
+          if (line.startsWith('event:')) event = line.slice(6).trim();
+          else if (line.startsWith('data:')) data += line.slice(5).trim();
+        }
+        if (!data) continue;
+        task = JSON.parse(data);
+        onEvent(event, task);
+      }
+    }
+
+    if (!task || (task.status !== 'TAMAMLANDI' && task.status !== 'HATA')) {
+      throw new Error('Processing event stream ended before the task finished');
+    }
+    return task;
+  } catch (error) {
+    console.error('Error following processing status:', error);
+    throw error;
+  }
+}
+
 /**
  * Get available brain regions for analysis
  * @returns Brain regions information